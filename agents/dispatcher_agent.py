@@ -1,32 +1,25 @@
 # agents/dispatcher_agent.py
-import os, random
+import os, time
 from math import isfinite
 from typing import Dict, Any, List
 
 from core.llm import call_llm
-from core.db import compute_warehouse_stats
+from core.db import compute_warehouse_stats, try_hold_capacity
+from core.pricing import PricingConfig, get_config, reload_config
+from core import rng
 from agents.location_agent_llm import LocationAgent
 from agents.pricing_agent_llm import PricingAgent
 from agents.warehouse_agent_llm import WarehouseAgent
 
-# ===== Scoring Weights =====
-W_PROFIT   = float(os.getenv("W_PROFIT", "0.6"))
-W_UTILBAL  = float(os.getenv("W_UTILBAL", "0.2"))
-W_DISTANCE = float(os.getenv("W_DISTANCE", "0.1"))
-W_SLA      = float(os.getenv("W_SLA", "0.05"))
-W_PRICE    = float(os.getenv("W_PRICE", "0.05"))
-W_SPEC     = float(os.getenv("W_SPEC", "0.05"))
-
-TARGET_UTIL = float(os.getenv("TARGET_UTIL", "0.7"))
-
-# ===== Exploration =====
-EPSILON       = float(os.getenv("EPSILON", "0.08"))  # โอกาสสุ่มเลือก
-EXPL_TOPK     = int(os.getenv("EXPL_TOPK", "3"))
-EXPL_WEIGHT   = os.getenv("EXPL_WEIGHT", "distance*avail")
+# ===== Scoring Weights / Exploration =====
+# W_* / TARGET_UTIL / EPSILON / EXPL_* อยู่ใน core.pricing.PricingConfig (load_context จับไว้ต่อ batch)
 
 USE_LLM_EXPLAIN = os.getenv("USE_LLM_EXPLAIN", "0") == "1"
 HISTORY_DAYS    = int(os.getenv("HISTORY_DAYS", "14"))
 
+# ===== Reservation =====
+RESERVE_MAX_ATTEMPTS = int(os.getenv("RESERVE_MAX_ATTEMPTS", "0"))  # 0 = ไล่ได้ทุก candidate
+
 _loc  = LocationAgent()
 _price= PricingAgent()
 _wh   = WarehouseAgent()
@@ -41,10 +34,21 @@ def _hist():
             _HIST = {}
     return _HIST
 
-def _util_penalty(util: float) -> float:
-    if util <= TARGET_UTIL:
+def invalidate_caches(env_file: str = None):
+    """
+    ล้าง cache ระดับโปรเซส (สถิติย้อนหลัง, route estimator) และโหลด pricing config ใหม่ (อ่าน env_file ทับก่อนถ้าระบุ)
+    — worker pool เรียกเมื่อ generation เปลี่ยน: os.environ ของ worker ไม่เห็น .env ที่ supervisor โหลดใหม่ตอน SIGHUP
+    """
+    global _HIST
+    _HIST = None
+    from core import route_estimator
+    route_estimator.reset()
+    reload_config(env_file)
+
+def _util_penalty(util: float, target_util: float) -> float:
+    if util <= target_util:
         return 1.0
-    overflow = util - TARGET_UTIL
+    overflow = util - target_util
     return max(0.0, 1.0 - 0.8 * overflow)  # ลงโทษแรงขึ้นเมื่อเกินเป้า
 
 def _price_rank_score(prices: List[float], val: float) -> float:
@@ -100,35 +104,124 @@ def _candidate_reason(c: Dict[str, Any], hist_row: Dict[str, Any] | None, extra:
         why.update(extra)
     return why
 
-def run(offer: Dict[str, Any]) -> Dict[str, Any]:
-    # 1) Geocode ถ้าจำเป็น
+# ===== Stages (ใช้ทั้ง run() และ graph ใน app.py ซึ่งรันแต่ละ stage เป็น node แยก) =====
+def resolve_origin(offer: Dict[str, Any]) -> tuple:
+    """1) Geocode ถ้าจำเป็น -> (lat, lng)"""
     if not (offer.get("origin_lat") and offer.get("origin_lng")):
-        lat, lng = _loc.geocode(offer.get("origin_address"))
-    else:
-        lat, lng = float(offer["origin_lat"]), float(offer["origin_lng"])
-
-    # 2) ดึงคลัง + สถิติย้อนหลัง
-    whs = _wh.get_active()
-    hist = _hist()
-    streaks = _wh.streaks()
-
-    # 3) สร้าง candidates (pricing + spec)
-    cands = []
-    for w in whs:
-        rt = _loc.route(lat, lng, w["lat"], w["lng"])      # dict {"km","minutes"}
-        wid = w["warehouse_id"]
-        cand = _price.quote_candidate(
-            offer=offer,
-            wh=w,
-            route_info=rt,
-            hist_row=hist.get(wid)
-        )
-        # spec score (LLM-able)
-        spec = _wh.spec_score(offer, w)
-        cand["spec_score"] = round(float(spec), 4)
+        return _loc.geocode(offer.get("origin_address"))
+    return float(offer["origin_lat"]), float(offer["origin_lng"])
+
+def load_context() -> Dict[str, Any]:
+    """2) ดึงคลัง + สถิติย้อนหลัง + สตรีคผู้ชนะ + pricing config (ไม่ขึ้นกับ offer)"""
+    return {"warehouses": _wh.get_active(), "hist": _hist(), "streaks": _wh.streaks(),
+            "config": get_config()}
+
+def quote_warehouse(offer: Dict[str, Any], lat: float, lng: float,
+                    w: Dict[str, Any], hist_row: Dict[str, Any] | None,
+                    route_info: Dict[str, float] | None = None,
+                    cfg: PricingConfig | None = None) -> Dict[str, Any]:
+    """3) candidate ของคลังเดียว (route + pricing + spec) — ส่ง route_info มาได้ถ้าดึงแบบ bulk ไว้แล้ว"""
+    rt = route_info or _loc.route(lat, lng, w["lat"], w["lng"])      # dict {"km","minutes"}
+    cand = _price.quote_candidate(
+        offer=offer,
+        wh=w,
+        route_info=rt,
+        hist_row=hist_row,
+        cfg=cfg,
+    )
+    # spec score (LLM-able)
+    spec = _wh.spec_score(offer, w)
+    cand["spec_score"] = round(float(spec), 4)
+    return cand
+
+def run(offer: Dict[str, Any], streaks: Dict[str, int] | None = None) -> Dict[str, Any]:
+    """streaks = สตรีคที่ผู้เรียกเดินเอง (advance_streaks) แทนค่าที่อ่านจาก DB"""
+    lat, lng = resolve_origin(offer)
+    ctx = load_context()
+    hist, cfg = ctx["hist"], ctx.get("config") or get_config()
+    cands = [quote_warehouse(offer, lat, lng, w, hist.get(w["warehouse_id"]), cfg=cfg) for w in ctx["warehouses"]]
+    return select(offer, cands, hist, ctx["streaks"] if streaks is None else streaks, cfg)
+
+def run_cached(offer: Dict[str, Any], version: str | None = None,
+               streaks: Dict[str, int] | None = None) -> Dict[str, Any]:
+    """
+    run() ที่อ่าน candidate จาก feature store ก่อน (core/feature_store) — เจอ = select ตรง ๆ ไม่ route/price ใหม่
+    ไม่เจอ (หรือไม่มี offer_id) = quote ตามปกติแล้วบันทึกไว้ใต้ snapshot_version เดียวกัน
+    """
+    from core import feature_store
+    ctx = load_context()
+    hist, cfg = ctx["hist"], ctx.get("config") or get_config()
+    version = version or feature_store.snapshot_version(ctx, cfg)
+    oid = offer.get("offer_id")
+    cands = (feature_store.load_candidates([oid], version, ctx["warehouses"]).get(str(oid))
+             if oid is not None else None)
+    hit = cands is not None
+    if not hit:
+        lat, lng = resolve_origin(offer)
+        cands = [quote_warehouse(offer, lat, lng, w, hist.get(w["warehouse_id"]), cfg=cfg) for w in ctx["warehouses"]]
+        feature_store.record(oid, cands, version)
+    decision = select(offer, cands, hist, ctx["streaks"] if streaks is None else streaks, cfg)
+    decision["meta"] = {**(decision.get("meta") or {}), "features": {"snapshot_version": version, "hit": hit}}
+    return decision
 
-        cands.append(cand)
+def advance_streaks(streaks: Dict[str, int], chosen: str | None) -> Dict[str, int]:
+    """สตรีคหลังเพิ่ม decision ใหม่ 1 อัน (ตรรกะเดียวกับ WarehouseAgent.streaks ที่อ่านจาก DB)"""
+    if not chosen:
+        return {}
+    return {chosen: streaks.get(chosen, 0) + 1} if chosen in streaks else {chosen: 1}
 
+def _error_decision(e: Exception) -> Dict[str, Any]:
+    return {"accept": False, "chosen_warehouse": None, "reason": f"error: {e}",
+            "priced_amount": None, "candidates": []}
+
+def run_batch(offers: List[Dict[str, Any]], reserve_capacity: bool = False) -> List[Dict[str, Any]]:
+    """
+    ตัดสินใจหลาย offer ด้วย context ชุดเดียว (คลัง/สถิติ/สตรีค โหลดครั้งเดียว)
+    - route ทุกคู่ (offer × คลัง) ดึงผ่าน route_many (cache อ่าน/เขียน bulk)
+    - สตรีคเดินต่อในหน่วยความจำตามลำดับ offer ให้ผลเหมือนเรียก run() ทีละอันแล้วบันทึก
+    - reserve_capacity=True จะ hold capacity (reserve()) และบวก used_cbm ใน snapshot ให้ offer ถัดไปเห็น
+    offer ที่ geocode/quote พังได้ decision แบบ error เฉพาะตัว ไม่ล้มทั้ง batch
+    """
+    ctx = load_context()
+    whs = [dict(w) for w in ctx["warehouses"]]
+    hist, streaks = ctx["hist"], dict(ctx["streaks"])
+    cfg = ctx.get("config") or get_config()
+
+    origins: List[Any] = []
+    for offer in offers:
+        try:
+            origins.append(resolve_origin(offer))
+        except Exception as e:
+            origins.append(e)
+    pairs = [(o[0], o[1], w["lat"], w["lng"]) for o in origins if not isinstance(o, Exception) for w in whs]
+    routes = iter(_loc.route_many(pairs) if pairs else [])
+
+    out = []
+    for offer, origin in zip(offers, origins):
+        if isinstance(origin, Exception):
+            out.append(_error_decision(origin)); continue
+        rts = [next(routes) for _ in whs]
+        try:
+            cands = [quote_warehouse(offer, origin[0], origin[1], w, hist.get(w["warehouse_id"]), rt, cfg)
+                     for w, rt in zip(whs, rts)]
+            decision = select(offer, cands, hist, streaks, cfg)
+            if reserve_capacity:
+                decision = reserve(offer, decision)
+                if decision.get("reservation_id"):
+                    w = next(w for w in whs if w["warehouse_id"] == decision["chosen_warehouse"])
+                    w["used_cbm"] = float(w.get("used_cbm") or 0.0) + float(offer.get("volume_cbm") or 0.0)
+        except Exception as e:
+            decision = _error_decision(e)
+        streaks = advance_streaks(streaks, decision.get("chosen_warehouse"))
+        out.append(decision)
+    return out
+
+def select(offer: Dict[str, Any], cands: List[Dict[str, Any]],
+           hist: Dict[str, Any], streaks: Dict[str, int],
+           cfg: PricingConfig | None = None) -> Dict[str, Any]:
+    """4-6) ให้คะแนน + เลือกผู้ชนะ (epsilon-greedy) + อธิบายเหตุผล"""
+    cfg = cfg or get_config()
+    W = cfg.weights
     # 4) จัดอันดับ + คำนวณคะแนนรวม
     prices = [c["_raw_price"] for c in cands] if cands else []
     scored = []
@@ -138,18 +231,18 @@ def run(offer: Dict[str, Any]) -> Dict[str, Any]:
         profit_score  = min(1.0, (c["profit"] / 200.0) if isfinite(c["profit"]) else 0.0)
         distance_score= 1.0 / (1.0 + km)
         sla_score     = 1.0 if c["sla_fit"] else 0.0
-        util_score    = max(0.0, 1.0 - abs(c["utilization"] - TARGET_UTIL))
-        util_pen      = _util_penalty(c["utilization"])
+        util_score    = max(0.0, 1.0 - abs(c["utilization"] - cfg.target_util))
+        util_pen      = _util_penalty(c["utilization"], cfg.target_util)
 
         div_pen, st  = _wh.diversity_penalty(c["warehouse_id"], streaks)
 
         base_score = (
-            W_PROFIT   * profit_score +
-            W_PRICE    * price_score  +
-            W_DISTANCE * distance_score +
-            W_SLA      * sla_score +
-            W_UTILBAL  * util_score +
-            W_SPEC     * c["spec_score"]
+            W.profit   * profit_score +
+            W.price    * price_score  +
+            W.distance * distance_score +
+            W.sla      * sla_score +
+            W.utilbal  * util_score +
+            W.spec     * c["spec_score"]
         )
         score = base_score * util_pen * div_pen
 
@@ -164,25 +257,26 @@ def run(offer: Dict[str, Any]) -> Dict[str, Any]:
         c["score"]             = round(float(score), 6)
         scored.append(c)
 
-    # 5) เลือกผู้ชนะ (epsilon-greedy exploration)
+    # 5) เลือกผู้ชนะ (epsilon-greedy exploration) — สุ่มจาก core.rng ต่อ offer (RUN_SEED + offer_id)
     scored.sort(key=lambda x: x["score"], reverse=True)
     winner = scored[0] if scored else None
     exploration = False
-    if scored and random.random() < EPSILON:
+    draw = rng.OfferRNG(offer.get("offer_id"), "explore")
+    if scored and draw.random() < cfg.epsilon:
         exploration = True
-        k = min(EXPL_TOPK, len(scored))
+        k = min(cfg.expl_topk, len(scored))
         pool = scored[:k]
         weights = []
         for c in pool:
-            if EXPL_WEIGHT == "distance*avail":
+            if cfg.expl_weight == "distance*avail":
                 w = max(1e-9, c["distance_score"] * (c["available_cbm"] + 1.0))
-            elif EXPL_WEIGHT == "score":
+            elif cfg.expl_weight == "score":
                 w = max(1e-9, c["score"])
             else:
                 w = 1.0
             weights.append(w)
         s = sum(weights)
-        r = random.random() * s
+        r = draw.random() * s
         cur = 0.0
         for c, w in zip(pool, weights):
             cur += w
@@ -215,8 +309,8 @@ def run(offer: Dict[str, Any]) -> Dict[str, Any]:
             reason["llm_summary"] = _llm_explain({
                 "winner": winner, "top3": scored[:3],
                 "weights": {
-                    "W_PROFIT": W_PROFIT, "W_PRICE": W_PRICE, "W_DISTANCE": W_DISTANCE,
-                    "W_UTILBAL": W_UTILBAL, "W_SPEC": W_SPEC
+                    "W_PROFIT": W.profit, "W_PRICE": W.price, "W_DISTANCE": W.distance,
+                    "W_UTILBAL": W.utilbal, "W_SPEC": W.spec
                 }
             })
         decision = {
@@ -234,4 +328,66 @@ def run(offer: Dict[str, Any]) -> Dict[str, Any]:
             "priced_amount": None,
             "candidates": [],
         }
+    # seed ของ jitter/exploration: ตั้ง RUN_SEED ค่านี้ + offer_id เดิม = replay ได้ผลเดิม
+    decision["meta"] = {**(decision.get("meta") or {}), "run_seed": rng.run_seed()}
+    return decision
+
+def reserve(offer: Dict[str, Any], decision: Dict[str, Any], hold=None,
+            max_attempts: int | None = None) -> Dict[str, Any]:
+    """
+    7) hold capacity ให้ผู้ชนะ ถ้าแพ้ race (conditional hold ไม่ผ่าน) ไล่ candidate ถัดไปตามอันดับ score
+       ที่คำนวณไว้แล้ว — ไม่ route/price/LLM ใหม่
+    บันทึกทุกครั้งที่ลองใน decision["meta"]["reservation"]
+    """
+    hold = hold or try_hold_capacity
+    limit = RESERVE_MAX_ATTEMPTS if max_attempts is None else max_attempts
+    decision = dict(decision)
+    winner = decision.get("chosen_warehouse")
+    if not (decision.get("accept") and winner):
+        return decision
+
+    scored = decision.get("candidates") or []
+    order = [c for c in scored if c.get("warehouse_id") == winner][:1]
+    order += [c for c in scored if c.get("warehouse_id") != winner]
+    if not order:
+        order = [{"warehouse_id": winner, "price_amount": decision.get("priced_amount")}]
+    if limit > 0:
+        order = order[:limit]
+
+    offer_id = str(offer.get("offer_id") or "")
+    volume = float(offer.get("volume_cbm") or 0.0)
+    attempts, rid, held = [], None, None
+    for rank, c in enumerate(order):
+        wid = c["warehouse_id"]
+        t0 = time.perf_counter()
+        try:
+            rid = hold(wid, offer_id, volume)
+            err = None
+        except Exception as e:
+            rid, err = None, str(e)
+        attempts.append({"warehouse_id": wid, "rank": rank, "ok": bool(rid),
+                         "ms": round((time.perf_counter() - t0) * 1000, 2), **({"error": err} if err else {})})
+        if rid:
+            held = c
+            break
+
+    meta = dict(decision.get("meta") or {})
+    meta["reservation"] = {"reservation_id": rid, "attempts": attempts,
+                           "fallthrough": bool(held) and held["warehouse_id"] != winner,
+                           "initial_winner": winner}
+    decision["meta"] = meta
+    decision["reservation_id"] = rid
+    reason = decision.get("reason")
+    if held is None:
+        decision["accept"] = False
+        decision["chosen_warehouse"] = None
+        decision["priced_amount"] = None
+        if isinstance(reason, dict):
+            decision["reason"] = {**reason, "reservation": "capacity_hold_failed"}
+    elif held["warehouse_id"] != winner:
+        decision["chosen_warehouse"] = held["warehouse_id"]
+        decision["priced_amount"] = held.get("price_amount")
+        if isinstance(reason, dict):
+            decision["reason"] = {**reason, "chosen_warehouse": held["warehouse_id"],
+                                  "reservation": f"fallthrough from {winner} (rank {len(attempts) - 1})"}
     return decision
@@ -1,9 +1,9 @@
 # agents/location_agent_llm.py
 import os
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, List
 
 from core.llm import call_llm
-from core.location import geocode as _geo, route as _route
+from core.location import geocode as _geo, route as _route, route_many as _route_many
 
 USE_LLM_LOCATION = os.getenv("USE_LLM_LOCATION", "0") == "0"
 
@@ -28,10 +28,16 @@ def _norm_route(rt) -> Dict[str, float]:
     """
     if isinstance(rt, dict):
         return {"km": float(rt.get("km") or 0.0),
-                "minutes": float(rt.get("minutes") or 0.0)}
+                "minutes": float(rt.get("minutes") or 0.0),
+                "snap_err_m": float(rt.get("snap_err_m") or 0.0)}
     if isinstance(rt, (tuple, list)) and len(rt) >= 2:
-        return {"km": float(rt[0] or 0.0), "minutes": float(rt[1] or 0.0)}
-    return {"km": 0.0, "minutes": 0.0}
+        # RouteResult พก snap_err_m (ความคลาดเคลื่อนสูงสุดจากการ snap ต้นทาง) และ source มาด้วย
+        out = {"km": float(rt[0] or 0.0), "minutes": float(rt[1] or 0.0),
+               "snap_err_m": float(getattr(rt, "snap_err_m", 0.0) or 0.0)}
+        if getattr(rt, "source", None):
+            out["source"] = rt.source
+        return out
+    return {"km": 0.0, "minutes": 0.0, "snap_err_m": 0.0}
 
 class LocationAgent:
     """ตัวกลางเรื่อง location: geocode + route พร้อมจุดเสียบ LLM"""
@@ -43,3 +49,7 @@ class LocationAgent:
     def route(self, a_lat: float, a_lng: float, b_lat: float, b_lng: float) -> Dict[str, float]:
         rt = _route(a_lat, a_lng, b_lat, b_lng)
         return _norm_route(rt)
+
+    def route_many(self, pairs: List[Tuple[float, float, float, float]]) -> List[Dict[str, float]]:
+        """หลายคู่ในครั้งเดียว (cache อ่าน/เขียนแบบ bulk)"""
+        return [_norm_route(rt) for rt in _route_many(pairs)]
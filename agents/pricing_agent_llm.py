@@ -1,31 +1,29 @@
 # agents/pricing_agent_llm.py
-import os, random
+import os
 from typing import Dict, Any
 
+import numpy as np
+
 from core.llm import call_llm
+from core.pricing import PricingConfig, get_config, rate_arrays
+from core import rng
 
-# ===== Pricing / Cost Params (อ่านจาก env) =====
-MIN_MARGIN            = float(os.getenv("MIN_MARGIN", "0.05"))
-TARGET_UTIL           = float(os.getenv("TARGET_UTIL", "0.7"))
-BID_UTIL_K            = float(os.getenv("BID_UTIL_K", "1.0"))
-BID_KM_K              = float(os.getenv("BID_KM_K", "0.02"))
-BID_JITTER            = float(os.getenv("BID_JITTER", "0.005"))
-OPPORTUNITY_COEFF     = float(os.getenv("OPPORTUNITY_COEFF", "0.15"))
-SURCHARGE             = float(os.getenv("SURCHARGE", "0"))
-KM_COST               = float(os.getenv("KM_COST", "10"))
-HANDLING_PER_CBM      = float(os.getenv("HANDLING_PER_CBM", "5"))
-STORAGE_PER_CBM_DAY   = float(os.getenv("STORAGE_PER_CBM_DAY", "0.8"))
+CANDIDATE_DTYPE = np.dtype([("cost", "f8"), ("margin_eff", "f8"), ("bid_factor", "f8"), ("jitter", "f8"),
+                            ("price_amount", "f8"), ("profit", "f8"), ("margin", "f8"),
+                            ("utilization", "f8"), ("available_cbm", "f8")])
 
+# ===== Pricing / Cost Params =====
+# rate card, margin/bid/jitter มาจาก core.pricing.PricingConfig (โหลดจาก env ครั้งเดียว, override รายคลังได้)
 USE_LLM_PRICING = os.getenv("USE_LLM_PRICING", "0") == "1"
-ALPHA_MARGIN    = float(os.getenv("ALPHA_MARGIN", "0.10"))  # margin push per util overflow
-BETA_AR         = float(os.getenv("BETA_AR", "0.05"))       # bid factor sensitivity by accept_rate
 
-def _adj_margin(base_margin: float, ewma_util: float) -> float:
-    overflow = max(0.0, ewma_util - TARGET_UTIL)
-    return base_margin + ALPHA_MARGIN * overflow + OPPORTUNITY_COEFF * overflow
+def _adj_margin(base_margin: float, ewma_util: float, cfg: PricingConfig) -> float:
+    # alpha_margin = margin push per util overflow
+    overflow = max(0.0, ewma_util - cfg.target_util)
+    return base_margin + cfg.alpha_margin * overflow + cfg.opportunity_coeff * overflow
 
-def _adj_bid_factor(base_factor: float, accept_rate: float) -> float:
-    return base_factor * (1.0 + BETA_AR * (accept_rate - 0.5))
+def _adj_bid_factor(base_factor: float, accept_rate: float, cfg: PricingConfig) -> float:
+    # beta_ar = bid factor sensitivity by accept_rate
+    return base_factor * (1.0 + cfg.beta_ar * (accept_rate - 0.5))
 
 def _llm_margin_hint(context: Dict[str, Any]) -> float:
     """
@@ -55,7 +53,10 @@ class PricingAgent:
         wh: Dict[str, Any],
         route_info: Dict[str, float],
         hist_row: Dict[str, Any] | None = None,
+        cfg: PricingConfig | None = None,
     ) -> Dict[str, Any]:
+        cfg = cfg or get_config()
+        r = cfg.rate_for(wh.get("warehouse_id"))
         km = float(route_info.get("km") or 0.0)
         vol = float(offer["volume_cbm"])
         duration_days = float(offer.get("duration_days", 0) or 0)
@@ -65,10 +66,10 @@ class PricingAgent:
 
         # base cost
         cost = (
-            KM_COST * km
-            + HANDLING_PER_CBM * vol
-            + STORAGE_PER_CBM_DAY * vol * duration_days
-            + SURCHARGE
+            r.km_cost * km
+            + r.handling_per_cbm * vol
+            + r.storage_per_cbm_day * vol * duration_days
+            + r.surcharge
         )
 
         # history
@@ -76,7 +77,7 @@ class PricingAgent:
         ewma_util   = float(hist_row.get("ewma_util", 0.0)) if hist_row else 0.0
 
         # margin & bid factor
-        margin_eff = _adj_margin(MIN_MARGIN, ewma_util)
+        margin_eff = _adj_margin(r.min_margin, ewma_util, cfg)
         margin_eff += _llm_margin_hint({
             "volume": vol, "km": km,
             "util_after": util_after, "accept_rate": accept_rate,
@@ -84,10 +85,13 @@ class PricingAgent:
         })
 
         base_price = cost / max(1e-6, (1.0 - margin_eff))
-        base_factor = 1.0 + BID_UTIL_K * max(0.0, util_after - TARGET_UTIL) + BID_KM_K * km
-        bid_factor  = _adj_bid_factor(base_factor, accept_rate)
+        base_factor = 1.0 + cfg.bid_util_k * max(0.0, util_after - cfg.target_util) + cfg.bid_km_k * km
+        bid_factor  = _adj_bid_factor(base_factor, accept_rate, cfg)
 
-        price = base_price * bid_factor * (1.0 + random.uniform(-BID_JITTER, BID_JITTER))
+        # jitter ต่อคู่ (offer, คลัง) จาก core.rng: RUN_SEED + offer_id เดิม = ราคาเดิม
+        jitter = rng.uniform_for(offer.get("offer_id"), "jitter", wh.get("warehouse_id"),
+                                 -cfg.bid_jitter, cfg.bid_jitter)
+        price = base_price * bid_factor * (1.0 + jitter)
         profit = max(0.0, price - cost)
         margin = profit / max(1e-6, price)
 
@@ -109,3 +113,61 @@ class PricingAgent:
             "_raw_km": float(km),
             "_wh": wh,
         }
+
+    def quote_batch(
+        self,
+        volume_cbm,
+        duration_days,
+        km,
+        used_cbm,
+        capacity_cbm,
+        accept_rate=0.0,
+        ewma_util=0.0,
+        warehouse_ids=None,
+        cfg: PricingConfig | None = None,
+        seed: int | None = None,
+        offer_ids=None,
+    ) -> np.ndarray:
+        """
+        quote_candidate() แบบ vectorized: ทุก input เป็น array/scalar ที่ broadcast กันได้ (เช่น offers × คลัง)
+        -> structured array CANDIDATE_DTYPE (ไม่ปัดเศษ)
+        jitter: ส่ง offer_ids (+ warehouse_ids) = core.rng ต่อคู่ ได้ค่าเดียวกับ quote_candidate (seed = run seed)
+                ไม่ส่ง = np.random.default_rng(seed) ทั้งก้อน (seed เดิม = ผลเดิม)
+        ไม่มี LLM margin hint (ต่อคู่) — ใช้สำหรับ re-pricing / what-if / simulation
+        """
+        cfg = cfg or get_config()
+        nums = [np.asarray(x, dtype="f8") for x in (
+            volume_cbm, duration_days, km, used_cbm, capacity_cbm, accept_rate, ewma_util)]
+        # shape รวม id ด้วย: แกนคลังอาจมาจาก warehouse_ids อย่างเดียว (km (n,1) × warehouse_ids (1,m))
+        ids = [np.asarray(x, dtype=object) for x in (warehouse_ids, offer_ids) if x is not None]
+        shape = np.broadcast_shapes(*(a.shape for a in nums + ids))
+        vol, days, km_, used, cap, ar, ew = (np.broadcast_to(a, shape) for a in nums)
+        if warehouse_ids is not None:
+            warehouse_ids = np.broadcast_to(np.asarray(warehouse_ids, dtype=object), shape)
+        r = rate_arrays(warehouse_ids, cfg)
+
+        util_after = (used + vol) / np.maximum(1.0, cap)
+        cost = r["km_cost"] * km_ + r["handling_per_cbm"] * vol + r["storage_per_cbm_day"] * vol * days + r["surcharge"]
+
+        overflow = np.maximum(0.0, ew - cfg.target_util)
+        margin_eff = r["min_margin"] + cfg.alpha_margin * overflow + cfg.opportunity_coeff * overflow
+        base_price = cost / np.maximum(1e-6, 1.0 - margin_eff)
+        base_factor = 1.0 + cfg.bid_util_k * np.maximum(0.0, util_after - cfg.target_util) + cfg.bid_km_k * km_
+        bid_factor = base_factor * (1.0 + cfg.beta_ar * (ar - 0.5))
+        if cfg.bid_jitter <= 0:
+            jitter = np.zeros(vol.shape)
+        elif offer_ids is not None:
+            jitter = np.broadcast_to(rng.uniform_batch(offer_ids, "jitter", warehouse_ids, -cfg.bid_jitter,
+                                                       cfg.bid_jitter, seed=seed), vol.shape)
+        else:
+            jitter = np.random.default_rng(seed).uniform(-cfg.bid_jitter, cfg.bid_jitter, vol.shape)
+        price = base_price * bid_factor * (1.0 + jitter)
+        profit = np.maximum(0.0, price - cost)
+
+        out = np.empty(vol.shape, dtype=CANDIDATE_DTYPE)
+        out["cost"], out["margin_eff"], out["bid_factor"], out["jitter"] = cost, margin_eff, bid_factor, jitter
+        out["price_amount"], out["profit"] = price, profit
+        out["margin"] = profit / np.maximum(1e-6, price)
+        out["utilization"] = util_after
+        out["available_cbm"] = np.maximum(0.0, cap - used)
+        return out
@@ -65,7 +65,7 @@ def _winner_streaks() -> Dict[str, int]:
     ใช้กับ cooldown penalty
     """
     try:
-        rows = get_recent_decisions(COOLDOWN_LOOKBACK) or []
+        rows = get_recent_decisions(COOLDOWN_LOOKBACK, fields=["decision.chosen_warehouse"]) or []
     except Exception:
         rows = []
     streak = {}
@@ -23,37 +23,163 @@ except Exception as e:
 
 
 
-from langgraph.graph import StateGraph, END
+import operator
+from typing import Any, Dict, List, TypedDict, Annotated
+
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
 
 # (นำเข้า core หลังโหลด .env แล้วเท่านั้น)
-from core.db import init_db, seed_warehouses, save_decision_result
+from core.db import init_db, seed_warehouses
+from core.writer import get_decision_writer
 from core.schema import Offer
-from agents.dispatcher_agent import run as dispatcher_run
+from agents import dispatcher_agent
+
+# hold capacity ให้ผู้ชนะใน node reserve เมื่อ input ไม่ได้ระบุ reserve (app.invoke เดี่ยว / server)
+# decide_many / adecide_many / astream_decisions และ inspect_cases ส่ง reserve=False เป็นค่าเริ่มต้น
+GRAPH_RESERVE         = os.getenv("GRAPH_RESERVE", "1") == "1"
+GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY", "8"))
+
+
+class DispatchState(TypedDict, total=False):
+    offer: Any                      # Offer (pydantic) หรือ dict
+    origin: tuple                   # (lat, lng)
+    warehouses: List[Dict[str, Any]]
+    hist: Dict[str, Any]
+    streaks: Dict[str, int]         # ส่งมากับ input = ใช้ค่านี้แทนที่อ่านจาก DB (ผู้เรียกเดินสตรีคเอง)
+    config: Any                     # core.pricing.PricingConfig ที่จับไว้ตอน context
+    reserve: bool                   # hold capacity ใน node reserve หรือไม่ (ไม่ส่ง = GRAPH_RESERVE)
+    candidates: Annotated[List[Dict[str, Any]], operator.add]   # quote แต่ละคลังต่อท้ายกันเอง
+    decision: Dict[str, Any]
+
+
+def _offer_dict(state: dict) -> Dict[str, Any]:
+    o = state["offer"]
+    return o.model_dump() if hasattr(o, "model_dump") else dict(o)
 
 
 # -------- graph nodes --------
-def s_dispatch(state: dict) -> dict:
-    """เรียก DispatcherAgent ให้ตัดสินใจ (LLM+tools หรือ fallback deterministic ภายใน agent)"""
-    decision = dispatcher_run(state["offer"].model_dump())
-    state["decision"] = decision
-    return state
+#   START ─┬─ geocode ─┐
+#          └─ context ─┴─ fanout ──Send×N──> quote ──> score ──> reserve ──> END
+def s_geocode(state: dict) -> dict:
+    return {"origin": tuple(dispatcher_agent.resolve_origin(_offer_dict(state)))}
+
+
+def s_context(state: dict) -> dict:
+    """คลัง + สถิติย้อนหลัง + สตรีค (ขนานกับ geocode)"""
+    ctx = dispatcher_agent.load_context()
+    if state.get("streaks") is not None:
+        ctx.pop("streaks", None)
+    return ctx
+
+
+def s_fanout(state: dict) -> dict:
+    # join node: รอทั้ง geocode และ context ก่อนแตก quote ต่อคลัง
+    return {}
+
+
+def route_quotes(state: dict):
+    whs = state.get("warehouses") or []
+    if not whs:
+        return "score"
+    offer, (lat, lng), hist = _offer_dict(state), state["origin"], state.get("hist") or {}
+    return [Send("quote", {"offer": offer, "lat": lat, "lng": lng, "wh": w,
+                           "hist_row": hist.get(w["warehouse_id"]), "config": state.get("config")})
+            for w in whs]
+
+
+def s_quote(task: dict) -> dict:
+    """quote ของคลังเดียว — LangGraph รันทุก Send ใน superstep เดียวกันแบบขนาน"""
+    cand = dispatcher_agent.quote_warehouse(task["offer"], task["lat"], task["lng"],
+                                            task["wh"], task["hist_row"], cfg=task.get("config"))
+    return {"candidates": [cand]}
+
+
+def s_score(state: dict) -> dict:
+    # เรียง candidates ตามลำดับคลังเดิม ให้ผลเหมือน dispatcher_agent.run ไม่ขึ้นกับลำดับที่ quote เสร็จ
+    order = {w["warehouse_id"]: i for i, w in enumerate(state.get("warehouses") or [])}
+    cands = sorted(state.get("candidates") or [], key=lambda c: order.get(c["warehouse_id"], len(order)))
+    decision = dispatcher_agent.select(_offer_dict(state), cands,
+                                       state.get("hist") or {}, state.get("streaks") or {},
+                                       state.get("config"))
+    return {"decision": decision}
 
 
 def s_reserve(state: dict) -> dict:
-    # จุดนี้ถ้าต้องการเรียก “จอง capacity” จริง (hold) ให้เพิ่ม tool_call ได้
-    return state
+    """hold capacity ให้ผู้ชนะ ถ้าแพ้ race ไล่ candidate ถัดไปตามอันดับ (ปิดด้วย state reserve=False / GRAPH_RESERVE=0)"""
+    decision = state.get("decision") or {}
+    if not (state.get("reserve", GRAPH_RESERVE) and decision.get("accept")):
+        return {}
+    return {"decision": dispatcher_agent.reserve(_offer_dict(state), decision)}
 
 
 def build():
-    g = StateGraph(dict)
-    g.add_node("dispatch", s_dispatch)
+    g = StateGraph(DispatchState)
+    g.add_node("geocode", s_geocode)
+    g.add_node("context", s_context)
+    g.add_node("fanout", s_fanout)
+    g.add_node("quote", s_quote)
+    g.add_node("score", s_score)
     g.add_node("reserve", s_reserve)
-    g.set_entry_point("dispatch")
-    g.add_edge("dispatch", "reserve")
+    g.add_edge(START, "geocode")
+    g.add_edge(START, "context")
+    g.add_edge(["geocode", "context"], "fanout")
+    g.add_conditional_edges("fanout", route_quotes, ["quote", "score"])
+    g.add_edge("quote", "score")
+    g.add_edge("score", "reserve")
     g.add_edge("reserve", END)
     return g.compile()
 
 
+_APP = None
+def get_app():
+    """compiled graph ตัวเดียวต่อโปรเซส (compile ครั้งแรกที่เรียก)"""
+    global _APP
+    if _APP is None:
+        _APP = build()
+    return _APP
+
+
+def _inputs(offers: List[Any], reserve: bool) -> List[dict]:
+    return [{"offer": o, "reserve": reserve} for o in offers]
+
+
+# batch helper ไม่ hold capacity เว้นแต่ส่ง reserve=True (งาน eval/batch ไม่ควรกิน used_cbm ของคลังจริงค้างไว้)
+def decide_many(offers: List[Any], max_concurrency: int = GRAPH_MAX_CONCURRENCY,
+                reserve: bool = False) -> List[Dict[str, Any]]:
+    """
+    รันหลาย offer ผ่าน graph เดียวกัน (batch ขนาน) คืน decision ตามลำดับ input
+    ทุก offer เห็นสตรีคจาก DB ชุดเดียวกัน — ถ้าต้องการให้สตรีค/cooldown เดินต่อจากเคสก่อนหน้า
+    ให้ invoke ทีละ offer ตามลำดับพร้อมส่ง streaks (ดู scripts/inspect_cases.py)
+    """
+    states = get_app().batch(_inputs(offers, reserve), config={"max_concurrency": max_concurrency},
+                             return_exceptions=True)
+    return [_decision_or_error(s) for s in states]
+
+
+async def adecide_many(offers: List[Any], max_concurrency: int = GRAPH_MAX_CONCURRENCY,
+                       reserve: bool = False) -> List[Dict[str, Any]]:
+    states = await get_app().abatch(_inputs(offers, reserve), config={"max_concurrency": max_concurrency},
+                                    return_exceptions=True)
+    return [_decision_or_error(s) for s in states]
+
+
+async def astream_decisions(offers: List[Any], max_concurrency: int = GRAPH_MAX_CONCURRENCY,
+                            reserve: bool = False):
+    """async generator: (index, decision) ตามลำดับที่เสร็จ"""
+    async for i, s in get_app().abatch_as_completed(_inputs(offers, reserve),
+                                                    config={"max_concurrency": max_concurrency},
+                                                    return_exceptions=True):
+        yield i, _decision_or_error(s)
+
+
+def _decision_or_error(state: Any) -> Dict[str, Any]:
+    if isinstance(state, Exception):
+        return {"accept": False, "chosen_warehouse": None, "reason": f"error: {state}",
+                "priced_amount": None, "candidates": []}
+    return (state or {}).get("decision") or {}
+
+
 # -------- main --------
 if __name__ == "__main__":
     # 1) เตรียม DB และ seed คลัง
@@ -73,7 +199,7 @@ if __name__ == "__main__":
     )
 
     # 3) รันกราฟ
-    app = build()
+    app = get_app()
     res = app.invoke({"offer": offer})
 
     # 3.1 บันทึกผลลง DB (sqlite/mongo ตาม DB_BACKEND)
@@ -87,8 +213,10 @@ if __name__ == "__main__":
             "jitter": os.getenv("BID_JITTER", "0.0"),
         },
     }
+    # เขียนผ่าน buffered writer (ไม่บล็อก); flush ก่อนจบโปรเซสผ่าน atexit/close()
+    writer = get_decision_writer()
     try:
-        save_decision_result(offer.model_dump(), res.get("decision", {}), meta)
+        writer.submit(offer.model_dump(), res.get("decision", {}), meta)
     except Exception as e:
         # กันล้ม: ถ้าบันทึกไม่สำเร็จให้แค่เตือนใน stdout
         print(f"[WARN] save_decision_result failed: {e}")
@@ -125,4 +253,6 @@ if __name__ == "__main__":
             round(float(winner.get("score", 0.0)), 3),
         )
     else:
-        print("NO CANDIDATES (LLM didn’t produce any).")
\ No newline at end of file
+        print("NO CANDIDATES (LLM didn’t produce any).")
+
+    writer.close()
\ No newline at end of file
@@ -0,0 +1,353 @@
+# core/archive.py
+"""
+ย้าย decision_runs / case_runs เก่าออกจาก hot table ไปเป็นไฟล์ Parquet (zstd)
+
+โครงไฟล์ (partition รายวันตาม ts แบบ UTC):
+  {ARCHIVE_DIR}/decisions/day=YYYY-MM-DD/*.parquet   1 แถวต่อ decision (offer + winner)
+  {ARCHIVE_DIR}/candidates/day=YYYY-MM-DD/*.parquet  1 แถวต่อ candidate
+  {ARCHIVE_DIR}/cases/day=YYYY-MM-DD/*.parquet       1 แถวต่อ row ของ case_runs
+
+get_recent_decisions() ใน core/db.py จะอ่านไฟล์เหล่านี้ต่อท้ายให้เอง
+decision_key / run_key = key ของแถวต้นทาง (id ของ sqlite / _id ของ mongo):
+- ตอนเขียน: key ที่อยู่ใน archive แล้วไม่เขียนซ้ำ (รันซ้ำหลัง --keep-hot หรือหลังล้มก่อนลบ)
+- ตอนอ่าน: decision ที่ key ยังอยู่ใน hot table ถูกข้าม (hot เป็นตัวจริง ไม่นับซ้ำ) — เช็คเฉพาะแถว archive
+  ที่ ts ≥ ts ต่ำสุดของ hot (1 query); หลังย้ายแบบลบปกติช่วงนี้ว่าง จึงไม่มี lookup ราย key เลย
+  (ซ้อนกันได้เฉพาะหลัง --keep-hot / ล้มระหว่างเขียนกับลบ)
+ต้องมี pyarrow (pandas ใช้เป็น engine สำหรับ parquet)
+"""
+import os, json, time
+import datetime as dt
+from typing import List, Dict, Any, Optional
+
+ARCHIVE_DIR         = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS  = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+ARCHIVE_BATCH       = int(os.getenv("ARCHIVE_BATCH", "5000"))
+
+# ---- typed columns ----
+_DECISION_COLS = {
+    "decision_key": "string", "ts": "int64",
+    "offer_id": "string", "customer_id": "string", "origin_address": "string",
+    "origin_lat": "float64", "origin_lng": "float64", "volume_cbm": "float64",
+    "start_date": "string", "duration_days": "float64",
+    "accept": "bool", "chosen_warehouse": "string", "priced_amount": "float64",
+    "reason_type": "string", "exploration": "bool", "n_candidates": "int64",
+    "winner_km": "float64", "winner_minutes": "float64", "winner_price": "float64",
+    "winner_cost": "float64", "winner_profit": "float64", "winner_margin": "float64",
+    "winner_utilization": "float64", "winner_score": "float64",
+    "meta_json": "string",
+}
+_CANDIDATE_COLS = {
+    "decision_key": "string", "ts": "int64", "rank": "int64",
+    "warehouse_id": "string", "km": "float64", "minutes": "float64",
+    "price_amount": "float64", "cost": "float64", "profit": "float64",
+    "margin": "float64", "utilization": "float64", "available_cbm": "float64",
+    "score": "float64", "is_winner": "bool",
+}
+_CASE_COLS = {
+    "run_key": "string", "ts": "int64", "idx": "int64", "offer_id": "string",
+    "origin": "string", "vol": "float64", "exp_accept": "string", "act_accept": "string",
+    "chosen": "string", "price": "float64", "cost": "float64", "profit": "float64",
+    "margin": "float64", "cands": "int64", "reason_type": "string", "meta_json": "string",
+}
+
+
+def _pd():
+    import pandas as pd
+    return pd
+
+def _day(ts: int) -> str:
+    return dt.datetime.fromtimestamp(int(ts), tz=dt.timezone.utc).strftime("%Y-%m-%d")
+
+def _num(v) -> Optional[float]:
+    try:
+        return None if v is None else float(v)
+    except Exception:
+        return None
+
+def _str(v) -> Optional[str]:
+    return None if v is None else str(v)
+
+def _dataset(kind: str, base: Optional[str] = None) -> str:
+    return os.path.join(base or ARCHIVE_DIR, kind)
+
+def archive_available(base: Optional[str] = None) -> bool:
+    """มี archive ของ decisions อยู่หรือไม่ (เช็คแค่ไดเรกทอรี ไม่แตะไฟล์)"""
+    p = _dataset("decisions", base)
+    return os.path.isdir(p) and any(n.startswith("day=") for n in os.listdir(p))
+
+
+# ---------------- flatten ----------------
+def _reason_of(dec: Dict[str, Any]) -> Dict[str, Any]:
+    r = dec.get("reason")
+    return r if isinstance(r, dict) else {"type": _str(r)}
+
+def _flatten_decision(row: Dict[str, Any]):
+    offer = row.get("offer") or {}
+    dec = row.get("decision") or {}
+    cands = [c for c in (dec.get("candidates") or []) if isinstance(c, dict)]
+    chosen = dec.get("chosen_warehouse")
+    winner = next((c for c in cands if chosen and c.get("warehouse_id") == chosen), {})
+    wrt = winner.get("route") or {}
+    reason = _reason_of(dec)
+
+    d = {
+        "decision_key": str(row["key"]), "ts": int(row["ts"]),
+        "offer_id": _str(offer.get("offer_id")), "customer_id": _str(offer.get("customer_id")),
+        "origin_address": _str(offer.get("origin_address")),
+        "origin_lat": _num(offer.get("origin_lat")), "origin_lng": _num(offer.get("origin_lng")),
+        "volume_cbm": _num(offer.get("volume_cbm")), "start_date": _str(offer.get("start_date")),
+        "duration_days": _num(offer.get("duration_days")),
+        "accept": bool(dec.get("accept")), "chosen_warehouse": _str(chosen),
+        "priced_amount": _num(dec.get("priced_amount")),
+        "reason_type": _str(reason.get("type")), "exploration": bool(reason.get("exploration", False)),
+        "n_candidates": len(cands),
+        "winner_km": _num(wrt.get("km")), "winner_minutes": _num(wrt.get("minutes")),
+        "winner_price": _num(winner.get("price_amount")), "winner_cost": _num(winner.get("cost")),
+        "winner_profit": _num(winner.get("profit")), "winner_margin": _num(winner.get("margin")),
+        "winner_utilization": _num(winner.get("utilization")), "winner_score": _num(winner.get("score")),
+        "meta_json": json.dumps(row.get("meta") or {}, ensure_ascii=False),
+    }
+    out_c = []
+    for rank, c in enumerate(cands):
+        rt = c.get("route") or {}
+        out_c.append({
+            "decision_key": d["decision_key"], "ts": d["ts"], "rank": rank,
+            "warehouse_id": _str(c.get("warehouse_id")),
+            "km": _num(rt.get("km")), "minutes": _num(rt.get("minutes")),
+            "price_amount": _num(c.get("price_amount")), "cost": _num(c.get("cost")),
+            "profit": _num(c.get("profit")), "margin": _num(c.get("margin")),
+            "utilization": _num(c.get("utilization")), "available_cbm": _num(c.get("available_cbm")),
+            "score": _num(c.get("score")), "is_winner": bool(chosen and c.get("warehouse_id") == chosen),
+        })
+    return d, out_c
+
+def _flatten_case_run(run: Dict[str, Any]) -> List[Dict[str, Any]]:
+    out = []
+    meta_j = json.dumps(run.get("meta") or {}, ensure_ascii=False)
+    for r in run.get("rows") or []:
+        if not isinstance(r, dict):
+            continue
+        reason = r.get("reason")
+        out.append({
+            "run_key": str(run["key"]), "ts": int(run["ts"]),
+            "idx": int(r.get("idx") or 0), "offer_id": _str(r.get("offer_id")),
+            "origin": _str(r.get("origin")), "vol": _num(r.get("vol")),
+            "exp_accept": _str(r.get("exp_accept")), "act_accept": _str(r.get("act_accept")),
+            "chosen": _str(r.get("chosen")), "price": _num(r.get("price")),
+            "cost": _num(r.get("cost")), "profit": _num(r.get("profit")),
+            "margin": _num(r.get("margin")), "cands": int(r.get("cands") or 0),
+            "reason_type": _str(reason.get("type") if isinstance(reason, dict) else reason),
+            "meta_json": meta_j,
+        })
+    return out
+
+def _write(kind: str, records: List[Dict[str, Any]], cols: Dict[str, str], base: Optional[str]):
+    if not records:
+        return 0
+    pd = _pd()
+    df = pd.DataFrame.from_records(records, columns=list(cols)).astype(cols)
+    df["day"] = [_day(t) for t in df["ts"]]
+    df.to_parquet(_dataset(kind, base), engine="pyarrow", index=False,
+                  partition_cols=["day"], compression=ARCHIVE_COMPRESSION)
+    return len(df)
+
+def _archived_keys(kind: str, col: str, recs: List[Dict[str, Any]], base: Optional[str]) -> set:
+    """key ใน recs ที่เคยเขียนลง archive แล้ว (อ่านเฉพาะคอลัมน์ key ของ partition วันที่เกี่ยวข้อง)"""
+    if not recs or not os.path.isdir(_dataset(kind, base)):
+        return set()
+    keys = sorted({r[col] for r in recs})
+    days = [_day(r["ts"]) for r in recs]
+    df = _read(kind, [("day", ">=", min(days)), ("day", "<=", max(days)), (col, "in", keys)], [col], base)
+    return set(df[col].astype(str))
+
+
+# ---------------- archive (move) ----------------
+def archive_decisions(older_than_days: int = ARCHIVE_AFTER_DAYS, *, base: Optional[str] = None,
+                      delete: bool = True, batch: int = ARCHIVE_BATCH) -> Dict[str, int]:
+    """
+    ย้าย decision_runs ที่ ts < now - older_than_days ไปเป็น parquet แล้วลบออกจาก hot table
+    เขียนไฟล์ก่อนค่อยลบ (ถ้าล้มระหว่างทาง รอบหน้าข้าม key ที่เขียนไปแล้วแล้วลบต่อ ไม่หาย ไม่ซ้ำ)
+    delete=False = copy อย่างเดียว (ตอนอ่าน แถวที่ยังอยู่ใน hot table ถูกข้ามฝั่ง archive)
+    """
+    from core.db import fetch_old_decision_runs, delete_decision_runs
+    cutoff = int(time.time()) - int(older_than_days) * 24 * 3600
+    stats = {"decisions": 0, "candidates": 0, "deleted": 0}
+    last_key = None
+    while True:
+        rows = fetch_old_decision_runs(cutoff, limit=batch, after_key=last_key)
+        if not rows:
+            break
+        decs, cands = [], []
+        for r in rows:
+            d, cs = _flatten_decision(r)
+            decs.append(d); cands.extend(cs)
+        done = _archived_keys("decisions", "decision_key", decs, base)
+        if done:
+            decs = [d for d in decs if d["decision_key"] not in done]
+            cands = [c for c in cands if c["decision_key"] not in done]
+        stats["decisions"] += _write("decisions", decs, _DECISION_COLS, base)
+        stats["candidates"] += _write("candidates", cands, _CANDIDATE_COLS, base)
+        if delete:
+            stats["deleted"] += delete_decision_runs([r["key"] for r in rows])
+        last_key = rows[-1]["key"]
+        if len(rows) < batch:
+            break
+    return stats
+
+def archive_case_runs(older_than_days: int = ARCHIVE_AFTER_DAYS, *, base: Optional[str] = None,
+                      delete: bool = True, batch: int = 500) -> Dict[str, int]:
+    from core.db import fetch_old_case_runs, delete_case_runs
+    cutoff = int(time.time()) - int(older_than_days) * 24 * 3600
+    stats = {"case_runs": 0, "rows": 0, "deleted": 0}
+    last_key = None
+    while True:
+        runs = fetch_old_case_runs(cutoff, limit=batch, after_key=last_key)
+        if not runs:
+            break
+        recs = []
+        for run in runs:
+            recs.extend(_flatten_case_run(run))
+        done = _archived_keys("cases", "run_key", recs, base)
+        recs = [r for r in recs if r["run_key"] not in done]
+        stats["case_runs"] += len(runs)
+        stats["rows"] += _write("cases", recs, _CASE_COLS, base)
+        if delete:
+            stats["deleted"] += delete_case_runs([r["key"] for r in runs])
+        last_key = runs[-1]["key"]
+        if len(runs) < batch:
+            break
+    return stats
+
+
+# ---------------- read (predicate pushdown) ----------------
+def _filters(since_ts, until_ts, extra=None):
+    f = []
+    if since_ts is not None:
+        f += [("day", ">=", _day(since_ts)), ("ts", ">=", int(since_ts))]
+    if until_ts is not None:
+        f += [("day", "<=", _day(until_ts)), ("ts", "<=", int(until_ts))]
+    return f + (extra or [])
+
+def _read(kind: str, filters, columns=None, base: Optional[str] = None):
+    pd = _pd()
+    path = _dataset(kind, base)
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=columns or [])
+    return pd.read_parquet(path, engine="pyarrow", columns=columns, filters=filters or None)
+
+def read_archived_frames(since_ts: Optional[int] = None, until_ts: Optional[int] = None,
+                         warehouse_id: Optional[str] = None, base: Optional[str] = None):
+    """
+    คืน (decisions_df, candidates_df) สำหรับงาน analytics แบบ columnar
+    filter ts/day/warehouse ถูกส่งลงไปให้ pyarrow ตัด partition + row group
+    decision ที่ key ยังอยู่ใน hot table ถูกตัดออก (get_recent_decisions อ่านจาก hot อยู่แล้ว)
+    """
+    extra = [("chosen_warehouse", "==", warehouse_id)] if warehouse_id else None
+    decs = _read("decisions", _filters(since_ts, until_ts, extra), base=base)
+    cands = _read("candidates", _filters(since_ts, until_ts), base=base)
+    if not len(decs):
+        return decs, cands.iloc[0:0]
+    # archive ที่เขียนก่อนมีการกันซ้ำอาจมี key เดิมหลายแถว
+    decs = decs.drop_duplicates("decision_key")
+    from core.db import existing_decision_keys, hot_decision_min_ts
+    lo = hot_decision_min_ts()
+    overlap = decs["ts"] >= lo if lo is not None else None
+    if overlap is not None and overlap.any():
+        hot = existing_decision_keys(decs.loc[overlap, "decision_key"].astype(str).tolist())
+        if hot:
+            decs = decs[~decs["decision_key"].isin(hot)]
+    if len(cands):
+        cands = cands.drop_duplicates(["decision_key", "rank"])
+        cands = cands[cands["decision_key"].isin(set(decs["decision_key"]))]
+    return decs, cands
+
+def _none(v):
+    # NaN / <NA> -> None
+    try:
+        return None if v is None or v != v else v
+    except TypeError:
+        return None if v is _pd().NA else v
+
+def read_archived_decisions(since_ts: Optional[int] = None, until_ts: Optional[int] = None,
+                            warehouse_id: Optional[str] = None,
+                            base: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    ประกอบกลับเป็นรูปเดียวกับ get_recent_decisions(): {"ts","offer","decision","meta"} เรียงตาม ts
+    (reason เหลือแค่ type/exploration; candidates มีเฉพาะ field ที่เก็บเป็นคอลัมน์)
+    """
+    decs, cands = read_archived_frames(since_ts, until_ts, warehouse_id, base)
+    if not len(decs):
+        return []
+    by_key: Dict[str, List[Dict[str, Any]]] = {}
+    if len(cands):
+        cands = cands.sort_values(["decision_key", "rank"])
+        for c in cands.to_dict("records"):
+            by_key.setdefault(c["decision_key"], []).append({
+                "warehouse_id": _none(c["warehouse_id"]),
+                "route": {"km": _none(c["km"]), "minutes": _none(c["minutes"])},
+                "price_amount": _none(c["price_amount"]), "cost": _none(c["cost"]),
+                "profit": _none(c["profit"]), "margin": _none(c["margin"]),
+                "utilization": _none(c["utilization"]), "available_cbm": _none(c["available_cbm"]),
+                "score": _none(c["score"]),
+            })
+    out = []
+    for d in decs.sort_values(["ts", "decision_key"]).to_dict("records"):
+        offer = {k: _none(d[k]) for k in ("offer_id", "customer_id", "origin_address", "origin_lat",
+                                          "origin_lng", "volume_cbm", "start_date", "duration_days")}
+        out.append({
+            "ts": int(d["ts"]),
+            "offer": offer,
+            "decision": {
+                "accept": bool(d["accept"]),
+                "chosen_warehouse": _none(d["chosen_warehouse"]),
+                "priced_amount": _none(d["priced_amount"]),
+                "reason": {"type": _none(d["reason_type"]), "exploration": bool(d["exploration"])},
+                "candidates": by_key.get(d["decision_key"], []),
+            },
+            "meta": json.loads(_none(d["meta_json"]) or "{}"),
+        })
+    return out
+
+def read_archived_stat_partials(since_ts: Optional[int] = None, until_ts: Optional[int] = None,
+                                base: Optional[str] = None):
+    """
+    partial ของ compute_warehouse_stats จาก archive (groupby ใน pandas ไม่ต้องประกอบ dict ทีละแถว)
+    คืน (agg, utils): agg = {wid: {wins,bids,profit_sum,margin_sum,price_sum}}
+                      utils = [(wid, util), ...] ของ candidate ผู้ชนะ เรียงแบบเดียวกับ read_archived_decisions
+    """
+    decs, cands = read_archived_frames(since_ts, until_ts, None, base)
+    agg: Dict[str, Dict[str, float]] = {}
+    utils: List[tuple] = []
+    if not len(decs):
+        return agg, utils
+
+    def slot(wid):
+        return agg.setdefault(wid, {"wins": 0, "bids": 0, "profit_sum": 0.0,
+                                    "margin_sum": 0.0, "price_sum": 0.0})
+
+    if len(cands):
+        cands = cands[cands["warehouse_id"].notna() & (cands["warehouse_id"] != "")]
+        cands = cands.merge(decs[["decision_key", "chosen_warehouse"]], on="decision_key", how="inner")
+        sums = (cands.fillna({"profit": 0.0, "margin": 0.0, "price_amount": 0.0})
+                     .groupby("warehouse_id", sort=False)
+                     .agg(bids=("decision_key", "size"), profit_sum=("profit", "sum"),
+                          margin_sum=("margin", "sum"), price_sum=("price_amount", "sum")))
+        for wid, s in sums.iterrows():
+            a = slot(str(wid))
+            a["bids"] += int(s["bids"])
+            a["profit_sum"] += float(s["profit_sum"]); a["margin_sum"] += float(s["margin_sum"])
+            a["price_sum"] += float(s["price_sum"])
+        won = cands[cands["warehouse_id"] == cands["chosen_warehouse"]]
+        won = won.sort_values(["ts", "decision_key", "rank"])
+        utils = [(str(w), float(_none(u) or 0.0))
+                 for w, u in zip(won["warehouse_id"], won["utilization"])]
+
+    chosen = decs["chosen_warehouse"]
+    for wid, n in chosen[chosen.notna() & (chosen != "")].value_counts(sort=False).items():
+        slot(str(wid))["wins"] += int(n)
+    return agg, utils
+
+def read_archived_case_rows(since_ts: Optional[int] = None, until_ts: Optional[int] = None,
+                            base: Optional[str] = None):
+    return _read("cases", _filters(since_ts, until_ts), base=base)
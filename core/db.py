@@ -1,5 +1,5 @@
 # core/db.py
-import os, time, json
+import os, time, json, uuid, hashlib
 from typing import List, Dict, Optional, Any
 
 BACKEND = os.getenv("DB_BACKEND", "sqlite").lower()
@@ -7,6 +7,9 @@ BACKEND = os.getenv("DB_BACKEND", "sqlite").lower()
 # -----------------------------
 # Common helpers (shared API)
 # -----------------------------
+# คอลัมน์ของ candidate_features (นอกเหนือจาก key + pos)
+FEATURE_FIELDS = ("km", "minutes", "cost", "raw_price", "utilization", "available_cbm", "spec_score", "sla_fit")
+
 def capacity_available(wh_row: dict) -> float:
     try:
         cap = float(wh_row.get("capacity_cbm", 0.0))
@@ -15,6 +18,26 @@ def capacity_available(wh_row: dict) -> float:
     except Exception:
         return 0.0
 
+def offer_payload_hash(offer: Dict[str, Any]) -> str:
+    """hash ของ payload offer (JSON เรียง key, ตัด field ที่เป็น None) — ใช้ตรวจว่า offer_id เดิมส่งมาซ้ำแบบเดิมหรือไม่"""
+    body = {k: v for k, v in (offer or {}).items() if v is not None}
+    raw = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _offer_key(offer: Dict[str, Any]) -> tuple:
+    oid = (offer or {}).get("offer_id")
+    return (None if oid is None else str(oid)), offer_payload_hash(offer)
+
+def _reservation_id(offer_id: str, warehouse_id: str) -> str:
+    # suffix สุ่ม: offer เดิม hold คลังเดิมซ้ำ (retry / เคสทดสอบ) ก็ได้ id ไม่ชนกัน
+    return f"RESV-{str(offer_id)[:8]}-{warehouse_id}-{uuid.uuid4().hex[:8]}"
+
+def _decision_item(item: tuple) -> tuple:
+    """(offer, decision, meta[, ts]) -> (offer, decision, meta, ts)  ts ว่าง = ตอนนี้"""
+    offer, decision, meta, *rest = item
+    ts = rest[0] if rest and rest[0] is not None else time.time()
+    return offer, decision, meta, int(ts)
+
 
 # =========================
 # SQLite backend
@@ -46,8 +69,14 @@ if BACKEND == "sqlite":
         CREATE TABLE IF NOT EXISTS distance_cache(
             key TEXT PRIMARY KEY,
             a_lat REAL, a_lng REAL, b_lat REAL, b_lng REAL,
-            km REAL, minutes REAL, expires_at INTEGER
+            km REAL, minutes REAL, expires_at INTEGER,
+            snap_err_m REAL, fetched_at INTEGER, source TEXT
         )""")
+        # DB เก่าที่สร้างก่อนมีคอลัมน์เหล่านี้
+        cols = {r[1] for r in cur.execute("PRAGMA table_info(distance_cache)").fetchall()}
+        for col, typ in (("snap_err_m", "REAL"), ("fetched_at", "INTEGER"), ("source", "TEXT")):
+            if col not in cols:
+                cur.execute(f"ALTER TABLE distance_cache ADD COLUMN {col} {typ}")
         # decision runs (app.py)
         cur.execute("""
         CREATE TABLE IF NOT EXISTS decision_runs(
@@ -55,8 +84,14 @@ if BACKEND == "sqlite":
             ts INTEGER,
             offer_json TEXT,
             decision_json TEXT,
-            meta_json TEXT
+            meta_json TEXT,
+            offer_id TEXT,
+            payload_hash TEXT
         )""")
+        cols = {r[1] for r in cur.execute("PRAGMA table_info(decision_runs)").fetchall()}
+        for col in ("offer_id", "payload_hash"):
+            if col not in cols:
+                cur.execute(f"ALTER TABLE decision_runs ADD COLUMN {col} TEXT")
         # case runs (inspect_cases.py)
         cur.execute("""
         CREATE TABLE IF NOT EXISTS case_runs(
@@ -65,6 +100,33 @@ if BACKEND == "sqlite":
             rows_json TEXT,
             meta_json TEXT
         )""")
+        # candidate features (core/feature_store): route/ราคา/spec ต่อ (offer, คลัง, snapshot)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS candidate_features(
+            offer_id TEXT, warehouse_id TEXT, snapshot_version TEXT, pos INTEGER,
+            km REAL, minutes REAL, cost REAL, raw_price REAL, utilization REAL,
+            available_cbm REAL, spec_score REAL, sla_fit REAL, created_at INTEGER,
+            PRIMARY KEY (offer_id, warehouse_id, snapshot_version)
+        )""")
+        # reservation ledger: hold ทุกครั้งมีแถว (HELD -> RELEASED) ให้ release อ้าง reservation_id ได้
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS reservations(
+            reservation_id TEXT PRIMARY KEY,
+            warehouse_id TEXT,
+            offer_id TEXT,
+            volume_cbm REAL,
+            status TEXT,
+            created_at INTEGER,
+            released_at INTEGER
+        )""")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_reservations_offer ON reservations(offer_id, warehouse_id, status)")
+        # history อ่าน/ย้ายไป archive ตามช่วง ts
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_decision_runs_ts ON decision_runs(ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_case_runs_ts ON case_runs(ts)")
+        # idempotency lookup (core/idempotency): decision ล่าสุดของ offer_id
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_decision_runs_offer ON decision_runs(offer_id, ts)")
+        # prewarm job หา entry ที่ใกล้หมดอายุ
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_distance_cache_exp ON distance_cache(expires_at)")
         con.commit(); con.close()
 
     def seed_warehouses():
@@ -103,19 +165,54 @@ if BACKEND == "sqlite":
         return out
 
     def try_hold_capacity(warehouse_id: str, offer_id: str, volume_cbm: float) -> Optional[str]:
+        # conditional UPDATE คำสั่งเดียว (atomic) — ไม่มีช่องว่างระหว่าง SELECT/UPDATE ให้ hold ซ้อนกันเกิน capacity
+        # แถว reservations ลงใน transaction เดียวกัน
+        rid = _reservation_id(offer_id, warehouse_id)
         con = get_conn(); cur = con.cursor()
-        row = cur.execute("""SELECT capacity_cbm, used_cbm FROM warehouses WHERE warehouse_id=?""",
-                          (warehouse_id,)).fetchone()
-        if not row:
-            con.close(); return None
-        cap, used = float(row[0]), float(row[1])
-        if used + volume_cbm > cap:
-            con.close(); return None
-        new_used = used + volume_cbm
-        cur.execute("""UPDATE warehouses SET used_cbm=? WHERE warehouse_id=?""",
-                    (new_used, warehouse_id))
+        cur.execute("""UPDATE warehouses SET used_cbm = used_cbm + ?
+                       WHERE warehouse_id=? AND used_cbm + ? <= capacity_cbm""",
+                    (float(volume_cbm), warehouse_id, float(volume_cbm)))
+        ok = cur.rowcount == 1
+        if ok:
+            cur.execute("""INSERT INTO reservations(reservation_id, warehouse_id, offer_id, volume_cbm, status, created_at)
+                           VALUES (?,?,?,?,'HELD',?)""",
+                        (rid, warehouse_id, str(offer_id), float(volume_cbm), int(time.time())))
         con.commit(); con.close()
-        return f"RESV-{offer_id[:8]}-{warehouse_id}"
+        return rid if ok else None
+
+    def release_reservation(reservation_id: str) -> Optional[Dict[str, Any]]:
+        """คืน capacity ของ reservation ที่ยัง HELD (ได้ครั้งเดียว); ไม่รู้จัก / คืนไปแล้ว = None"""
+        con = get_conn(); cur = con.cursor()
+        cur.execute("""UPDATE reservations SET status='RELEASED', released_at=?
+                       WHERE reservation_id=? AND status='HELD'""", (int(time.time()), str(reservation_id)))
+        if cur.rowcount != 1:
+            con.rollback(); con.close()
+            return None
+        wid, vol = cur.execute("SELECT warehouse_id, volume_cbm FROM reservations WHERE reservation_id=?",
+                               (str(reservation_id),)).fetchone()
+        cur.execute("UPDATE warehouses SET used_cbm = MAX(0, used_cbm - ?) WHERE warehouse_id=?", (float(vol), wid))
+        con.commit(); con.close()
+        return {"reservation_id": str(reservation_id), "warehouse_id": wid, "volume_cbm": float(vol)}
+
+    def find_held_reservation(offer_id: str, warehouse_id: str) -> Optional[Dict[str, Any]]:
+        """hold ล่าสุดที่ยัง HELD ของ (offer_id, warehouse_id) — POST /reserve ซ้ำคืนตัวนี้แทน hold ใหม่"""
+        con = get_conn(); cur = con.cursor()
+        row = cur.execute("""SELECT reservation_id, volume_cbm FROM reservations
+                             WHERE offer_id=? AND warehouse_id=? AND status='HELD'
+                             ORDER BY created_at DESC LIMIT 1""", (str(offer_id), str(warehouse_id))).fetchone()
+        con.close()
+        if row is None:
+            return None
+        return {"reservation_id": row[0], "warehouse_id": str(warehouse_id), "volume_cbm": float(row[1])}
+
+    def release_capacity(warehouse_id: str, volume_cbm: float) -> bool:
+        """คืน capacity ที่ hold ไว้ (used_cbm ไม่ต่ำกว่า 0)"""
+        con = get_conn(); cur = con.cursor()
+        cur.execute("""UPDATE warehouses SET used_cbm = MAX(0, used_cbm - ?) WHERE warehouse_id=?""",
+                    (float(volume_cbm), warehouse_id))
+        ok = cur.rowcount == 1
+        con.commit(); con.close()
+        return ok
 
     # ---- distance cache (sqlite) ----
     def _sqlite_distance_get(key: str):
@@ -131,25 +228,126 @@ if BACKEND == "sqlite":
         return (km, minutes)
 
     def _sqlite_distance_put(key: str, a_lat, a_lng, b_lat, b_lng,
-                             km: float, minutes: float, ttl_sec: int = 86400):
+                             km: float, minutes: float, ttl_sec: int = 86400, snap_err_m: float = 0.0,
+                             source: Optional[str] = None):
+        now = int(time.time())
         con = get_conn(); cur = con.cursor()
         cur.execute("""INSERT OR REPLACE INTO distance_cache
-                       (key,a_lat,a_lng,b_lat,b_lng,km,minutes,expires_at)
-                       VALUES (?,?,?,?,?,?,?,?)""",
+                       (key,a_lat,a_lng,b_lat,b_lng,km,minutes,expires_at,snap_err_m,fetched_at,source)
+                       VALUES (?,?,?,?,?,?,?,?,?,?,?)""",
                     (key, float(a_lat), float(a_lng), float(b_lat), float(b_lng),
-                     float(km), float(minutes), int(time.time()) + int(ttl_sec)))
+                     float(km), float(minutes), now + int(ttl_sec), float(snap_err_m or 0.0), now, source))
         con.commit(); con.close()
 
+    def _sqlite_distance_get_many(keys: List[str]) -> Dict[str, tuple]:
+        out: Dict[str, tuple] = {}
+        if not keys:
+            return out
+        now = int(time.time())
+        con = get_conn(); cur = con.cursor()
+        uniq = list(dict.fromkeys(keys))
+        for i in range(0, len(uniq), 500):   # กันชน SQLITE_MAX_VARIABLE_NUMBER
+            chunk = uniq[i:i+500]
+            rows = cur.execute(f"""SELECT key, km, minutes, expires_at FROM distance_cache
+                                   WHERE key IN ({",".join("?"*len(chunk))})""", chunk).fetchall()
+            for key, km, minutes, exp in rows:
+                if exp and int(exp) < now:
+                    continue
+                out[key] = (float(km), float(minutes))
+        con.close()
+        return out
+
+    def _sqlite_distance_put_many(entries: List[tuple], ttl_sec: int = 86400) -> int:
+        if not entries:
+            return 0
+        now = int(time.time())
+        exp = now + int(ttl_sec)
+        con = get_conn(); cur = con.cursor()
+        cur.executemany("""INSERT OR REPLACE INTO distance_cache
+                           (key,a_lat,a_lng,b_lat,b_lng,km,minutes,expires_at,snap_err_m,fetched_at,source)
+                           VALUES (?,?,?,?,?,?,?,?,?,?,?)""",
+                        [(k, float(a1), float(g1), float(a2), float(g2), float(km), float(mn), exp,
+                          float((rest or [0.0])[0] or 0.0), now, (rest[1:] or [None])[0])
+                         for (k, a1, g1, a2, g2, km, mn, *rest) in entries])
+        con.commit(); con.close()
+        return len(entries)
+
+    def _sqlite_distance_expiring(within_sec: int, limit: int = 10000) -> List[tuple]:
+        now = int(time.time())
+        con = get_conn(); cur = con.cursor()
+        rows = cur.execute("""SELECT key, a_lat, a_lng, b_lat, b_lng FROM distance_cache
+                              WHERE expires_at BETWEEN ? AND ? ORDER BY expires_at LIMIT ?""",
+                           (now, now + int(within_sec), int(limit))).fetchall()
+        con.close()
+        return [tuple(r) for r in rows]
+
+    def _sqlite_distance_samples(limit: int = 200000) -> List[tuple]:
+        con = get_conn(); cur = con.cursor()
+        rows = cur.execute("""SELECT a_lat, a_lng, b_lat, b_lng, km, minutes, fetched_at, source
+                              FROM distance_cache WHERE km IS NOT NULL AND minutes IS NOT NULL
+                              ORDER BY fetched_at DESC LIMIT ?""", (int(limit),)).fetchall()
+        con.close()
+        return [tuple(r) for r in rows]
+
+    # ---- candidate features (sqlite) ----
+    def _sqlite_features_put_many(rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        now = int(time.time())
+        con = get_conn(); cur = con.cursor()
+        cur.executemany(f"""INSERT OR REPLACE INTO candidate_features
+                            (offer_id,warehouse_id,snapshot_version,pos,{",".join(FEATURE_FIELDS)},created_at)
+                            VALUES ({",".join("?" * (5 + len(FEATURE_FIELDS)))})""",
+                        [(str(r["offer_id"]), r["warehouse_id"], r["snapshot_version"], int(r.get("pos") or 0),
+                          *(None if r.get(f) is None else float(r[f]) for f in FEATURE_FIELDS), now)
+                         for r in rows])
+        con.commit(); con.close()
+        return len(rows)
+
+    def _sqlite_features_get_many(snapshot_version: str, offer_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        uniq = list(dict.fromkeys(str(o) for o in offer_ids))
+        if not uniq:
+            return out
+        cols = ("offer_id", "warehouse_id", "pos") + FEATURE_FIELDS
+        con = get_conn(); cur = con.cursor()
+        for i in range(0, len(uniq), 500):
+            chunk = uniq[i:i+500]
+            rows = cur.execute(f"""SELECT {",".join(cols)} FROM candidate_features
+                                   WHERE snapshot_version=? AND offer_id IN ({",".join("?"*len(chunk))})
+                                   ORDER BY offer_id, pos""", [snapshot_version, *chunk]).fetchall()
+            for r in rows:
+                out.setdefault(r[0], []).append(dict(zip(cols, r)))
+        con.close()
+        return out
+
     # ---- persist results (sqlite) ----
     def save_decision_result(offer: Dict[str, Any], decision: Dict[str, Any], meta: Dict[str, Any] | None = None):
         con = get_conn(); cur = con.cursor()
-        cur.execute("""INSERT INTO decision_runs(ts, offer_json, decision_json, meta_json)
-                       VALUES (?,?,?,?)""",
+        cur.execute("""INSERT INTO decision_runs(ts, offer_json, decision_json, meta_json, offer_id, payload_hash)
+                       VALUES (?,?,?,?,?,?)""",
                     (int(time.time()),
                      json.dumps(offer, ensure_ascii=False),
                      json.dumps(decision, ensure_ascii=False),
-                     json.dumps(meta or {}, ensure_ascii=False)))
+                     json.dumps(meta or {}, ensure_ascii=False),
+                     *_offer_key(offer)))
+        con.commit(); con.close()
+
+    def save_decision_results(items: List[tuple]) -> int:
+        """บันทึกหลาย decision ใน transaction เดียว; items = [(offer, decision, meta[, ts]), ...]"""
+        if not items:
+            return 0
+        con = get_conn(); cur = con.cursor()
+        cur.executemany("""INSERT INTO decision_runs(ts, offer_json, decision_json, meta_json, offer_id, payload_hash)
+                           VALUES (?,?,?,?,?,?)""",
+                        [(ts,
+                          json.dumps(offer, ensure_ascii=False),
+                          json.dumps(decision, ensure_ascii=False),
+                          json.dumps(meta or {}, ensure_ascii=False),
+                          *_offer_key(offer))
+                         for (offer, decision, meta, ts) in map(_decision_item, items)])
         con.commit(); con.close()
+        return len(items)
 
     def save_case_runs(rows: List[Dict[str, Any]], meta: Dict[str, Any] | None = None):
         con = get_conn(); cur = con.cursor()
@@ -160,12 +358,102 @@ if BACKEND == "sqlite":
                      json.dumps(meta or {}, ensure_ascii=False)))
         con.commit(); con.close()
 
+    def save_case_runs_many(items: List[tuple]) -> int:
+        """items = [(rows, meta), ...]"""
+        if not items:
+            return 0
+        now = int(time.time())
+        con = get_conn(); cur = con.cursor()
+        cur.executemany("""INSERT INTO case_runs(ts, rows_json, meta_json) VALUES (?,?,?)""",
+                        [(now, json.dumps(rows, ensure_ascii=False), json.dumps(meta or {}, ensure_ascii=False))
+                         for (rows, meta) in items])
+        con.commit(); con.close()
+        return len(items)
+
+    # ---- archive support (sqlite) ----
+    def _loads(s: Optional[str], default):
+        try:
+            return json.loads(s) if s else default
+        except Exception:
+            return default
+
+    def fetch_old_decision_runs(cutoff_ts: int, limit: int = 5000,
+                                after_key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """ดึง decision_runs ที่เก่ากว่า cutoff_ts (เรียงตาม id, ต่อจาก after_key) ให้ core/archive.py"""
+        con = get_conn(); cur = con.cursor()
+        rows = cur.execute("""SELECT id, ts, offer_json, decision_json, meta_json FROM decision_runs
+                              WHERE ts < ? AND id > ? ORDER BY id ASC LIMIT ?""",
+                           (int(cutoff_ts), int(after_key or 0), int(limit))).fetchall()
+        con.close()
+        return [{"key": str(rid), "ts": int(ts or 0),
+                 "offer": _loads(o, {}), "decision": _loads(d, {}), "meta": _loads(m, {})}
+                for (rid, ts, o, d, m) in rows]
+
+    def _sqlite_find_decision(offer_id: str, since_ts: int) -> Optional[Dict[str, Any]]:
+        con = get_conn(); cur = con.cursor()
+        row = cur.execute("""SELECT ts, payload_hash, offer_json, decision_json, meta_json FROM decision_runs
+                             WHERE offer_id = ? AND ts >= ? ORDER BY ts DESC, id DESC LIMIT 1""",
+                          (str(offer_id), int(since_ts))).fetchone()
+        con.close()
+        if row is None:
+            return None
+        ts, h, o, d, m = row
+        return {"ts": int(ts or 0), "payload_hash": h,
+                "offer": _loads(o, {}), "decision": _loads(d, {}), "meta": _loads(m, {})}
+
+    def hot_decision_min_ts() -> Optional[int]:
+        """ts ต่ำสุดที่ยังอยู่ใน decision_runs (None = ว่าง) — แถว archive ที่เก่ากว่านี้ไม่มีทางซ้ำกับ hot"""
+        con = get_conn()
+        row = con.execute("SELECT MIN(ts) FROM decision_runs").fetchone()
+        con.close()
+        return None if row is None or row[0] is None else int(row[0])
+
+    def existing_decision_keys(keys: List[str]) -> set:
+        """key (id) ใน keys ที่ยังอยู่ใน decision_runs"""
+        ids = sorted({int(k) for k in keys})
+        con = get_conn(); cur = con.cursor()
+        out = set()
+        for i in range(0, len(ids), 900):
+            chunk = ids[i:i + 900]
+            out.update(str(r[0]) for r in cur.execute(
+                f"SELECT id FROM decision_runs WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        con.close()
+        return out
+
+    def delete_decision_runs(keys: List[str]) -> int:
+        if not keys:
+            return 0
+        con = get_conn(); cur = con.cursor()
+        cur.executemany("DELETE FROM decision_runs WHERE id=?", [(int(k),) for k in keys])
+        n = con.total_changes
+        con.commit(); con.close()
+        return n
+
+    def fetch_old_case_runs(cutoff_ts: int, limit: int = 500,
+                            after_key: Optional[str] = None) -> List[Dict[str, Any]]:
+        con = get_conn(); cur = con.cursor()
+        rows = cur.execute("""SELECT id, ts, rows_json, meta_json FROM case_runs
+                              WHERE ts < ? AND id > ? ORDER BY id ASC LIMIT ?""",
+                           (int(cutoff_ts), int(after_key or 0), int(limit))).fetchall()
+        con.close()
+        return [{"key": str(rid), "ts": int(ts or 0), "rows": _loads(r, []), "meta": _loads(m, {})}
+                for (rid, ts, r, m) in rows]
+
+    def delete_case_runs(keys: List[str]) -> int:
+        if not keys:
+            return 0
+        con = get_conn(); cur = con.cursor()
+        cur.executemany("DELETE FROM case_runs WHERE id=?", [(int(k),) for k in keys])
+        n = con.total_changes
+        con.commit(); con.close()
+        return n
+
 
 # =========================
 # MongoDB backend (Atlas)
 # =========================
 else:
-    from pymongo import MongoClient, ASCENDING
+    from pymongo import MongoClient, ASCENDING, DESCENDING, InsertOne, UpdateOne
     from pymongo.errors import PyMongoError, OperationFailure
     import datetime as dt
     try:
@@ -180,6 +468,48 @@ else:
     COLL_D    = os.getenv("MONGO_DISTANCE_COLL", "distance_cache")
     COLL_DEC  = os.getenv("MONGO_DECISION_COLL", "decision_runs")
     COLL_CASE = os.getenv("MONGO_CASE_COLL", "case_runs")
+    COLL_FEAT = os.getenv("MONGO_FEATURE_COLL", "candidate_features")
+    COLL_RESV = os.getenv("MONGO_RESERVATION_COLL", "reservations")
+    MONGO_BULK_CHUNK = int(os.getenv("MONGO_BULK_CHUNK", "1000"))  # ops / keys ต่อ round trip
+
+    # ---- connection tuning ----
+    try:
+        import zstandard  # noqa: F401  (pymongo ต้องมีแพ็กเกจนี้ถึงจะใช้ zstd ได้)
+        _DEFAULT_COMPRESSORS = "zstd,zlib"
+    except Exception:
+        _DEFAULT_COMPRESSORS = "zlib"
+    MONGO_MAX_POOL_SIZE   = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE   = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_MS     = os.getenv("MONGO_MAX_IDLE_MS")            # ว่าง = ค่า default ของ driver
+    MONGO_COMPRESSORS     = os.getenv("MONGO_COMPRESSORS", _DEFAULT_COMPRESSORS)  # "" = ปิด
+    MONGO_SERVER_SEL_MS   = int(os.getenv("MONGO_SERVER_SELECTION_MS", "30000"))
+    # history / analytics อ่านจาก secondary ได้ (ยอมให้ข้อมูลช้ากว่า primary เล็กน้อย)
+    MONGO_ANALYTICS_READ_PREF = os.getenv("MONGO_ANALYTICS_READ_PREF", "secondaryPreferred")
+
+    def _client_options() -> Dict[str, Any]:
+        opts: Dict[str, Any] = {
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+            "serverSelectionTimeoutMS": MONGO_SERVER_SEL_MS,
+        }
+        if MONGO_MAX_IDLE_MS:
+            opts["maxIdleTimeMS"] = int(MONGO_MAX_IDLE_MS)
+        if MONGO_COMPRESSORS.strip():
+            opts["compressors"] = MONGO_COMPRESSORS.strip()
+        return opts
+
+    def _read_pref(name: str):
+        from pymongo import read_preferences as rp
+        modes = {
+            "primary": rp.Primary, "primarypreferred": rp.PrimaryPreferred,
+            "secondary": rp.Secondary, "secondarypreferred": rp.SecondaryPreferred,
+            "nearest": rp.Nearest,
+        }
+        return modes.get((name or "").replace("_", "").lower(), rp.SecondaryPreferred)()
+
+    def _analytics(coll):
+        """collection เดิมแต่อ่านด้วย MONGO_ANALYTICS_READ_PREF"""
+        return coll.with_options(read_preference=_read_pref(MONGO_ANALYTICS_READ_PREF))
 
     _client: Optional[MongoClient] = None
     _db = None
@@ -193,7 +523,7 @@ else:
         if _client is None:
             if not MONGO_URI:
                 raise RuntimeError("MONGO_URI is not set")
-            kwargs = {}
+            kwargs = _client_options()
             if _TLS_CA:
                 kwargs["tlsCAFile"] = _TLS_CA
             kwargs.setdefault("serverSelectionTimeoutMS", 30000)
@@ -210,6 +540,7 @@ else:
         cw.create_index([("warehouse_id", ASCENDING)], unique=True)
         cw.create_index([("status", ASCENDING)])
         cd.create_index([("key", ASCENDING)], unique=True)
+        cd.create_index([("fetched_at", DESCENDING)])     # route_estimator อ่านใหม่สุดก่อน
         # --- TTL index on expires_at (พร้อมกันชน IndexOptionsConflict) ---
         try:
             cd.create_index("expires_at", expireAfterSeconds=0)
@@ -224,7 +555,11 @@ else:
                 raise
         # history collections
         cdec.create_index([("ts", ASCENDING)])
+        cdec.create_index([("offer_id", ASCENDING), ("ts", DESCENDING)])   # idempotency lookup
         ccase.create_index([("ts", ASCENDING)])
+        db[COLL_RESV].create_index([("offer_id", ASCENDING), ("warehouse_id", ASCENDING), ("status", ASCENDING)])
+        db[COLL_FEAT].create_index([("snapshot_version", ASCENDING), ("offer_id", ASCENDING),
+                                    ("warehouse_id", ASCENDING)], unique=True)
 
     def seed_warehouses():
         """
@@ -265,7 +600,7 @@ else:
         ))
 
     def try_hold_capacity(warehouse_id: str, offer_id: str, volume_cbm: float) -> Optional[str]:
-        _, _, cw, *_ = _ensure_client()
+        _, db, cw, *_ = _ensure_client()
         try:
             res = cw.update_one(
                 {
@@ -279,11 +614,52 @@ else:
                 },
                 {"$inc": {"used_cbm": float(volume_cbm)}}
             )
-            if res.modified_count == 1:
-                return f"RESV-{offer_id[:8]}-{warehouse_id}"
+            if res.modified_count != 1:
+                return None
+        except PyMongoError:
             return None
+        rid = _reservation_id(offer_id, warehouse_id)
+        try:
+            db[COLL_RESV].insert_one({"_id": rid, "warehouse_id": warehouse_id, "offer_id": str(offer_id),
+                                      "volume_cbm": float(volume_cbm), "status": "HELD",
+                                      "created_at": int(time.time())})
         except PyMongoError:
+            # ไม่มีแถวใน ledger = release ไม่ได้ -> คืน capacity ทันทีแล้วถือว่า hold ไม่ผ่าน
+            release_capacity(warehouse_id, volume_cbm)
             return None
+        return rid
+
+    def release_reservation(reservation_id: str) -> Optional[Dict[str, Any]]:
+        """คืน capacity ของ reservation ที่ยัง HELD (ได้ครั้งเดียว); ไม่รู้จัก / คืนไปแล้ว = None"""
+        _, db, *_ = _ensure_client()
+        d = db[COLL_RESV].find_one_and_update({"_id": str(reservation_id), "status": "HELD"},
+                                              {"$set": {"status": "RELEASED", "released_at": int(time.time())}})
+        if d is None:
+            return None
+        release_capacity(d["warehouse_id"], d["volume_cbm"])
+        return {"reservation_id": str(reservation_id), "warehouse_id": d["warehouse_id"],
+                "volume_cbm": float(d["volume_cbm"])}
+
+    def find_held_reservation(offer_id: str, warehouse_id: str) -> Optional[Dict[str, Any]]:
+        """hold ล่าสุดที่ยัง HELD ของ (offer_id, warehouse_id) — POST /reserve ซ้ำคืนตัวนี้แทน hold ใหม่"""
+        _, db, *_ = _ensure_client()
+        d = db[COLL_RESV].find_one({"offer_id": str(offer_id), "warehouse_id": str(warehouse_id), "status": "HELD"},
+                                   sort=[("created_at", DESCENDING)])
+        if d is None:
+            return None
+        return {"reservation_id": d["_id"], "warehouse_id": d["warehouse_id"], "volume_cbm": float(d["volume_cbm"])}
+
+    def release_capacity(warehouse_id: str, volume_cbm: float) -> bool:
+        """คืน capacity ที่ hold ไว้ (used_cbm ไม่ต่ำกว่า 0) — pipeline update ทำใน document เดียว atomic"""
+        _, _, cw, *_ = _ensure_client()
+        try:
+            res = cw.update_one(
+                {"warehouse_id": warehouse_id},
+                [{"$set": {"used_cbm": {"$max": [0.0, {"$subtract": ["$used_cbm", float(volume_cbm)]}]}}}]
+            )
+            return res.matched_count == 1
+        except PyMongoError:
+            return False
 
     # ---- distance cache (mongo) ----
     def _mongo_distance_get(key: str):
@@ -297,19 +673,106 @@ else:
         return float(doc.get("km", 0.0)), float(doc.get("minutes", 0.0))
 
     def _mongo_distance_put(key: str, a_lat, a_lng, b_lat, b_lng,
-                            km: float, minutes: float, ttl_sec: int = 86400):
+                            km: float, minutes: float, ttl_sec: int = 86400, snap_err_m: float = 0.0,
+                            source: Optional[str] = None):
         _, _, _, cd, *_ = _ensure_client()
+        now = dt.datetime.utcnow()
         cd.update_one(
             {"key": key},
             {"$set": {
                 "a_lat": float(a_lat), "a_lng": float(a_lng),
                 "b_lat": float(b_lat), "b_lng": float(b_lng),
                 "km": float(km), "minutes": float(minutes),
-                "expires_at": dt.datetime.utcnow() + dt.timedelta(seconds=int(ttl_sec)),
+                "expires_at": now + dt.timedelta(seconds=int(ttl_sec)),
+                "snap_err_m": float(snap_err_m or 0.0),
+                "fetched_at": now, "source": source,
             }},
             upsert=True
         )
 
+    def _chunks(seq: list, n: int):
+        for i in range(0, len(seq), n):
+            yield seq[i:i+n]
+
+    def _mongo_distance_get_many(keys: List[str]) -> Dict[str, tuple]:
+        """หลาย key ใน query เดียวต่อ chunk: find({"key": {"$in": [...]}})"""
+        _, _, _, cd, *_ = _ensure_client()
+        out: Dict[str, tuple] = {}
+        now = dt.datetime.utcnow()
+        for chunk in _chunks(list(dict.fromkeys(keys)), MONGO_BULK_CHUNK):
+            for doc in cd.find({"key": {"$in": chunk}},
+                               {"_id": 0, "key": 1, "km": 1, "minutes": 1, "expires_at": 1}):
+                exp = doc.get("expires_at")
+                if isinstance(exp, dt.datetime) and exp < now:
+                    continue
+                out[doc["key"]] = (float(doc.get("km", 0.0)), float(doc.get("minutes", 0.0)))
+        return out
+
+    def _mongo_distance_put_many(entries: List[tuple], ttl_sec: int = 86400) -> int:
+        """upsert หลาย entry ด้วย bulk_write(UpdateOne..., ordered=False)"""
+        if not entries:
+            return 0
+        _, _, _, cd, *_ = _ensure_client()
+        now = dt.datetime.utcnow()
+        exp = now + dt.timedelta(seconds=int(ttl_sec))
+        ops = [UpdateOne({"key": k}, {"$set": {
+                   "a_lat": float(a1), "a_lng": float(g1), "b_lat": float(a2), "b_lng": float(g2),
+                   "km": float(km), "minutes": float(mn), "expires_at": exp,
+                   "snap_err_m": float((rest or [0.0])[0] or 0.0),
+                   "fetched_at": now, "source": (rest[1:] or [None])[0]}}, upsert=True)
+               for (k, a1, g1, a2, g2, km, mn, *rest) in entries]
+        for chunk in _chunks(ops, MONGO_BULK_CHUNK):
+            cd.bulk_write(chunk, ordered=False)
+        return len(ops)
+
+    def _mongo_distance_expiring(within_sec: int, limit: int = 10000) -> List[tuple]:
+        """ยังไม่หมดอายุแต่จะหมดภายใน within_sec (ก่อน TTL index ลบทิ้ง)"""
+        _, _, _, cd, *_ = _ensure_client()
+        now = dt.datetime.utcnow()
+        cur = cd.find({"expires_at": {"$gte": now, "$lte": now + dt.timedelta(seconds=int(within_sec))}},
+                      {"_id": 0, "key": 1, "a_lat": 1, "a_lng": 1, "b_lat": 1, "b_lng": 1}
+                      ).sort("expires_at", ASCENDING).limit(int(limit))
+        return [(d["key"], d.get("a_lat"), d.get("a_lng"), d.get("b_lat"), d.get("b_lng")) for d in cur]
+
+    def _mongo_distance_samples(limit: int = 200000) -> List[tuple]:
+        _, _, _, cd, *_ = _ensure_client()
+        cur = cd.find({"km": {"$ne": None}, "minutes": {"$ne": None}},
+                      {"_id": 0, "a_lat": 1, "a_lng": 1, "b_lat": 1, "b_lng": 1, "km": 1, "minutes": 1,
+                       "fetched_at": 1, "source": 1}).sort("fetched_at", DESCENDING).limit(int(limit))
+        out = []
+        for d in cur:
+            f = d.get("fetched_at")
+            f = int(f.replace(tzinfo=dt.timezone.utc).timestamp()) if isinstance(f, dt.datetime) else None
+            out.append((d.get("a_lat"), d.get("a_lng"), d.get("b_lat"), d.get("b_lng"),
+                        d.get("km"), d.get("minutes"), f, d.get("source")))
+        return out
+
+    # ---- candidate features (mongo) ----
+    def _mongo_features_put_many(rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        _, db, *_ = _ensure_client()
+        now = dt.datetime.utcnow()
+        ops = [UpdateOne({"snapshot_version": r["snapshot_version"], "offer_id": str(r["offer_id"]),
+                          "warehouse_id": r["warehouse_id"]},
+                         {"$set": {"pos": int(r.get("pos") or 0), "created_at": now,
+                                   **{f: (None if r.get(f) is None else float(r[f])) for f in FEATURE_FIELDS}}},
+                         upsert=True) for r in rows]
+        for chunk in _chunks(ops, MONGO_BULK_CHUNK):
+            db[COLL_FEAT].bulk_write(chunk, ordered=False)
+        return len(ops)
+
+    def _mongo_features_get_many(snapshot_version: str, offer_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        _, db, *_ = _ensure_client()
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        proj = {"_id": 0, "offer_id": 1, "warehouse_id": 1, "pos": 1, **{f: 1 for f in FEATURE_FIELDS}}
+        for chunk in _chunks(list(dict.fromkeys(str(o) for o in offer_ids)), MONGO_BULK_CHUNK):
+            for d in db[COLL_FEAT].find({"snapshot_version": snapshot_version, "offer_id": {"$in": chunk}}, proj):
+                out.setdefault(d["offer_id"], []).append(d)
+        for rows in out.values():
+            rows.sort(key=lambda r: r.get("pos") or 0)
+        return out
+
     # ---- persist results (mongo) ----
     def save_decision_result(offer: Dict[str, Any], decision: Dict[str, Any], meta: Dict[str, Any] | None = None):
         _, _, _, _, cdec, _ = _ensure_client()
@@ -319,8 +782,21 @@ else:
             "decision": decision,
             "meta": meta or {},
         }
+        doc["offer_id"], doc["payload_hash"] = _offer_key(offer)
         cdec.insert_one(doc)
 
+    def save_decision_results(items: List[tuple]) -> int:
+        """บันทึกหลาย decision ด้วย bulk_write(InsertOne..., ordered=False); items = [(offer, decision, meta[, ts]), ...]"""
+        if not items:
+            return 0
+        _, _, _, _, cdec, _ = _ensure_client()
+        ops = [InsertOne({"ts": ts, "offer": offer, "decision": decision, "meta": meta or {},
+                          **dict(zip(("offer_id", "payload_hash"), _offer_key(offer)))})
+               for (offer, decision, meta, ts) in map(_decision_item, items)]
+        for chunk in _chunks(ops, MONGO_BULK_CHUNK):
+            cdec.bulk_write(chunk, ordered=False)
+        return len(ops)
+
     def save_case_runs(rows: List[Dict[str, Any]], meta: Dict[str, Any] | None = None):
         _, _, _, _, _, ccase = _ensure_client()
         doc = {
@@ -330,6 +806,81 @@ else:
         }
         ccase.insert_one(doc)
 
+    def save_case_runs_many(items: List[tuple]) -> int:
+        """items = [(rows, meta), ...]"""
+        if not items:
+            return 0
+        _, _, _, _, _, ccase = _ensure_client()
+        now = int(time.time())
+        ops = [InsertOne({"ts": now, "rows": rows, "meta": meta or {}}) for (rows, meta) in items]
+        for chunk in _chunks(ops, MONGO_BULK_CHUNK):
+            ccase.bulk_write(chunk, ordered=False)
+        return len(ops)
+
+    # ---- archive support (mongo) ----
+    def _after_id(q: dict, after_key: Optional[str]) -> dict:
+        if after_key:
+            from bson import ObjectId
+            q["_id"] = {"$gt": ObjectId(after_key)}
+        return q
+
+    def fetch_old_decision_runs(cutoff_ts: int, limit: int = 5000,
+                                after_key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """ดึง decision_runs ที่เก่ากว่า cutoff_ts ให้ core/archive.py (key = str(_id))"""
+        _, _, _, _, cdec, _ = _ensure_client()
+        q = _after_id({"ts": {"$lt": int(cutoff_ts)}}, after_key)
+        cur = cdec.find(q).sort("_id", ASCENDING).limit(int(limit))
+        return [{"key": str(d.pop("_id")), "ts": int(d.get("ts") or 0),
+                 "offer": d.get("offer") or {}, "decision": d.get("decision") or {},
+                 "meta": d.get("meta") or {}} for d in cur]
+
+    def _mongo_find_decision(offer_id: str, since_ts: int) -> Optional[Dict[str, Any]]:
+        _, _, _, _, cdec, _ = _ensure_client()
+        d = cdec.find_one({"offer_id": str(offer_id), "ts": {"$gte": int(since_ts)}},
+                          {"_id": 0, "ts": 1, "payload_hash": 1, "offer": 1, "decision": 1, "meta": 1},
+                          sort=[("ts", DESCENDING), ("_id", DESCENDING)])
+        if d is None:
+            return None
+        return {"ts": int(d.get("ts") or 0), "payload_hash": d.get("payload_hash"),
+                "offer": d.get("offer") or {}, "decision": d.get("decision") or {}, "meta": d.get("meta") or {}}
+
+    def hot_decision_min_ts() -> Optional[int]:
+        """ts ต่ำสุดที่ยังอยู่ใน decision_runs (None = ว่าง) — แถว archive ที่เก่ากว่านี้ไม่มีทางซ้ำกับ hot"""
+        _, _, _, _, cdec, _ = _ensure_client()
+        d = cdec.find_one({}, {"ts": 1}, sort=[("ts", ASCENDING)])
+        return None if d is None or d.get("ts") is None else int(d["ts"])
+
+    def existing_decision_keys(keys: List[str]) -> set:
+        """key (_id) ใน keys ที่ยังอยู่ใน decision_runs"""
+        from bson import ObjectId
+        _, _, _, _, cdec, _ = _ensure_client()
+        out = set()
+        for chunk in _chunks(sorted(set(keys)), 1000):
+            out.update(str(d["_id"]) for d in cdec.find({"_id": {"$in": [ObjectId(k) for k in chunk]}}, {"_id": 1}))
+        return out
+
+    def delete_decision_runs(keys: List[str]) -> int:
+        if not keys:
+            return 0
+        from bson import ObjectId
+        _, _, _, _, cdec, _ = _ensure_client()
+        return cdec.delete_many({"_id": {"$in": [ObjectId(k) for k in keys]}}).deleted_count
+
+    def fetch_old_case_runs(cutoff_ts: int, limit: int = 500,
+                            after_key: Optional[str] = None) -> List[Dict[str, Any]]:
+        _, _, _, _, _, ccase = _ensure_client()
+        q = _after_id({"ts": {"$lt": int(cutoff_ts)}}, after_key)
+        cur = ccase.find(q).sort("_id", ASCENDING).limit(int(limit))
+        return [{"key": str(d.pop("_id")), "ts": int(d.get("ts") or 0),
+                 "rows": d.get("rows") or [], "meta": d.get("meta") or {}} for d in cur]
+
+    def delete_case_runs(keys: List[str]) -> int:
+        if not keys:
+            return 0
+        from bson import ObjectId
+        _, _, _, _, _, ccase = _ensure_client()
+        return ccase.delete_many({"_id": {"$in": [ObjectId(k) for k in keys]}}).deleted_count
+
     # ป้องกันไม่ให้โค้ดเก่าไปเรียก get_conn ตอน BACKEND=mongo
     def get_conn():
         raise RuntimeError("get_conn() is only available for sqlite backend")
@@ -344,10 +895,58 @@ def load_distance_cache(key: str):
     return _mongo_distance_get(key)
 
 def save_distance_cache(key: str, a_lat: float, a_lng: float, b_lat: float, b_lng: float,
-                        km: float, minutes: float, ttl_sec: int = 7*24*3600):
+                        km: float, minutes: float, ttl_sec: int = 7*24*3600, snap_err_m: float = 0.0,
+                        source: Optional[str] = None):
     if BACKEND == "sqlite":
-        return _sqlite_distance_put(key, a_lat, a_lng, b_lat, b_lng, km, minutes, ttl_sec)
-    return _mongo_distance_put(key, a_lat, a_lng, b_lat, b_lng, km, minutes, ttl_sec)
+        return _sqlite_distance_put(key, a_lat, a_lng, b_lat, b_lng, km, minutes, ttl_sec, snap_err_m, source)
+    return _mongo_distance_put(key, a_lat, a_lng, b_lat, b_lng, km, minutes, ttl_sec, snap_err_m, source)
+
+def load_distance_cache_many(keys: List[str]) -> Dict[str, tuple]:
+    """หลาย key ในครั้งเดียว → {key: (km, minutes)} เฉพาะที่เจอและยังไม่หมดอายุ"""
+    if BACKEND == "sqlite":
+        return _sqlite_distance_get_many(keys)
+    return _mongo_distance_get_many(keys)
+
+def save_distance_cache_many(entries: List[tuple], ttl_sec: int = 7*24*3600) -> int:
+    """entries = [(key, a_lat, a_lng, b_lat, b_lng, km, minutes[, snap_err_m[, source]]), ...]"""
+    if BACKEND == "sqlite":
+        return _sqlite_distance_put_many(entries, ttl_sec)
+    return _mongo_distance_put_many(entries, ttl_sec)
+
+def list_expiring_distance_cache(within_sec: int, limit: int = 10000) -> List[tuple]:
+    """entry ที่จะหมดอายุภายใน within_sec → [(key, a_lat, a_lng, b_lat, b_lng), ...] (ใกล้หมดก่อน)"""
+    if BACKEND == "sqlite":
+        return _sqlite_distance_expiring(within_sec, limit)
+    return _mongo_distance_expiring(within_sec, limit)
+
+def list_distance_samples(limit: int = 200000) -> List[tuple]:
+    """
+    เส้นทางใน cache สำหรับฝึก core/route_estimator (รวมที่หมดอายุแล้วแต่ยังไม่ถูกลบ) ใหม่สุดก่อน
+    -> [(a_lat, a_lng, b_lat, b_lng, km, minutes, fetched_at|None, source|None), ...]
+    """
+    if BACKEND == "sqlite":
+        return _sqlite_distance_samples(limit)
+    return _mongo_distance_samples(limit)
+
+# ===== Candidate feature store API (core/feature_store) =====
+def save_candidate_features(rows: List[Dict[str, Any]]) -> int:
+    """rows = [{"offer_id","warehouse_id","snapshot_version","pos", *FEATURE_FIELDS}, ...] (upsert)"""
+    if BACKEND == "sqlite":
+        return _sqlite_features_put_many(rows)
+    return _mongo_features_put_many(rows)
+
+def load_candidate_features(snapshot_version: str, offer_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """-> {offer_id: [row, ...]} เรียงตามลำดับคลังตอนบันทึก (pos) เฉพาะ offer ที่มีใน snapshot นี้"""
+    if BACKEND == "sqlite":
+        return _sqlite_features_get_many(snapshot_version, offer_ids)
+    return _mongo_features_get_many(snapshot_version, offer_ids)
+
+# ===== Idempotency lookup (core/idempotency) =====
+def find_recent_decision(offer_id: str, since_ts: int) -> Optional[Dict[str, Any]]:
+    """decision ล่าสุดของ offer_id ที่ ts >= since_ts -> {"ts","payload_hash","offer","decision","meta"} หรือ None"""
+    if BACKEND == "sqlite":
+        return _sqlite_find_decision(offer_id, since_ts)
+    return _mongo_find_decision(offer_id, since_ts)
 
 # (วาง "History features" ต่อจากนี้ก็ได้ หรือจะวางก่อน block นี้ก็ได้ ขอแค่อยู่หลัง backend blocks)
 
@@ -356,37 +955,312 @@ from collections import defaultdict
 import json as _json
 import time as _t
 
-def _sqlite_get_recent_decisions(days: int = 14) -> list[dict]:
+def _since_ts(days: int, since_ts: Optional[int]) -> int:
+    return int(since_ts) if since_ts is not None else int(_t.time()) - days * 24 * 3600
+
+def _sqlite_get_recent_decisions(days: int = 14, since_ts: Optional[int] = None,
+                                 until_ts: Optional[int] = None,
+                                 warehouse_id: Optional[str] = None) -> list[dict]:
+    con = get_conn(); cur = con.cursor()
+    sql = "SELECT ts, offer_json, decision_json, meta_json FROM decision_runs WHERE ts >= ?"
+    args: list = [_since_ts(days, since_ts)]
+    if until_ts is not None:
+        sql += " AND ts <= ?"; args.append(int(until_ts))
+    if warehouse_id:
+        sql += " AND json_extract(decision_json, '$.chosen_warehouse') = ?"; args.append(warehouse_id)
+    rows = cur.execute(sql + " ORDER BY ts ASC", args).fetchall()
+    con.close()
+    out = []
+    for ts, offer_j, dec_j, meta_j in rows:
+        try: offer = _json.loads(offer_j or "{}")
+        except Exception: offer = {}
+        try: decision = _json.loads(dec_j or "{}")
+        except Exception: decision = {}
+        try: meta = _json.loads(meta_j or "{}")
+        except Exception: meta = {}
+        out.append({"ts": int(ts or 0), "offer": offer, "decision": decision, "meta": meta})
+    return out
+
+# field ที่ผู้อ่าน history ใช้จริง (dispatcher / dashboard / warehouse streak) — ไม่ดึง explanation ทั้งก้อน
+# reason ทั้งก้อน (string "error: ..." หรือ dict) + meta ให้รูปเดียวกับแถวของ SQLite
+HISTORY_FIELDS = [
+    "ts",
+    "offer.offer_id", "offer.customer_id", "offer.origin_address", "offer.origin_lat",
+    "offer.origin_lng", "offer.volume_cbm", "offer.duration_days",
+    "decision.accept", "decision.chosen_warehouse", "decision.priced_amount",
+    "decision.reason", "meta",
+    "decision.candidates.warehouse_id", "decision.candidates.route",
+    "decision.candidates.price_amount", "decision.candidates.cost", "decision.candidates.profit",
+    "decision.candidates.margin", "decision.candidates.utilization",
+    "decision.candidates.available_cbm", "decision.candidates.score",
+]
+
+def _mongo_get_recent_decisions(days: int = 14, since_ts: Optional[int] = None,
+                                until_ts: Optional[int] = None,
+                                warehouse_id: Optional[str] = None,
+                                fields: Optional[List[str]] = None) -> list[dict]:
+    _, db, *_ = _ensure_client()
+    q: dict = {"ts": {"$gte": _since_ts(days, since_ts)}}
+    if until_ts is not None:
+        q["ts"]["$lte"] = int(until_ts)
+    if warehouse_id:
+        q["decision.chosen_warehouse"] = warehouse_id
+    proj = {"_id": 0, "ts": 1}
+    proj.update({f: 1 for f in (fields or HISTORY_FIELDS)})
+    return list(_analytics(db[COLL_DEC]).find(q, proj).sort("ts", ASCENDING))
+
+def get_recent_decisions(days: int = 14, *, since_ts: Optional[int] = None,
+                         until_ts: Optional[int] = None,
+                         warehouse_id: Optional[str] = None,
+                         fields: Optional[List[str]] = None) -> list[dict]:
+    """
+    ประวัติ decision ช่วง [since_ts หรือ now-days, until_ts] เรียงตาม ts
+    ถ้ามีไฟล์ archive (core/archive.py) จะอ่านส่วนที่ย้ายออกไปแล้วมาต่อหน้าให้อัตโนมัติ
+    fields = dotted paths ที่ต้องการ (Mongo ใช้เป็น projection; ค่า default = HISTORY_FIELDS)
+    """
+    since = _since_ts(days, since_ts)
+    if BACKEND == "sqlite":
+        hot = _sqlite_get_recent_decisions(days, since, until_ts, warehouse_id)
+    else:
+        hot = _mongo_get_recent_decisions(days, since, until_ts, warehouse_id, fields)
+
+    from core import archive
+    if not archive.archive_available():
+        return hot
+    try:
+        cold = archive.read_archived_decisions(since_ts=since, until_ts=until_ts,
+                                               warehouse_id=warehouse_id)
+    except Exception as e:
+        print(f"[WARN] read_archived_decisions failed: {e}")
+        cold = []
+    return cold + hot
+
+def _sqlite_decisions_after(after_key: Optional[str], since_ts: int, until_ts: Optional[int], limit: int,
+                            warehouse_id: Optional[str]) -> list[dict]:
     con = get_conn(); cur = con.cursor()
-    since = int(_t.time()) - days * 24 * 3600
-    rows = cur.execute(
-        "SELECT ts, offer_json, decision_json FROM decision_runs WHERE ts >= ? ORDER BY ts ASC",
-        (since,)
-    ).fetchall()
+    sql = "SELECT id, ts, offer_json, decision_json, meta_json FROM decision_runs WHERE id > ? AND ts >= ?"
+    args: list = [int(after_key or 0), int(since_ts)]
+    if until_ts is not None:
+        sql += " AND ts <= ?"; args.append(int(until_ts))
+    if warehouse_id:
+        sql += " AND json_extract(decision_json, '$.chosen_warehouse') = ?"; args.append(warehouse_id)
+    rows = cur.execute(sql + " ORDER BY id ASC LIMIT ?", args + [int(limit)]).fetchall()
     con.close()
     out = []
-    for ts, offer_j, dec_j in rows:
+    for rid, ts, offer_j, dec_j, meta_j in rows:
         try: offer = _json.loads(offer_j or "{}")
         except Exception: offer = {}
         try: decision = _json.loads(dec_j or "{}")
         except Exception: decision = {}
-        out.append({"ts": int(ts or 0), "offer": offer, "decision": decision})
+        try: meta = _json.loads(meta_j or "{}")
+        except Exception: meta = {}
+        out.append({"key": str(rid), "ts": int(ts or 0), "offer": offer, "decision": decision, "meta": meta})
     return out
 
-def _mongo_get_recent_decisions(days: int = 14) -> list[dict]:
+def _mongo_decisions_after(after_key: Optional[str], since_ts: int, until_ts: Optional[int], limit: int,
+                           warehouse_id: Optional[str], fields: Optional[List[str]]) -> list[dict]:
     _, db, *_ = _ensure_client()
-    since = int(_t.time()) - days * 24 * 3600
-    return list(db[COLL_DEC].find({"ts": {"$gte": since}}, {"_id": 0}))
+    q = _after_id({"ts": {"$gte": int(since_ts)}}, after_key)
+    if until_ts is not None:
+        q["ts"]["$lte"] = int(until_ts)
+    if warehouse_id:
+        q["decision.chosen_warehouse"] = warehouse_id
+    proj = {"ts": 1, "meta": 1}
+    proj.update({f: 1 for f in (fields or HISTORY_FIELDS)})
+    cur = _analytics(db[COLL_DEC]).find(q, proj).sort("_id", ASCENDING).limit(int(limit))
+    return [{"key": str(d.pop("_id")), **d} for d in cur]
 
-def get_recent_decisions(days: int = 14) -> list[dict]:
+def get_decisions_after(after_key: Optional[str] = None, *, since_ts: int = 0, until_ts: Optional[int] = None,
+                        limit: int = 5000, warehouse_id: Optional[str] = None,
+                        fields: Optional[List[str]] = None) -> list[dict]:
+    """
+    decision ที่ใหม่กว่า cursor (id ของ sqlite / _id ของ mongo) เรียงตามลำดับที่เขียน ทีละไม่เกิน limit
+    -> [{"key","ts","offer","decision","meta"}, ...]; ส่ง rows[-1]["key"] กลับมาเป็น after_key รอบถัดไป
+    อ่านเฉพาะ hot table (ใช้ live tail ของ metrics/dashboard --follow ไม่รวม archive)
+    """
     if BACKEND == "sqlite":
-        return _sqlite_get_recent_decisions(days)
-    return _mongo_get_recent_decisions(days)
+        return _sqlite_decisions_after(after_key, since_ts, until_ts, limit, warehouse_id)
+    return _mongo_decisions_after(after_key, since_ts, until_ts, limit, warehouse_id, fields)
+
+def iter_decisions(since_ts: int = 0, until_ts: Optional[int] = None, *, page: int = 5000,
+                   warehouse_id: Optional[str] = None, fields: Optional[List[str]] = None,
+                   archive: bool = True):
+    """
+    ประวัติทั้งหมดของช่วงเวลา: ส่วนที่ย้ายไป archive ก่อน (กันซ้ำกับ hot แบบเดียวกับ get_recent_decisions)
+    แล้ว stream decision_runs (hot table) ทีละหน้า — หน่วยความจำของฝั่ง hot คงที่ไม่ว่าช่วงจะมีกี่ล้านแถว
+    อ่าน archive ไม่ได้ = raise (ไม่ตัดแถวเก่าทิ้งเงียบๆ)
+    """
+    if archive:
+        from core import archive as _archive
+        if _archive.archive_available():
+            yield from _archive.read_archived_decisions(since_ts=since_ts, until_ts=until_ts,
+                                                        warehouse_id=warehouse_id)
+    key = None
+    while True:
+        rows = get_decisions_after(key, since_ts=since_ts, until_ts=until_ts, limit=page,
+                                   warehouse_id=warehouse_id, fields=fields)
+        yield from rows
+        if len(rows) < page:
+            return
+        key = rows[-1]["key"]
+
+STATS_EWMA_ALPHA = 0.3
+
+def _stats_row(wins: int, bids: int, profit_sum: float, margin_sum: float,
+               price_sum: float, ewma_util: float) -> dict:
+    div = max(1, bids)
+    return {
+        "wins": wins,
+        "bids": bids,
+        "accept_rate": wins / float(div),
+        "avg_profit": profit_sum / div,
+        "avg_margin": margin_sum / div,
+        "avg_price":  price_sum  / div,
+        "ewma_util":  ewma_util,
+    }
+
+def _mongo_compute_warehouse_stats(days: int = 14) -> dict[str, dict]:
+    """
+    compute_warehouse_stats ฝั่ง server: $unwind candidates + $group ต่อคลัง
+    EWMA ของ utilization ผู้ชนะคำนวณด้วย $reduce ตามลำดับ ts (ไม่ดึงเอกสารมาที่ Python)
+    """
+    _, db, *_ = _ensure_client()
+    a = STATS_EWMA_ALPHA
+    not_empty = {"$nin": [None, "", False]}
+    pipeline = [
+        {"$match": {"ts": {"$gte": _since_ts(days, None)}}},
+        {"$sort": {"ts": 1}},
+        {"$project": {"_id": 0, "chosen": "$decision.chosen_warehouse",
+                      "cands": {"$ifNull": ["$decision.candidates", []]}}},
+        {"$facet": {
+            "bids": [
+                {"$unwind": "$cands"},
+                {"$match": {"cands.warehouse_id": not_empty}},
+                {"$group": {
+                    "_id": "$cands.warehouse_id",
+                    "bids": {"$sum": 1},
+                    "profit_sum": {"$sum": {"$ifNull": ["$cands.profit", 0]}},
+                    "margin_sum": {"$sum": {"$ifNull": ["$cands.margin", 0]}},
+                    "price_sum":  {"$sum": {"$ifNull": ["$cands.price_amount", 0]}},
+                    "utils": {"$push": {"$cond": [{"$eq": ["$cands.warehouse_id", "$chosen"]},
+                                                  {"$ifNull": ["$cands.utilization", 0]}, None]}},
+                }},
+                {"$project": {
+                    "bids": 1, "profit_sum": 1, "margin_sum": 1, "price_sum": 1,
+                    "ewma_util": {"$reduce": {
+                        "input": {"$filter": {"input": "$utils", "cond": {"$ne": ["$$this", None]}}},
+                        "initialValue": None,
+                        "in": {"$cond": [{"$eq": ["$$value", None]}, "$$this",
+                                         {"$add": [{"$multiply": [a, "$$this"]},
+                                                   {"$multiply": [1 - a, "$$value"]}]}]},
+                    }},
+                }},
+            ],
+            "wins": [
+                {"$match": {"chosen": not_empty}},
+                {"$group": {"_id": "$chosen", "wins": {"$sum": 1}}},
+            ],
+        }},
+    ]
+    res = list(_analytics(db[COLL_DEC]).aggregate(pipeline, allowDiskUse=True))
+    facet = res[0] if res else {"bids": [], "wins": []}
+    wins = {d["_id"]: int(d["wins"]) for d in facet.get("wins", [])}
+    bids = {d["_id"]: d for d in facet.get("bids", [])}
+    out = {}
+    for wid in list(bids) + [w for w in wins if w not in bids]:
+        b = bids.get(wid, {})
+        out[wid] = _stats_row(wins.get(wid, 0), int(b.get("bids", 0)),
+                              float(b.get("profit_sum", 0.0)), float(b.get("margin_sum", 0.0)),
+                              float(b.get("price_sum", 0.0)), float(b.get("ewma_util") or 0.0))
+    return out
+
+_WID_OK = "COALESCE({0}, '') NOT IN ('', 0)"
+
+def _sqlite_warehouse_stat_partials(since: int) -> tuple[dict, list]:
+    """
+    compute_warehouse_stats ฝั่ง SQLite: json_each แตก candidates แล้ว GROUP BY ใน SQL
+    คืน (agg, utils) รูปเดียวกับ archive.read_archived_stat_partials
+    utils = สตรีม (wid, util) ของผู้ชนะเรียง ts,id — แถวเดียวต่อ decision ไม่ต้อง parse JSON ใน Python
+    """
+    con = get_conn(); cur = con.cursor()
+    base = """FROM decision_runs d, json_each(d.decision_json, '$.candidates') c
+              WHERE d.ts >= ? AND json_valid(d.decision_json)
+                AND json_type(d.decision_json, '$.candidates') = 'array'"""
+    wid = "json_extract(c.value, '$.warehouse_id')"
+    bids = cur.execute(f"""
+        SELECT {wid} AS wid, COUNT(*),
+               TOTAL(COALESCE(json_extract(c.value, '$.profit'), 0)),
+               TOTAL(COALESCE(json_extract(c.value, '$.margin'), 0)),
+               TOTAL(COALESCE(json_extract(c.value, '$.price_amount'), 0))
+        {base} AND {_WID_OK.format(wid)}
+        GROUP BY wid""", (since,)).fetchall()
+    chosen = "json_extract(decision_json, '$.chosen_warehouse')"
+    wins = cur.execute(f"""
+        SELECT {chosen} AS wid, COUNT(*) FROM decision_runs
+        WHERE ts >= ? AND json_valid(decision_json) AND {_WID_OK.format(chosen)}
+        GROUP BY wid""", (since,)).fetchall()
+    utils = cur.execute(f"""
+        SELECT {wid}, COALESCE(json_extract(c.value, '$.utilization'), 0)
+        {base} AND {_WID_OK.format(wid)}
+          AND {wid} = json_extract(d.decision_json, '$.chosen_warehouse')
+        ORDER BY d.ts, d.id, c.key""", (since,)).fetchall()
+    con.close()
+
+    agg: dict = {}
+    for w, n, p, m, pr in bids:
+        agg[w] = {"wins": 0, "bids": int(n), "profit_sum": float(p),
+                  "margin_sum": float(m), "price_sum": float(pr)}
+    for w, n in wins:
+        agg.setdefault(w, {"wins": 0, "bids": 0, "profit_sum": 0.0,
+                           "margin_sum": 0.0, "price_sum": 0.0})["wins"] = int(n)
+    return agg, [(w, float(u or 0.0)) for w, u in utils]
+
+def _fold_stat_partials(parts: list) -> dict[str, dict]:
+    """รวม partial หลายก้อน (เรียงเก่า→ใหม่) แล้ว EWMA utilization ต่อเนื่องข้ามก้อน"""
+    agg: dict = {}
+    ewma: dict = {}
+    alpha = STATS_EWMA_ALPHA
+    for part_agg, utils in parts:
+        for wid, a in part_agg.items():
+            t = agg.setdefault(wid, {"wins": 0, "bids": 0, "profit_sum": 0.0,
+                                     "margin_sum": 0.0, "price_sum": 0.0})
+            for k in t:
+                t[k] += a[k]
+        for wid, util in utils:
+            ewma[wid] = util if wid not in ewma else alpha * util + (1 - alpha) * ewma[wid]
+    return {wid: _stats_row(a["wins"], a["bids"], a["profit_sum"], a["margin_sum"],
+                            a["price_sum"], ewma.get(wid, 0.0))
+            for wid, a in agg.items()}
+
+def _sqlite_compute_warehouse_stats(days: int = 14) -> dict[str, dict]:
+    since = _since_ts(days, None)
+    parts = []
+    from core import archive
+    if archive.archive_available():
+        try:
+            parts.append(archive.read_archived_stat_partials(since_ts=since))
+        except Exception as e:
+            print(f"[WARN] read_archived_stat_partials failed: {e}")
+    parts.append(_sqlite_warehouse_stat_partials(since))
+    return _fold_stat_partials(parts)
 
 def compute_warehouse_stats(days: int = 14) -> dict[str, dict]:
+    """
+    สถิติต่อคลังช่วง days วันล่าสุด: aggregate ใน DB (SQLite json_each / Mongo $group)
+    ผลลัพธ์ต้องเท่ากับ _py_compute_warehouse_stats (มี test เทียบ)
+    """
+    if BACKEND == "sqlite":
+        return _sqlite_compute_warehouse_stats(days)
+    from core import archive
+    if not archive.archive_available():
+        return _mongo_compute_warehouse_stats(days)
+    return _py_compute_warehouse_stats(days)
+
+def _py_compute_warehouse_stats(days: int = 14) -> dict[str, dict]:
+    """reference implementation (Python ล้วน บน get_recent_decisions)"""
     rows = get_recent_decisions(days)
     agg = defaultdict(lambda: {"wins":0,"bids":0,"profit_sum":0.0,"margin_sum":0.0,"price_sum":0.0})
-    alpha = 0.3
+    alpha = STATS_EWMA_ALPHA
     ewma_util = defaultdict(float)
     has_ewma = defaultdict(bool)
 
@@ -413,17 +1287,8 @@ def compute_warehouse_stats(days: int = 14) -> dict[str, dict]:
 
     out = {}
     for wid, a in agg.items():
-        bids = max(1, a["bids"])
-        wins = a["wins"]
-        out[wid] = {
-            "wins": wins,
-            "bids": a["bids"],
-            "accept_rate": wins / float(bids),
-            "avg_profit": a["profit_sum"] / bids,
-            "avg_margin": a["margin_sum"] / bids,
-            "avg_price":  a["price_sum"]  / bids,
-            "ewma_util":  ewma_util.get(wid, 0.0),
-        }
+        out[wid] = _stats_row(a["wins"], a["bids"], a["profit_sum"], a["margin_sum"],
+                              a["price_sum"], ewma_util.get(wid, 0.0))
     return out
 
 # ===== Backward-compat aliases (ต้องวางสุดท้าย หลังประกาศฟังก์ชันแล้ว) =====
@@ -0,0 +1,86 @@
+# core/feature_store.py
+"""
+Candidate feature store: ผลของขั้นที่แพง (route, history lookup, pricing, spec) ต่อคู่ (offer, คลัง)
+เก็บไว้ใต้ snapshot_version แล้ว scoring/selection รันจาก store ได้ตรง ๆ ไม่ต้อง route/price ใหม่
+
+  version = snapshot_version(ctx, cfg)                # hash ของสถานะคลัง + สถิติย้อนหลัง + ส่วนราคาของ config
+  record(offer_id, cands, version)                    # หลัง quote_warehouse()
+  cands = load_candidates([offer_id], version, whs)   # -> candidate dict พร้อมส่งเข้า dispatcher_agent.select
+
+- น้ำหนัก scoring / EPSILON / EXPL_* ไม่อยู่ใน version: เปลี่ยนแค่นั้นยังอ่าน feature ชุดเดิม (A/B policy บน input เดียวกัน)
+- ราคาที่เก็บรวม jitter / LLM margin hint ตอนบันทึกแล้ว ผลจึงซ้ำได้ทุกรอบ
+- ตั้ง label เองได้ (FEATURE_SNAPSHOT หรือ version=...) ถ้าอยากตรึง snapshot ข้ามวัน
+"""
+import os, json, hashlib
+from typing import List, Dict, Any, Optional
+
+from core.db import FEATURE_FIELDS, save_candidate_features, load_candidate_features
+from core.pricing import PricingConfig, get_config
+
+FEATURE_SNAPSHOT = os.getenv("FEATURE_SNAPSHOT", "")     # ว่าง = คำนวณจาก context
+
+
+def snapshot_version(ctx: Dict[str, Any], cfg: Optional[PricingConfig] = None) -> str:
+    if FEATURE_SNAPSHOT:
+        return FEATURE_SNAPSHOT
+    cfg = cfg or ctx.get("config") or get_config()
+    whs = sorted((w["warehouse_id"], w.get("lat"), w.get("lng"), w.get("capacity_cbm"), w.get("used_cbm"))
+                 for w in ctx.get("warehouses") or [])
+    hist = {wid: ((h or {}).get("accept_rate"), (h or {}).get("ewma_util"))
+            for wid, h in sorted((ctx.get("hist") or {}).items())}
+    raw = json.dumps([whs, hist, repr(cfg.pricing_key())], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def features_of(offer_id: Any, cands: List[Dict[str, Any]], version: str) -> List[Dict[str, Any]]:
+    rows = []
+    for pos, c in enumerate(cands):
+        rt = c.get("route") or {}
+        rows.append({"offer_id": str(offer_id), "warehouse_id": c["warehouse_id"], "snapshot_version": version,
+                     "pos": pos, "km": c.get("_raw_km", rt.get("km")), "minutes": rt.get("minutes"),
+                     "cost": c.get("cost"), "raw_price": c.get("_raw_price", c.get("price_amount")),
+                     "utilization": c.get("utilization"), "available_cbm": c.get("available_cbm"),
+                     "spec_score": c.get("spec_score"), "sla_fit": c.get("sla_fit")})
+    return rows
+
+
+def record(offer_id: Any, cands: List[Dict[str, Any]], version: str) -> int:
+    if offer_id is None or not cands:
+        return 0
+    return save_candidate_features(features_of(offer_id, cands, version))
+
+
+def candidate_from_row(r: Dict[str, Any], wh: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """แถวใน store -> candidate รูปเดียวกับ PricingAgent.quote_candidate + spec_score"""
+    price = float(r.get("raw_price") or 0.0)
+    cost = float(r.get("cost") or 0.0)
+    profit = max(0.0, price - cost)
+    km = float(r.get("km") or 0.0)
+    return {
+        "warehouse_id": r["warehouse_id"],
+        "route": {"km": km, "minutes": r.get("minutes")},
+        "available_cbm": float(r.get("available_cbm") or 0.0),
+        "utilization": float(r.get("utilization") or 0.0),
+        "sla_fit": 1.0 if r.get("sla_fit") is None else float(r["sla_fit"]),
+        "price_amount": round(price, 2),
+        "cost": round(cost, 2),
+        "profit": round(profit, 2),
+        "margin": round(profit / max(1e-6, price), 4),
+        "_raw_price": price,
+        "_raw_km": km,
+        "_wh": wh or {"warehouse_id": r["warehouse_id"]},
+        "spec_score": round(float(r.get("spec_score") or 0.0), 4),
+    }
+
+
+def load_candidates(offer_ids: List[Any], version: str,
+                    warehouses: Optional[List[Dict[str, Any]]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """{offer_id: [candidate, ...]} เฉพาะ offer ที่มีครบทุกคลังใน warehouses (ถ้าระบุ)"""
+    by_id = {w["warehouse_id"]: w for w in warehouses or []}
+    out = {}
+    for oid, rows in load_candidate_features(version, [str(o) for o in offer_ids]).items():
+        if by_id and {r["warehouse_id"] for r in rows} != set(by_id):
+            continue
+        out[oid] = [candidate_from_row(r, by_id.get(r["warehouse_id"])) for r in rows]
+    return out
+
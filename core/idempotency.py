@@ -0,0 +1,70 @@
+# core/idempotency.py
+"""
+Idempotent re-submission: offer_id เดิม + payload เดิม ภายใน IDEMPOTENCY_WINDOW_SEC -> คืน decision ที่ตัดสินไว้แล้ว
+ไม่ geocode / route / LLM / hold capacity ซ้ำ (retry = lookup 1 ครั้งบน index (offer_id, ts) ของ decision_runs)
+
+  idem = Idempotency(writer)
+  decision = idem.decide(offer, decide_fn)    # miss -> decide_fn(offer) (ซึ่งต้อง submit เข้า writer เอง)
+
+ลำดับการหา: 1) writer.pending_decision (submit แล้วแต่ยังไม่ flush)  2) find_recent_decision ใน DB
+- payload เปลี่ยน (hash ไม่ตรง) -> ตัดสินใหม่ แถวใหม่กลายเป็นล่าสุดของ offer_id
+- offer เดียวกันที่เข้ามาพร้อมกันรวมเป็น flight เดียว (core.singleflight) ตัดสินครั้งเดียว
+- decision ที่มาจาก store มี meta.idempotent = {"hit": True, "source": "pending"|"db", "ts": ...}
+- decision ที่เป็น error (reason "error: ...") ไม่ replay; IDEMPOTENCY_WINDOW_SEC=0 = ปิด
+"""
+import os, time
+from typing import Dict, Any, Optional, Callable
+
+from core.db import offer_payload_hash, find_recent_decision
+from core.singleflight import SingleFlight
+
+IDEMPOTENCY_WINDOW_SEC = int(os.getenv("IDEMPOTENCY_WINDOW_SEC", "86400"))
+
+
+def _is_error(decision: Dict[str, Any]) -> bool:
+    reason = (decision or {}).get("reason")
+    return not decision or (isinstance(reason, str) and reason.startswith("error"))
+
+
+class Idempotency:
+    def __init__(self, writer=None, window_sec: int = IDEMPOTENCY_WINDOW_SEC):
+        self.writer = writer
+        self.window_sec = int(window_sec)
+        self.flight = SingleFlight()
+        self.stats = {"hits": 0, "pending_hits": 0, "misses": 0, "changed": 0}
+
+    def lookup(self, offer: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """decision ที่เก็บไว้ของ offer นี้ (payload ตรง, อยู่ในหน้าต่างเวลา) หรือ None"""
+        oid = (offer or {}).get("offer_id")
+        if oid is None or self.window_sec <= 0:
+            return None
+        since = int(time.time()) - self.window_sec
+        item = self.writer.pending_decision(oid) if self.writer is not None else None
+        if item is not None and item[3] >= since:
+            src, rec = "pending", {"ts": item[3], "payload_hash": offer_payload_hash(item[0]), "decision": item[1]}
+        else:
+            src, rec = "db", find_recent_decision(str(oid), since)
+        if rec is None or _is_error(rec["decision"]):
+            return None
+        if rec["payload_hash"] != offer_payload_hash(offer):
+            self.stats["changed"] += 1
+            return None
+        self.stats["hits"] += 1
+        if src == "pending":
+            self.stats["pending_hits"] += 1
+        out = dict(rec["decision"])
+        out["meta"] = {**(out.get("meta") or {}), "idempotent": {"hit": True, "source": src, "ts": rec["ts"]}}
+        return out
+
+    def _lookup_or_run(self, offer: Dict[str, Any], decide_fn: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        hit = self.lookup(offer)
+        if hit is not None:
+            return hit
+        self.stats["misses"] += 1
+        return decide_fn(offer)
+
+    def decide(self, offer: Dict[str, Any], decide_fn: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, Any]:
+        oid = (offer or {}).get("offer_id")
+        if oid is None or self.window_sec <= 0:
+            return decide_fn(offer)
+        return self.flight.do((str(oid), offer_payload_hash(offer)), self._lookup_or_run, offer, decide_fn)
@@ -1,11 +1,16 @@
 # core/location.py
-import os, math, time, json
-from typing import Tuple, Optional
-from urllib.parse import urlencode
-import requests
+import os, math, time
+from typing import Tuple, Optional, List, Dict
 
 # ใช้ cache กลางจาก core.db (ทำงานได้ทั้ง sqlite/mongo)
-from .db import load_distance_cache, save_distance_cache
+from .db import (load_distance_cache, save_distance_cache,
+                 load_distance_cache_many, save_distance_cache_many)
+from . import route_estimator as _est
+from .provider_client import get_client
+from .singleflight import SingleFlight
+
+# miss ของ route/geocode ที่เข้ามาพร้อมกันด้วย key เดียวกัน -> เรียก provider ครั้งเดียว แบ่งผลกัน
+FLIGHT = SingleFlight()
 
 # --- ENV ---
 USE_REAL_ROUTE = os.getenv("USE_REAL_ROUTE", "0") == "1"
@@ -22,6 +27,13 @@ ORS_API_KEY      = os.getenv("ORS_API_KEY")
 ASSUMED_KMH      = float(os.getenv("ASSUMED_KMH", "40"))   # ความเร็วเฉลี่ยถนนเมือง
 ROUTE_CACHE_TTL  = int(os.getenv("ROUTE_CACHE_TTL_SEC", str(7*24*3600)))  # 7 วัน
 
+# snap ต้นทางเข้า cell ก่อนทำ cache key (ปลายทาง=คลัง คงพิกัดจริง)
+#   none    = key ละเอียด 6 ตำแหน่ง (~10 ซม.) แบบเดิม
+#   grid    = ตาราง metric ขนาดเลือกให้ระยะจากจุดจริงถึงกลาง cell ≤ ROUTE_SNAP_MAX_ERR_M
+#   geohash = precision หยาบสุดที่ครึ่งเส้นทแยงของ cell ≤ ROUTE_SNAP_MAX_ERR_M
+ROUTE_SNAP           = os.getenv("ROUTE_SNAP", "grid").lower()
+ROUTE_SNAP_MAX_ERR_M = float(os.getenv("ROUTE_SNAP_MAX_ERR_M", "100"))
+
 # ---------------- Utils ----------------
 def _haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
     R = 6371.0088
@@ -31,17 +43,100 @@ def _haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
     a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlmb/2)**2
     return R * (2*math.atan2(math.sqrt(a), math.sqrt(1-a)))
 
+_M_PER_DEG = 111320.0
+_GEOHASH32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+class RouteResult(tuple):
+    """(km, minutes) + snap_err_m / snap / source (ยัง unpack เป็น km, minutes ได้เหมือนเดิม)"""
+    def __new__(cls, km: float, minutes: float, snap_err_m: float = 0.0, snap: str = "none",
+                source: Optional[str] = None):
+        obj = super().__new__(cls, (float(km), float(minutes)))
+        obj.snap_err_m = float(snap_err_m)
+        obj.snap = snap
+        obj.source = source      # google / ors / estimate / haversine / cache
+        return obj
+
+def _half_diag_m(dlat: float, dlng: float, lat: float) -> float:
+    return 0.5 * math.hypot(dlat * _M_PER_DEG, dlng * _M_PER_DEG * math.cos(math.radians(lat)))
+
+def _grid_snap(lat: float, lng: float, err_m: float):
+    cell_m = err_m * math.sqrt(2.0)                 # ครึ่งเส้นทแยงของ cell สี่เหลี่ยม = err_m
+    dlat = cell_m / _M_PER_DEG
+    i = math.floor(lat / dlat)
+    lat_c = (i + 0.5) * dlat
+    dlng = cell_m / (_M_PER_DEG * max(math.cos(math.radians(lat_c)), 1e-6))
+    j = math.floor(lng / dlng)
+    lng_c = (j + 0.5) * dlng
+    return lat_c, lng_c, _half_diag_m(dlat, dlng, lat_c), f"grid{int(round(cell_m))}m:{i}:{j}"
+
+def _geohash_cell(lat: float, lng: float, precision: int):
+    """encode geohash -> (hash, lat_center, lng_center, dlat, dlng)"""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    bits, even, out, ch = 0, True, [], 0
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid: ch = (ch << 1) | 1; lng_lo = mid
+            else:          ch = ch << 1;       lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid: ch = (ch << 1) | 1; lat_lo = mid
+            else:          ch = ch << 1;       lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_GEOHASH32[ch]); bits, ch = 0, 0
+    return "".join(out), (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2, lat_hi - lat_lo, lng_hi - lng_lo
+
+def _geohash_snap(lat: float, lng: float, err_m: float):
+    for p in range(1, 13):
+        gh, lat_c, lng_c, dlat, dlng = _geohash_cell(lat, lng, p)
+        err = _half_diag_m(dlat, dlng, lat_c)
+        if err <= err_m or p == 12:
+            return lat_c, lng_c, err, f"gh{p}:{gh}"
+
+def snap_origin(lat: float, lng: float, mode: Optional[str] = None,
+                max_err_m: Optional[float] = None) -> Tuple[float, float, float, str]:
+    """
+    คืน (lat, lng, err_m, label) ของต้นทางหลัง snap — err_m = ระยะสูงสุดจากจุดจริงถึงจุดที่ใช้คำนวณ route
+    snap ซ้ำที่จุดกลาง cell ได้ cell เดิม (idempotent) จึงใช้ a_lat/a_lng ใน cache ทำ key ใหม่ได้
+    """
+    mode = (mode or ROUTE_SNAP).lower()
+    err_m = ROUTE_SNAP_MAX_ERR_M if max_err_m is None else float(max_err_m)
+    if mode == "none" or err_m <= 0:
+        return float(lat), float(lng), 0.0, f"{round(lat,6)},{round(lng,6)}"
+    if mode == "geohash":
+        return _geohash_snap(float(lat), float(lng), err_m)
+    return _grid_snap(float(lat), float(lng), err_m)
+
+def _route_key(label: str, lat2: float, lng2: float) -> str:
+    """key ของ distance_cache และ flight ของ route/aroute/route_many (label = ต้นทางหลัง snap)"""
+    return f"{label}|{round(lat2,6)},{round(lng2,6)}"
+
 def _cache_key(lat1: float, lng1: float, lat2: float, lng2: float) -> str:
-    return f"{round(lat1,6)},{round(lng1,6)}|{round(lat2,6)},{round(lng2,6)}"
+    return _route_key(snap_origin(lat1, lng1)[3], lat2, lng2)
 
 # ---------------- Geocode ----------------
 def geocode(address: str) -> Tuple[float, float]:
     """
     คืน (lat, lng) จากที่อยู่
     ลำดับความพยายาม: Google → ORS Nominatim → error
+    ที่อยู่เดียวกัน (normalize ช่องว่าง/ตัวพิมพ์) ที่ขอพร้อมกันใช้ request เดียว
     """
     if not address or not address.strip():
         raise ValueError("geocode: address is empty")
+    return FLIGHT.do(_geocode_flight(address), _geocode, address)
+
+async def ageocode(address: str) -> Tuple[float, float]:
+    """geocode() สำหรับ asyncio: key เดียวกับ geocode() -> thread และ coroutine รอ flight เดียวกัน (รันใน executor)"""
+    if not address or not address.strip():
+        raise ValueError("geocode: address is empty")
+    return await FLIGHT.ado(_geocode_flight(address), _geocode, address)
+
+def _geocode_flight(address: str) -> tuple:
+    return ("geocode", " ".join(address.lower().split()))
+
+def _geocode(address: str) -> Tuple[float, float]:
 
     # 1) Google Geocoding API
     if GOOGLE_API_KEY:
@@ -52,13 +147,13 @@ def geocode(address: str) -> Tuple[float, float]:
                 "region": GOOGLE_REGION,
                 "language": GOOGLE_LANGUAGE,
             }
-            url = f"https://maps.googleapis.com/maps/api/geocode/json?{urlencode(params)}"
-            r = requests.get(url, timeout=20)
-            r.raise_for_status()
-            data = r.json()
+            client = get_client("google")
+            data = client.get_json("https://maps.googleapis.com/maps/api/geocode/json", params=params)
             if data.get("status") == "OK" and data.get("results"):
                 loc = data["results"][0]["geometry"]["location"]
                 return float(loc["lat"]), float(loc["lng"])
+            if data.get("status") not in ("OK", "ZERO_RESULTS"):
+                client.record_error()
         except Exception as e:
             print(f"[WARN] geocode(Google) failed: {e}")
 
@@ -69,9 +164,7 @@ def geocode(address: str) -> Tuple[float, float]:
             url = "https://api.openrouteservice.org/geocode/search"
             headers = {"Authorization": ORS_API_KEY}
             params = {"text": address, "size": 1, "lang": GOOGLE_LANGUAGE}
-            r = requests.get(url, headers=headers, params=params, timeout=20)
-            r.raise_for_status()
-            data = r.json()
+            data = get_client("ors").get_json(url, params=params, headers=headers)
             feats = (data or {}).get("features") or []
             if feats:
                 coords = feats[0]["geometry"]["coordinates"]  # [lng, lat]
@@ -83,19 +176,30 @@ def geocode(address: str) -> Tuple[float, float]:
     raise RuntimeError("geocode failed: no provider returned a result")
 
 # ---------------- Route (distance & time) ----------------
-def route(lat1: float, lng1: float, lat2: float, lng2: float) -> Tuple[float, float]:
+def _confident_estimate(lat1: float, lng1: float, lat2: float, lng2: float) -> Optional[RouteResult]:
+    """ค่าประมาณจาก core/route_estimator ถ้ามั่นใจพอ (≥ ROUTE_EST_MIN_CONF) ไม่งั้น None"""
+    try:
+        e = _est.estimate(lat1, lng1, lat2, lng2)
+    except Exception as ex:
+        print(f"[WARN] route_estimator failed: {ex}")
+        return None
+    if e is None:
+        return None
+    if e.confidence < _est.ROUTE_EST_MIN_CONF:
+        _est.STATS["low_confidence"] += 1
+        return None
+    _est.STATS["estimated"] += 1
+    return RouteResult(e.km, e.minutes, source="estimate")
+
+def _fetch_route(lat1: float, lng1: float, lat2: float, lng2: float) -> Tuple[float, float]:
     """
-    คืน (km, minutes) จากต้นทาง → ปลายทาง
-    ลำดับความพยายาม: cache → ผู้ให้บริการจริง (Google/ORS) → haversine fallback
+    ผู้ให้บริการจริง (Google/ORS) → haversine fallback (ไม่แตะ cache)
+    ค่าประมาณ local ที่ confidence ≥ ROUTE_EST_MIN_CONF ผู้เรียก (_route_miss) ลองก่อนแล้ว;
+    ต่ำกว่านั้นไม่ใช้แม้ provider ล้ม — haversine คาดเดาได้และไม่ขึ้นกับโมเดล
     """
-    # 0) เช็ค cache ก่อน
-    key = _cache_key(lat1, lng1, lat2, lng2)
-    cached = load_distance_cache(key)
-    if cached:
-        return float(cached[0]), float(cached[1])
-
     km: Optional[float] = None
     minutes: Optional[float] = None
+    source = "google"
 
     # 1) ผู้ให้บริการจริง (ถ้าเปิด USE_REAL_ROUTE)
     if USE_REAL_ROUTE:
@@ -110,34 +214,30 @@ def route(lat1: float, lng1: float, lat2: float, lng2: float) -> Tuple[float, fl
                     "language": GOOGLE_LANGUAGE,
                     "mode": "driving",
                 }
-                url = f"https://maps.googleapis.com/maps/api/directions/json?{urlencode(params)}"
-                r = requests.get(url, timeout=30)
-                r.raise_for_status()
-                data = r.json()
+                client = get_client("google")
+                data = client.get_json("https://maps.googleapis.com/maps/api/directions/json", params=params)
                 routes = data.get("routes") or []
                 if routes and routes[0].get("legs"):
                     leg = routes[0]["legs"][0]
                     km = (leg["distance"]["value"] or 0) / 1000.0
                     minutes = (leg["duration"]["value"] or 0) / 60.0
+                elif data.get("status") not in ("OK", "ZERO_RESULTS"):
+                    client.record_error()     # OVER_QUERY_LIMIT / REQUEST_DENIED ฯลฯ
             except Exception as e:
                 print(f"[WARN] route(Google) failed: {e}")
 
         # 1.2) ORS Directions (ถ้ามีคีย์และ Google ไม่สำเร็จ)
         if (km is None or minutes is None) and ORS_API_KEY:
+            source = "ors"
             try:
                 url = "https://api.openrouteservice.org/v2/directions/driving-car"
-                headers = {
-                    "Authorization": ORS_API_KEY,
-                    "Content-Type": "application/json",
-                }
+                headers = {"Authorization": ORS_API_KEY}
                 body = {
                     "coordinates": [[float(lng1), float(lat1)], [float(lng2), float(lat2)]],
                     "units": "km",
                     "language": GOOGLE_LANGUAGE,
                 }
-                r = requests.post(url, headers=headers, data=json.dumps(body), timeout=30)
-                r.raise_for_status()
-                data = r.json()
+                data = get_client("ors").post_json(url, body, headers=headers)
                 summary = (data.get("routes") or [{}])[0].get("summary") or {}
                 km = float(summary.get("distance", 0.0))
                 sec = float(summary.get("duration", 0.0))
@@ -150,11 +250,188 @@ def route(lat1: float, lng1: float, lat2: float, lng2: float) -> Tuple[float, fl
         km = _haversine_km(lat1, lng1, lat2, lng2)
         # สมมุติเวลาขับรถจากความเร็วเฉลี่ย
         minutes = (km / max(ASSUMED_KMH, 1e-6)) * 60.0
+        source = "haversine"
+
+    return RouteResult(km, minutes, source=source)
+
+# ---------------- Route matrix (prewarm / batch) ----------------
+ROUTE_MATRIX_QPS = float(os.getenv("ROUTE_MATRIX_QPS", "5"))   # request ต่อวินาทีไปยัง matrix API
+
+# ข้อจำกัดต่อ request: Google = ≤25 origins, ≤25 destinations, ≤100 elements; ORS (free) ≤3500 routes
+_GOOGLE_MAX_SIDE, _GOOGLE_MAX_ELEMS = 25, 100
+_ORS_MAX_SIDE = 50
+
+class _Throttle:
+    """เว้นระยะระหว่าง request ให้ไม่เกิน qps (ใช้กับงาน batch ที่เรียกต่อเนื่อง)"""
+    def __init__(self, qps: float):
+        self.interval = 1.0 / qps if qps > 0 else 0.0
+        self.next_at = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self.next_at:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
 
-    # 3) บันทึก cache
+def _google_matrix(origins, dests) -> List[List[Optional[Tuple[float, float]]]]:
+    params = {
+        "origins": "|".join(f"{a},{b}" for a, b in origins),
+        "destinations": "|".join(f"{a},{b}" for a, b in dests),
+        "key": GOOGLE_API_KEY, "region": GOOGLE_REGION, "language": GOOGLE_LANGUAGE, "mode": "driving",
+    }
+    client = get_client("google")
+    data = client.get_json("https://maps.googleapis.com/maps/api/distancematrix/json", params=params)
+    if data.get("status") != "OK":
+        client.record_error()
+        raise RuntimeError(f"distancematrix status={data.get('status')}")
+    out = []
+    for row in data.get("rows") or []:
+        cells = []
+        for el in row.get("elements") or []:
+            if el.get("status") == "OK":
+                cells.append(((el["distance"]["value"] or 0) / 1000.0, (el["duration"]["value"] or 0) / 60.0))
+            else:
+                cells.append(None)
+        out.append(cells)
+    return out
+
+def _ors_matrix(origins, dests) -> List[List[Optional[Tuple[float, float]]]]:
+    locs = [[float(b), float(a)] for a, b in list(origins) + list(dests)]   # ORS ใช้ [lng, lat]
+    body = {"locations": locs, "sources": list(range(len(origins))),
+            "destinations": list(range(len(origins), len(locs))),
+            "metrics": ["distance", "duration"], "units": "km"}
+    data = get_client("ors").post_json("https://api.openrouteservice.org/v2/matrix/driving-car", body,
+                                       headers={"Authorization": ORS_API_KEY})
+    dist, dur = data.get("distances") or [], data.get("durations") or []
+    return [[(float(d), float(t) / 60.0) if d is not None and t is not None else None
+             for d, t in zip(drow, trow)] for drow, trow in zip(dist, dur)]
+
+def route_matrix(origins: List[Tuple[float, float]], dests: List[Tuple[float, float]],
+                 qps: float = ROUTE_MATRIX_QPS) -> List[List[RouteResult]]:
+    """
+    RouteResult (km, minutes, .source) ของทุกคู่ origins × dests ผ่าน matrix API (Google → ORS)
+    แบ่ง request ตามข้อจำกัดผู้ให้บริการ และจำกัดอัตราด้วย qps
+    ช่องที่ provider ไม่ตอบ/ปิด USE_REAL_ROUTE ใช้ haversine แทน (source="haversine" เหมือน _fetch_route)
+    ไม่แตะ cache — ผู้เรียกเป็นคนเขียน และไม่ควรเขียนช่อง haversine (ดู scripts/prewarm_routes.py)
+    """
+    out: List[List[Optional[RouteResult]]] = [[None] * len(dests) for _ in origins]
+    if USE_REAL_ROUTE and origins and dests and (GOOGLE_API_KEY or ORS_API_KEY):
+        throttle = _Throttle(qps)
+        if GOOGLE_API_KEY:
+            d_step = min(_GOOGLE_MAX_SIDE, len(dests))
+            o_step = max(1, min(_GOOGLE_MAX_SIDE, _GOOGLE_MAX_ELEMS // d_step))
+        else:
+            d_step = o_step = _ORS_MAX_SIDE
+        for oi in range(0, len(origins), o_step):
+            for di in range(0, len(dests), d_step):
+                o_chunk, d_chunk = origins[oi:oi + o_step], dests[di:di + d_step]
+                block, source = None, None
+                for name, fn, ok in (("Google", _google_matrix, GOOGLE_API_KEY),
+                                     ("ORS", _ors_matrix, ORS_API_KEY)):
+                    if not ok:
+                        continue
+                    throttle.wait()
+                    try:
+                        block, source = fn(o_chunk, d_chunk), name.lower()
+                        break
+                    except Exception as e:
+                        print(f"[WARN] route_matrix({name}) failed: {e}")
+                for r, row in enumerate(block or []):
+                    for c, cell in enumerate(row):
+                        if cell is not None:
+                            out[oi + r][di + c] = RouteResult(cell[0], cell[1], source=source)
+
+    # Fallback: haversine + สมมุติเวลา
+    for r, (a_lat, a_lng) in enumerate(origins):
+        for c, (b_lat, b_lng) in enumerate(dests):
+            if out[r][c] is None:
+                km = _haversine_km(a_lat, a_lng, b_lat, b_lng)
+                out[r][c] = RouteResult(km, (km / max(ASSUMED_KMH, 1e-6)) * 60.0, source="haversine")
+    return out
+
+def route(lat1: float, lng1: float, lat2: float, lng2: float) -> Tuple[float, float]:
+    """
+    คืน (km, minutes) จากต้นทาง → ปลายทาง
+    ลำดับความพยายาม: cache → ตัวประมาณ local (ถ้ามั่นใจ) → ผู้ให้บริการจริง (Google/ORS) → haversine fallback
+    """
+    # 0) snap ต้นทาง แล้วเช็ค cache ก่อน
+    s_lat, s_lng, err_m, label = snap_origin(lat1, lng1)
+    key = _route_key(label, lat2, lng2)
+    cached = load_distance_cache(key)
+    if cached:
+        return RouteResult(cached[0], cached[1], err_m, ROUTE_SNAP, "cache")
+
+    km, minutes, source = FLIGHT.do(("route", key), _route_miss, key, s_lat, s_lng, lat2, lng2, err_m)
+    return RouteResult(km, minutes, err_m, ROUTE_SNAP, source)
+
+async def aroute(lat1: float, lng1: float, lat2: float, lng2: float) -> Tuple[float, float]:
+    """
+    route() สำหรับ asyncio: snap ต้นทางแบบเดียวกับ route() แล้วรอ flight ("route", key) เดียวกัน
+    (_route_miss เช็ค cache ซ้ำใน executor) -> thread และ coroutine ที่ขอคู่เดียวกันยิง provider ครั้งเดียว
+    """
+    s_lat, s_lng, err_m, label = snap_origin(lat1, lng1)
+    key = _route_key(label, lat2, lng2)
+    km, minutes, source = await FLIGHT.ado(("route", key), _route_miss, key, s_lat, s_lng, lat2, lng2, err_m)
+    return RouteResult(km, minutes, err_m, ROUTE_SNAP, source)
+
+def _route_miss(key: str, s_lat: float, s_lng: float, lat2: float, lng2: float, err_m: float,
+                bulk: bool = False) -> tuple:
+    """
+    งานของ leader ใน single-flight: เช็ค cache ซ้ำ (leader ก่อนหน้าอาจเพิ่งเขียน) → ประมาณ/provider → เขียน cache
+    bulk=True (route_many): เพิ่งอ่าน cache แบบ bulk มาแล้ว และจะเขียนกลับแบบ bulk เอง
+    """
+    if not bulk:
+        cached = load_distance_cache(key)
+        if cached:
+            return cached[0], cached[1], "cache"
+    res = _confident_estimate(s_lat, s_lng, lat2, lng2) or _fetch_route(s_lat, s_lng, lat2, lng2)
+    km, minutes = res
+    source = getattr(res, "source", None)
+
+    # บันทึก cache (ค่าประมาณไม่ลง cache: คำนวณใหม่ได้ทันที และโมเดลจะดีขึ้นเรื่อยๆ)
+    if not bulk and source != "estimate":
+        try:
+            save_distance_cache(key, s_lat, s_lng, lat2, lng2, float(km), float(minutes),
+                                ttl_sec=ROUTE_CACHE_TTL, snap_err_m=err_m, source=source)
+        except Exception as e:
+            print(f"[WARN] save_distance_cache failed: {e}")
+    return float(km), float(minutes), source
+
+def route_many(pairs: List[Tuple[float, float, float, float]]) -> List[Tuple[float, float]]:
+    """
+    route() หลายคู่ (lat1, lng1, lat2, lng2) พร้อมกัน: อ่าน cache ครั้งเดียว (key $in / IN (...))
+    คำนวณเฉพาะคู่ที่ miss (single-flight ร่วมกับ route()) แล้วเขียนกลับด้วย bulk upsert ครั้งเดียว
+    คืนผลตามลำดับ pairs
+    """
+    snapped = []
+    for (a_lat, a_lng, b_lat, b_lng) in pairs:
+        s_lat, s_lng, err_m, label = snap_origin(a_lat, a_lng)
+        snapped.append(((s_lat, s_lng, b_lat, b_lng), err_m, _route_key(label, b_lat, b_lng)))
+    keys = [k for _, _, k in snapped]
     try:
-        save_distance_cache(key, lat1, lng1, lat2, lng2, float(km), float(minutes), ttl_sec=ROUTE_CACHE_TTL)
+        hits = load_distance_cache_many(keys)
     except Exception as e:
-        print(f"[WARN] save_distance_cache failed: {e}")
+        print(f"[WARN] load_distance_cache_many failed: {e}")
+        hits = {}
+
+    fresh: Dict[str, tuple] = {}
+    entries = []
+    for p, err_m, key in snapped:
+        if key in hits or key in fresh:
+            continue
+        km, minutes, source = FLIGHT.do(("route", key), _route_miss, key, *p, err_m, bulk=True)
+        fresh[key] = (km, minutes, source)
+        if source not in ("estimate", "cache"):
+            entries.append((key, *p, km, minutes, err_m, source))
+
+    if entries:
+        try:
+            save_distance_cache_many(entries, ttl_sec=ROUTE_CACHE_TTL)
+        except Exception as e:
+            print(f"[WARN] save_distance_cache_many failed: {e}")
 
-    return float(km), float(minutes)
+    out = []
+    for _, err_m, key in snapped:
+        km, minutes, source = (*hits[key], "cache") if key in hits else fresh[key]
+        out.append(RouteResult(km, minutes, err_m, ROUTE_SNAP, source))
+    return out
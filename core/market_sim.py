@@ -0,0 +1,216 @@
+# core/market_sim.py
+"""
+Discrete-event market simulator (แทน Ref_Research_Scenarios/*.js ที่ต้องรันผ่าน Node + fake timers)
+
+  consumer (N ราย, พิกัดคงที่ต่อราย) ── offer ตามเวลาสุ่ม (exponential inter-arrival) ──┐
+                                                                                      ▼
+  event queue (heapq: เวลา, ลำดับ) ── flush ทุก batch_window หน่วยเวลา ──> decide_batch(offers)
+                                                                         (dispatcher_agent.run_batch
+                                                                          reserve_capacity=True -> try_hold_capacity)
+  ได้คลัง -> ตั้ง event release ที่ t + duration_days × day_units -> release(warehouse_id, volume)
+  ไม่ได้คลัง -> consumer ลองใหม่หลัง retry_after (สูงสุด max_retries ครั้ง) ไม่งั้นนับเป็น lost
+
+- RNG ของตัวจำลองเป็น random.Random(seed) ของตัวเอง: seed เดิม + policy เดิม = ลำดับ offer เดิม
+- เวลาเป็นหน่วยจำลอง (ไม่ผูกกับนาฬิกาจริง) 10,000 หน่วยรันจบในไม่กี่วินาที
+- report(): offers / accepted / rejected / lost / fallthrough / revenue / profit / utilization เฉลี่ยตามเวลาต่อคลัง
+  + percentile ราคาที่รับ และเวลา decide ต่อ batch (metrics.sketches.DDSketch หน่วยความจำคงที่ทุก horizon)
+"""
+import heapq, random, time
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from metrics.sketches import DDSketch
+
+ARRIVAL, FLUSH, RELEASE = 0, 1, 2      # ลำดับเมื่อเวลาเท่ากัน: release ก่อน flush ได้ capacity คืนก่อน
+
+# กรอบพิกัด consumer (lat_min, lat_max, lng_min, lng_max) — default รอบคลัง seed ฝั่งตะวันออกของกรุงเทพฯ
+DEFAULT_BBOX = (13.55, 13.80, 100.50, 100.80)
+
+
+def _pct(sk: DDSketch, nd: int) -> Dict[str, Optional[float]]:
+    return {k: (None if v is None else round(v, nd))
+            for k, v in (("p50", sk.quantile(0.5)), ("p95", sk.quantile(0.95)), ("p99", sk.quantile(0.99)))}
+
+
+class MarketSim:
+    def __init__(self,
+                 warehouses: List[Dict[str, Any]],
+                 decide_batch: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+                 release: Callable[[str, float], Any],
+                 consumers: int = 5,
+                 horizon: float = 10000.0,
+                 seed: int = 0,
+                 mean_interarrival: float = 20.0,
+                 batch_window: float = 1.0,
+                 day_units: float = 10.0,
+                 volume_range: Tuple[float, float] = (5.0, 300.0),
+                 duration_range: Tuple[int, int] = (1, 30),
+                 retry_after: float = 50.0,
+                 max_retries: int = 2,
+                 bbox: Tuple[float, float, float, float] = DEFAULT_BBOX):
+        self.rng = random.Random(seed)
+        self.decide_batch = decide_batch
+        self.release = release
+        self.horizon = float(horizon)
+        self.mean_interarrival = float(mean_interarrival)
+        self.batch_window = float(batch_window)
+        self.day_units = float(day_units)
+        self.volume_range = volume_range
+        self.duration_range = duration_range
+        self.retry_after = float(retry_after)
+        self.max_retries = int(max_retries)
+
+        self.capacity = {w["warehouse_id"]: float(w.get("capacity_cbm") or 0.0) for w in warehouses}
+        self.used = {w["warehouse_id"]: float(w.get("used_cbm") or 0.0) for w in warehouses}
+        lat0, lat1, lng0, lng1 = bbox
+        self.consumers = [{"customer_id": f"SIM-C{i + 1}",
+                           "lat": self.rng.uniform(lat0, lat1), "lng": self.rng.uniform(lng0, lng1), "n": 0}
+                          for i in range(int(consumers))]
+
+        self.now = 0.0
+        self._q: List[tuple] = []
+        self._seq = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_at: Optional[float] = None
+        self._util_area = {wid: 0.0 for wid in self.capacity}
+        self._last_t = 0.0
+        self.stats = {"events": 0, "batches": 0, "offers": 0, "accepted": 0, "rejected": 0, "retries": 0,
+                      "lost": 0, "fallthrough": 0, "released": 0, "revenue": 0.0, "profit": 0.0,
+                      "decide_sec": 0.0}
+        self.per_warehouse = {wid: {"wins": 0, "revenue": 0.0, "profit": 0.0} for wid in self.capacity}
+        self.price_sketch = DDSketch()
+        self.decide_ms = DDSketch()
+
+    # ---------- event queue ----------
+    def _push(self, t: float, kind: int, payload: Any = None):
+        self._seq += 1
+        heapq.heappush(self._q, (t, kind, self._seq, payload))
+
+    def _advance(self, t: float):
+        """สะสม utilization × เวลา ถึงเวลา t (time-weighted average)"""
+        dt = t - self._last_t
+        if dt > 0:
+            for wid, cap in self.capacity.items():
+                self._util_area[wid] += (self.used[wid] / cap if cap > 0 else 0.0) * dt
+            self._last_t = t
+
+    # ---------- consumers ----------
+    def _new_offer(self, ci: int) -> Dict[str, Any]:
+        c = self.consumers[ci]
+        c["n"] += 1
+        return {
+            "offer_id": f"{c['customer_id']}-{c['n']}",
+            "customer_id": c["customer_id"],
+            "origin_lat": c["lat"], "origin_lng": c["lng"],
+            "volume_cbm": round(self.rng.uniform(*self.volume_range), 2),
+            "start_date": "2025-01-01",
+            "duration_days": self.rng.randint(*self.duration_range),
+            "sla": {"latest_dropoff_hour": 18, "weekday_only": True},
+            "_sim": {"consumer": ci, "attempt": 0},
+        }
+
+    def _arrival(self, payload):
+        ci, offer = payload
+        if offer is None:
+            offer = self._new_offer(ci)
+            nxt = self.now + self.rng.expovariate(1.0 / self.mean_interarrival)
+            if nxt < self.horizon:
+                self._push(nxt, ARRIVAL, (ci, None))
+        self._pending.append(offer)
+        if self._flush_at is None:
+            self._flush_at = self.now + self.batch_window
+            self._push(self._flush_at, FLUSH)
+
+    # ---------- market ----------
+    def _flush(self):
+        offers, self._pending, self._flush_at = self._pending, [], None
+        if not offers:
+            return
+        t0 = time.perf_counter()
+        decisions = self.decide_batch([{k: v for k, v in o.items() if k != "_sim"} for o in offers])
+        dt = time.perf_counter() - t0
+        self.stats["decide_sec"] += dt
+        self.decide_ms.add(dt * 1000)
+        self.stats["batches"] += 1
+        for offer, d in zip(offers, decisions):
+            self.stats["offers"] += 1
+            wid = d.get("chosen_warehouse")
+            if d.get("accept") and wid:          # reserve() ปิด accept ให้แล้วถ้า hold ไม่ผ่านทุกอันดับ
+                self._accepted(offer, d, wid)
+                continue
+            self.stats["rejected"] += 1
+            sim = offer["_sim"]
+            if sim["attempt"] < self.max_retries and self.now + self.retry_after < self.horizon:
+                self.stats["retries"] += 1
+                retry = dict(offer, _sim={**sim, "attempt": sim["attempt"] + 1})
+                self._push(self.now + self.retry_after, ARRIVAL, (sim["consumer"], retry))
+            else:
+                self.stats["lost"] += 1
+
+    def _accepted(self, offer: Dict[str, Any], d: Dict[str, Any], wid: str):
+        vol = float(offer["volume_cbm"])
+        price = float(d.get("priced_amount") or 0.0)
+        win = next((c for c in d.get("candidates") or [] if c.get("warehouse_id") == wid), {})
+        profit = float(win.get("profit") or 0.0)
+        self.stats["accepted"] += 1
+        self.stats["revenue"] += price
+        self.stats["profit"] += profit
+        self.price_sketch.add(price)
+        if ((d.get("meta") or {}).get("reservation") or {}).get("fallthrough"):
+            self.stats["fallthrough"] += 1
+        pw = self.per_warehouse.setdefault(wid, {"wins": 0, "revenue": 0.0, "profit": 0.0})
+        pw["wins"] += 1; pw["revenue"] += price; pw["profit"] += profit
+        if wid in self.used:
+            self.used[wid] += vol
+        self._push(self.now + float(offer["duration_days"]) * self.day_units, RELEASE, (wid, vol))
+
+    def _release(self, payload):
+        wid, vol = payload
+        self.release(wid, vol)
+        if wid in self.used:
+            self.used[wid] = max(0.0, self.used[wid] - vol)
+        self.stats["released"] += 1
+
+    # ---------- run ----------
+    def run(self, drain: bool = False) -> Dict[str, Any]:
+        """
+        เดินเวลาไปจนครบ horizon (drain=True: เดินต่อจน release ที่ค้างหมด คืน capacity ให้ DB ครบ)
+        """
+        t_wall = time.perf_counter()
+        for ci in range(len(self.consumers)):
+            self._push(self.rng.expovariate(1.0 / self.mean_interarrival), ARRIVAL, (ci, None))
+        while self._q:
+            t, kind, _, payload = self._q[0]
+            if t >= self.horizon and not (drain and kind == RELEASE):
+                if not drain:
+                    break
+                heapq.heappop(self._q)
+                continue
+            heapq.heappop(self._q)
+            self._advance(min(t, self.horizon))
+            self.now = t
+            self.stats["events"] += 1
+            if kind == ARRIVAL:
+                self._arrival(payload)
+            elif kind == FLUSH:
+                self._flush()
+            else:
+                self._release(payload)
+        self._advance(self.horizon)
+        return self.report(time.perf_counter() - t_wall)
+
+    def report(self, wall_sec: float = 0.0) -> Dict[str, Any]:
+        s = dict(self.stats)
+        n = max(1, s["offers"])
+        return {
+            **{k: (round(v, 2) if isinstance(v, float) else v) for k, v in s.items()},
+            "horizon": self.horizon, "consumers": len(self.consumers),
+            "accept_rate": round(s["accepted"] / n, 4),
+            "avg_price": round(s["revenue"] / max(1, s["accepted"]), 2),
+            "price_pct": _pct(self.price_sketch, 2),
+            "utilization_avg": {wid: round(a / max(1e-9, self.horizon), 4) for wid, a in self._util_area.items()},
+            "per_warehouse": {wid: {**v, "revenue": round(v["revenue"], 2), "profit": round(v["profit"], 2)}
+                              for wid, v in self.per_warehouse.items()},
+            "decide_ms": _pct(self.decide_ms, 3),
+            "wall_sec": round(wall_sec, 3),
+            "events_per_sec": round(s["events"] / max(1e-9, wall_sec), 1) if wall_sec else None,
+        }
@@ -0,0 +1,243 @@
+# core/offer_queue.py
+"""
+Durable offer queue (ไฟล์ SQLite แยกจาก DB หลัก) + micro-batch ingestion
+
+  producer:  OfferQueue.enqueue_many(offers)          -> เขียนลงดิสก์ทันที (WAL)
+  consumer:  IngestWorkers(queue).start()             -> N threads
+             ดึง offer เป็นก้อน (ครบ batch_size หรือครบ max_wait) -> dispatcher_agent.run_batch
+             -> save_decision_results (sync) -> ack   (ack หลังบันทึกแล้วเท่านั้น)
+
+- lease: แถวที่ถูกดึงจะถูกจองไว้ lease_sec วินาที ถ้า worker ตายก่อน ack จะกลับมาให้คนอื่นดึงได้
+- nack: attempts+1 ครบ OFFER_QUEUE_MAX_ATTEMPTS -> state='dead'
+- backpressure: enqueue รอจน depth < max_depth (สูงสุด timeout วินาที) ไม่งั้น QueueFull
+- metrics(): depth / leased / dead / lag_sec (อายุ offer ที่รอนานสุด) + ตัวนับของ workers
+"""
+import os, json, time, sqlite3, threading
+from typing import List, Dict, Any, Optional, Callable
+
+OFFER_QUEUE_PATH         = os.getenv("OFFER_QUEUE_PATH", "offer_queue.sqlite3")
+OFFER_QUEUE_BATCH        = int(os.getenv("OFFER_QUEUE_BATCH", "32"))
+OFFER_QUEUE_MAX_WAIT     = float(os.getenv("OFFER_QUEUE_MAX_WAIT", "0.05"))   # วินาที
+OFFER_QUEUE_WORKERS      = int(os.getenv("OFFER_QUEUE_WORKERS", "2"))
+OFFER_QUEUE_LEASE_SEC    = float(os.getenv("OFFER_QUEUE_LEASE_SEC", "60"))
+OFFER_QUEUE_MAX_ATTEMPTS = int(os.getenv("OFFER_QUEUE_MAX_ATTEMPTS", "3"))
+OFFER_QUEUE_MAX_DEPTH    = int(os.getenv("OFFER_QUEUE_MAX_DEPTH", "100000"))
+OFFER_QUEUE_POLL_SEC     = float(os.getenv("OFFER_QUEUE_POLL_SEC", "0.01"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class OfferQueue:
+    """คิว offer บน SQLite (1 แถว = 1 offer) ใช้ได้หลาย thread/หลายโปรเซสบนเครื่องเดียว"""
+
+    def __init__(self, path: str = OFFER_QUEUE_PATH, max_depth: int = OFFER_QUEUE_MAX_DEPTH,
+                 max_attempts: int = OFFER_QUEUE_MAX_ATTEMPTS):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        con = self._conn()
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS offer_queue(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            offer_id TEXT,
+            payload TEXT,
+            enqueued_at REAL,
+            state TEXT DEFAULT 'ready',
+            lease_until REAL,
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT
+        )""")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_offer_queue_state ON offer_queue(state, id)")
+        con.commit(); con.close()
+
+    def _conn(self):
+        # isolation_level=None -> จัดการ BEGIN/COMMIT เอง (BEGIN IMMEDIATE ตอน lease)
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    # ---------- producer ----------
+    def enqueue(self, offer: Dict[str, Any], timeout: float = 0.0) -> int:
+        return self.enqueue_many([offer], timeout)[0]
+
+    def enqueue_many(self, offers: List[Dict[str, Any]], timeout: float = 0.0) -> List[int]:
+        deadline = time.time() + timeout
+        while self.depth() + len(offers) > self.max_depth:
+            if time.time() >= deadline:
+                raise QueueFull(f"offer queue depth >= {self.max_depth}")
+            time.sleep(OFFER_QUEUE_POLL_SEC)
+        now = time.time()
+        con = self._conn(); cur = con.cursor()
+        cur.execute("BEGIN")
+        ids = []
+        for o in offers:
+            cur.execute("INSERT INTO offer_queue(offer_id, payload, enqueued_at) VALUES (?,?,?)",
+                        (str(o.get("offer_id") or ""), json.dumps(o, ensure_ascii=False), now))
+            ids.append(cur.lastrowid)
+        cur.execute("COMMIT"); con.close()
+        return ids
+
+    # ---------- consumer ----------
+    def lease(self, n: int, lease_sec: float = OFFER_QUEUE_LEASE_SEC) -> List[tuple]:
+        """จองสูงสุด n แถว (ready หรือ lease หมดอายุ) -> [(id, offer, enqueued_at), ...] เรียงตาม id"""
+        now = time.time()
+        con = self._conn(); cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        rows = cur.execute("""SELECT id, payload, enqueued_at FROM offer_queue
+                              WHERE state='ready' OR (state='leased' AND lease_until < ?)
+                              ORDER BY id LIMIT ?""", (now, int(n))).fetchall()
+        if rows:
+            cur.executemany("UPDATE offer_queue SET state='leased', lease_until=? WHERE id=?",
+                            [(now + lease_sec, r[0]) for r in rows])
+        cur.execute("COMMIT"); con.close()
+        return [(i, json.loads(p), float(t)) for i, p, t in rows]
+
+    def ack(self, ids: List[int]) -> int:
+        if not ids:
+            return 0
+        con = self._conn()
+        n = con.executemany("DELETE FROM offer_queue WHERE id=?", [(i,) for i in ids]).rowcount
+        con.close()
+        return n
+
+    def nack(self, ids: List[int], error: str = "") -> int:
+        """คืนกลับคิว (attempts+1) ครบ max_attempts -> dead"""
+        if not ids:
+            return 0
+        con = self._conn()
+        n = con.executemany("""UPDATE offer_queue
+                               SET attempts = attempts + 1, last_error = ?, lease_until = NULL,
+                                   state = CASE WHEN attempts + 1 >= ? THEN 'dead' ELSE 'ready' END
+                               WHERE id=?""", [(error[:500], self.max_attempts, i) for i in ids]).rowcount
+        con.close()
+        return n
+
+    # ---------- metrics ----------
+    def depth(self) -> int:
+        con = self._conn()
+        n = con.execute("SELECT COUNT(*) FROM offer_queue WHERE state='ready'").fetchone()[0]
+        con.close()
+        return int(n)
+
+    def metrics(self) -> Dict[str, Any]:
+        con = self._conn()
+        counts = dict(con.execute("SELECT state, COUNT(*) FROM offer_queue GROUP BY state").fetchall())
+        oldest = con.execute("SELECT MIN(enqueued_at) FROM offer_queue WHERE state IN ('ready','leased')").fetchone()[0]
+        con.close()
+        return {"depth": int(counts.get("ready", 0)), "leased": int(counts.get("leased", 0)),
+                "dead": int(counts.get("dead", 0)),
+                "lag_sec": round(time.time() - oldest, 3) if oldest else 0.0}
+
+
+def _default_decide(offers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    from agents.dispatcher_agent import run_batch
+    return run_batch(offers)
+
+
+def _default_persist(items: List[tuple]) -> int:
+    from core.db import save_decision_results
+    return save_decision_results(items)
+
+
+class IngestWorkers:
+    """
+    N threads ดึง micro-batch จาก OfferQueue -> decide_batch -> persist -> ack
+    decide_batch(offers) -> decisions (ลำดับเดียวกัน); persist([(offer, decision, meta), ...])
+    """
+
+    def __init__(self, queue: OfferQueue, batch_size: int = OFFER_QUEUE_BATCH,
+                 max_wait: float = OFFER_QUEUE_MAX_WAIT, workers: int = OFFER_QUEUE_WORKERS,
+                 decide_batch: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None,
+                 persist: Optional[Callable[[List[tuple]], int]] = None,
+                 meta: Optional[Dict[str, Any]] = None):
+        self.queue = queue
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self.n_workers = max(1, int(workers))
+        self.decide_batch = decide_batch or _default_decide
+        self.persist = persist or _default_persist
+        self.meta = dict(meta or {"source": "offer_queue"})
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.stats = {"batches": 0, "processed": 0, "failed": 0, "lag_sum_sec": 0.0,
+                      "lag_max_sec": 0.0, "busy_sec": 0.0}
+
+    def _collect(self) -> List[tuple]:
+        """micro-batch: ได้ครบ batch_size หรือรอครบ max_wait นับจาก offer แรก"""
+        got = self.queue.lease(self.batch_size)
+        if not got:
+            return []
+        deadline = time.time() + self.max_wait
+        while len(got) < self.batch_size and time.time() < deadline and not self._stop.is_set():
+            time.sleep(OFFER_QUEUE_POLL_SEC)
+            got += self.queue.lease(self.batch_size - len(got))
+        return got
+
+    def process_once(self) -> int:
+        """ดึงและประมวลผล 1 micro-batch คืนจำนวน offer ที่ ack ได้"""
+        got = self._collect()
+        if not got:
+            return 0
+        ids = [g[0] for g in got]
+        offers = [g[1] for g in got]
+        t0 = time.time()
+        try:
+            decisions = self.decide_batch(offers)
+            self.persist([(o, d, {**self.meta, "queue_id": i, "enqueued_at": t})
+                          for (i, o, t), d in zip(got, decisions)])
+        except Exception as e:
+            self.queue.nack(ids, str(e))
+            with self._lock:
+                self.stats["failed"] += len(ids)
+            print(f"[WARN] offer batch failed ({len(ids)} offers): {e}")
+            return 0
+        self.queue.ack(ids)
+        done = time.time()
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["processed"] += len(ids)
+            self.stats["busy_sec"] += done - t0
+            for _, _, t in got:
+                self.stats["lag_sum_sec"] += done - t
+                self.stats["lag_max_sec"] = max(self.stats["lag_max_sec"], done - t)
+        return len(ids)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self.process_once():
+                self._stop.wait(OFFER_QUEUE_POLL_SEC * 5)
+
+    def start(self) -> "IngestWorkers":
+        self._stop.clear()
+        for i in range(self.n_workers):
+            t = threading.Thread(target=self._loop, name=f"offer-ingest-{i}", daemon=True)
+            t.start(); self._threads.append(t)
+        return self
+
+    def stop(self, timeout: float = 30.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def drain(self, timeout: float = 60.0) -> bool:
+        """รอจนคิวว่าง (ไม่มี ready/leased) หรือครบ timeout"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            m = self.queue.metrics()
+            if m["depth"] == 0 and m["leased"] == 0:
+                return True
+            time.sleep(OFFER_QUEUE_POLL_SEC * 5)
+        return False
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self.stats)
+        n = max(1, s["processed"])
+        return {**self.queue.metrics(), "batches": s["batches"], "processed": s["processed"],
+                "failed": s["failed"], "avg_batch": round(s["processed"] / max(1, s["batches"]), 2),
+                "avg_lag_sec": round(s["lag_sum_sec"] / n, 4), "max_lag_sec": round(s["lag_max_sec"], 4),
+                "busy_sec": round(s["busy_sec"], 3),
+                "workers": self.n_workers}
@@ -0,0 +1,299 @@
+# core/policy_sweep.py
+"""
+Policy sweep: ประเมินชุดพารามิเตอร์ (W_*, TARGET_UTIL, EPSILON, EXPL_*, ALPHA_MARGIN, BETA_AR, COOLDOWN_*, ...)
+บน offer ชุดเดิม โดยไม่ต้องแก้ .env แล้วรัน inspect_cases.py ใหม่ทีละรอบ
+
+  corpus = build_corpus(offers)                 # geocode + route_many + spec + สถิติ/สตรีค: ทำครั้งเดียว
+  results = sweep(corpus, grid({"W_PROFIT": [0.4, 0.6], "EPSILON": [0, 0.08]}), processes=8)
+  best = rank(results, "profit")[:10]
+
+- quote: PricingAgent.quote_batch (vectorized offers × คลัง) — cache ในแต่ละ worker ตามส่วนของ config ที่มีผลต่อราคา
+  ชุดที่ต่างกันแค่น้ำหนัก/exploration ใช้ quote เดิม (ไม่มี LLM margin hint ต่อคู่)
+- jitter ราคา / epsilon exploration ใช้ seed เดียวกันทุกชุด (common random numbers) ผลต่างจึงมาจากพารามิเตอร์จริง
+  offer มี offer_id ครบ = ใช้ stream ต่อ offer ของ core.rng (seed = run seed) ได้ค่าเดียวกับ dispatcher ที่ RUN_SEED นั้น
+- เลือกผู้ชนะตามตรรกะเดียวกับ dispatcher_agent.select (util penalty, diversity/cooldown streak, epsilon top-k)
+- KPI ต่อชุดผ่าน metrics.dashboard.kpis_from_rows: profit / regret / consistency / winner HHI
+- สถานะคลังเป็น snapshot ตอนสร้าง corpus (ไม่ hold capacity ระหว่าง replay)
+"""
+import os, time, random, itertools, multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Sequence, Mapping
+
+import numpy as np
+
+from core.pricing import PricingConfig
+from core import rng
+
+# พารามิเตอร์ที่ไม่อยู่ใน PricingConfig (diversity penalty ของ WarehouseAgent)
+COOLDOWN_KEYS = ("COOLDOWN_GAMMA", "COOLDOWN_CAP")
+
+OBJECTIVES = {              # ชื่อ -> (คีย์ใน summary, มากดีกว่า?)
+    "profit": ("overall_profit", True),
+    "regret": ("avg_regret", False),
+    "consistency": ("avg_cluster_consistency", True),
+    "hhi": ("winner_hhi", False),
+}
+
+
+@dataclass
+class Corpus:
+    offer_ids: List[Any]
+    warehouse_ids: List[str]
+    volume: np.ndarray            # (n,)
+    duration: np.ndarray          # (n,)
+    km: np.ndarray                # (n, m)
+    spec: np.ndarray              # (n, m)
+    sla_fit: np.ndarray           # (n, m)
+    used: np.ndarray              # (m,)
+    capacity: np.ndarray          # (m,)
+    accept_rate: np.ndarray       # (m,)
+    ewma_util: np.ndarray         # (m,)
+    streaks: Dict[str, int] = field(default_factory=dict)
+    seed: int = 0
+    skipped: int = 0              # offer ที่ geocode/route ไม่ผ่าน (ไม่อยู่ใน corpus)
+
+    @property
+    def shape(self):
+        return self.km.shape
+
+
+def build_corpus(offers: List[Dict[str, Any]], ctx: Optional[Dict[str, Any]] = None, seed: int = 0) -> Corpus:
+    """ส่วนที่ไม่ขึ้นกับพารามิเตอร์: ต้นทาง, route ทุกคู่ (route_many ครั้งเดียว), spec score, snapshot คลัง/สถิติ"""
+    from agents import dispatcher_agent as da
+    ctx = ctx or da.load_context()
+    whs, hist = ctx["warehouses"], ctx.get("hist") or {}
+
+    kept, origins, skipped = [], [], 0
+    for o in offers:
+        try:
+            origins.append(da.resolve_origin(o)); kept.append(o)
+        except Exception as e:
+            skipped += 1
+            print(f"[WARN] skip offer {o.get('offer_id')}: {e}")
+    pairs = [(lat, lng, w["lat"], w["lng"]) for lat, lng in origins for w in whs]
+    routes = da._loc.route_many(pairs) if pairs else []
+    n, m = len(kept), len(whs)
+    km = np.array([float(r["km"] or 0.0) for r in routes], dtype="f8").reshape(n, m)
+    spec = np.array([[float(da._wh.spec_score(o, w)) for w in whs] for o in kept], dtype="f8").reshape(n, m)
+    hrow = lambda w, k: float((hist.get(w["warehouse_id"]) or {}).get(k) or 0.0)
+    return Corpus(
+        offer_ids=[o.get("offer_id") for o in kept],
+        warehouse_ids=[w["warehouse_id"] for w in whs],
+        volume=np.array([float(o["volume_cbm"]) for o in kept], dtype="f8"),
+        duration=np.array([float(o.get("duration_days") or 0) for o in kept], dtype="f8"),
+        km=km, spec=spec, sla_fit=np.ones((n, m)),
+        used=np.array([float(w.get("used_cbm") or 0.0) for w in whs], dtype="f8"),
+        capacity=np.array([float(w.get("capacity_cbm") or 1.0) for w in whs], dtype="f8"),
+        accept_rate=np.array([hrow(w, "accept_rate") for w in whs], dtype="f8"),
+        ewma_util=np.array([hrow(w, "ewma_util") for w in whs], dtype="f8"),
+        streaks=dict(ctx.get("streaks") or {}), seed=seed, skipped=skipped,
+    )
+
+
+# ---------- parameter spaces ----------
+def grid(space: Mapping[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    keys = list(space)
+    return [dict(zip(keys, vals)) for vals in itertools.product(*(space[k] for k in keys))]
+
+
+def random_search(space: Mapping[str, Any], n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """(lo, hi) = สุ่ม uniform (ถ้าเป็น int ทั้งคู่ใช้ randint), list = สุ่มเลือก"""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(int(n)):
+        p = {}
+        for k, v in space.items():
+            if isinstance(v, tuple) and len(v) == 2:
+                lo, hi = v
+                p[k] = rng.randint(lo, hi) if isinstance(lo, int) and isinstance(hi, int) else rng.uniform(lo, hi)
+            else:
+                p[k] = rng.choice(list(v))
+        out.append(p)
+    return out
+
+
+# ---------- evaluation ----------
+class Evaluator:
+    """ประเมินทีละชุดพารามิเตอร์บน corpus เดียว (1 ตัวต่อโปรเซส) — quote cache ตาม PricingConfig.pricing_key()"""
+
+    def __init__(self, corpus: Corpus, base_env: Optional[Mapping[str, str]] = None, max_quotes: int = 64):
+        from agents import warehouse_agent_llm as wa
+        from agents.pricing_agent_llm import PricingAgent
+        self.c = corpus
+        self.base_env = dict(os.environ if base_env is None else base_env)
+        self.cooldown = {k: float(self.base_env.get(k, getattr(wa, k))) for k in COOLDOWN_KEYS}
+        self._agent = PricingAgent()
+        self._quotes: Dict[tuple, np.ndarray] = {}
+        self._max_quotes = max_quotes
+        self.stats = {"evaluated": 0, "quote_hits": 0, "quote_misses": 0}
+        self._ids = (np.asarray(corpus.offer_ids, dtype=object)
+                     if all(o is not None for o in corpus.offer_ids) else None)
+        self._explore_keys = ([rng.offer_key(o, "explore", corpus.seed) for o in corpus.offer_ids]
+                              if self._ids is not None else None)
+
+    def config(self, params: Mapping[str, Any]) -> PricingConfig:
+        env = {**self.base_env, **{k: str(v) for k, v in params.items() if k not in COOLDOWN_KEYS}}
+        return PricingConfig.from_env(env)
+
+    def quotes(self, cfg: PricingConfig) -> np.ndarray:
+        key = cfg.pricing_key()
+        q = self._quotes.get(key)
+        if q is not None:
+            self.stats["quote_hits"] += 1
+            return q
+        self.stats["quote_misses"] += 1
+        c = self.c
+        q = self._agent.quote_batch(c.volume[:, None], c.duration[:, None], c.km, c.used[None, :], c.capacity[None, :],
+                                    c.accept_rate[None, :], c.ewma_util[None, :],
+                                    warehouse_ids=np.asarray(c.warehouse_ids, dtype=object)[None, :],
+                                    cfg=cfg, seed=c.seed,
+                                    offer_ids=None if self._ids is None else self._ids[:, None])
+        if len(self._quotes) >= self._max_quotes:
+            self._quotes.pop(next(iter(self._quotes)))
+        self._quotes[key] = q
+        return q
+
+    def select(self, q: np.ndarray, cfg: PricingConfig, params: Mapping[str, Any]):
+        """ผู้ชนะต่อ offer (index คลัง) + flag exploration — ตรรกะเดียวกับ dispatcher_agent.select"""
+        c, W, t = self.c, cfg.weights, cfg.target_util
+        gamma = float(params.get("COOLDOWN_GAMMA", self.cooldown["COOLDOWN_GAMMA"]))
+        cap = int(float(params.get("COOLDOWN_CAP", self.cooldown["COOLDOWN_CAP"])))
+
+        price, util = q["price_amount"], q["utilization"]
+        pmin, pmax = price.min(axis=1, keepdims=True), price.max(axis=1, keepdims=True)
+        span = pmax - pmin
+        price_score = np.where(span > 0, (pmax - price) / np.where(span > 0, span, 1.0), 0.5)
+        profit_score = np.minimum(1.0, np.round(q["profit"], 2) / 200.0)
+        distance_score = 1.0 / (1.0 + c.km)
+        util_score = np.maximum(0.0, 1.0 - np.abs(util - t))
+        util_pen = np.where(util <= t, 1.0, np.maximum(0.0, 1.0 - 0.8 * (util - t)))
+        base = (W.profit * profit_score + W.price * price_score + W.distance * distance_score +
+                W.sla * c.sla_fit + W.utilbal * util_score + W.spec * c.spec) * util_pen
+
+        if cfg.expl_weight == "distance*avail":
+            ew = np.maximum(1e-9, distance_score * (q["available_cbm"] + 1.0)).tolist()
+        else:
+            ew = None
+
+        idx = {wid: j for j, wid in enumerate(c.warehouse_ids)}
+        last = next((idx[w] for w, s in c.streaks.items() if w in idx and s), None)
+        st = c.streaks.get(c.warehouse_ids[last], 0) if last is not None else 0
+        shared = random.Random(c.seed)
+        n, m = base.shape
+        chosen, explored = np.empty(n, dtype=np.int64), np.zeros(n, dtype=bool)
+        cols = range(m)
+        for i, row in enumerate(base.tolist()):
+            if last is not None:
+                row[last] *= max(0.7, 1.0 - gamma * min(cap, st))
+            order = sorted(cols, key=row.__getitem__, reverse=True)
+            win = order[0]
+            draw = shared if self._explore_keys is None else rng.OfferRNG(None, "explore", key=self._explore_keys[i])
+            if draw.random() < cfg.epsilon:
+                explored[i] = True
+                pool = order[:min(cfg.expl_topk, m)]
+                if ew is not None:
+                    wts = [ew[i][j] for j in pool]
+                elif cfg.expl_weight == "score":
+                    wts = [max(1e-9, row[j]) for j in pool]
+                else:
+                    wts = [1.0] * len(pool)
+                r, cur = draw.random() * sum(wts), 0.0
+                for j, w in zip(pool, wts):
+                    cur += w
+                    if r <= cur:
+                        win = j
+                        break
+            chosen[i] = win
+            st = st + 1 if win == last else 1
+            last = win
+        return chosen, explored
+
+    def rows(self, q: np.ndarray, chosen: np.ndarray, explored: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        แถวรูปแบบ decision_runs ขั้นต่ำที่ kpis_from_rows ต้องใช้
+        candidates มีแค่ผู้ชนะ + คลังกำไรสูงสุด (KPI ใช้แค่สองตัวนี้: regret / util / profit / cluster)
+        """
+        c = self.c
+        profit = np.round(q["profit"], 2)
+        best = profit.argmax(axis=1)
+        cols = {k: np.round(q[k], 2).tolist() for k in ("price_amount", "cost")}
+        profit, util, km = profit.tolist(), q["utilization"].tolist(), c.km.tolist()
+        wids, vols = c.warehouse_ids, c.volume.tolist()
+        cand = lambda i, j: {"warehouse_id": wids[j], "profit": profit[i][j], "cost": cols["cost"][i][j],
+                             "price_amount": cols["price_amount"][i][j], "utilization": util[i][j],
+                             "route": {"km": km[i][j]}}
+        out = []
+        for i, (win, b, ex) in enumerate(zip(chosen.tolist(), best.tolist(), explored.tolist())):
+            out.append({"ts": i, "offer": {"volume_cbm": vols[i]},
+                        "decision": {"accept": True, "chosen_warehouse": wids[win], "reason": {"exploration": ex},
+                                     "candidates": [cand(i, win)] if b == win else [cand(i, b), cand(i, win)]}})
+        return out
+
+    def evaluate(self, params: Mapping[str, Any], full: bool = False) -> Dict[str, Any]:
+        from metrics.dashboard import kpis_from_rows
+        cfg = self.config(params)
+        q = self.quotes(cfg)
+        chosen, explored = self.select(q, cfg, params)
+        k = kpis_from_rows(self.rows(q, chosen, explored), brief=True)
+        self.stats["evaluated"] += 1
+        eff, cons = k["efficiency"], k["consistency"]
+        wins = np.bincount(chosen, minlength=len(self.c.warehouse_ids))
+        out = {
+            "params": dict(params),
+            "overall_profit": k["profitability"]["overall_profit"],
+            "revenue": round(float(np.take_along_axis(q["price_amount"], chosen[:, None], axis=1).sum()), 2),
+            "avg_regret": eff["avg_regret"],
+            "avg_cluster_consistency": cons["avg_cluster_consistency"],
+            "winner_hhi": cons["winner_hhi"],
+            "exploration_rate": cons["exploration_rate"],
+            "wins": dict(zip(self.c.warehouse_ids, wins.tolist())),
+        }
+        if full:
+            out["kpis"] = k
+        return out
+
+
+# ---------- parallel sweep ----------
+_EVAL: Optional[Evaluator] = None
+
+def _init_worker(corpus: Corpus, base_env: Dict[str, str]):
+    global _EVAL
+    _EVAL = Evaluator(corpus, base_env)
+
+def _eval_chunk(param_sets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [_EVAL.evaluate(p) for p in param_sets]
+
+
+def sweep(corpus: Corpus, param_sets: List[Dict[str, Any]], processes: int = 0,
+          base_env: Optional[Mapping[str, str]] = None, chunk: int = 0,
+          start_method: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    ประเมินทุกชุด (ผลเรียงตาม input) — processes <= 1 รันในโปรเซสนี้
+    ส่ง corpus ไปแต่ละ worker ครั้งเดียวตอน init; chunk ที่ติดกันมักแชร์ quote (grid วนคีย์สุดท้ายเร็วสุด)
+    """
+    from agents import warehouse_agent_llm as wa
+    env = dict(os.environ if base_env is None else base_env)
+    for k in COOLDOWN_KEYS:         # ค่าที่โปรเซสนี้ใช้อยู่ ให้ worker (spawn = import ใหม่) ใช้ค่าเดียวกัน
+        env.setdefault(k, str(getattr(wa, k)))
+    t0 = time.perf_counter()
+    if processes <= 1 or len(param_sets) <= 1:
+        ev = Evaluator(corpus, env)
+        out = [ev.evaluate(p) for p in param_sets]
+    else:
+        from core.worker_pool import WORKER_START
+        chunk = chunk or max(1, min(64, len(param_sets) // (processes * 4) or 1))
+        chunks = [param_sets[i:i + chunk] for i in range(0, len(param_sets), chunk)]
+        with ProcessPoolExecutor(max_workers=processes, mp_context=mp.get_context(start_method or WORKER_START),
+                                 initializer=_init_worker, initargs=(corpus, env)) as ex:
+            out = [r for part in ex.map(_eval_chunk, chunks) for r in part]
+    el = time.perf_counter() - t0
+    print(f"[INFO] sweep: {len(param_sets)} configs × {corpus.shape[0]} offers in {el:.2f}s "
+          f"({len(param_sets) / max(1e-9, el):.1f} configs/s)")
+    return out
+
+
+def rank(results: List[Dict[str, Any]], objective: str = "profit") -> List[Dict[str, Any]]:
+    key, higher = OBJECTIVES[objective]
+    valid = [r for r in results if r.get(key) is not None]
+    return sorted(valid, key=lambda r: r[key], reverse=higher) + [r for r in results if r.get(key) is None]
@@ -1,47 +1,206 @@
 # core/pricing.py
-import os
-from typing import Dict, Tuple
-import os
+import os, json, signal, threading
+from dataclasses import dataclass, field, fields, replace
+from types import MappingProxyType
+from typing import Dict, Tuple, Mapping, Optional, Any, Callable
+
+import numpy as np
+
+
+# ===== Precompiled pricing/scoring config =====
+# อ่าน env + parse float ครั้งเดียวตอนโหลด (ไม่ใช่ทุก quote) แล้วส่ง cfg ต่อไปให้ pricing/scoring ตรง ๆ
+# โหลดใหม่: reload_config() หรือส่ง SIGHUP (install_reload_signal) -> อ่าน .env/ไฟล์ override ใหม่
+# override ราย warehouse: RATE_CARD_OVERRIDES = path ไฟล์ JSON หรือ JSON ตรง ๆ
+#   {"W1": {"km_cost": 12, "min_margin": 0.08}, ...}   (ฟิลด์ที่ไม่ระบุใช้ค่ากลาง)
+
+def _envf(env: Mapping[str, str], name: str, default: float) -> float:
+    try:
+        return float(env.get(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+@dataclass(frozen=True)
+class RateCard:
+    handling_per_cbm: float = 5.0
+    storage_per_cbm_day: float = 0.8
+    km_cost: float = 10.0
+    min_margin: float = 0.05
+    surcharge: float = 0.0
+
+    # ใช้แทน dict เดิมได้ (r["km_cost"])
+    def __getitem__(self, key: str) -> float:
+        return getattr(self, key)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+@dataclass(frozen=True)
+class ScoringWeights:
+    profit: float = 0.6
+    utilbal: float = 0.2
+    distance: float = 0.1
+    sla: float = 0.05
+    price: float = 0.05
+    spec: float = 0.05
+
+
+@dataclass(frozen=True)
+class PricingConfig:
+    rate: RateCard = RateCard()
+    overrides: Mapping[str, RateCard] = field(default_factory=lambda: MappingProxyType({}))
+    opportunity_coeff: float = 0.15
+    surge_k: float = 0.0
+    target_util: float = 0.7
+    bid_util_k: float = 1.0
+    bid_km_k: float = 0.02
+    bid_jitter: float = 0.005
+    alpha_margin: float = 0.10
+    beta_ar: float = 0.05
+    weights: ScoringWeights = ScoringWeights()
+    epsilon: float = 0.08
+    expl_topk: int = 3
+    expl_weight: str = "distance*avail"
+    version: int = 0
+
+    def rate_for(self, warehouse_id: Optional[str]) -> RateCard:
+        """rate card ของคลัง (override ถ้ามี ไม่งั้นค่ากลาง) — dict lookup เดียว"""
+        return self.overrides.get(warehouse_id, self.rate) if warehouse_id else self.rate
+
+    def pricing_key(self) -> tuple:
+        """ส่วนของ config ที่มีผลต่อราคา (ไม่รวมน้ำหนัก scoring / exploration) — ใช้เป็น key cache ของ quote"""
+        return (self.rate, tuple(sorted(self.overrides.items())), self.opportunity_coeff, self.target_util,
+                self.bid_util_k, self.bid_km_k, self.bid_jitter, self.alpha_margin, self.beta_ar)
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None, version: int = 0) -> "PricingConfig":
+        e = os.environ if env is None else env
+        rate = RateCard(
+            handling_per_cbm=_envf(e, "HANDLING_PER_CBM", 5.0),
+            storage_per_cbm_day=_envf(e, "STORAGE_PER_CBM_DAY", 0.8),
+            km_cost=_envf(e, "KM_COST", 10.0),
+            min_margin=_envf(e, "MIN_MARGIN", 0.05),
+            surcharge=_envf(e, "SURCHARGE", 0.0),
+        )
+        return cls(
+            rate=rate,
+            overrides=MappingProxyType({wid: replace(rate, **o)
+                                        for wid, o in _load_overrides(e.get("RATE_CARD_OVERRIDES")).items()}),
+            opportunity_coeff=_envf(e, "OPPORTUNITY_COEFF", 0.15),
+            surge_k=_envf(e, "SURGE_K", 0.0),
+            target_util=_envf(e, "TARGET_UTIL", 0.7),
+            bid_util_k=_envf(e, "BID_UTIL_K", 1.0),
+            bid_km_k=_envf(e, "BID_KM_K", 0.02),
+            bid_jitter=_envf(e, "BID_JITTER", 0.005),
+            alpha_margin=_envf(e, "ALPHA_MARGIN", 0.10),
+            beta_ar=_envf(e, "BETA_AR", 0.05),
+            weights=ScoringWeights(
+                profit=_envf(e, "W_PROFIT", 0.6), utilbal=_envf(e, "W_UTILBAL", 0.2),
+                distance=_envf(e, "W_DISTANCE", 0.1), sla=_envf(e, "W_SLA", 0.05),
+                price=_envf(e, "W_PRICE", 0.05), spec=_envf(e, "W_SPEC", 0.05),
+            ),
+            epsilon=_envf(e, "EPSILON", 0.08),
+            expl_topk=int(_envf(e, "EXPL_TOPK", 3)),
+            expl_weight=e.get("EXPL_WEIGHT", "distance*avail"),
+            version=version,
+        )
+
+
+def _load_overrides(spec: Optional[str]) -> Dict[str, Dict[str, float]]:
+    if not spec or not spec.strip():
+        return {}
+    try:
+        if spec.strip().startswith("{"):
+            raw = json.loads(spec)
+        else:
+            with open(spec, encoding="utf-8") as f:
+                raw = json.load(f)
+    except Exception as e:
+        print(f"[WARN] RATE_CARD_OVERRIDES ignored: {e}")
+        return {}
+    known = {f.name for f in fields(RateCard)}
+    return {str(wid): {k: float(v) for k, v in (o or {}).items() if k in known} for wid, o in raw.items()}
+
+
+_CFG: Optional[PricingConfig] = None
+_CFG_LOCK = threading.Lock()
+
+
+def get_config() -> PricingConfig:
+    """config ปัจจุบัน (โหลดครั้งแรกเมื่อถูกเรียก) — ผู้เรียกควรจับไว้หนึ่งครั้งต่อ batch แล้วส่งต่อ"""
+    cfg = _CFG
+    return cfg if cfg is not None else reload_config()
+
+
+def reload_config(env_file: Optional[str] = None) -> PricingConfig:
+    """สร้าง config ใหม่จาก env (อ่าน env_file ทับก่อนถ้าระบุ) แล้วสลับแบบ atomic"""
+    global _CFG
+    if env_file:
+        try:
+            from dotenv import load_dotenv
+            load_dotenv(env_file, override=True)
+        except Exception as e:
+            print(f"[WARN] reload_config: cannot load {env_file}: {e}")
+    with _CFG_LOCK:
+        _CFG = PricingConfig.from_env(version=(_CFG.version + 1) if _CFG is not None else 1)
+        return _CFG
+
+
+def install_reload_signal(env_file: Optional[str] = None,
+                          on_reload: Optional[Callable[[PricingConfig], Any]] = None) -> bool:
+    """SIGHUP -> reload_config(env_file) แล้ว on_reload(cfg) ถ้ามี (เช่นแจ้ง worker process) — POSIX + main thread เท่านั้น"""
+    if not hasattr(signal, "SIGHUP") or threading.current_thread() is not threading.main_thread():
+        return False
+    def _on_hup(signum, frame):
+        cfg = reload_config(env_file)
+        print(f"[INFO] pricing config reloaded (version {cfg.version}, {len(cfg.overrides)} overrides)")
+        if on_reload is not None:
+            on_reload(cfg)
+    signal.signal(signal.SIGHUP, _on_hup)
+    return True
+
+
+def _rate(rate: Any, cfg: Optional[PricingConfig]) -> Any:
+    if rate is not None:
+        return rate
+    return (cfg or get_config()).rate
 
 
 def load_rate() -> Dict:
-    """Rate card กลาง (ยังใช้ได้ร่วมกับ per-warehouse ถ้ามีในอนาคต)"""
-    return {
-        "handling_per_cbm": float(os.getenv("HANDLING_PER_CBM", 5.0)),
-        "storage_per_cbm_day": float(os.getenv("STORAGE_PER_CBM_DAY", 0.8)),
-        "km_cost": float(os.getenv("KM_COST", 10.0)),
-        "min_margin": float(os.getenv("MIN_MARGIN", 0.05)),
-        "surcharge": float(os.getenv("SURCHARGE", 0.0)),
-    }
+    """Rate card กลาง (จาก config ที่โหลดไว้แล้ว) — ราย warehouse ใช้ get_config().rate_for(wid)"""
+    return get_config().rate.as_dict()
 
 def compute_cost(
     volume_cbm: float,
     duration_days: int,
     km: float,
     utilization: float,
-    rate: Dict | None = None,
+    rate: Dict | RateCard | None = None,
+    cfg: PricingConfig | None = None,
 ) -> float:
     """
     ต้นทุนจริง = handling + storage + km + opportunity_cost(utilization)
     opportunity_cost ~ coeff * utilization * volume_cbm
     """
-    r = rate or load_rate()
+    cfg = cfg or get_config()
+    r = _rate(rate, cfg)
     base = (
         r["handling_per_cbm"] * volume_cbm
         + r["storage_per_cbm_day"] * volume_cbm * duration_days
         + r["km_cost"] * km
     )
     # โอกาสเสียโอกาส (ยิ่ง utilization สูง ยิ่งแพง)
-    opp_coeff = float(os.getenv("OPPORTUNITY_COEFF", 0.15))
-    opp = opp_coeff * max(0.0, min(1.0, utilization)) * volume_cbm
+    opp = cfg.opportunity_coeff * max(0.0, min(1.0, utilization)) * volume_cbm
     return base + opp
 
-def price_from_cost(cost: float, rate: Dict | None = None) -> Tuple[float, float]:
+def price_from_cost(cost: float, rate: Dict | RateCard | None = None,
+                    cfg: PricingConfig | None = None) -> Tuple[float, float]:
     """
     แปลง cost -> price ด้วย min_margin + surcharge
     คืน (price, margin_ratio)
     """
-    r = rate or load_rate()
+    r = _rate(rate, cfg)
     price = cost * (1.0 + r["min_margin"]) + r["surcharge"]
     margin = 0.0 if price <= 0 else (price - cost) / price
     return price, margin
@@ -51,17 +210,18 @@ def quote_price(
     duration_days: int,
     km: float,
     utilization: float,
-    rate: Dict | None = None,
+    rate: Dict | RateCard | None = None,
+    cfg: PricingConfig | None = None,
 ) -> Dict:
     """คำนวณราคาพร้อมรายละเอียด ติดไปกับ candidate ใช้ใน scoring ได้"""
-    r = rate or load_rate()
-    cost = compute_cost(volume_cbm, duration_days, km, utilization, r)
+    cfg = cfg or get_config()
+    r = _rate(rate, cfg)
+    cost = compute_cost(volume_cbm, duration_days, km, utilization, r, cfg)
     price, margin = price_from_cost(cost, r)
 
-    # surge ราคาตาม utilization (ออปชัน)
-    surge_k = float(os.getenv("SURGE_K", 0.0))   # 0.0 = ปิด
-    if surge_k > 0:
-        surge = 1.0 + surge_k * max(0.0, utilization - 0.7)  # เริ่ม surge หลัง 70%
+    # surge ราคาตาม utilization (ออปชัน, 0.0 = ปิด)
+    if cfg.surge_k > 0:
+        surge = 1.0 + cfg.surge_k * max(0.0, utilization - 0.7)  # เริ่ม surge หลัง 70%
         price *= surge
         margin = 0.0 if price <= 0 else (price - cost) / price
 
@@ -72,14 +232,66 @@ def quote_price(
         "profit": round(price - cost, 2),
     }
 
+# ===== Vectorized batch quoting (re-pricing / what-if / simulation) =====
+QUOTE_DTYPE = np.dtype([("cost", "f8"), ("opportunity", "f8"), ("surge", "f8"),
+                        ("price_amount", "f8"), ("margin", "f8"), ("profit", "f8")])
+
+
+def rate_arrays(warehouse_ids=None, cfg: PricingConfig | None = None) -> Dict[str, Any]:
+    """
+    rate card เป็น array ตาม shape ของ warehouse_ids (override รายคลัง) — ไม่มี ids = scalar ของค่ากลาง
+    lookup ครั้งเดียวต่อคลังที่ไม่ซ้ำ แล้ว gather ด้วย index
+    """
+    cfg = cfg or get_config()
+    names = [f.name for f in fields(RateCard)]
+    if warehouse_ids is None:
+        return {k: getattr(cfg.rate, k) for k in names}
+    ids = np.asarray(warehouse_ids, dtype=object)
+    codes: Dict[Any, int] = {}
+    inv = np.fromiter((codes.setdefault(w, len(codes)) for w in ids.ravel().tolist()), dtype=np.intp, count=ids.size)
+    table = np.array([[getattr(cfg.rate_for(str(w)), k) for k in names] for w in codes], dtype="f8")
+    return {k: table[inv, i].reshape(ids.shape) for i, k in enumerate(names)}
+
+
+def quote_price_batch(
+    volume_cbm,
+    duration_days,
+    km,
+    utilization,
+    warehouse_ids=None,
+    cfg: PricingConfig | None = None,
+) -> np.ndarray:
+    """
+    quote_price() แบบ vectorized บน array (broadcast ได้) -> structured array QUOTE_DTYPE
+    สูตรเดียวกับ quote_price (ไม่ปัดเศษ — ปัดเองตอนแสดงผล)
+    """
+    cfg = cfg or get_config()
+    nums = [np.asarray(x, dtype="f8") for x in (volume_cbm, duration_days, km, utilization)]
+    if warehouse_ids is not None:           # แกนคลังอาจมาจาก warehouse_ids อย่างเดียว
+        warehouse_ids = np.asarray(warehouse_ids, dtype=object)
+        nums.append(np.zeros(warehouse_ids.shape))
+    vol, days, km_, util = np.broadcast_arrays(*nums)[:4]
+    r = rate_arrays(warehouse_ids, cfg)
+    opp = cfg.opportunity_coeff * np.clip(util, 0.0, 1.0) * vol
+    cost = (r["handling_per_cbm"] * vol + r["storage_per_cbm_day"] * vol * days + r["km_cost"] * km_) + opp
+    price = cost * (1.0 + r["min_margin"]) + r["surcharge"]
+    surge = 1.0 + cfg.surge_k * np.maximum(0.0, util - 0.7) if cfg.surge_k > 0 else np.ones_like(cost)
+    price = price * surge
+
+    out = np.empty(vol.shape, dtype=QUOTE_DTYPE)
+    out["cost"], out["opportunity"], out["surge"], out["price_amount"] = cost, opp, surge, price
+    out["profit"] = price - cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["margin"] = np.where(price > 0, (price - cost) / price, 0.0)
+    return out
+
+
 # --- Backward-compat wrapper for old callers ---
 def price(volume_cbm: float, km: float, duration_days: int, rate: dict | None = None) -> float:
     """
     Legacy shim so older code that imports `price` keeps working.
     Returns only the quoted price amount (not the cost/margin breakdown).
     """
-    if rate is None:
-        rate = load_rate()
     q = quote_price(
         volume_cbm=float(volume_cbm),
         duration_days=int(duration_days),
@@ -0,0 +1,167 @@
+# core/provider_client.py
+"""
+HTTP client ต่อผู้ให้บริการแผนที่ (google / ors) ใช้ร่วมกันทั้งโปรเซส
+
+- 1 requests.Session ต่อ provider: keep-alive + connection pool (PROVIDER_POOL_SIZE) ไม่ต้อง handshake TCP/TLS ทุกครั้ง
+- retry เฉพาะ 429/5xx แบบ backoff (PROVIDER_RETRIES), timeout แยก connect/read
+- token bucket ต่อ provider (PROVIDER_<NAME>_QPS / _BURST) รอ token ได้ไม่เกิน PROVIDER_RATE_WAIT_SEC
+  ไม่งั้น RateLimited -> ผู้เรียก (core/location) ข้ามไป provider ถัดไปตามลำดับเดิม Google → ORS → haversine
+- request เดียวกัน (method+url+params+body) ที่ยิงพร้อมกันหลาย thread รวมเป็นครั้งเดียว (core/singleflight) ทุกคนได้ JSON ชุดเดียวกัน
+- metrics(): requests / errors / merged / throttled / latency (avg, p50, p95, max) ต่อ provider
+"""
+import os, json, time, threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .singleflight import SingleFlight
+
+PROVIDER_POOL_SIZE       = int(os.getenv("PROVIDER_POOL_SIZE", "16"))
+PROVIDER_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "3.05"))
+PROVIDER_READ_TIMEOUT    = float(os.getenv("PROVIDER_READ_TIMEOUT", "10"))
+PROVIDER_RETRIES         = int(os.getenv("PROVIDER_RETRIES", "2"))
+PROVIDER_RATE_WAIT_SEC   = float(os.getenv("PROVIDER_RATE_WAIT_SEC", "2"))
+
+# ค่า default ตามโควต้าทั่วไป: Google ~50 QPS ต่อโปรเจกต์, ORS free 40 req/นาที
+_DEFAULT_RATE = {"google": (20.0, 20.0), "ors": (0.66, 5.0)}
+
+
+class RateLimited(Exception):
+    pass
+
+
+class TokenBucket:
+    """rate token/วินาที, จุได้สูงสุด burst"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """หยิบ 1 token (รอได้ไม่เกิน timeout วินาที); rate <= 0 = ไม่จำกัด"""
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return True
+                wait = (1.0 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class ProviderClient:
+    def __init__(self, name: str, rate: Optional[float] = None, burst: Optional[float] = None,
+                 pool_size: int = PROVIDER_POOL_SIZE, retries: int = PROVIDER_RETRIES,
+                 timeout: tuple = (PROVIDER_CONNECT_TIMEOUT, PROVIDER_READ_TIMEOUT),
+                 rate_wait: float = PROVIDER_RATE_WAIT_SEC):
+        d_rate, d_burst = _DEFAULT_RATE.get(name, (10.0, 10.0))
+        env = name.upper()
+        self.name = name
+        self.timeout = timeout
+        self.rate_wait = rate_wait
+        self.bucket = TokenBucket(rate if rate is not None else float(os.getenv(f"PROVIDER_{env}_QPS", str(d_rate))),
+                                  burst if burst is not None else float(os.getenv(f"PROVIDER_{env}_BURST", str(d_burst))))
+        self.session = requests.Session()
+        retry = Retry(total=retries, connect=retries, read=retries, backoff_factor=0.3,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({"GET", "POST"}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._lat = deque(maxlen=512)
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "sum_ms": 0.0, "max_ms": 0.0}
+
+    # ---------- public ----------
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                 headers: Optional[Dict[str, str]] = None) -> Any:
+        return self._merged("GET", url, params=params, headers=headers)
+
+    def post_json(self, url: str, body: Any, headers: Optional[Dict[str, str]] = None) -> Any:
+        return self._merged("POST", url, body=body, headers=headers)
+
+    def record_error(self):
+        """ให้ผู้เรียกนับ error ระดับ payload (เช่น Google status=OVER_QUERY_LIMIT)"""
+        with self._lock:
+            self.stats["errors"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self.stats)
+            lat = sorted(self._lat)
+        s["merged"] = self._flight.stats["shared"]
+        pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))], 2) if lat else 0.0
+        return {"requests": s["requests"], "errors": s["errors"], "merged": s["merged"],
+                "throttled": s["throttled"], "avg_ms": round(s["sum_ms"] / max(1, s["requests"]), 2),
+                "p50_ms": pct(0.50), "p95_ms": pct(0.95), "max_ms": round(s["max_ms"], 2),
+                "rate_qps": self.bucket.rate, "inflight": self._flight.inflight()}
+
+    def close(self):
+        self.session.close()
+
+    # ---------- internal ----------
+    def _merged(self, method: str, url: str, params=None, body=None, headers=None) -> Any:
+        key = (method, url, json.dumps(params, sort_keys=True, default=str),
+               json.dumps(body, sort_keys=True, default=str))
+        return self._flight.do(key, self._send, method, url, params, body, headers)
+
+    def _send(self, method: str, url: str, params, body, headers) -> Any:
+        if not self.bucket.acquire(self.rate_wait):
+            with self._lock:
+                self.stats["throttled"] += 1
+            raise RateLimited(f"{self.name}: local rate limit ({self.bucket.rate}/s) exhausted")
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            if method == "GET":
+                r = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            else:
+                r = self.session.post(url, data=json.dumps(body), timeout=self.timeout,
+                                      headers={"Content-Type": "application/json", **(headers or {})})
+            r.raise_for_status()
+            data = r.json()
+            ok = True
+            return data
+        finally:
+            ms = (time.perf_counter() - t0) * 1000.0
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["errors"] += 0 if ok else 1
+                self.stats["sum_ms"] += ms
+                self.stats["max_ms"] = max(self.stats["max_ms"], ms)
+                self._lat.append(ms)
+
+
+_CLIENTS: Dict[str, ProviderClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(name: str) -> ProviderClient:
+    c = _CLIENTS.get(name)
+    if c is None:
+        with _CLIENTS_LOCK:
+            c = _CLIENTS.get(name)
+            if c is None:
+                c = _CLIENTS[name] = ProviderClient(name)
+    return c
+
+
+def metrics() -> Dict[str, Any]:
+    return {name: c.metrics() for name, c in list(_CLIENTS.items())}
@@ -0,0 +1,112 @@
+# core/rng.py
+"""
+สุ่มแบบกำหนดซ้ำได้ต่อ offer: ค่าสุ่มขึ้นกับ (RUN_SEED, offer_id, stream, counter) เท่านั้น
+ไม่ขึ้นกับลำดับการเรียก / thread / โปรเซส / ขนาด batch -> replay ได้แบบ bit-exact และ cache decision ได้
+
+  u = uniform_for(offer_id, "jitter", warehouse_id, -j, j)        # scalar (PricingAgent.quote_candidate)
+  U = uniform_batch(ids[:, None], "jitter", wids[None, :], -j, j) # vectorized (quote_batch) ได้ค่าเดียวกันทุกช่อง
+  r = OfferRNG(offer_id, "explore"); r.random(); r.random()        # ลำดับต่อ offer (epsilon-greedy)
+
+- key = blake2b(run_seed | offer_id | stream) 64 บิต, ค่า = splitmix64(key + counter × golden) -> [0, 1) 53 บิต
+- counter ของ warehouse = crc32(warehouse_id) (ไม่ขึ้นกับลำดับคลังใน list)
+- RUN_SEED ไม่ตั้ง = สุ่ม seed ใหม่ต่อโปรเซส (พฤติกรรมใกล้เดิม) แต่บันทึกใน decision meta ให้ replay ได้
+- offer ที่ไม่มี offer_id ใช้ random (global) แบบเดิม
+"""
+import os, random, secrets, zlib, hashlib
+from typing import Any, Optional
+
+import numpy as np
+
+_M64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+_C1, _C2 = 0xBF58476D1CE4E5B9, 0x94D049BB133111EB
+_INV53 = 2.0 ** -53
+
+_RUN_SEED = int(os.getenv("RUN_SEED")) if os.getenv("RUN_SEED", "").strip() else secrets.randbits(63)
+
+
+def run_seed() -> int:
+    return _RUN_SEED
+
+
+def set_run_seed(seed: int) -> int:
+    """ตั้ง run seed ของโปรเซสนี้ (benchmark / simulation / test) — คืนค่าเดิม"""
+    global _RUN_SEED
+    prev, _RUN_SEED = _RUN_SEED, int(seed)
+    return prev
+
+
+def offer_key(offer_id: Any, stream: str, seed: Optional[int] = None) -> int:
+    raw = f"{_RUN_SEED if seed is None else int(seed)}|{offer_id}|{stream}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), "little")
+
+
+def counter_of(name: Any) -> int:
+    return zlib.crc32(str(name).encode("utf-8"))
+
+
+def _splitmix(z: int) -> int:
+    z = (z + _GOLDEN) & _M64
+    z = ((z ^ (z >> 30)) * _C1) & _M64
+    z = ((z ^ (z >> 27)) * _C2) & _M64
+    return z ^ (z >> 31)
+
+
+def u01(key: int, counter: int) -> float:
+    return (_splitmix((key + counter * _GOLDEN) & _M64) >> 11) * _INV53
+
+
+def u01_batch(keys, counters) -> np.ndarray:
+    """u01 แบบ vectorized (keys / counters broadcast กันได้) — ค่าตรงกับ u01 ทุกช่อง"""
+    k = np.asarray(keys, dtype=np.uint64)
+    c = np.asarray(counters, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        z = k + c * np.uint64(_GOLDEN) + np.uint64(_GOLDEN)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(_C1)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(_C2)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype("f8") * _INV53
+
+
+def uniform_for(offer_id: Any, stream: str, name: Any, lo: float, hi: float, seed: Optional[int] = None) -> float:
+    if offer_id is None:
+        return random.uniform(lo, hi)
+    return lo + (hi - lo) * u01(offer_key(offer_id, stream, seed), counter_of(name))
+
+
+def _codes(values: np.ndarray, fn) -> np.ndarray:
+    memo = {}
+    def code(x):
+        c = memo.get(x)
+        if c is None:
+            c = memo[x] = fn(x)
+        return c
+    return np.fromiter((code(x) for x in values.ravel().tolist()), dtype=np.uint64,
+                       count=values.size).reshape(values.shape)
+
+
+def uniform_batch(offer_ids, stream: str, names, lo: float, hi: float, seed: Optional[int] = None) -> np.ndarray:
+    """
+    offer_ids / names เป็น array-like ที่ broadcast กันได้ (เช่น ids[:, None] กับ warehouse_ids[None, :])
+    ช่องเดียวกัน = uniform_for(offer_id, stream, name, lo, hi) ทุกบิต
+    hash เฉพาะ input ก่อน broadcast (n ids + m names) แล้วค่อย broadcast key/counter เป็น uint64 ใน u01_batch
+    """
+    o, n = np.asarray(offer_ids, dtype=object), np.asarray(names, dtype=object)
+    np.broadcast_shapes(o.shape, n.shape)           # shape ไม่เข้ากัน -> ValueError ก่อน hash
+    keys = _codes(o, lambda x: offer_key(x, stream, seed))
+    return lo + (hi - lo) * u01_batch(keys, _codes(n, counter_of))
+
+
+class OfferRNG:
+    """ลำดับสุ่มของ offer เดียว (counter เดินทีละ 1) — ไม่มี offer_id ใช้ random global"""
+    __slots__ = ("key", "n")
+
+    def __init__(self, offer_id: Any, stream: str, seed: Optional[int] = None, key: Optional[int] = None):
+        self.key = key if key is not None else (None if offer_id is None else offer_key(offer_id, stream, seed))
+        self.n = 0
+
+    def random(self) -> float:
+        if self.key is None:
+            return random.random()
+        self.n += 1
+        return u01(self.key, self.n)
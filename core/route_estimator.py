@@ -0,0 +1,264 @@
+# core/route_estimator.py
+"""
+ตัวประมาณระยะทางถนน/เวลาแบบ local เรียนจากเส้นทางจริงที่อยู่ใน distance_cache
+
+  km      = haversine × detour(region)
+  minutes = km / speed(region, ช่วงเวลาของวัน) × 60
+
+- region = ช่อง grid ของต้นทาง (ROUTE_EST_REGION_DEG องศา), ช่วงเวลา = ชั่วโมงท้องถิ่น // ROUTE_EST_SLOT_HOURS
+- เรียนใน log-space แบบ hierarchical shrinkage: global (หด→ค่า default เดิม 1.0 / ASSUMED_KMH)
+  + ผลของช่วงเวลา + ผลของ region + residual ของ (region, ช่วงเวลา) แต่ละชั้นหดเข้าหาชั้นบนด้วย n/(n+ROUTE_EST_PRIOR_N)
+- confidence ∈ [0, 1] = น้ำหนักข้อมูลของ region × exp(-SD ของ log(นาที/haversine) ใน region)
+  core/location ใช้ค่าประมาณแทนการเรียก provider เมื่อ confidence ≥ ROUTE_EST_MIN_CONF
+- ใช้เฉพาะผลจาก provider จริง (source google/ors หรือ entry เก่าที่ไม่ใช่ haversine ล้วน) ไม่เรียนจากค่าที่ตัวเองประมาณ
+- predict ไม่ส่ง ts = ไม่ใช้ผลของช่วงเวลา (ค่าเฉลี่ยทั้งวันของ region) -> offer เดิมได้ km/นาทีเดิมไม่ขึ้นกับนาฬิกา
+  (replay / snapshot ของ feature store ตรงกัน); ผลตามช่วงเวลาใช้เมื่อผู้เรียกส่ง ts มาเองเท่านั้น
+- fit ใน thread เบื้องหลังทุก ROUTE_EST_REFIT_SEC (request ใช้โมเดลเดิมไปก่อน ไม่รอ fit);
+  ยังไม่มีโมเดลเลย -> estimate คืน None ระหว่าง fit ครั้งแรก (server warmup fit ให้ตรงๆ ครั้งเดียว)
+- predict เป็น dict lookup ล้วน (ระดับไมโครวินาที)
+"""
+import os, math, time, threading
+from typing import List, Dict, Optional, NamedTuple, Iterable
+
+ROUTE_ESTIMATOR       = os.getenv("ROUTE_ESTIMATOR", "1") == "1"
+ROUTE_EST_MIN_CONF    = float(os.getenv("ROUTE_EST_MIN_CONF", "0.7"))
+ROUTE_EST_REGION_DEG  = float(os.getenv("ROUTE_EST_REGION_DEG", "0.05"))   # ~5.5 km
+ROUTE_EST_SLOT_HOURS  = max(1, int(os.getenv("ROUTE_EST_SLOT_HOURS", "3")))
+ROUTE_EST_TZ_OFFSET_H = float(os.getenv("ROUTE_EST_TZ_OFFSET_H", "7"))     # Asia/Bangkok
+ROUTE_EST_PRIOR_N     = float(os.getenv("ROUTE_EST_PRIOR_N", "10"))
+ROUTE_EST_MAX_ROWS    = int(os.getenv("ROUTE_EST_MAX_ROWS", "200000"))
+ROUTE_EST_REFIT_SEC   = float(os.getenv("ROUTE_EST_REFIT_SEC", "3600"))
+ROUTE_EST_MIN_KM      = float(os.getenv("ROUTE_EST_MIN_KM", "0.3"))         # ทริปสั้นกว่านี้ ratio แกว่ง ไม่ใช้ฝึก
+
+PROVIDER_SOURCES = ("google", "ors")
+
+
+class RouteEstimate(NamedTuple):
+    km: float
+    minutes: float
+    confidence: float
+
+
+class _Acc:
+    """n / ผลรวม / ผลรวมกำลังสอง ของค่าใน log-space"""
+    __slots__ = ("n", "s", "ss")
+
+    def __init__(self):
+        self.n, self.s, self.ss = 0, 0.0, 0.0
+
+    def add(self, x: float):
+        self.n += 1; self.s += x; self.ss += x * x
+
+    @property
+    def mean(self) -> float:
+        return self.s / self.n if self.n else 0.0
+
+    @property
+    def sd(self) -> float:
+        if self.n < 2:
+            return 0.0
+        return math.sqrt(max(0.0, self.ss / self.n - self.mean ** 2))
+
+
+def _haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    R = 6371.0088
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlmb/2)**2
+    return R * (2*math.atan2(math.sqrt(a), math.sqrt(1-a)))
+
+
+def _shrink(acc: Optional[_Acc], parent: float, k: float) -> float:
+    if acc is None or not acc.n:
+        return parent
+    w = acc.n / (acc.n + k)
+    return w * acc.mean + (1.0 - w) * parent
+
+
+class RouteEstimator:
+    def __init__(self, region_deg: float = ROUTE_EST_REGION_DEG, slot_hours: int = ROUTE_EST_SLOT_HOURS,
+                 prior_n: float = ROUTE_EST_PRIOR_N, default_kmh: Optional[float] = None,
+                 tz_offset_h: float = ROUTE_EST_TZ_OFFSET_H):
+        self.region_deg = float(region_deg)
+        self.slot_hours = max(1, int(slot_hours))
+        self.prior_n = float(prior_n)
+        self.tz_offset_h = float(tz_offset_h)
+        self.default_kmh = float(default_kmh or os.getenv("ASSUMED_KMH", "40"))
+        self.n = 0
+        self.fitted_at = 0.0
+        # ตารางที่คำนวณไว้ตอน fit (log-space)
+        self._g_detour = 0.0
+        self._g_speed = math.log(self.default_kmh)
+        self._detour: Dict[tuple, float] = {}
+        self._speed_slot: Dict[int, float] = {}
+        self._speed_region: Dict[tuple, float] = {}
+        self._speed_rs: Dict[tuple, float] = {}
+        self._conf: Dict[tuple, float] = {}
+
+    # ---------- keys ----------
+    def region(self, lat: float, lng: float) -> tuple:
+        return (int(lat // self.region_deg), int(lng // self.region_deg))
+
+    def slot(self, ts: Optional[float]) -> Optional[int]:
+        if ts is None:
+            return None
+        hour = ((float(ts) / 3600.0) + self.tz_offset_h) % 24
+        return int(hour // self.slot_hours)
+
+    # ---------- fit ----------
+    @staticmethod
+    def usable(km, minutes, source, hav_km: float) -> bool:
+        if km is None or minutes is None or float(km) <= 0 or float(minutes) <= 0 or hav_km < ROUTE_EST_MIN_KM:
+            return False
+        if source is not None:
+            return source in PROVIDER_SOURCES
+        return float(km) / hav_km > 1.0005          # entry เก่า: ตัด haversine fallback (detour = 1 พอดี)
+
+    def fit(self, samples: Iterable[tuple]) -> "RouteEstimator":
+        """samples = [(a_lat, a_lng, b_lat, b_lng, km, minutes, fetched_at|None, source|None), ...]"""
+        rows = []
+        for a_lat, a_lng, b_lat, b_lng, km, minutes, fetched_at, source in samples:
+            if None in (a_lat, a_lng, b_lat, b_lng):
+                continue
+            hav = _haversine_km(float(a_lat), float(a_lng), float(b_lat), float(b_lng))
+            if not self.usable(km, minutes, source, hav):
+                continue
+            km, minutes = float(km), float(minutes)
+            rows.append((self.region(float(a_lat), float(a_lng)), self.slot(fetched_at),
+                         math.log(km / hav), math.log(km / (minutes / 60.0)), math.log(minutes / hav)))
+
+        k = self.prior_n
+        g_d, g_s = _Acc(), _Acc()
+        d_reg: Dict[tuple, _Acc] = {}
+        s_reg: Dict[tuple, _Acc] = {}
+        s_slot: Dict[int, _Acc] = {}
+        m_reg: Dict[tuple, _Acc] = {}
+        for reg, sl, d, s, m in rows:
+            g_d.add(d); g_s.add(s)
+            d_reg.setdefault(reg, _Acc()).add(d)
+            s_reg.setdefault(reg, _Acc()).add(s)
+            m_reg.setdefault(reg, _Acc()).add(m)
+            if sl is not None:
+                s_slot.setdefault(sl, _Acc()).add(s)
+
+        # global หดเข้าหาค่า default เดิม (detour 1.0, ASSUMED_KMH)
+        self._g_detour = _shrink(g_d, 0.0, k)
+        self._g_speed = _shrink(g_s, math.log(self.default_kmh), k)
+        self._detour = {r: _shrink(a, self._g_detour, k) for r, a in d_reg.items()}
+        self._speed_slot = {sl: _shrink(a, self._g_speed, k) - self._g_speed for sl, a in s_slot.items()}
+        self._speed_region = {r: _shrink(a, self._g_speed, k) - self._g_speed for r, a in s_reg.items()}
+
+        # residual ของ (region, slot) หลังหักผล global + slot + region
+        rs: Dict[tuple, _Acc] = {}
+        for reg, sl, _, s, _ in rows:
+            if sl is not None:
+                base = self._g_speed + self._speed_slot.get(sl, 0.0) + self._speed_region.get(reg, 0.0)
+                rs.setdefault((reg, sl), _Acc()).add(s - base)
+        self._speed_rs = {key: _shrink(a, 0.0, k) for key, a in rs.items()}
+
+        self._conf = {r: (a.n / (a.n + k)) * math.exp(-a.sd) for r, a in m_reg.items()}
+        self.n = len(rows)
+        self.fitted_at = time.time()
+        return self
+
+    # ---------- predict ----------
+    def predict(self, lat1: float, lng1: float, lat2: float, lng2: float,
+                ts: Optional[float] = None) -> RouteEstimate:
+        hav = _haversine_km(lat1, lng1, lat2, lng2)
+        reg = self.region(lat1, lng1)
+        sl = self.slot(ts)            # None -> ไม่มีผลของช่วงเวลา (deterministic)
+        km = hav * math.exp(self._detour.get(reg, self._g_detour))
+        log_kmh = (self._g_speed + self._speed_slot.get(sl, 0.0) + self._speed_region.get(reg, 0.0)
+                   + self._speed_rs.get((reg, sl), 0.0))
+        minutes = km / math.exp(log_kmh) * 60.0
+        conf = self._conf.get(reg, 0.0)
+        if hav < ROUTE_EST_MIN_KM:
+            conf *= 0.5
+        return RouteEstimate(km, minutes, round(conf, 4))
+
+    def summary(self) -> Dict[str, object]:
+        return {"samples": self.n, "regions": len(self._detour), "fitted_at": int(self.fitted_at),
+                "global_detour": round(math.exp(self._g_detour), 4),
+                "global_kmh": round(math.exp(self._g_speed), 2),
+                "slot_kmh": {sl * self.slot_hours: round(math.exp(self._g_speed + e), 2)
+                             for sl, e in sorted(self._speed_slot.items())}}
+
+
+# ---------- singleton ระดับโปรเซส ----------
+_EST: Optional[RouteEstimator] = None
+_LOCK = threading.Lock()
+_GEN = 0                  # เพิ่มทุก reset(): fit เบื้องหลังที่เริ่มก่อน reset จะไม่เขียนทับ
+_FITTING = False
+STATS = {"estimated": 0, "low_confidence": 0}
+
+
+def _fit() -> RouteEstimator:
+    from .db import list_distance_samples
+    try:
+        samples: List[tuple] = list_distance_samples(ROUTE_EST_MAX_ROWS)
+    except Exception as e:
+        print(f"[WARN] route_estimator: load samples failed: {e}")
+        samples = []
+    return RouteEstimator().fit(samples)
+
+
+def _fit_background(gen: int):
+    global _EST, _FITTING
+    try:
+        est = _fit()
+        with _LOCK:
+            if gen == _GEN:
+                _EST = est
+    except Exception as e:
+        print(f"[WARN] route_estimator: background fit failed: {e}")
+    finally:
+        with _LOCK:
+            _FITTING = False
+
+
+def _refit_async():
+    """เริ่ม fit ใน daemon thread (ทีละตัว) — ผู้เรียกไม่รอ"""
+    global _FITTING
+    with _LOCK:
+        if _FITTING:
+            return
+        _FITTING = True
+        gen = _GEN
+    threading.Thread(target=_fit_background, args=(gen,), name="route-estimator-fit", daemon=True).start()
+
+
+def get_estimator(refresh: bool = False) -> Optional[RouteEstimator]:
+    """
+    โมเดลปัจจุบัน (ไม่ block): เก่ากว่า ROUTE_EST_REFIT_SEC / ยังไม่มี -> สั่ง fit เบื้องหลังแล้วคืนตัวเดิม (อาจเป็น None)
+    refresh=True -> fit ตรงๆ ใน thread นี้ (warmup / script / test)
+    """
+    global _EST
+    if refresh:
+        est = _fit()
+        with _LOCK:
+            _EST = est
+        return est
+    est = _EST
+    if est is None or time.time() - est.fitted_at >= ROUTE_EST_REFIT_SEC:
+        _refit_async()
+    return est
+
+
+def reset():
+    """ทิ้งโมเดล ให้ fit ใหม่ครั้งถัดไป (เช่นหลัง prewarm)"""
+    global _EST, _GEN
+    with _LOCK:
+        _EST = None
+        _GEN += 1
+
+
+def estimate(lat1: float, lng1: float, lat2: float, lng2: float,
+             ts: Optional[float] = None) -> Optional[RouteEstimate]:
+    """None ถ้าปิด ROUTE_ESTIMATOR, ยัง fit ไม่เสร็จ หรือยังไม่มีข้อมูลให้เรียน"""
+    if not ROUTE_ESTIMATOR:
+        return None
+    est = get_estimator()
+    if est is None or not est.n:
+        return None
+    return est.predict(lat1, lng1, lat2, lng2, ts)
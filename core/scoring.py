@@ -1,20 +1,15 @@
 # core/scoring.py
 from __future__ import annotations
-import os
 from typing import List, Dict, Optional
 
+from core.pricing import PricingConfig, get_config
+
 def _f(v: float) -> float:
     try:
         return float(v)
     except Exception:
         return 0.0
 
-def _w(name: str, default: float) -> float:
-    try:
-        return float(os.getenv(name, default))
-    except Exception:
-        return default
-
 def _norm_min_better(x: float, lo: float, hi: float) -> float:
     """ยิ่งต่ำยิ่งดี -> สเกลเป็น [0,1]"""
     if hi <= lo:
@@ -37,11 +32,12 @@ def compute_scores(
     *,
     offer: Optional[Dict] = None,
     weights: Optional[Dict[str, float]] = None,
+    cfg: Optional[PricingConfig] = None,
 ) -> List[Dict]:
     """
     เติม sub-scores และ score รวมให้แต่ละ candidate แล้วคืนรายการเรียงจากคะแนนสูง -> ต่ำ
 
-    ใช้ค่าน้ำหนักจาก ENV (หรืออาร์กิวเมนต์ weights):
+    ใช้ค่าน้ำหนักจาก cfg (core.pricing.PricingConfig ที่โหลดจาก ENV ไว้แล้ว) หรืออาร์กิวเมนต์ weights:
       W_PROFIT, W_UTILBAL, W_DISTANCE, W_SLA, W_PRICE
       TARGET_UTIL
 
@@ -59,12 +55,13 @@ def compute_scores(
         return []
 
     # น้ำหนัก
-    W_PROFIT   = _w("W_PROFIT",   0.6)
-    W_UTILBAL  = _w("W_UTILBAL",  0.2)
-    W_DISTANCE = _w("W_DISTANCE", 0.1)
-    W_SLA      = _w("W_SLA",      0.05)
-    W_PRICE    = _w("W_PRICE",    0.05)
-    TARGET_UTIL = _w("TARGET_UTIL", 0.7)
+    cfg = cfg or get_config()
+    W_PROFIT   = cfg.weights.profit
+    W_UTILBAL  = cfg.weights.utilbal
+    W_DISTANCE = cfg.weights.distance
+    W_SLA      = cfg.weights.sla
+    W_PRICE    = cfg.weights.price
+    TARGET_UTIL = cfg.target_util
 
     if weights:
         W_PROFIT   = weights.get("profit",   W_PROFIT)
@@ -0,0 +1,134 @@
+# core/singleflight.py
+"""
+Single-flight: ผู้เรียกหลายรายที่ขอ key เดียวกันพร้อมกัน -> ทำงานจริงครั้งเดียว แล้วแบ่งผลให้ทุกคน
+
+  flight = SingleFlight()
+  flight.do(key, fn, *args)           # thread: คนแรกเป็น leader รัน fn, คนอื่นรอ Event
+  await flight.ado(key, fn, *args)    # asyncio: รอผ่าน Future ของ loop ตัวเอง (ไม่บล็อก event loop)
+                                      # fn เป็น coroutine function ก็ได้ ไม่งั้นรันใน default executor
+
+- thread และ coroutine ที่ขอ key เดียวกันรอ flight เดียวกัน (leader แจ้งผลข้าม loop ด้วย call_soon_threadsafe)
+- exception ของ leader ส่งต่อให้ทุกคนที่รอ; key ถูกปล่อยทันทีที่ leader จบ (ไม่ cache ผล — เป็นหน้าที่ผู้เรียก)
+- leader ที่เป็น coroutine ถูก cancel (เช่น client หลุด) ไม่ลามไปหาคนอื่น:
+  fn ธรรมดารันต่อใน executor จนจบแล้วแจ้งผลทุกคนเอง (งานที่เริ่มแล้วไม่ทิ้ง)
+  fn ที่เป็น coroutine ถูก cancel ไปด้วย -> คนที่รอเข้าคิวใหม่ (คนแรกกลายเป็น leader) แทนการได้ CancelledError
+- ห้ามเรียก do() ด้วย key เดิมซ้อนภายใน fn ของตัวเอง (รอตัวเอง = deadlock)
+"""
+import asyncio, threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+_RETRY = object()       # leader ถูก cancel -> ผู้รอ join ใหม่
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "retry", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.retry = False
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+
+def _resolve(fut: asyncio.Future, call: _Call):
+    if fut.done():
+        return
+    if call.retry:
+        fut.set_result(_RETRY)
+    elif call.error is not None:
+        fut.set_exception(call.error)
+    else:
+        fut.set_result(call.result)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "shared": 0}
+
+    def _join(self, key: Hashable) -> Tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.stats["leaders"] += 1
+                return call, True
+            self.stats["shared"] += 1
+            return call, False
+
+    def _finish(self, key: Hashable, call: _Call):
+        with self._lock:
+            self._calls.pop(key, None)
+            waiters, call.waiters = call.waiters, []
+            call.event.set()
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, fut, call)
+            except RuntimeError:       # loop ปิดไปแล้ว
+                pass
+
+    @staticmethod
+    def _value(call: _Call) -> Any:
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        call, leader = self._join(key)
+        while not leader:
+            call.event.wait()
+            if not call.retry:
+                return self._value(call)
+            call, leader = self._join(key)
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+        finally:
+            self._finish(key, call)
+        return self._value(call)
+
+    async def ado(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        call, leader = self._join(key)
+        while not leader:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            with self._lock:
+                done = call.event.is_set()
+                if not done:
+                    call.waiters.append((loop, fut))
+            if done:
+                if not call.retry:
+                    return self._value(call)
+            elif (res := await fut) is not _RETRY:
+                return res
+            call, leader = self._join(key)
+        if not asyncio.iscoroutinefunction(fn):
+            # thread ใน executor จบ flight เอง: leader ถูก cancel ระหว่างรอ ผู้รอคนอื่นยังได้ผลตามปกติ
+            await asyncio.get_running_loop().run_in_executor(None, self._lead, key, call, fn, *args)
+            return self._value(call)
+        try:
+            call.result = await fn(*args)
+        except asyncio.CancelledError:
+            call.retry = True           # ไม่ส่ง cancel ของ leader ต่อ: ผู้รอเข้าคิวใหม่
+            raise
+        except BaseException as e:
+            call.error = e
+        finally:
+            self._finish(key, call)
+        return self._value(call)
+
+    def _lead(self, key: Hashable, call: _Call, fn: Callable[..., Any], *args) -> None:
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+        finally:
+            self._finish(key, call)
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._calls)
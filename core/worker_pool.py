@@ -0,0 +1,114 @@
+# core/worker_pool.py
+"""
+Multi-process dispatch: 1 shard = 1 โปรเซส (ProcessPoolExecutor max_workers=1) ที่ถือ cache ของตัวเอง
+
+- supervisor แบ่ง offer ตาม "ภูมิภาค" ของต้นทาง (grid ละ WORKER_REGION_DEG องศา) -> shard เดิมเสมอ
+  offer ใกล้กันจึงไปตกที่โปรเซสเดียวกัน ใช้ route/geocode/สถิติที่ warm อยู่แล้วซ้ำได้
+- capacity hold ข้ามโปรเซสประสานกันที่ DB (try_hold_capacity = conditional update แบบ atomic)
+- invalidate(): เพิ่ม generation ที่แชร์ (multiprocessing.Value) ทุก worker เห็นก่อน batch ถัดไป
+  แล้วเรียก dispatcher_agent.invalidate_caches(env_file) ของตัวเอง (รวมโหลด pricing config ใหม่จาก env_file)
+  -> supervisor ผูก SIGHUP ไว้กับ invalidate() ให้ worker ได้ config ใหม่ด้วย
+- สตรีคผู้ชนะเดินต่อภายใน batch ของแต่ละ shard (ข้าม shard อ่านจาก DB ตอนเริ่ม batch)
+"""
+import os, zlib, threading, multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Callable
+
+WORKER_PROCESSES  = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 2)))
+WORKER_REGION_DEG = float(os.getenv("WORKER_REGION_DEG", "0.05"))   # ~5.5 km
+WORKER_START      = os.getenv("WORKER_START_METHOD", "spawn")      # spawn ปลอดภัยกับ thread/driver ที่เปิดไว้
+
+# ---- ฝั่ง worker (state ระดับโปรเซส) ----
+_GEN = None          # multiprocessing.Value ที่ supervisor แชร์มา
+_SEEN_GEN = -1
+_ENV_FILE = None     # .env ที่อ่านทับตอน reload pricing config
+
+def _init_worker(gen, env_file=None):
+    global _GEN, _SEEN_GEN, _ENV_FILE
+    _GEN = gen
+    _SEEN_GEN = gen.value
+    _ENV_FILE = env_file
+
+def _check_generation():
+    global _SEEN_GEN
+    if _GEN is not None and _GEN.value != _SEEN_GEN:
+        from agents import dispatcher_agent
+        dispatcher_agent.invalidate_caches(_ENV_FILE)
+        _SEEN_GEN = _GEN.value
+
+def _run_batch(offers: List[Dict[str, Any]], reserve_capacity: bool = False) -> List[Dict[str, Any]]:
+    _check_generation()
+    from agents.dispatcher_agent import run_batch
+    return run_batch(offers, reserve_capacity=reserve_capacity)
+
+
+# ---- ฝั่ง supervisor ----
+def region_key(offer: Dict[str, Any], deg: float = WORKER_REGION_DEG) -> str:
+    """ช่อง grid ของต้นทาง (lat/lng) หรือที่อยู่ (normalize แล้ว) ถ้ายังไม่ได้ geocode"""
+    lat, lng = offer.get("origin_lat"), offer.get("origin_lng")
+    if lat is not None and lng is not None:
+        return f"{int(float(lat) // deg)}:{int(float(lng) // deg)}"
+    return " ".join(str(offer.get("origin_address") or "").lower().split())
+
+def shard_of(offer: Dict[str, Any], n: int, deg: float = WORKER_REGION_DEG) -> int:
+    # crc32 คงที่ข้ามโปรเซส/รอบรัน (hash() ของ str ถูกสุ่มต่อโปรเซส)
+    return zlib.crc32(region_key(offer, deg).encode("utf-8")) % max(1, n)
+
+
+class ProcessDispatcher:
+    """
+    dispatch(offers) -> decisions ตามลำดับ input โดยกระจายไปตาม shard ของภูมิภาค
+    fn(offers, reserve_capacity=...) ต้องเป็นฟังก์ชันระดับโมดูล (pickle ได้)
+    """
+
+    def __init__(self, processes: int = WORKER_PROCESSES, region_deg: float = WORKER_REGION_DEG,
+                 fn: Optional[Callable[..., List[Dict[str, Any]]]] = None,
+                 start_method: str = WORKER_START, env_file: Optional[str] = None):
+        ctx = mp.get_context(start_method)
+        self.n = max(1, int(processes))
+        self.region_deg = region_deg
+        self.fn = fn or _run_batch
+        self.generation = ctx.Value("L", 0)
+        self.shards = [ProcessPoolExecutor(max_workers=1, mp_context=ctx,
+                                           initializer=_init_worker, initargs=(self.generation, env_file))
+                       for _ in range(self.n)]
+        self.stats = {"batches": 0, "offers": 0, "per_shard": [0] * self.n}
+        self._lock = threading.Lock()   # dispatch() ถูกเรียกจากหลาย ingest thread ได้
+
+    def invalidate(self) -> int:
+        """ให้ทุก worker ล้าง cache + โหลด pricing config ใหม่ก่อน batch ถัดไป (เช่นหลัง SIGHUP/seed/แก้คลัง/ย้าย archive)"""
+        with self.generation.get_lock():
+            self.generation.value += 1
+            return int(self.generation.value)
+
+    def dispatch(self, offers: List[Dict[str, Any]], reserve_capacity: bool = False) -> List[Dict[str, Any]]:
+        groups: Dict[int, List[int]] = {}
+        for i, o in enumerate(offers):
+            groups.setdefault(shard_of(o, self.n, self.region_deg), []).append(i)
+        futs = {s: self.shards[s].submit(self.fn, [offers[i] for i in idx], reserve_capacity=reserve_capacity)
+                for s, idx in groups.items()}
+        out: List[Any] = [None] * len(offers)
+        for s, idx in groups.items():
+            try:
+                res = futs[s].result()
+            except Exception as e:
+                res = [{"accept": False, "chosen_warehouse": None, "reason": f"error: {e}",
+                        "priced_amount": None, "candidates": []} for _ in idx]
+            for i, d in zip(idx, res):
+                out[i] = d
+        with self._lock:
+            for s, idx in groups.items():
+                self.stats["per_shard"][s] += len(idx)
+            self.stats["batches"] += 1
+            self.stats["offers"] += len(offers)
+        return out
+
+    def close(self):
+        for ex in self.shards:
+            ex.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
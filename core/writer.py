@@ -0,0 +1,304 @@
+# core/writer.py
+"""
+Buffered decision persistence
+
+แทนที่จะเรียก save_decision_result() (1 INSERT+commit / 1 insert_one ต่อ decision) บน critical path
+ให้โยนเข้าคิวในหน่วยความจำ แล้ว thread เบื้องหลังจะ flush เป็นก้อน (executemany / insert_many)
+เมื่อครบ batch หรือครบเวลา
+
+- คิวมีขนาดจำกัด: ถ้าเต็ม submit() จะรอ (backpressure) สูงสุด put_timeout วินาที
+  เกินนั้นจะเขียนแบบ synchronous บน thread ผู้เรียกแทน (ไม่ทิ้งข้อมูล)
+- sink ล้มครบ WRITER_RETRIES ครั้ง -> batch ถูก spill ต่อท้ายไฟล์ JSONL ของโปรเซสนี้
+  (WRITER_SPILL_DIR/decisions.<pid>.jsonl) แล้ว thread เบื้องหลังเขียนกลับเข้า DB เมื่อ sink ใช้ได้อีก
+  เขียนไฟล์ไม่ได้ -> ถือไว้ในหน่วยความจำ
+- ไฟล์ spill ของโปรเซสที่ตายไปแล้ว: writer ที่ใช้ DB sink ปกติรับไป replay ตอน start (claim ด้วย os.replace
+  เป็นชื่อเฉพาะของตัวเอง -> ไม่มีสองโปรเซส replay ไฟล์เดียวกัน); writer ที่ส่ง sink เองไม่ spill / ไม่แตะไฟล์ของใคร
+  เว้นแต่ส่ง spill_path มาเอง
+- flush() รอจนทุกอย่างที่ submit ไปแล้วถูกเขียนลง DB (หรือ spill); close() = flush + หยุด thread
+- get_decision_writer() คืน singleton ที่ลงทะเบียน close() กับ atexit ไว้แล้ว
+- pending_decision(offer_id) เห็น decision ที่ submit แล้วแต่ยังไม่ลง DB (core/idempotency ใช้กัน retry ช่วงรอ flush)
+  รวม batch ที่ spill อยู่ — ล้างเมื่อเขียนลง DB สำเร็จเท่านั้น (ไม่งั้น retry จะ miss ทั้งสองทางแล้วตัดสิน/hold ซ้ำ)
+"""
+import os, json, time, queue, atexit, threading
+from typing import Dict, Any, List, Optional, Callable
+
+WRITER_BATCH       = int(os.getenv("DECISION_WRITER_BATCH", "200"))
+WRITER_FLUSH_SEC   = float(os.getenv("DECISION_WRITER_FLUSH_SEC", "0.5"))
+WRITER_MAX_QUEUE   = int(os.getenv("DECISION_WRITER_MAX_QUEUE", "10000"))
+WRITER_PUT_TIMEOUT = float(os.getenv("DECISION_WRITER_PUT_TIMEOUT", "1.0"))
+WRITER_RETRIES     = int(os.getenv("DECISION_WRITER_RETRIES", "3"))
+WRITER_SPILL_DIR   = os.getenv("DECISION_WRITER_SPILL_DIR", "writer_spill")
+
+_DEFAULT = object()     # spill_path ไม่ได้ส่งมา
+
+
+def _spill_file(pid: int) -> str:
+    return os.path.join(WRITER_SPILL_DIR, f"decisions.{pid}.jsonl")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:         # PermissionError = มีอยู่แต่เป็นของ user อื่น
+        return True
+    return True
+
+
+def _orphan_spills() -> List[str]:
+    """ไฟล์ spill ของโปรเซสอื่นที่ไม่มีชีวิตแล้ว"""
+    try:
+        names = os.listdir(WRITER_SPILL_DIR)
+    except OSError:
+        return []
+    out = []
+    for name in names:
+        parts = name.split(".")
+        if len(parts) == 3 and parts[0] == "decisions" and parts[2] == "jsonl" and parts[1].isdigit():
+            pid = int(parts[1])
+            if pid != os.getpid() and not _pid_alive(pid):
+                out.append(os.path.join(WRITER_SPILL_DIR, name))
+    return out
+
+
+def _default_sink(items: List[tuple]) -> int:
+    from core.db import save_decision_results
+    return save_decision_results(items)
+
+
+class BufferedDecisionWriter:
+    """คิว (offer, decision, meta, ts) + background flush ด้วย save_decision_results()"""
+
+    def __init__(
+        self,
+        batch_size: int = WRITER_BATCH,
+        flush_interval: float = WRITER_FLUSH_SEC,
+        max_queue: int = WRITER_MAX_QUEUE,
+        put_timeout: float = WRITER_PUT_TIMEOUT,
+        sink: Optional[Callable[[List[tuple]], int]] = None,
+        spill_path: Any = _DEFAULT,
+    ):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.put_timeout = float(put_timeout)
+        self._sink = sink or _default_sink
+        self._q: "queue.Queue[tuple]" = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._stop = threading.Event()
+        self._lock = threading.Lock()   # กัน sink ทำงานซ้อนกัน (background vs sync fallback)
+        self._pending: Dict[str, tuple] = {}   # offer_id -> item ล่าสุดที่ยังไม่ได้เขียน
+        self._plock = threading.Lock()
+        # DB sink ปกติ = ไฟล์ของโปรเซสนี้ + รับไฟล์ค้างของโปรเซสที่ตายแล้ว; sink อื่นต้องส่ง spill_path มาเอง
+        self._adopt_orphans = sink is None and spill_path is _DEFAULT
+        if spill_path is _DEFAULT:
+            spill_path = _spill_file(os.getpid()) if sink is None else None
+        self.spill_path: Optional[str] = spill_path
+        self._held: List[tuple] = []           # batch ที่ spill ลงไฟล์ไม่ได้
+        self._spill_lock = threading.Lock()
+        self._slock = threading.Lock()         # stats ถูกแก้จากหลาย thread
+        self.stats = {"submitted": 0, "written": 0, "batches": 0, "sync_fallback": 0,
+                      "errors": 0, "spilled": 0, "replayed": 0}
+        self._thread = threading.Thread(target=self._run, name="decision-writer", daemon=True)
+        self._thread.start()
+
+    # ---- producer side ----
+    def submit(self, offer: Dict[str, Any], decision: Dict[str, Any],
+               meta: Dict[str, Any] | None = None) -> None:
+        item = (offer, decision, meta or {}, int(time.time()))
+        self._bump("submitted")
+        oid = (offer or {}).get("offer_id")
+        if oid is not None:
+            with self._plock:
+                self._pending[str(oid)] = item
+        if self._stop.is_set():
+            self._write([item]); return
+        try:
+            self._q.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            # backpressure หมดเวลา → คนเรียกจ่ายค่าเขียนเอง
+            self._bump("sync_fallback")
+            self._write([item])
+
+    def _bump(self, key: str, n: int = 1) -> None:
+        with self._slock:
+            self.stats[key] += n
+
+    def pending(self) -> int:
+        return self._q.qsize()
+
+    def pending_decision(self, offer_id: Any) -> Optional[tuple]:
+        """(offer, decision, meta, ts) ล่าสุดของ offer_id ที่ยังค้างในคิว / กำลังเขียน; ไม่มี = None"""
+        with self._plock:
+            return self._pending.get(str(offer_id))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """รอจนคิวว่างและ batch ที่ค้างเขียนเสร็จ; คืน False ถ้าหมดเวลา"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._q.unfinished_tasks:
+            if not self._thread.is_alive():
+                self._drain_inline(); break
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout=max(1.0, self.flush_interval * 2))
+        self._drain_inline()
+        self._replay_spilled()
+
+    # ---- consumer side ----
+    def _write(self, batch: List[tuple]) -> bool:
+        ok = self._write_batch(batch)
+        if ok:
+            self._clear_pending(batch)
+        return ok
+
+    @staticmethod
+    def _same_item(a: tuple, b: tuple) -> bool:
+        # แถวที่อ่านกลับจากไฟล์ spill เป็น object ใหม่ -> เทียบ ts + เนื้อหาแบบเดียวกับตอน spill
+        if a is b:
+            return True
+        if a[3] != b[3]:
+            return False
+        dump = lambda x: json.dumps(list(x), ensure_ascii=False, default=str, sort_keys=True)
+        return dump(a) == dump(b)
+
+    def _clear_pending(self, items: List[tuple]) -> None:
+        """ลง DB แล้ว -> ให้ lookup ไปอ่านจาก DB; item ใหม่กว่าของ offer เดิมยังอยู่"""
+        with self._plock:
+            for item in items:
+                oid = (item[0] or {}).get("offer_id")
+                cur = self._pending.get(str(oid)) if oid is not None else None
+                if cur is not None and self._same_item(cur, item):
+                    del self._pending[str(oid)]
+
+    def _write_batch(self, batch: List[tuple]) -> bool:
+        """True = ลง DB แล้ว; False = ล้มครบทุกครั้ง batch ถูก spill ไว้เขียนใหม่ภายหลัง"""
+        for attempt in range(1, WRITER_RETRIES + 1):
+            try:
+                with self._lock:
+                    self._sink(batch)
+                self._bump("written", len(batch))
+                self._bump("batches")
+                return True
+            except Exception as e:
+                self._bump("errors")
+                if attempt == WRITER_RETRIES:
+                    print(f"[WARN] decision writer failed {len(batch)} rows, spilling: {e}")
+                    self._spill(batch)
+                else:
+                    time.sleep(0.2 * attempt)
+        return False
+
+    # ---- spill / replay ----
+    def _spill(self, batch: List[tuple], count: bool = True) -> None:
+        with self._spill_lock:
+            try:
+                if not self.spill_path:
+                    raise OSError("no spill path")
+                os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for item in batch:
+                        f.write(json.dumps(list(item), ensure_ascii=False, default=str) + "\n")
+            except Exception as e:
+                print(f"[WARN] decision writer spill failed, holding {len(batch)} rows in memory: {e}")
+                self._held.extend(batch)
+        if count:
+            self._bump("spilled", len(batch))
+
+    def _take_spilled(self, orphans: bool = False) -> List[tuple]:
+        with self._spill_lock:
+            items, self._held = self._held, []
+            paths = [self.spill_path] if self.spill_path else []
+            if orphans and self._adopt_orphans:
+                paths += _orphan_spills()
+            for path in paths:
+                # claim เป็นชื่อเฉพาะของ writer นี้ก่อนอ่าน: ใครย้ายได้ก่อนคนนั้น replay
+                tmp = f"{path}.{os.getpid()}-{id(self)}.replay"
+                try:
+                    os.replace(path, tmp)
+                except FileNotFoundError:
+                    continue
+                with open(tmp, encoding="utf-8") as f:
+                    items += [tuple(json.loads(line)) for line in f if line.strip()]
+                os.remove(tmp)
+        return items
+
+    def _replay_spilled(self, orphans: bool = False) -> None:
+        """เขียนแถวที่ spill ไว้กลับเข้า DB (ล้มอีก -> ถือไว้รอรอบหน้า); orphans = รวมไฟล์ของโปรเซสที่ตายแล้ว"""
+        if not orphans and not self._held and not (self.spill_path and os.path.exists(self.spill_path)):
+            return
+        try:
+            items = self._take_spilled(orphans)
+        except Exception as e:
+            print(f"[WARN] decision writer cannot read spill file: {e}")
+            return
+        for i in range(0, len(items), self.batch_size):
+            chunk = items[i:i + self.batch_size]
+            try:
+                with self._lock:
+                    self._sink(chunk)
+                self._bump("written", len(chunk))
+                self._bump("replayed", len(chunk))
+                self._clear_pending(chunk)
+            except Exception as e:
+                self._bump("errors")
+                print(f"[WARN] decision writer replay failed: {e}")
+                self._spill(items[i:], count=False)     # กลับลงไฟล์ของโปรเซสนี้ (รวมที่รับมาจากโปรเซสอื่น)
+                return
+
+    def _take_batch(self) -> List[tuple]:
+        try:
+            batch = [self._q.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                batch.append(self._q.get(timeout=left))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        self._replay_spilled(orphans=True)      # ค้างจากโปรเซสก่อนที่ตายไปแล้ว
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                if self._write(batch):
+                    self._replay_spilled()
+            finally:
+                for _ in batch:
+                    self._q.task_done()
+
+    def _drain_inline(self) -> None:
+        batch = []
+        while True:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+            for _ in batch:
+                self._q.task_done()
+
+
+_WRITER: Optional[BufferedDecisionWriter] = None
+_WRITER_LOCK = threading.Lock()
+
+def get_decision_writer() -> BufferedDecisionWriter:
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = BufferedDecisionWriter()
+            atexit.register(_WRITER.close)
+        return _WRITER
@@ -3,6 +3,8 @@
 import json, statistics as stats
 from collections import defaultdict, Counter
 
+from metrics.sketches import DDSketch, HyperLogLog
+
 def _as_dict(x):
     """พยายามแปลง x ให้เป็น dict:
        - ถ้าเป็น str จะลอง json.loads
@@ -26,56 +28,75 @@ def _safe_float(v, d=0.0):
 def _bin(x, step):
     return step * round(_safe_float(x)/step)
 
-def _ewma(values, alpha=0.3):
-    s = None
-    for v in values:
-        s = v if s is None else alpha*v + (1-alpha)*s
-    return s if s is not None else 0.0
-
-def compute_kpis(from_ts=None, to_ts=None, brief: bool=False):
-    from core.db import get_recent_decisions, list_active_warehouses
+def compute_kpis(from_ts=None, to_ts=None, brief: bool=False, warehouse_id=None):
+    from core.db import get_recent_decisions
 
     #decisions = get_recent_decisions(days=365*5) or []
 
-    # ใหม่ ดูย้อนหลังแค่ 1 วัน
-    decisions = get_recent_decisions(days=1) or []
+    # ใหม่ ดูย้อนหลังแค่ 1 วัน (ถ้าระบุ from_ts/to_ts/warehouse จะส่งลงไปกรองที่ DB + archive เลย)
+    decisions = get_recent_decisions(days=1, since_ts=from_ts, until_ts=to_ts,
+                                     warehouse_id=warehouse_id) or []
     if from_ts or to_ts:
         decisions = [
             d for d in decisions
             if (from_ts is None or d.get("ts", 0) >= from_ts) and
                (to_ts   is None or d.get("ts", 0) <= to_ts)
         ]
-
-    whs = {w["warehouse_id"]: w for w in (list_active_warehouses() or [])}
-
-    chosen_seq = []
-    util_history = defaultdict(list)
-    profit_history = defaultdict(list)
-    price_history = defaultdict(list)
-    regret_list = []
-
-    accept_cnt = decline_cnt = forward_cnt = 0
-    exploration_cnt = 0
-
-    clusters = defaultdict(list)
-
-    for row in decisions:
+    return kpis_from_rows(decisions, brief=brief)
+
+def kpis_from_rows(decisions, brief: bool=False):
+    """KPI จากแถว decision ({"ts","offer","decision"}) ที่โหลดมาแล้ว — ใช้ร่วมกับ policy sweep (core/policy_sweep)"""
+    acc = KpiAccumulator()
+    acc.add_many(decisions)
+    return acc.snapshot(brief=brief)
+
+
+class KpiAccumulator:
+    """
+    ตัวสะสม KPI แบบเพิ่มทีละแถว: add() = O(1) ต่อ decision, median/p90 จาก DDSketch, distinct จาก HyperLogLog
+    snapshot() ไม่วนแถวเก่า -> dashboard --follow ต่อ refresh จ่ายตามจำนวน decision ใหม่เท่านั้น
+    หน่วยความจำคงที่ไม่ขึ้นกับจำนวน decision (median/p90 ผิดไม่เกิน ~1% ของค่า)
+    """
+
+    def __init__(self, ewma_alpha: float = 0.3):
+        self.alpha = ewma_alpha
+        self.n = 0
+        self.accept_cnt = self.decline_cnt = self.forward_cnt = 0
+        self.exploration_cnt = 0
+        self.util = {}        # wid -> {"n","sum","ewma","sketch"}
+        self.profit = {}      # wid -> {"n","sum","sketch"}
+        self.regret = DDSketch()
+        self.customers = HyperLogLog()
+        self.origins = HyperLogLog()
+        self.wins = Counter()
+        self.clusters = defaultdict(Counter)
+        self.last_ts = None
+
+    def add_many(self, rows):
+        for row in rows:
+            self.add(row)
+        return self
+
+    def add(self, row):
         dec = _as_dict(row.get("decision"))
         offer = _as_dict(row.get("offer"))
+        self.n += 1
+        self.last_ts = row.get("ts", self.last_ts)
+        self.customers.add(offer.get("customer_id"))
+        self.origins.add(_origin_key(offer))
 
         accept = dec.get("accept", row.get("accept"))
         chosen_wid = dec.get("chosen_warehouse", row.get("chosen_warehouse"))
 
         reason = dec.get("reason", row.get("reason"))
-        reason_dict = _as_dict(reason)
-        exploration = bool(reason_dict.get("exploration", False))
+        exploration = bool(_as_dict(reason).get("exploration", False))
         if exploration:
-            exploration_cnt += 1
+            self.exploration_cnt += 1
 
         if bool(accept):
-            accept_cnt += 1
+            self.accept_cnt += 1
         else:
-            decline_cnt += 1
+            self.decline_cnt += 1
 
         cands = dec.get("candidates", row.get("candidates"))
         if isinstance(cands, str):
@@ -99,109 +120,124 @@ def compute_kpis(from_ts=None, to_ts=None, brief: bool=False):
         src = chosen or best or {}
         rt = src.get("route") or {}
         if isinstance(rt, (list, tuple)) and len(rt) >= 2:
-            km = _safe_float(rt[0]); minutes = _safe_float(rt[1])
+            km = _safe_float(rt[0])
         else:
-            km = _safe_float(rt.get("km")); minutes = _safe_float(rt.get("minutes"))
-
-        util = _safe_float(src.get("utilization"))
-        profit = _safe_float(src.get("profit"))
-        price = _safe_float(src.get("price_amount"))
-        cost = _safe_float(src.get("cost"))
+            km = _safe_float(rt.get("km"))
 
         if chosen and best and _safe_float(best.get("profit")) > 0:
             regret = max(0.0, (_safe_float(best.get("profit")) - _safe_float(chosen.get("profit")))
                               / _safe_float(best.get("profit")))
-            regret_list.append(regret)
+            self.regret.add(regret)
 
         if chosen_wid and chosen:
-            util_history[chosen_wid].append(util)
-            profit_history[chosen_wid].append(profit)
-            price_history[chosen_wid].append(price)
-            chosen_seq.append((int(row.get("ts", 0)), chosen_wid, km, util, profit, price, cost, exploration))
-
-        vol = _safe_float(offer.get("volume_cbm"))
-        vol_key = _bin(vol, 5.0)
-        dist_key = _bin(km, 5.0)
+            util = _safe_float(src.get("utilization"))
+            profit = _safe_float(src.get("profit"))
+            u = self.util.setdefault(chosen_wid, {"n": 0, "sum": 0.0, "ewma": None, "sketch": DDSketch()})
+            u["n"] += 1; u["sum"] += util
+            u["ewma"] = util if u["ewma"] is None else self.alpha*util + (1-self.alpha)*u["ewma"]
+            u["sketch"].add(util)
+            p = self.profit.setdefault(chosen_wid, {"n": 0, "sum": 0.0, "sketch": DDSketch()})
+            p["n"] += 1; p["sum"] += profit
+            p["sketch"].add(profit)
+            self.wins[chosen_wid] += 1
+
         if chosen_wid:
-            clusters[(vol_key, dist_key)].append(chosen_wid)
-
-    # Utilization KPI
-    util_kpi = {}
-    for wid, utils in util_history.items():
-        utils_sorted = sorted(utils)
-        p90 = utils_sorted[int(0.9*len(utils))-1] if len(utils) >= 10 else None
-        util_kpi[wid] = {
-            "mean_util": round(stats.mean(utils), 4) if utils else 0.0,
-            "p90_util": round(p90, 4) if p90 is not None else None,
-            "ewma_util": round(_ewma(utils, alpha=0.3), 4) if utils else 0.0,
-            "samples": len(utils),
+            vol_key = _bin(_safe_float(offer.get("volume_cbm")), 5.0)
+            self.clusters[(vol_key, _bin(km, 5.0))][chosen_wid] += 1
+
+    def snapshot(self, brief: bool=False):
+        # Utilization KPI
+        util_kpi = {}
+        for wid, u in self.util.items():
+            p90 = u["sketch"].quantile(0.9) if u["n"] >= 10 else None
+            util_kpi[wid] = {
+                "mean_util": round(u["sum"] / u["n"], 4),
+                "p90_util": round(p90, 4) if p90 is not None else None,
+                "ewma_util": round(u["ewma"], 4),
+                "samples": u["n"],
+            }
+
+        # Profitability KPI
+        PROFIT_TO_TOKEN = _safe_float(os.getenv("PROFIT_TO_TOKEN", "1.0"))
+        profit_kpi = {}
+        total_profit = 0.0
+        for wid, p in self.profit.items():
+            s = p["sum"]; total_profit += s
+            profit_kpi[wid] = {
+                "total_profit": round(s, 2),
+                "avg_profit": round(s / p["n"], 2),
+                "median_profit": round(p["sketch"].quantile(0.5), 2),
+                "tokens_earned": round(s * PROFIT_TO_TOKEN, 2),
+            }
+        overall_tokens = round(total_profit * PROFIT_TO_TOKEN, 2)
+
+        # Efficiency KPI
+        total = self.accept_cnt + self.decline_cnt + self.forward_cnt
+        n_regret = int(self.regret.count)
+        eff_kpi = {
+            "accept_rate": round(self.accept_cnt / total, 4) if total else 0.0,
+            "decline_rate": round(self.decline_cnt / total, 4) if total else 0.0,
+            "forward_rate": round(self.forward_cnt / total, 4) if total else 0.0,
+            "avg_regret": round(self.regret.mean, 4) if n_regret else None,
+            "median_regret": round(self.regret.quantile(0.5), 4) if n_regret else None,
+            "n_with_regret": n_regret,
         }
 
-    # Profitability KPI
-    PROFIT_TO_TOKEN = _safe_float(os.getenv("PROFIT_TO_TOKEN", "1.0"))
-    profit_kpi = {}
-    total_profit = 0.0
-    for wid, profits in profit_history.items():
-        s = sum(profits); total_profit += s
-        profit_kpi[wid] = {
-            "total_profit": round(s, 2),
-            "avg_profit": round(stats.mean(profits), 2) if profits else 0.0,
-            "median_profit": round(stats.median(profits), 2) if profits else 0.0,
-            "tokens_earned": round(s * PROFIT_TO_TOKEN, 2),
+        # Consistency KPI
+        cluster_scores = []
+        dominant_table = []
+        for key, cnt in self.clusters.items():
+            n = sum(cnt.values())
+            if n < 3:
+                continue
+            dominant, freq = cnt.most_common(1)[0]
+            consistency = freq / n
+            cluster_scores.append(consistency)
+            if not brief:
+                dominant_table.append({
+                    "cluster": {"vol_bin": key[0], "dist_bin": key[1]},
+                    "dominant_warehouse": dominant,
+                    "consistency": round(consistency, 4),
+                    "n": n,
+                })
+        exploration_rate = round(self.exploration_cnt / max(1, self.n), 4)
+
+        # ความกระจุกตัวของผู้ชนะ (Herfindahl–Hirschman: ผลรวม share^2, 1/n = กระจายเท่ากัน, 1 = คลังเดียวชนะหมด)
+        n_wins = sum(self.wins.values())
+        winner_hhi = round(sum((c / n_wins) ** 2 for c in self.wins.values()), 4) if n_wins else None
+
+        consistency_kpi = {
+            "avg_cluster_consistency": round(stats.mean(cluster_scores), 4) if cluster_scores else None,
+            "median_cluster_consistency": round(stats.median(cluster_scores), 4) if cluster_scores else None,
+            "exploration_rate": exploration_rate,
+            "winner_hhi": winner_hhi,
+            "top_clusters": sorted(dominant_table, key=lambda x: (-x["n"], -x["consistency"]))[:10],
         }
-    overall_tokens = round(total_profit * PROFIT_TO_TOKEN, 2)
-
-    # Efficiency KPI
-    total = accept_cnt + decline_cnt + forward_cnt
-    eff_kpi = {
-        "accept_rate": round(accept_cnt / total, 4) if total else 0.0,
-        "decline_rate": round(decline_cnt / total, 4) if total else 0.0,
-        "forward_rate": round(forward_cnt / total, 4) if total else 0.0,
-        "avg_regret": round(stats.mean(regret_list), 4) if regret_list else None,
-        "median_regret": round(stats.median(regret_list), 4) if regret_list else None,
-        "n_with_regret": len(regret_list),
-    }
-
-    # Consistency KPI
-    cluster_scores = []
-    dominant_table = []
-    for key, winners in clusters.items():
-        if len(winners) < 3:
-            continue
-        cnt = Counter(winners)
-        dominant, freq = cnt.most_common(1)[0]
-        consistency = freq / len(winners)
-        cluster_scores.append(consistency)
-        if not brief:
-            dominant_table.append({
-                "cluster": {"vol_bin": key[0], "dist_bin": key[1]},
-                "dominant_warehouse": dominant,
-                "consistency": round(consistency, 4),
-                "n": len(winners),
-            })
-    exploration_rate = round(exploration_cnt / max(1, len(decisions)), 4)
-
-    consistency_kpi = {
-        "avg_cluster_consistency": round(stats.mean(cluster_scores), 4) if cluster_scores else None,
-        "median_cluster_consistency": round(stats.median(cluster_scores), 4) if cluster_scores else None,
-        "exploration_rate": exploration_rate,
-        "top_clusters": sorted(dominant_table, key=lambda x: (-x["n"], -x["consistency"]))[:10],
-    }
-
-    return {
-        "utilization": util_kpi,
-        "profitability": {
-            "per_warehouse": profit_kpi,
-            "overall_tokens": overall_tokens,
-            "overall_profit": round(total_profit, 2),
-        },
-        "efficiency": eff_kpi,
-        "consistency": consistency_kpi,
-        "meta": {
-            "n_decisions": len(decisions),
-            "warehouses_seen": sorted(set(util_history.keys()) | set(profit_history.keys())),
-        },
-    }
+
+        return {
+            "utilization": util_kpi,
+            "profitability": {
+                "per_warehouse": profit_kpi,
+                "overall_tokens": overall_tokens,
+                "overall_profit": round(total_profit, 2),
+            },
+            "efficiency": eff_kpi,
+            "consistency": consistency_kpi,
+            "meta": {
+                "n_decisions": self.n,
+                "warehouses_seen": sorted(set(self.util.keys()) | set(self.profit.keys())),
+                "distinct_customers": self.customers.count(),
+                "distinct_origins": self.origins.count(),
+            },
+        }
+
+
+def _origin_key(offer):
+    """ต้นทางของ offer สำหรับนับ distinct: พิกัดปัด 3 ตำแหน่ง (~100 ม.) ไม่มีพิกัดใช้ที่อยู่"""
+    lat, lng = offer.get("origin_lat"), offer.get("origin_lng")
+    if lat is not None and lng is not None:
+        return f"{_safe_float(lat):.3f},{_safe_float(lng):.3f}"
+    return offer.get("origin_address") or None
 
 
 # ===== add to bottom of metrics/dashboard.py =====
@@ -225,9 +261,11 @@ def _print_plain(k):
     # Overall / Efficiency
     eff = k["efficiency"]; prof = k["profitability"]; cons = k["consistency"]
     print("\n=== OVERALL ===")
-    print(f"n_decisions={k['meta']['n_decisions']}, warehouses={','.join(k['meta']['warehouses_seen'])}")
+    print(f"n_decisions={k['meta']['n_decisions']}, warehouses={','.join(k['meta']['warehouses_seen'])}, "
+          f"distinct_customers~{k['meta'].get('distinct_customers')}, distinct_origins~{k['meta'].get('distinct_origins')}")
     print(f"accept_rate={eff['accept_rate']:.3f}, decline_rate={eff['decline_rate']:.3f}, "
-          f"avg_regret={eff.get('avg_regret')}, exploration_rate={cons.get('exploration_rate',0):.3f}")
+          f"avg_regret={eff.get('avg_regret')}, exploration_rate={cons.get('exploration_rate',0):.3f}, "
+          f"winner_hhi={cons.get('winner_hhi')}")
     print(f"overall_profit={prof['overall_profit']:.2f}, overall_tokens={prof['overall_tokens']:.2f}")
 
     # Per-warehouse (Util + Profit)
@@ -291,6 +329,45 @@ def _print_table(k):
                        row["dominant_warehouse"], f"{row['consistency']:.3f}", str(row["n"]))
         c.print(tc)
 
+def _render(kpis, fmt: str):
+    if fmt == "json":
+        print(json.dumps(kpis, ensure_ascii=False, indent=2))
+    elif fmt == "plain":
+        _print_plain(kpis)
+    else:
+        _print_table(kpis)
+
+def follow(from_ts=None, warehouse_id=None, interval: float=5.0, page: int=5000,
+           brief: bool=False, fmt: str="table", max_refresh=None):
+    """
+    live tail: โหลด decision ตั้งแต่ from_ts (ไม่ระบุ = 1 วันย้อนหลัง เหมือน compute_kpis) ครั้งเดียว
+    แล้วทุก interval วินาทีอ่านเฉพาะแถวหลัง cursor (get_decisions_after) เข้า KpiAccumulator แล้ว render ใหม่
+    """
+    from core.db import get_decisions_after
+    since = int(from_ts) if from_ts is not None else int(time.time()) - 24*3600
+    acc, cursor, refresh = KpiAccumulator(), None, 0
+    while True:
+        t0 = time.perf_counter(); new = 0
+        while True:
+            rows = get_decisions_after(cursor, since_ts=since, limit=page, warehouse_id=warehouse_id)
+            if not rows:
+                break
+            acc.add_many(rows); new += len(rows)
+            cursor = rows[-1]["key"]
+            if len(rows) < page:
+                break
+        kpis = acc.snapshot(brief=brief)
+        kpis["meta"]["follow"] = {"new_decisions": new, "cursor": cursor, "last_ts": acc.last_ts,
+                                  "refresh_ms": round((time.perf_counter() - t0) * 1000, 1)}
+        if fmt != "json":
+            print("\033[2J\033[H", end="")
+            print(f"[follow] +{new} decisions, cursor={cursor}, every {interval:g}s (Ctrl+C to stop)")
+        _render(kpis, fmt)
+        refresh += 1
+        if max_refresh is not None and refresh >= max_refresh:
+            return kpis
+        time.sleep(interval)
+
 def main():
     import argparse
     ap = argparse.ArgumentParser(description="WMS Metrics Dashboard (print to terminal)")
@@ -299,17 +376,30 @@ def main():
     ap.add_argument("--to-ts", type=int, default=None, help="end epoch (inclusive)")
     ap.add_argument("--format", choices=["plain","table","json"], default="table", help="output format")
     ap.add_argument("--brief", action="store_true", help="hide long cluster table")
+    ap.add_argument("--warehouse", default=None, help="only decisions won by this warehouse_id")
+    ap.add_argument("--follow", action="store_true", help="live tail: re-render as new decisions arrive")
+    ap.add_argument("--interval", type=float, default=5.0, help="--follow refresh interval (seconds)")
+    ap.add_argument("--page", type=int, default=5000, help="--follow rows fetched per DB round trip")
     args = ap.parse_args()
+    if args.follow and args.to_ts is not None:
+        ap.error("--follow cannot be combined with --to-ts")
 
     _load_env(args.env_file)
 
-    kpis = compute_kpis(from_ts=args.from_ts, to_ts=args.to_ts, brief=args.brief)
+    if args.follow:
+        try:
+            follow(from_ts=args.from_ts, warehouse_id=args.warehouse, interval=args.interval,
+                   page=args.page, brief=args.brief, fmt=args.format)
+        except KeyboardInterrupt:
+            pass
+        return
 
-    if args.format == "json":
-        print(json.dumps(kpis, ensure_ascii=False, indent=2))
-    elif args.format == "plain":
-        _print_plain(kpis)
-    else:
-        _print_table(kpis)
+    kpis = compute_kpis(from_ts=args.from_ts, to_ts=args.to_ts, brief=args.brief,
+                        warehouse_id=args.warehouse)
+
+    _render(kpis, args.format)
+
+if __name__ == "__main__":
+    main()
 
 # ===== end add =====
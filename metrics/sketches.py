@@ -0,0 +1,216 @@
+# metrics/sketches.py
+"""
+Mergeable sketches: percentile / cardinality แบบหน่วยความจำคงที่ (ไม่ต้องเก็บทุกค่าไว้ sort)
+
+  s = DDSketch(0.01); s.add(x); s.add_many(np_array); s.quantile(0.95)   # relative error <= 1%
+  h = HyperLogLog(12); h.add(customer_id); h.count()                        # distinct ~1.6% (p=12)
+  s.merge(other) / h.merge(other)          # รวมข้าม time bucket / worker process (ผลเหมือนใส่ค่าชุดเดียวกัน)
+  DDSketch.from_dict(s.to_dict())          # ส่งผ่าน JSON / เก็บ rollup ได้
+
+- DDSketch: bucket ตาม log_gamma(|x|) (gamma = (1+a)/(1-a)) ค่าคืน = กลาง bucket -> ผิดไม่เกิน a เท่าของค่าจริง
+  จำนวน bucket เกิน max_bins จะยุบ bucket ค่าน้อยสุดรวมกัน (หาง p99 ยังแม่น); |x| < min_value นับเป็นศูนย์
+- HyperLogLog: hash 64 บิต (xxhash ถ้าติดตั้ง ไม่งั้น blake2b) register 2^p ไบต์
+  sketch ที่จะ merge กันต้องสร้างด้วย hash ตัวเดียวกัน (ดู HLL_HASH ใน to_dict)
+"""
+import math, hashlib
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+try:
+    import xxhash
+    HLL_HASH = "xxh64"
+
+    def _hash64(b: bytes) -> int:
+        return xxhash.xxh64_intdigest(b)
+except Exception:
+    HLL_HASH = "blake2b"
+
+    def _hash64(b: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(b, digest_size=8).digest(), "little")
+
+
+class DDSketch:
+    __slots__ = ("alpha", "gamma", "_ln_gamma", "max_bins", "min_value",
+                 "pos", "neg", "zero", "count", "sum", "min", "max")
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048, min_value: float = 1e-9):
+        self.alpha = float(relative_accuracy)
+        self.gamma = (1 + self.alpha) / (1 - self.alpha)
+        self._ln_gamma = math.log(self.gamma)
+        self.max_bins = int(max_bins)
+        self.min_value = float(min_value)
+        self.pos: Dict[int, float] = {}
+        self.neg: Dict[int, float] = {}
+        self.zero = 0.0
+        self.count = 0.0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    # ---- insert ----
+    def _index(self, a: float) -> int:
+        return math.ceil(math.log(a) / self._ln_gamma)
+
+    def add(self, x: float, weight: float = 1.0) -> None:
+        x = float(x)
+        if x != x:          # NaN
+            return
+        if x > self.min_value:
+            i = self._index(x); self.pos[i] = self.pos.get(i, 0.0) + weight
+        elif x < -self.min_value:
+            i = self._index(-x); self.neg[i] = self.neg.get(i, 0.0) + weight
+        else:
+            self.zero += weight
+        self.count += weight
+        self.sum += x * weight
+        if x < self.min: self.min = x
+        if x > self.max: self.max = x
+        if len(self.pos) > self.max_bins or len(self.neg) > self.max_bins:
+            self._collapse()
+
+    def add_many(self, values: Iterable[float]) -> "DDSketch":
+        """vectorized: log/ceil/นับ bucket ด้วย numpy ทีเดียว"""
+        x = np.asarray(values, dtype="f8").ravel()
+        x = x[~np.isnan(x)]
+        if not x.size:
+            return self
+        for store, part in ((self.pos, x[x > self.min_value]), (self.neg, -x[x < -self.min_value])):
+            if part.size:
+                idx, cnt = np.unique(np.ceil(np.log(part) / self._ln_gamma).astype(np.int64), return_counts=True)
+                for i, c in zip(idx.tolist(), cnt.tolist()):
+                    store[i] = store.get(i, 0.0) + c
+        self.zero += float(np.count_nonzero(np.abs(x) <= self.min_value))
+        self.count += float(x.size)
+        self.sum += float(x.sum())
+        self.min = min(self.min, float(x.min()))
+        self.max = max(self.max, float(x.max()))
+        self._collapse()
+        return self
+
+    def _collapse(self) -> None:
+        for store in (self.pos, self.neg):
+            if len(store) <= self.max_bins:
+                continue
+            keys = sorted(store)
+            cut = keys[len(keys) - self.max_bins]
+            store[cut] = store.get(cut, 0.0) + sum(store.pop(k) for k in keys[:len(keys) - self.max_bins])
+
+    # ---- query ----
+    def _value(self, i: int) -> float:
+        return 2.0 * self.gamma ** i / (self.gamma + 1.0)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count <= 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = 0.0
+        for i in sorted(self.neg, reverse=True):
+            seen += self.neg[i]
+            if seen > rank:
+                return max(self.min, -self._value(i))
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for i in sorted(self.pos):
+            seen += self.pos[i]
+            if seen > rank:
+                return min(self.max, self._value(i))
+        return self.max
+
+    def quantiles(self, qs: Iterable[float]) -> Dict[float, Optional[float]]:
+        return {q: self.quantile(q) for q in qs}
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    # ---- merge / serialize ----
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        if abs(other.gamma - self.gamma) > 1e-12:
+            raise ValueError("cannot merge DDSketch with different relative_accuracy")
+        for mine, theirs in ((self.pos, other.pos), (self.neg, other.neg)):
+            for i, c in theirs.items():
+                mine[i] = mine.get(i, 0.0) + c
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._collapse()
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"alpha": self.alpha, "max_bins": self.max_bins, "min_value": self.min_value,
+                "pos": {str(k): v for k, v in self.pos.items()}, "neg": {str(k): v for k, v in self.neg.items()},
+                "zero": self.zero, "count": self.count, "sum": self.sum,
+                "min": None if self.count == 0 else self.min, "max": None if self.count == 0 else self.max}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "DDSketch":
+        s = cls(d.get("alpha", 0.01), d.get("max_bins", 2048), d.get("min_value", 1e-9))
+        s.pos = {int(k): float(v) for k, v in (d.get("pos") or {}).items()}
+        s.neg = {int(k): float(v) for k, v in (d.get("neg") or {}).items()}
+        s.zero, s.count, s.sum = float(d.get("zero", 0)), float(d.get("count", 0)), float(d.get("sum", 0))
+        s.min = math.inf if d.get("min") is None else float(d["min"])
+        s.max = -math.inf if d.get("max") is None else float(d["max"])
+        return s
+
+
+class HyperLogLog:
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, p: int = 12):
+        if not 4 <= p <= 18:
+            raise ValueError("HyperLogLog p must be in [4, 18]")
+        self.p = int(p)
+        self.m = 1 << self.p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def _slot(self, value: Any):
+        h = _hash64(value if isinstance(value, bytes) else str(value).encode("utf-8"))
+        rest = h & ((1 << (64 - self.p)) - 1)
+        return h >> (64 - self.p), (64 - self.p) - rest.bit_length() + 1
+
+    def add(self, value: Any) -> None:
+        if value is None:
+            return
+        i, rho = self._slot(value)
+        if rho > self.registers[i]:
+            self.registers[i] = rho
+
+    def add_many(self, values: Iterable[Any]) -> "HyperLogLog":
+        slots = [self._slot(v) for v in values if v is not None]
+        if slots:
+            idx, rho = np.array(slots, dtype=np.int64).T
+            np.maximum.at(self.registers, idx, rho.astype(np.uint8))
+        return self
+
+    def count(self) -> int:
+        m = float(self.m)
+        est = (0.7213 / (1 + 1.079 / m)) * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if est <= 2.5 * m and zeros:
+            est = m * math.log(m / zeros)       # small-range correction (linear counting)
+        return int(round(est))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("cannot merge HyperLogLog with different p")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"p": self.p, "hash": HLL_HASH, "registers": self.registers.tobytes().hex()}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "HyperLogLog":
+        if d.get("hash", HLL_HASH) != HLL_HASH:
+            raise ValueError(f"HyperLogLog built with {d.get('hash')}, this process hashes with {HLL_HASH}")
+        h = cls(int(d["p"]))
+        h.registers = np.frombuffer(bytes.fromhex(d["registers"]), dtype=np.uint8).copy()
+        return h
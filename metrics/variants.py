@@ -0,0 +1,208 @@
+# metrics/variants.py
+"""
+A/B (หรือ A/B/C...) KPI ต่อ variant ในการอ่านรอบเดียว (streaming) + bootstrap confidence interval
+
+  rows = core.db.iter_decisions(since_ts, until_ts)           # archive + sqlite / mongo
+  out = compare(rows, group_by="meta.version", bootstrap=1000, seed=0)
+
+- variant = ค่าของ dotted path ใน row {"offer","decision","meta"} (เช่น meta.version, meta.source,
+  decision.meta.run_seed) ถ้า path ขึ้นต้นด้วย meta. แล้วไม่เจอ จะลอง decision.meta.* ต่อ (รูปแบบเก่า)
+- KPI: accept_rate, profit (mean/p50/p95), km_median, regret (best profit - chosen profit), winner HHI/share
+  (เฉพาะ offer ที่มีผู้ชนะ), distinct customers — percentile/distinct จาก metrics.sketches (หน่วยความจำคงที่ต่อ variant)
+- bootstrap แบบ Poisson: ทุกแถวได้น้ำหนัก Poisson(1) × B replicate แล้วสะสม W.T @ ค่า ทีละก้อน (numpy)
+  = resample ทั้งชุดโดยไม่ต้องเก็บแถวไว้; seed เดิม + ข้อมูลเดิม = CI เดิม ไม่ขึ้นกับขนาดหน้าที่อ่านจาก DB
+- variant แรก (ตาม --variants หรือชื่อเรียง) เป็น baseline: delta ของ variant อื่นพร้อม CI (replicate อิสระต่อ variant)
+"""
+import math, zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from metrics.sketches import DDSketch, HyperLogLog
+
+NONE_LABEL = "(none)"
+BOOT_METRICS = ("accept_rate", "profit_mean", "regret_mean", "winner_hhi")
+# CDF ของ Poisson(1) ที่ k = 0..9 -> น้ำหนักสูงสุด 10 (P(X > 10) ~ 1e-8 ตัดทิ้งได้)
+_POISSON1_CDF = np.cumsum([math.exp(-1) / math.factorial(k) for k in range(10)]).astype(np.float32)
+
+
+def _poisson1(rng: np.random.Generator, shape: tuple) -> np.ndarray:
+    """
+    น้ำหนัก Poisson(1) แบบ inverse CDF: uniform float32 1 ชุด + นับ threshold ที่เกินใน uint8
+    (~3.5 เท่าเร็วกว่า rng.poisson) -> float32 ให้ matmul ต่อ chunk; ผลรวมข้าม chunk เก็บใน float64
+    """
+    u = rng.random(shape, dtype=np.float32)
+    w = np.zeros(shape, dtype=np.uint8)
+    for c in _POISSON1_CDF:
+        w += u > c
+    return w.astype(np.float32)
+
+
+def _get(row: Dict[str, Any], path: str) -> Any:
+    cur: Any = row
+    for part in path.split("."):
+        if not isinstance(cur, dict):
+            return None
+        cur = cur.get(part)
+    return cur
+
+
+def group_value(row: Dict[str, Any], group_by: str) -> str:
+    v = _get(row, group_by)
+    if v is None and group_by.startswith("meta."):
+        v = _get(row, "decision." + group_by)
+    return NONE_LABEL if v is None else str(v)
+
+
+def _f(v, d=0.0) -> float:
+    try:
+        return float(v)
+    except Exception:
+        return float(d)
+
+
+class VariantStats:
+    """KPI ของ variant เดียว: sketch + ผลรวม + ผลรวมถ่วง Poisson ต่อ replicate (บัฟเฟอร์ทีละ chunk)"""
+
+    def __init__(self, name: str, bootstrap: int = 0, seed: int = 0, chunk: int = 4096):
+        self.name = name
+        self.n_rows = 0
+        self.n = 0                     # แถวที่มี candidate (ฐานของ profit/regret/HHI)
+        self.accepted = 0
+        self.profit = DDSketch()
+        self.km = DDSketch()
+        self.regret_sum = 0.0
+        self.wins: Counter = Counter()
+        self.customers = HyperLogLog()
+        self.B = int(bootstrap)
+        self.chunk = max(1, int(chunk))
+        # generator ต่อ variant: ลำดับน้ำหนักขึ้นกับ (seed, ชื่อ variant, ลำดับแถว) เท่านั้น
+        self._rng = np.random.default_rng([int(seed), zlib.crc32(name.encode("utf-8"))])
+        self._buf: List[tuple] = []    # (accept, has_cands, profit, regret, winner, km)
+        self._w = np.zeros((4, self.B))  # Σw (ทุกแถว), Σw·accept, Σw (มี cand), Σw·profit
+        self._w_regret = np.zeros(self.B)
+        self._w_wins: Dict[str, np.ndarray] = {}
+
+    def add(self, row: Dict[str, Any]) -> None:
+        dec = row.get("decision") or {}
+        self.n_rows += 1
+        accept = bool(dec.get("accept"))
+        self.accepted += accept
+        self.customers.add((row.get("offer") or {}).get("customer_id"))
+        cands = [c for c in dec.get("candidates") or [] if isinstance(c, dict)]
+        if not cands:
+            if self.B:
+                self._push((accept, False, 0.0, 0.0, None, 0.0))
+            return
+        chosen = dec.get("chosen_warehouse")
+        best = max(cands, key=lambda x: _f(x.get("profit")))
+        chosen_c = next((x for x in cands if x.get("warehouse_id") == chosen), best)
+        profit = _f(chosen_c.get("profit"))
+        regret = _f(best.get("profit")) - profit
+        self.n += 1
+        self.regret_sum += regret
+        if chosen:
+            self.wins[str(chosen)] += 1
+        self._push((accept, True, profit, regret, chosen, _f((chosen_c.get("route") or {}).get("km"))))
+
+    def _push(self, item: tuple) -> None:
+        self._buf.append(item)
+        if len(self._buf) >= self.chunk:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buf:
+            return
+        acc, has, profit, regret, winner, km = zip(*self._buf)
+        self._buf = []
+        mask = np.asarray(has, bool)
+        self.profit.add_many(np.asarray(profit, "f8")[mask])
+        self.km.add_many(np.asarray(km, "f8")[mask])
+        if not self.B:
+            return
+        W = _poisson1(self._rng, (len(acc), self.B))
+        X = np.stack([np.ones(len(acc)), np.asarray(acc, "f8"), np.asarray(has, "f8"),
+                      np.asarray(profit, "f8")], axis=1).astype(np.float32)
+        self._w += X.T @ W
+        self._w_regret += np.asarray(regret, np.float32) @ W
+        winners = np.asarray([str(w) if w else "" for w in winner], dtype=object)
+        mask = winners != ""
+        if mask.any():
+            names, inv = np.unique(winners[mask], return_inverse=True)
+            onehot = (inv[None, :] == np.arange(len(names))[:, None]).astype(np.float32)
+            sums = onehot @ W[mask]
+            for name, v in zip(names.tolist(), sums):
+                if name in self._w_wins:
+                    self._w_wins[name] += v
+                else:
+                    self._w_wins[name] = v.astype("f8")
+
+    def replicates(self) -> Dict[str, np.ndarray]:
+        """ค่า KPI ของแต่ละ bootstrap replicate (shape (B,))"""
+        self._flush()
+        tot, acc, has, prof = self._w
+        with np.errstate(invalid="ignore", divide="ignore"):
+            wins = np.stack(list(self._w_wins.values())) if self._w_wins else np.zeros((1, self.B))
+            shares = wins / wins.sum(axis=0)
+            return {"accept_rate": acc / tot, "profit_mean": prof / has, "regret_mean": self._w_regret / has,
+                    "winner_hhi": (shares ** 2).sum(axis=0)}
+
+    def kpis(self) -> Dict[str, Any]:
+        self._flush()
+        total = sum(self.wins.values())
+        return {
+            "n_rows": self.n_rows,
+            "n": self.n,
+            "accept_rate": round(self.accepted / self.n_rows, 4) if self.n_rows else 0.0,
+            "profit_mean": round(self.profit.mean, 4) if self.n else 0.0,
+            "profit_p50": round(self.profit.quantile(0.5), 4) if self.n else 0.0,
+            "profit_p95": round(self.profit.quantile(0.95), 4) if self.n else 0.0,
+            "km_median": round(self.km.quantile(0.5), 4) if self.n else 0.0,
+            "regret_mean": round(self.regret_sum / self.n, 4) if self.n else 0.0,
+            # Herfindahl-Hirschman Index (ยิ่งต่ำยิ่งกระจาย)
+            "winner_hhi": round(sum((c / total) ** 2 for c in self.wins.values()), 4) if total else None,
+            "winner_share": {k: round(v / total, 3) for k, v in sorted(self.wins.items())},
+            "distinct_customers": self.customers.count(),
+        }
+
+
+def _ci(reps: np.ndarray, level: float) -> Optional[List[float]]:
+    reps = reps[np.isfinite(reps)]
+    if not reps.size:
+        return None
+    lo, hi = np.quantile(reps, [(1 - level) / 2, (1 + level) / 2])
+    return [round(float(lo), 4), round(float(hi), 4)]
+
+
+def compare(rows: Iterable[Dict[str, Any]], group_by: str = "meta.version",
+            variants: Optional[List[str]] = None, bootstrap: int = 1000, seed: int = 0,
+            level: float = 0.95, chunk: int = 4096) -> Dict[str, Any]:
+    """KPI ต่อ variant จาก rows (อ่านรอบเดียว) — variants ระบุ = เฉพาะกลุ่มเหล่านั้น ตามลำดับ (ตัวแรก = baseline)"""
+    wanted = set(variants or [])
+    stats: Dict[str, VariantStats] = {name: VariantStats(name, bootstrap, seed, chunk) for name in variants or []}
+    for row in rows:
+        g = group_value(row, group_by)
+        if wanted and g not in wanted:
+            continue
+        st = stats.get(g)
+        if st is None:
+            st = stats[g] = VariantStats(g, bootstrap, seed, chunk)
+        st.add(row)
+
+    order = list(variants) if variants else sorted(stats)
+    out: Dict[str, Any] = {"group_by": group_by, "bootstrap": int(bootstrap), "level": level,
+                           "baseline": order[0] if order else None, "variants": {}}
+    reps = {name: stats[name].replicates() for name in order} if bootstrap else {}
+    kpis = {name: stats[name].kpis() for name in order}
+    for name in order:
+        k = kpis[name]
+        if bootstrap:
+            k["ci"] = {m: _ci(reps[name][m], level) for m in BOOT_METRICS}
+            if name != order[0]:
+                base = kpis[order[0]]
+                k["delta"] = {m: {"value": None if k[m] is None or base[m] is None else round(k[m] - base[m], 4),
+                                  "ci": _ci(reps[name][m] - reps[order[0]][m], level)}
+                              for m in BOOT_METRICS}
+        out["variants"][name] = k
+    return out
@@ -0,0 +1,49 @@
+# scripts/archive_history.py
+import sys
+import json
+import argparse
+from pathlib import Path
+
+# --- ทำให้ import โมดูลในโปรเจกต์ได้ ---
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+
+def load_env(env_file: str | None):
+    try:
+        from dotenv import load_dotenv
+    except Exception:
+        print("[WARN] python-dotenv not installed; skip .env loading")
+        return
+    path = env_file or (ROOT / ".env")
+    if Path(path).exists():
+        ok = load_dotenv(path)
+        print(f"[INFO] .env loaded from: {path}" if ok else f"[WARN] failed to load {path}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Move old decision_runs/case_runs into partitioned Parquet (zstd).")
+    ap.add_argument("--env-file", default=None, help="ชี้ไฟล์ .env (ถ้าต้องการ)")
+    ap.add_argument("--older-than-days", type=int, default=None,
+                    help="ย้ายเฉพาะแถวที่เก่ากว่า N วัน [default: ARCHIVE_AFTER_DAYS]")
+    ap.add_argument("--out", default=None, help="โฟลเดอร์ archive [default: ARCHIVE_DIR]")
+    ap.add_argument("--keep-hot", action="store_true", help="copy อย่างเดียว ไม่ลบจาก hot table")
+    ap.add_argument("--skip-cases", action="store_true", help="ไม่ย้าย case_runs")
+    args = ap.parse_args()
+
+    # โหลด .env ก่อน import core/*
+    load_env(args.env_file)
+    from core.db import init_db
+    from core import archive
+
+    init_db()
+    days = args.older_than_days if args.older_than_days is not None else archive.ARCHIVE_AFTER_DAYS
+    out = {"decision_runs": archive.archive_decisions(days, base=args.out, delete=not args.keep_hot)}
+    if not args.skip_cases:
+        out["case_runs"] = archive.archive_case_runs(days, base=args.out, delete=not args.keep_hot)
+    print(json.dumps(out, indent=2))
+
+
+if __name__ == "__main__":
+    main()
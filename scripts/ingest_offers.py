@@ -0,0 +1,131 @@
+# scripts/ingest_offers.py
+"""
+ป้อน offer เข้าคิว (durable) และรัน workers แบบ micro-batch
+
+  python scripts/ingest_offers.py enqueue --jsonl offers.jsonl
+  python scripts/ingest_offers.py enqueue --module tests.my_cases.test_generated_cases
+  python scripts/ingest_offers.py run --batch 64 --max-wait 0.05 --workers 4 [--drain] [--reserve]
+  python scripts/ingest_offers.py stats
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+# --- ทำให้ import โมดูลในโปรเจกต์ได้ ---
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+
+def load_env(env_file: str | None):
+    try:
+        from dotenv import load_dotenv
+    except Exception:
+        print("[WARN] python-dotenv not installed; skip .env loading")
+        return
+    path = env_file or (ROOT / ".env")
+    if Path(path).exists():
+        ok = load_dotenv(path)
+        print(f"[INFO] .env loaded from: {path}" if ok else f"[WARN] failed to load {path}")
+
+
+def _read_offers(args) -> list:
+    if args.jsonl:
+        with open(args.jsonl, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    mod = __import__(args.module, fromlist=["CASES"])
+    return [offer for offer, _ in getattr(mod, "CASES")]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Durable offer queue with micro-batched dispatch.")
+    ap.add_argument("--env-file", default=None, help="ชี้ไฟล์ .env (ถ้าต้องการ)")
+    ap.add_argument("--queue", default=None, help="ไฟล์คิว SQLite [default: OFFER_QUEUE_PATH]")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    enq = sub.add_parser("enqueue", help="เพิ่ม offer เข้าคิว")
+    src = enq.add_mutually_exclusive_group(required=True)
+    src.add_argument("--jsonl", help="ไฟล์ JSONL (1 offer ต่อบรรทัด)")
+    src.add_argument("--module", help="โมดูลที่มีตัวแปร CASES")
+    enq.add_argument("--timeout", type=float, default=30.0, help="รอได้นานสุดถ้าคิวเต็ม (วินาที)")
+
+    run = sub.add_parser("run", help="รัน workers ดึงคิว -> run_batch -> บันทึก -> ack")
+    run.add_argument("--batch", type=int, default=None, help="ขนาด micro-batch [default: OFFER_QUEUE_BATCH]")
+    run.add_argument("--max-wait", type=float, default=None,
+                     help="รอรวม batch นานสุด (วินาที) [default: OFFER_QUEUE_MAX_WAIT]")
+    run.add_argument("--workers", type=int, default=None, help="จำนวน worker threads [default: OFFER_QUEUE_WORKERS]")
+    run.add_argument("--drain", action="store_true", help="จบเมื่อคิวว่าง (ไม่งั้นรันจน Ctrl+C)")
+    run.add_argument("--reserve", action="store_true", help="hold capacity ให้ผู้ชนะ (fallthrough ตามอันดับ)")
+    run.add_argument("--processes", type=int, default=0,
+                     help="> 0 = กระจาย batch ไปหลายโปรเซสตามภูมิภาคต้นทาง (core/worker_pool)")
+    run.add_argument("--report-every", type=float, default=5.0, help="พิมพ์ metrics ทุก N วินาที")
+
+    sub.add_parser("stats", help="พิมพ์ depth/lag ของคิว")
+    args = ap.parse_args()
+
+    # โหลด .env ก่อน import core/*
+    load_env(args.env_file)
+    from core import offer_queue as oq
+
+    q = oq.OfferQueue(args.queue or oq.OFFER_QUEUE_PATH)
+
+    if args.cmd == "enqueue":
+        offers = _read_offers(args)
+        ids = q.enqueue_many(offers, timeout=args.timeout)
+        print(f"[OK] enqueued {len(ids)} offers -> {q.path}")
+        print(json.dumps(q.metrics()))
+        return
+
+    if args.cmd == "stats":
+        print(json.dumps(q.metrics(), indent=2))
+        return
+
+    from core.db import init_db, seed_warehouses
+    from core.pricing import install_reload_signal
+    from agents.dispatcher_agent import run_batch
+    init_db()
+    seed_warehouses()
+    env_file = args.env_file or str(ROOT / ".env")
+
+    pool = None
+    if args.processes > 0:
+        from core.worker_pool import ProcessDispatcher
+        pool = ProcessDispatcher(processes=args.processes, env_file=env_file)
+        decide_batch = lambda offers: pool.dispatch(offers, reserve_capacity=args.reserve)
+    else:
+        decide_batch = lambda offers: run_batch(offers, reserve_capacity=args.reserve)
+    # SIGHUP -> โหลด pricing config ใหม่ + เพิ่ม generation ให้ worker process โหลดตามก่อน batch ถัดไป
+    install_reload_signal(env_file, on_reload=(lambda cfg: pool.invalidate()) if pool is not None else None)
+
+    workers = oq.IngestWorkers(
+        q,
+        batch_size=args.batch or oq.OFFER_QUEUE_BATCH,
+        max_wait=args.max_wait if args.max_wait is not None else oq.OFFER_QUEUE_MAX_WAIT,
+        workers=args.workers or oq.OFFER_QUEUE_WORKERS,
+        decide_batch=decide_batch,
+        meta={"source": "ingest_offers", "reserve": args.reserve, "processes": args.processes},
+    ).start()
+    t0 = time.time()
+    try:
+        while True:
+            if args.drain and workers.drain(timeout=args.report_every):
+                break
+            if not args.drain:
+                time.sleep(args.report_every)
+            print(json.dumps(workers.metrics()))
+    except KeyboardInterrupt:
+        print("\n[INFO] stopping workers")
+    finally:
+        workers.stop()
+        if pool is not None:
+            print(f"[INFO] per-shard offers: {pool.stats['per_shard']}")
+            pool.close()
+    m = workers.metrics()
+    el = max(1e-9, time.time() - t0)
+    print(json.dumps({**m, "elapsed_sec": round(el, 2), "offers_per_sec": round(m["processed"] / el, 2)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
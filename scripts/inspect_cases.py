@@ -88,6 +88,9 @@ def main():
                     help="บันทึกสรุปรวม (rows) ลง MongoDB.case_runs")
     ap.add_argument("--persist-decisions", action="store_true",
                     help="บันทึกแต่ละ decision ลง MongoDB.decision_runs")
+    # feature store: รอบแรกบันทึก route/ราคา/spec ต่อคู่ รอบถัดไป (เปลี่ยนแค่ W_*/EPSILON) select จาก store ตรง ๆ
+    ap.add_argument("--features", nargs="?", const="auto", default=None, metavar="SNAPSHOT",
+                    help="ใช้ candidate feature store (engine dispatcher) ระบุ label ของ snapshot ได้ [default: auto]")
     args = ap.parse_args()
 
     # 1) โหลด .env ก่อน import core/*
@@ -101,32 +104,47 @@ def main():
     # 3) โหลดเคส
     CASES = load_cases(args.module)
 
-    # 3.1 เลือก engine ที่จะใช้ตัดสินใจ
+    # 3.1 เลือก engine ที่จะใช้ตัดสินใจ — ทุก engine รับ streaks ที่สคริปต์เดินเองทีละเคส
     if args.engine == "graph":
-        # ใช้กราฟ LangGraph เหมือนใน app.py
-        from app import build
+        # ใช้กราฟ LangGraph เหมือนใน app.py (compile ครั้งเดียว, quote ต่อคลังขนานภายในเคส)
+        from app import get_app
         from core.schema import Offer
+        graph = get_app()
 
-        app = build()
-
-        def decide(offer: dict) -> dict:
-            # สร้าง Offer model จาก dict แล้วส่งเข้า graph
-            offer_model = Offer(**offer)
-            state = app.invoke({"offer": offer_model})
-            # graph ของเราบันทึก decision อยู่ใน state["decision"]
+        # reserve=False: งาน eval ไม่ hold capacity ใน DB จริง (เหมือน engine dispatcher) ไม่งั้น used_cbm
+        # สะสมข้ามรอบ (seed_warehouses ไม่ reset) และผลรอบหลังเพี้ยน
+        def decide(offer: dict, streaks: dict) -> dict:
+            state = graph.invoke({"offer": Offer(**offer), "streaks": streaks, "reserve": False})
             return state.get("decision") or {}
+    elif args.features:
+        from agents.dispatcher_agent import run_cached
+        version = None if args.features == "auto" else args.features
+
+        def decide(offer: dict, streaks: dict) -> dict:
+            return run_cached(offer, version, streaks)
     else:
         # ใช้ dispatcher_agent.run แบบเดิม
         from agents.dispatcher_agent import run as _decide
 
-        def decide(offer: dict) -> dict:
-            return _decide(offer)
+        def decide(offer: dict, streaks: dict) -> dict:
+            return _decide(offer, streaks)
+
+    # สตรีคผู้ชนะ (cooldown) เดินต่อในหน่วยความจำตามลำดับเคส แบบเดียวกับ dispatcher_agent.run_batch
+    # -> ผลไม่ขึ้นกับว่า writer flush decision ก่อนหน้าลง DB แล้วหรือยัง และทุก engine เห็นสตรีคเดียวกัน
+    from agents.dispatcher_agent import advance_streaks
+    from agents.warehouse_agent_llm import WarehouseAgent
+    streaks = WarehouseAgent().streaks()
 
     rows = []
     accepted = []
+    writer = None
+    if args.persist_decisions:
+        from core.writer import get_decision_writer
+        writer = get_decision_writer()
 
     for i, (offer, expected) in enumerate(CASES, 1):
-        res = run_case(decide, offer)
+        res = run_case(lambda o: decide(o, streaks), offer)
+        streaks = advance_streaks(streaks, res.get("chosen_warehouse"))
 
         # หา candidate ผู้ชนะตาม chosen_warehouse
         chosen_id = res.get("chosen_warehouse")
@@ -200,7 +218,7 @@ def main():
                     f"util={c.get('utilization')}",
                 )
 
-        # (ออปชัน) Persist decision รายเคส → Mongo
+        # (ออปชัน) Persist decision รายเคส → buffered writer (flush เป็นก้อนเบื้องหลัง)
         if args.persist_decisions:
             try:
                 meta = {
@@ -209,10 +227,14 @@ def main():
                     "idx": i,
                     "engine": args.engine,
                 }
-                save_decision_result(offer, res, meta=meta)
+                writer.submit(offer, res, meta=meta)
             except Exception as e:
                 print(f"[WARN] save_decision_result failed: {e}")
 
+    if writer is not None:
+        writer.close()
+        print(f"[OK] decisions persisted: {writer.stats}")
+
     # 4) สรุปรวม
     print("\n=== SUMMARY ===")
     print(f"Accepted {len(accepted)}/{len(rows)}:", accepted)
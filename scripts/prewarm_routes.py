@@ -0,0 +1,169 @@
+# scripts/prewarm_routes.py
+"""
+อุ่น distance_cache ล่วงหน้า: ต้นทางที่พบบ่อย × คลังที่ ACTIVE ทั้งหมด
+
+  python scripts/prewarm_routes.py --from-history 30 --top 200
+  python scripts/prewarm_routes.py --csv customers.csv            (คอลัมน์ address หรือ lat,lng)
+  python scripts/prewarm_routes.py --refresh-only --refresh-within-hours 24
+
+ลำดับงาน:
+  1) รวบรวมต้นทาง (history: นับความถี่ offer ต่อพิกัด/ที่อยู่, CSV: ตามไฟล์) แล้ว geocode ที่ยังไม่มีพิกัด
+  2) หาคู่ (ต้นทาง, คลัง) ที่ยังไม่อยู่ใน cache (load_distance_cache_many)
+  3) entry ที่จะหมดอายุภายใน --refresh-within-hours ถูกคำนวณใหม่ก่อนหมด (ROUTE_CACHE_TTL)
+  4) คำนวณผ่าน matrix API (core.location.route_matrix, จำกัด --qps) แล้ว bulk upsert ครั้งเดียว
+เหมาะกับรันทุกคืน (cron) ให้ dispatch ตอนกลางวันเจอ cache อุ่นแล้ว
+"""
+import sys
+import csv
+import json
+import time
+import argparse
+from collections import Counter
+from pathlib import Path
+
+# --- ทำให้ import โมดูลในโปรเจกต์ได้ ---
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+
+def load_env(env_file: str | None):
+    try:
+        from dotenv import load_dotenv
+    except Exception:
+        print("[WARN] python-dotenv not installed; skip .env loading")
+        return
+    path = env_file or (ROOT / ".env")
+    if Path(path).exists():
+        ok = load_dotenv(path)
+        print(f"[INFO] .env loaded from: {path}" if ok else f"[WARN] failed to load {path}")
+
+
+def origins_from_history(days: int, top: int) -> list:
+    """[(lat|None, lng|None, address|None), ...] เรียงตามความถี่"""
+    from core.db import get_recent_decisions
+    cnt = Counter()
+    for r in get_recent_decisions(days, fields=["offer.origin_lat", "offer.origin_lng", "offer.origin_address"]):
+        o = r.get("offer") or {}
+        lat, lng = o.get("origin_lat"), o.get("origin_lng")
+        if lat is not None and lng is not None:
+            cnt[(round(float(lat), 6), round(float(lng), 6), None)] += 1
+        elif o.get("origin_address"):
+            cnt[(None, None, " ".join(str(o["origin_address"]).split()))] += 1
+    return [k for k, _ in cnt.most_common(top or None)]
+
+
+def origins_from_csv(path: str) -> list:
+    out = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            lat, lng = row.get("lat") or row.get("origin_lat"), row.get("lng") or row.get("origin_lng")
+            addr = row.get("address") or row.get("origin_address")
+            if lat and lng:
+                out.append((float(lat), float(lng), None))
+            elif addr:
+                out.append((None, None, addr.strip()))
+    return list(dict.fromkeys(out))
+
+
+def geocode_all(origins: list, qps: float) -> list:
+    from core.location import geocode, _Throttle
+    throttle, out = _Throttle(qps), []
+    for lat, lng, addr in origins:
+        if lat is None:
+            throttle.wait()
+            try:
+                lat, lng = geocode(addr)
+            except Exception as e:
+                print(f"[WARN] geocode failed for {addr!r}: {e}")
+                continue
+        out.append((float(lat), float(lng)))
+    return list(dict.fromkeys(out))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Prewarm distance_cache for frequent origins x active warehouses.")
+    ap.add_argument("--env-file", default=None, help="ชี้ไฟล์ .env (ถ้าต้องการ)")
+    ap.add_argument("--from-history", type=int, default=None, metavar="DAYS",
+                    help="ดึงต้นทางจาก decision history ย้อนหลัง N วัน")
+    ap.add_argument("--csv", default=None, help="CSV ของลูกค้า (address หรือ lat,lng)")
+    ap.add_argument("--top", type=int, default=500, help="ใช้เฉพาะต้นทางที่พบบ่อยสุด N อัน (history)")
+    ap.add_argument("--refresh-within-hours", type=float, default=24.0,
+                    help="คำนวณใหม่สำหรับ entry ที่จะหมดอายุภายใน N ชั่วโมง (0 = ไม่ refresh)")
+    ap.add_argument("--refresh-only", action="store_true", help="refresh entry ใกล้หมดอายุอย่างเดียว")
+    ap.add_argument("--qps", type=float, default=None, help="request/วินาที ไปยัง provider [default: ROUTE_MATRIX_QPS]")
+    ap.add_argument("--dry-run", action="store_true", help="นับงานอย่างเดียว ไม่เรียก API/ไม่เขียน cache")
+    args = ap.parse_args()
+
+    # โหลด .env ก่อน import core/*
+    load_env(args.env_file)
+    from core.db import (init_db, list_active_warehouses, load_distance_cache_many,
+                         save_distance_cache_many, list_expiring_distance_cache)
+    from core.location import route_matrix, snap_origin, _cache_key, ROUTE_CACHE_TTL, ROUTE_MATRIX_QPS
+
+    init_db()
+    qps = args.qps or ROUTE_MATRIX_QPS
+    t0 = time.time()
+    whs = [(float(w["lat"]), float(w["lng"])) for w in list_active_warehouses()]
+
+    # 1) + 2) ต้นทางใหม่ที่ยังไม่มีใน cache
+    jobs: dict = {}                    # origin -> set(dest) ที่ต้องคำนวณ
+    n_origins = n_hits = 0
+    if not args.refresh_only and (args.from_history is not None or args.csv):
+        raw = []
+        if args.from_history is not None:
+            raw += origins_from_history(args.from_history, args.top)
+        if args.csv:
+            raw += origins_from_csv(args.csv)
+        origins = geocode_all(raw, qps) if not args.dry_run else [(a, b) for a, b, _ in raw if a is not None]
+        # snap ให้ตรงกับ key ที่ dispatch จะใช้ (ต้นทางใน cell เดียวกันคำนวณครั้งเดียว)
+        origins = list(dict.fromkeys(snap_origin(a, b)[:2] for a, b in origins))
+        n_origins = len(origins)
+        keys = {(o, d): _cache_key(o[0], o[1], d[0], d[1]) for o in origins for d in whs}
+        hits = load_distance_cache_many(list(keys.values()))
+        n_hits = len(hits)
+        for (o, d), k in keys.items():
+            if k not in hits:
+                jobs.setdefault(o, set()).add(d)
+
+    # 3) entry ที่ใกล้หมดอายุ
+    n_refresh = 0
+    if args.refresh_within_hours > 0:
+        for _, a_lat, a_lng, b_lat, b_lng in list_expiring_distance_cache(int(args.refresh_within_hours * 3600)):
+            if None in (a_lat, a_lng, b_lat, b_lng):
+                continue
+            o = snap_origin(float(a_lat), float(a_lng))[:2]      # entry เก่าก่อนมี snap ก็ได้ key ใหม่
+            jobs.setdefault(o, set()).add((float(b_lat), float(b_lng)))
+            n_refresh += 1
+
+    # 4) matrix ต่อกลุ่มปลายทางเดียวกัน (origins ที่ขาดปลายทางชุดเดียวกันรวมเป็น request เดียว)
+    groups: dict = {}
+    for o, ds in jobs.items():
+        groups.setdefault(tuple(sorted(ds)), []).append(o)
+    n_pairs = sum(len(ds) * len(os_) for ds, os_ in groups.items())
+
+    written = skipped = 0
+    if not args.dry_run:
+        entries = []
+        for dests, origins in groups.items():
+            m = route_matrix(origins, list(dests), qps=qps)
+            for o, row in zip(origins, m):
+                for d, res in zip(dests, row):
+                    # ช่อง haversine (provider ล้ม / ปิด USE_REAL_ROUTE) ไม่ลง cache: route() คำนวณเองได้
+                    # และไม่ให้เส้นตรงค้างใน cache ทั้ง TTL / ปนข้อมูลฝึกของ route_estimator
+                    if res.source == "haversine":
+                        skipped += 1
+                        continue
+                    entries.append((_cache_key(o[0], o[1], d[0], d[1]), o[0], o[1], d[0], d[1], res[0], res[1],
+                                    snap_origin(o[0], o[1])[2], res.source))
+        written = save_distance_cache_many(entries, ttl_sec=ROUTE_CACHE_TTL)
+
+    print(json.dumps({
+        "warehouses": len(whs), "origins": n_origins, "cache_hits": n_hits,
+        "expiring_refreshed": n_refresh, "pairs_computed": n_pairs, "requests_groups": len(groups),
+        "written": written, "skipped_fallback": skipped, "dry_run": args.dry_run, "elapsed_sec": round(time.time() - t0, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
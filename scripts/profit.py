@@ -1,39 +1,126 @@
-# quick & simple (รันใน notebook/สคริปต์)
-from pymongo import MongoClient
-import numpy as np
-cli = MongoClient("<MONGO_URI>")
-c = cli["wms"]["decision_runs"]
-
-def kpi(filter_):
-    docs = list(c.find(filter_, {"_id":0, "decision":1}))
-    profits, km_list, regrets, winners = [], [], [], []
-    for d in docs:
-        dec = d["decision"]; cands = dec.get("candidates", [])
-        if not cands: continue
-        chosen = dec.get("chosen_warehouse")
-        best = max(cands, key=lambda x: x.get("profit", 0))
-        chosen_c = next((x for x in cands if x["warehouse_id"]==chosen), best)
-        profits.append(chosen_c.get("profit", 0))
-        km_list.append((chosen_c.get("route") or {}).get("km", 0))
-        regrets.append(best.get("profit",0) - chosen_c.get("profit",0))
-        winners.append(chosen)
-    import collections, math
-    h = collections.Counter(winners)
-    total = sum(h.values()) or 1
-    # Herfindahl-Hirschman Index (ยิ่งต่ำยิ่งกระจาย)
-    hhi = sum((cnt/total)**2 for cnt in h.values())
-    return {
-        "n": len(profits),
-        "profit_mean": np.mean(profits) if profits else 0,
-        "profit_p50": float(np.median(profits)) if profits else 0,
-        "profit_p95": float(np.percentile(profits,95)) if profits else 0,
-        "km_median": float(np.median(km_list)) if km_list else 0,
-        "regret_mean": np.mean(regrets) if regrets else 0,
-        "winner_hhi": hhi,
-        "winner_share": {k: round(v/total,3) for k,v in h.items()}
-    }
-
-old = kpi({"decision.meta.version":"v_old"})
-new = kpi({"decision.meta.version":"v_new"})
-print("OLD:", old)
-print("NEW:", new)
+# scripts/profit.py
+"""
+เปรียบเทียบ KPI ระหว่าง variant (A/B) จากประวัติ decision ทั้งหมด (archive + decision_runs)
+ใช้ได้ทั้ง SQLite และ MongoDB ตาม DB_BACKEND ใน .env
+
+  python scripts/profit.py --variants v_old v_new                    # group ตาม meta.version (7 วันล่าสุด)
+  python scripts/profit.py --group-by meta.source --days 1 --format json --json-out ab.json
+  python scripts/profit.py --group-by decision.meta.run_seed --bootstrap 0   # ไม่ทำ CI
+
+- อ่านแบบ stream ทีละหน้า (core.db.iter_decisions) รอบเดียวได้ KPI ทุก variant (metrics/variants.py)
+  ช่วงที่เก่ากว่า ARCHIVE_AFTER_DAYS อ่านจาก archive (scripts/archive_history.py) ต่อหน้าให้ ไม่ซ้ำกับ hot;
+  อ่าน archive ไม่ได้ = error (ไม่ตัดแถวเก่าทิ้งเงียบๆ)
+- CI = Poisson bootstrap แบบ vectorized (--bootstrap replicate, --seed เดิมได้ผลเดิม)
+- variant แรกใน --variants (หรือชื่อเรียงตามตัวอักษร) เป็น baseline ของ delta
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+# --- ทำให้ import โมดูลในโปรเจกต์ได้ ---
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+
+def load_env(env_file: str | None):
+    try:
+        from dotenv import load_dotenv
+    except Exception:
+        print("[WARN] python-dotenv not installed; skip .env loading", file=sys.stderr)
+        return
+    path = env_file or (ROOT / ".env")
+    if Path(path).exists():
+        ok = load_dotenv(path)
+        print(f"[INFO] .env loaded from: {path}" if ok else f"[WARN] failed to load {path}", file=sys.stderr)
+
+
+def mongo_fields(group_by: str) -> list:
+    """projection ของ Mongo: field ที่ KPI ใช้ + field ที่ใช้ group (ไม่ซ้อน path กัน)"""
+    from core.db import HISTORY_FIELDS
+    fields = list(HISTORY_FIELDS) + ["decision.meta"]
+    extra = [group_by] + (["decision." + group_by] if group_by.startswith("meta.") else [])
+    for f in extra:
+        if not any(f == g or f.startswith(g + ".") or g.startswith(f + ".") for g in fields + ["meta"]):
+            fields.append(f)
+    return fields
+
+
+def _fmt(v, ci=None) -> str:
+    s = "-" if v is None else (f"{v:.4f}" if isinstance(v, float) else str(v))
+    return f"{s} [{ci[0]:.4f}, {ci[1]:.4f}]" if ci else s
+
+
+def print_table(out: dict):
+    names = list(out["variants"])
+    if not names:
+        print("no decisions matched")
+        return
+    rows = [("n_rows", None), ("n", None), ("accept_rate", "ci"), ("profit_mean", "ci"), ("profit_p50", None),
+            ("profit_p95", None), ("km_median", None), ("regret_mean", "ci"), ("winner_hhi", "ci"),
+            ("distinct_customers", None)]
+    table = [["metric"] + names]
+    for m, has_ci in rows:
+        table.append([m] + [_fmt(out["variants"][n][m], (out["variants"][n].get("ci") or {}).get(m) if has_ci else None)
+                            for n in names])
+    for m in ("accept_rate", "profit_mean", "regret_mean", "winner_hhi"):
+        line = [f"Δ {m}"]
+        for n in names:
+            d = (out["variants"][n].get("delta") or {}).get(m)
+            line.append(_fmt(d["value"], d["ci"]) if d else "(baseline)" if n == out["baseline"] else "-")
+        if any(c not in ("-", "(baseline)") for c in line[1:]):
+            table.append(line)
+    widths = [max(len(r[i]) for r in table) for i in range(len(table[0]))]
+    print(f"group_by={out['group_by']}  baseline={out['baseline']}  "
+          f"bootstrap={out['bootstrap']} ({int(out['level'] * 100)}% CI)")
+    for i, r in enumerate(table):
+        print("  ".join(c.ljust(w) for c, w in zip(r, widths)))
+        if i == 0:
+            print("  ".join("-" * w for w in widths))
+    for n in names:
+        print(f"winner_share[{n}]: {out['variants'][n]['winner_share']}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="A/B KPI comparison over decision history (archive + sqlite/mongo).")
+    ap.add_argument("--env-file", default=None, help="ชี้ไฟล์ .env (ถ้าต้องการ)")
+    ap.add_argument("--group-by", default="meta.version",
+                    help="dotted path ใน {offer, decision, meta} (meta.* ไม่เจอจะลอง decision.meta.*)")
+    ap.add_argument("--variants", nargs="*", default=None, help="เฉพาะค่าเหล่านี้ ตามลำดับ (ตัวแรก = baseline)")
+    ap.add_argument("--days", type=float, default=7.0, help="ย้อนหลังกี่วัน (ถ้าไม่ระบุ --since-ts)")
+    ap.add_argument("--since-ts", type=int, default=None)
+    ap.add_argument("--until-ts", type=int, default=None)
+    ap.add_argument("--warehouse", default=None, help="เฉพาะ decision ที่คลังนี้ชนะ")
+    ap.add_argument("--bootstrap", type=int, default=1000, help="จำนวน replicate (0 = ไม่ทำ CI)")
+    ap.add_argument("--level", type=float, default=0.95)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--page", type=int, default=5000, help="แถวต่อหน้าที่อ่านจาก DB")
+    ap.add_argument("--format", choices=["table", "json"], default="table")
+    ap.add_argument("--json-out", default=None, help="เขียนผล JSON ลงไฟล์ด้วย")
+    args = ap.parse_args()
+
+    load_env(args.env_file)
+    from core.db import BACKEND, iter_decisions
+    from metrics.variants import compare
+
+    since = args.since_ts if args.since_ts is not None else int(time.time() - args.days * 86400)
+    t0 = time.perf_counter()
+    rows = iter_decisions(since, args.until_ts, page=args.page, warehouse_id=args.warehouse,
+                          fields=mongo_fields(args.group_by) if BACKEND != "sqlite" else None)
+    out = compare(rows, group_by=args.group_by, variants=args.variants, bootstrap=args.bootstrap,
+                  seed=args.seed, level=args.level)
+    out.update({"db_backend": BACKEND, "since_ts": since, "until_ts": args.until_ts,
+                "elapsed_sec": round(time.perf_counter() - t0, 3)})
+
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.format == "json":
+        print(json.dumps(out, ensure_ascii=False, indent=2))
+    else:
+        print_table(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# scripts/simulate_market.py
+"""
+จำลองตลาด (discrete-event, core/market_sim) ขับ dispatcher_agent.run_batch(reserve_capacity=True)
+แทนสคริปต์ Node ใน Ref_Research_Scenarios/ (N consumers, 5 providers, pool, 10,000 ticks)
+
+  python scripts/simulate_market.py --consumers 5 --horizon 10000 --seed 7
+  python scripts/simulate_market.py --consumers 50 --providers 20 --capacity 3000 --interarrival 5
+  python scripts/simulate_market.py --persist --db sim_market.sqlite3     (บันทึก decision ลง DB จำลอง)
+
+- ใช้ SQLite แยก (--db) เสมอ ไม่แตะ DB จริง; reset used_cbm ก่อนเริ่มทุกครั้ง
+- ปิด provider แผนที่จริง / LLM (route = haversine/estimator, ราคา = สูตร) ให้รันซ้ำได้และไม่เสียโควต้า
+- --seed เป็น run seed ของ core.rng ด้วย ให้ jitter ราคา / epsilon exploration ของ dispatcher ซ้ำได้
+"""
+import os
+import sys
+import json
+import random
+import argparse
+from pathlib import Path
+
+# --- ทำให้ import โมดูลในโปรเจกต์ได้ ---
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+
+def load_env(env_file: str | None):
+    try:
+        from dotenv import load_dotenv
+    except Exception:
+        print("[WARN] python-dotenv not installed; skip .env loading")
+        return
+    path = env_file or (ROOT / ".env")
+    if Path(path).exists():
+        ok = load_dotenv(path)
+        print(f"[INFO] .env loaded from: {path}" if ok else f"[WARN] failed to load {path}")
+
+
+def setup_providers(n: int, capacity: float, seed: int):
+    """n > 0 = แทนที่ตาราง warehouses ด้วยคลังสังเคราะห์ n แห่ง (ว่างทั้งหมด) ไม่งั้นใช้ seed_warehouses W1..W5"""
+    from core.db import get_conn, seed_warehouses
+    con = get_conn(); cur = con.cursor()
+    if n > 0:
+        rng = random.Random(seed ^ 0x5EED)
+        cur.execute("DELETE FROM warehouses")
+        cur.executemany(
+            """INSERT INTO warehouses (warehouse_id,name,lat,lng,capacity_cbm,used_cbm,service_limit,status)
+               VALUES (?,?,?,?,?,?,?,?)""",
+            [(f"SIM-W{i + 1}", f"Sim DC{i + 1}", rng.uniform(13.55, 13.80), rng.uniform(100.50, 100.80),
+              float(capacity), 0.0, 200.0, "ACTIVE") for i in range(n)])
+        con.commit(); con.close()
+        return
+    con.close()
+    seed_warehouses()
+    con = get_conn(); cur = con.cursor()
+    cur.execute("UPDATE warehouses SET used_cbm = 0")
+    con.commit(); con.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Discrete-event market simulation against the dispatcher (batch mode).")
+    ap.add_argument("--env-file", default=None, help="ชี้ไฟล์ .env (ถ้าต้องการ)")
+    ap.add_argument("--db", default="sim_market.sqlite3", help="SQLite ของการจำลอง (แยกจาก DB จริง)")
+    ap.add_argument("--consumers", type=int, default=5)
+    ap.add_argument("--providers", type=int, default=0, help="> 0 = สร้างคลังสังเคราะห์ N แห่ง แทน W1..W5")
+    ap.add_argument("--capacity", type=float, default=5000.0, help="capacity_cbm ของคลังสังเคราะห์")
+    ap.add_argument("--horizon", type=float, default=10000.0, help="จำนวนหน่วยเวลา (ticks)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--interarrival", type=float, default=20.0, help="เวลาเฉลี่ยระหว่าง offer ต่อ consumer")
+    ap.add_argument("--batch-window", type=float, default=1.0, help="รวม offer ที่มาถึงภายในกี่ tick ต่อ 1 batch")
+    ap.add_argument("--day-units", type=float, default=10.0, help="1 วันของสัญญา = กี่ tick")
+    ap.add_argument("--volume", type=float, nargs=2, default=(5.0, 300.0), metavar=("MIN", "MAX"))
+    ap.add_argument("--duration", type=int, nargs=2, default=(1, 30), metavar=("MIN", "MAX"))
+    ap.add_argument("--retry-after", type=float, default=50.0)
+    ap.add_argument("--max-retries", type=int, default=2)
+    ap.add_argument("--persist", action="store_true", help="บันทึก decision ลง decision_runs ของ DB จำลอง")
+    ap.add_argument("--real-routes", action="store_true", help="ไม่ปิด USE_REAL_ROUTE / LLM จาก .env")
+    args = ap.parse_args()
+
+    # โหลด .env ก่อน import core/* แล้วบังคับค่าของการจำลอง
+    load_env(args.env_file)
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["DB_PATH"] = args.db
+    if not args.real_routes:
+        for k in ("USE_REAL_ROUTE", "USE_LLM_PRICING", "USE_LLM_EXPLAIN", "USE_LLM_WAREHOUSE"):
+            os.environ[k] = "0"
+    os.environ["RUN_SEED"] = str(args.seed)
+
+    from core.db import init_db, list_active_warehouses, release_capacity, save_decision_results
+    from core.market_sim import MarketSim
+    from agents.dispatcher_agent import run_batch
+
+    init_db()
+    setup_providers(args.providers, args.capacity, args.seed)
+
+    def decide_batch(offers):
+        decisions = run_batch(offers, reserve_capacity=True)
+        if args.persist:
+            save_decision_results([(o, d, {"source": "simulate_market", "seed": args.seed})
+                                   for o, d in zip(offers, decisions)])
+        return decisions
+
+    sim = MarketSim(list_active_warehouses(), decide_batch, release_capacity,
+                    consumers=args.consumers, horizon=args.horizon, seed=args.seed,
+                    mean_interarrival=args.interarrival, batch_window=args.batch_window,
+                    day_units=args.day_units, volume_range=tuple(args.volume),
+                    duration_range=tuple(args.duration), retry_after=args.retry_after,
+                    max_retries=args.max_retries)
+    report = sim.run(drain=True)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# scripts/sweep_policy.py
+"""
+ค้นหาพารามิเตอร์ policy (grid / random) บน offer ชุดเดิม แบบขนานหลายโปรเซส (core/policy_sweep)
+
+  python scripts/sweep_policy.py --grid W_PROFIT=0.4,0.6,0.8 --grid EPSILON=0,0.05,0.1 --grid EXPL_TOPK=2,3
+  python scripts/sweep_policy.py --range W_PROFIT=0.2:0.9 --range ALPHA_MARGIN=0:0.3 --range EXPL_TOPK=1:5 \\
+         --samples 2000 --processes 8 --objective regret --top 20 --json-out sweep.json
+  python scripts/sweep_policy.py --from-history 7 --grid COOLDOWN_GAMMA=0,0.05,0.1
+
+corpus: --module (CASES แบบ inspect_cases.py, ค่าเริ่มต้น) หรือ --from-history DAYS (offer จาก decision_runs)
+geocode/route/spec ทำครั้งเดียวตอนสร้าง corpus; แต่ละชุดรันแค่ quote (cache) + scoring/selection + KPI
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+from pathlib import Path
+
+# --- ทำให้ import โมดูลในโปรเจกต์ได้ ---
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+
+def load_env(env_file: str | None):
+    try:
+        from dotenv import load_dotenv
+    except Exception:
+        print("[WARN] python-dotenv not installed; skip .env loading")
+        return
+    path = env_file or (ROOT / ".env")
+    if Path(path).exists():
+        ok = load_dotenv(path)
+        print(f"[INFO] .env loaded from: {path}" if ok else f"[WARN] failed to load {path}")
+
+
+def _num(s: str):
+    s = s.strip()
+    try:
+        return int(s)
+    except ValueError:
+        try:
+            return float(s)
+        except ValueError:
+            return s
+
+
+def parse_space(grid_specs, range_specs) -> dict:
+    """--grid K=a,b,c -> [a,b,c]; --range K=lo:hi -> (lo, hi)"""
+    space = {}
+    for spec in grid_specs or []:
+        k, _, vals = spec.partition("=")
+        space[k.strip()] = [_num(v) for v in vals.split(",") if v.strip()]
+    for spec in range_specs or []:
+        k, _, rng = spec.partition("=")
+        lo, _, hi = rng.partition(":")
+        space[k.strip()] = (_num(lo), _num(hi))
+    return space
+
+
+def load_offers(args) -> list:
+    if args.from_history:
+        from core.db import get_recent_decisions
+        offers = [r["offer"] for r in get_recent_decisions(args.from_history, fields=["offer"])
+                  if isinstance(r.get("offer"), dict) and r["offer"].get("volume_cbm") is not None]
+    else:
+        mod = __import__(args.module, fromlist=["CASES"])
+        offers = [offer for offer, _expected in getattr(mod, "CASES")]
+    return offers[:args.limit] if args.limit else offers
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Grid/random sweep of dispatch policy parameters over a fixed offer corpus.")
+    ap.add_argument("--env-file", default=None, help="ชี้ไฟล์ .env (ถ้าต้องการ)")
+    ap.add_argument("--module", default="tests.my_cases.test_generated_cases", help="โมดูลที่มี CASES")
+    ap.add_argument("--from-history", type=int, default=0, help="> 0 = ใช้ offer จาก decision_runs ย้อนหลัง N วันแทน")
+    ap.add_argument("--limit", type=int, default=0, help="จำกัดจำนวน offer")
+    ap.add_argument("--grid", action="append", help="K=v1,v2,...  (ระบุซ้ำได้)")
+    ap.add_argument("--range", action="append", help="K=lo:hi สำหรับ random search (ระบุซ้ำได้)")
+    ap.add_argument("--samples", type=int, default=0, help="จำนวนชุดสุ่ม (> 0 = random search ทั้งหมด)")
+    ap.add_argument("--seed", type=int, default=0, help="seed ของ jitter/exploration และการสุ่มชุดพารามิเตอร์")
+    ap.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--objective", choices=["profit", "regret", "consistency", "hhi"], default="profit")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--json-out", default=None, help="บันทึกผลทุกชุด (เรียงตาม objective) เป็น JSON")
+    ap.add_argument("--csv-out", default=None, help="บันทึกผลทุกชุดเป็น CSV")
+    args = ap.parse_args()
+
+    # โหลด .env ก่อน import core/*
+    load_env(args.env_file)
+    from core.policy_sweep import build_corpus, grid, random_search, sweep, rank, OBJECTIVES
+
+    space = parse_space(args.grid, args.range)
+    if not space:
+        ap.error("ต้องระบุ --grid หรือ --range อย่างน้อยหนึ่งตัว")
+    if args.samples > 0:
+        space = {k: (v if isinstance(v, tuple) else list(v)) for k, v in space.items()}
+        param_sets = random_search(space, args.samples, seed=args.seed)
+    else:
+        if any(isinstance(v, tuple) for v in space.values()):
+            ap.error("--range ใช้คู่กับ --samples เท่านั้น")
+        param_sets = grid(space)
+
+    offers = load_offers(args)
+    print(f"[INFO] building corpus: {len(offers)} offers")
+    corpus = build_corpus(offers, seed=args.seed)
+    print(f"[INFO] corpus {corpus.shape[0]} offers × {corpus.shape[1]} warehouses (skipped {corpus.skipped})")
+
+    results = rank(sweep(corpus, param_sets, processes=args.processes), args.objective)
+    key = OBJECTIVES[args.objective][0]
+    print(f"\n=== TOP {args.top} by {args.objective} ({key}) ===")
+    for r in results[:args.top]:
+        print(f"{key}={r[key]}  profit={r['overall_profit']:.2f} regret={r['avg_regret']} "
+              f"consistency={r['avg_cluster_consistency']} hhi={r['winner_hhi']} "
+              f"expl={r['exploration_rate']}  {json.dumps(r['params'])}")
+
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[OK] wrote {args.json_out}")
+    if args.csv_out:
+        pkeys = sorted({k for r in results for k in r["params"]})
+        cols = ["overall_profit", "revenue", "avg_regret", "avg_cluster_consistency", "winner_hhi", "exploration_rate"]
+        with open(args.csv_out, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(pkeys + cols)
+            for r in results:
+                w.writerow([r["params"].get(k) for k in pkeys] + [r[c] for c in cols])
+        print(f"[OK] wrote {args.csv_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+# server.py
+"""
+HTTP service หน้า dispatcher (asyncio, stdlib ล้วน — ไม่ต้องลง web framework เพิ่ม)
+
+  POST /decide          body = Offer (JSON)                         -> decision
+  POST /decide/batch    body = {"offers": [Offer, ...]}             -> {"results": [...]}
+  POST /reserve         body = {"warehouse_id","offer_id","volume_cbm"}      -> {"reservation_id", ...}
+                        ซ้ำ (offer + คลังที่ยัง HELD) = reservation เดิม ไม่ hold เพิ่ม; ปริมาตรต่างจากเดิม = 409
+  POST /release         body = {"reservation_id"}   คืน capacity ของ hold นั้น (ครั้งเดียว; ไม่รู้จัก/คืนแล้ว = 404)
+  GET  /health          สถานะ + warmup
+  GET  /metrics         ตัวนับ request/latency (p50/p95/p99 จาก DDSketch)/inflight + stats ของ decision writer / map provider
+
+import/.env/seed/compile graph/สถิติย้อนหลัง ทำครั้งเดียวตอน start (warmup)
+SIGHUP = โหลด pricing/scoring config ใหม่จาก .env (core.pricing.reload_config)
+ทั้งสอง engine hold capacity ให้ผู้ชนะเหมือนกัน (dispatcher_agent.reserve / node reserve ของ graph) ปิดด้วย SERVER_RESERVE=0
+retry ด้วย offer_id + payload เดิม (ภายใน IDEMPOTENCY_WINDOW_SEC) ได้ decision เดิมคืน ไม่ตัดสิน/hold ซ้ำ (core.idempotency)
+การตัดสินใจ (blocking: DB + HTTP ไป map provider) รันใน thread pool
+จำกัดจำนวนงานพร้อมกันด้วย semaphore (SERVER_MAX_CONCURRENCY)
+
+รัน:  python server.py --port 8080 [--engine graph]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+# โหลด .env ก่อน import core (เหมือน app.py)
+try:
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=os.path.join(ROOT, ".env"))
+except Exception as e:
+    print(f"[WARN] cannot load .env early: {e}")
+
+from pydantic import ValidationError
+
+from core.schema import Offer
+from core.singleflight import SingleFlight
+from metrics.sketches import DDSketch
+
+SERVER_HOST            = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT            = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_ENGINE          = os.getenv("SERVER_ENGINE", "dispatcher")   # dispatcher | graph
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", "16"))
+SERVER_WORKERS         = int(os.getenv("SERVER_WORKERS", str(SERVER_MAX_CONCURRENCY)))
+SERVER_MAX_BODY        = int(os.getenv("SERVER_MAX_BODY", str(1024 * 1024)))
+SERVER_MAX_BATCH       = int(os.getenv("SERVER_MAX_BATCH", "500"))
+SERVER_PERSIST         = os.getenv("SERVER_PERSIST", "1") == "1"
+SERVER_RESERVE         = os.getenv("SERVER_RESERVE", "1") == "1"
+SERVER_KEEPALIVE_SEC   = float(os.getenv("SERVER_KEEPALIVE_SEC", "15"))
+
+_ROUTES = frozenset({"/decide", "/decide/batch", "/reserve", "/release", "/health", "/metrics"})
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            409: "Conflict", 411: "Length Required", 413: "Payload Too Large",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class DispatchService:
+    """
+    ถือ state ที่ warm แล้ว (graph ที่ compile, thread pool, writer) + ตัวนับ metrics
+    decide_fn ส่งเข้ามาได้ (เช่นใน test); ถ้าไม่ส่งจะผูกกับ dispatcher/graph ตอน warmup()
+    """
+
+    def __init__(self, engine: str = SERVER_ENGINE, max_concurrency: int = SERVER_MAX_CONCURRENCY,
+                 workers: int = SERVER_WORKERS, persist: bool = SERVER_PERSIST,
+                 reserve: bool = SERVER_RESERVE,
+                 decide_fn: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+        self.engine = engine
+        self.persist = persist
+        self.reserve_on_decide = reserve
+        self.decide_fn = decide_fn
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="decide")
+        self.sem: Optional[asyncio.Semaphore] = None
+        self.writer = None
+        self.idem = None
+        self.reserve_flight = SingleFlight()    # /reserve ของ (offer, คลัง) เดียวกันพร้อมกัน -> hold ครั้งเดียว
+        self.warm = False
+        self.started = time.time()
+        self.inflight = 0
+        self.counters: Dict[str, int] = {"requests": 0, "errors": 0, "decisions": 0,
+                                         "accepted": 0, "reserved": 0, "released": 0}
+        self.latency: Dict[str, DDSketch] = {}
+
+    # ---------- startup ----------
+    def warmup(self) -> Dict[str, Any]:
+        """งานที่แพงทำครั้งเดียว: DB/seed, snapshot คลัง, สถิติย้อนหลัง, compile graph"""
+        t0 = time.perf_counter()
+        from core.db import init_db, seed_warehouses, list_active_warehouses
+        init_db()
+        seed_warehouses()
+        n_wh = len(list_active_warehouses())
+
+        if self.decide_fn is None:
+            from agents import dispatcher_agent
+            from core import route_estimator
+            n_hist = len(dispatcher_agent._hist())
+            route_estimator.get_estimator(refresh=True)     # fit ครั้งแรกตรงนี้; ต่อจากนั้น refit เบื้องหลัง
+            if self.engine == "graph":
+                from app import get_app
+                graph = get_app()
+
+                def decide(offer: Dict[str, Any]) -> Dict[str, Any]:
+                    state = graph.invoke({"offer": Offer(**offer), "reserve": self.reserve_on_decide})
+                    return state.get("decision") or {}
+            else:
+                def decide(offer: Dict[str, Any]) -> Dict[str, Any]:
+                    decision = dispatcher_agent.run(offer)
+                    return dispatcher_agent.reserve(offer, decision) if self.reserve_on_decide else decision
+            self.decide_fn = decide
+        else:
+            n_hist = 0
+
+        if self.persist:
+            from core.writer import get_decision_writer
+            self.writer = get_decision_writer()
+            # idempotency อ่าน decision ที่บันทึกไว้ -> มีความหมายเฉพาะตอน persist
+            from core.idempotency import Idempotency
+            self.idem = Idempotency(self.writer)
+        self.warm = True
+        info = {"warehouses": n_wh, "history_rows": n_hist, "engine": self.engine,
+                "warmup_ms": round((time.perf_counter() - t0) * 1000, 1)}
+        print(f"[INFO] warmup done: {info}")
+        return info
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        if self.writer is not None:
+            self.writer.flush()
+
+    # ---------- helpers ----------
+    def _observe(self, path: str, ms: float):
+        # sketch ต่อ route ที่รู้จัก + "other" ก้อนเดียว: path สุ่ม (404) ไม่ทำให้ latency/metrics โตไม่จำกัด
+        key = path if path in _ROUTES else "other"
+        s = self.latency.get(key)
+        if s is None:
+            s = self.latency[key] = DDSketch()
+        s.add(ms)
+
+    async def _blocking(self, fn, *args):
+        async with self.sem:
+            self.inflight += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+            finally:
+                self.inflight -= 1
+
+    @staticmethod
+    def _offer(body: Any) -> Dict[str, Any]:
+        if not isinstance(body, dict):
+            raise HttpError(400, "offer must be a JSON object")
+        try:
+            return Offer(**body).model_dump()
+        except ValidationError as e:
+            raise HttpError(400, f"invalid offer: {e.errors(include_url=False)}")
+
+    def _decide_one(self, offer: Dict[str, Any]) -> Dict[str, Any]:
+        if self.idem is not None:
+            return self.idem.decide(offer, self._decide_persist)
+        return self._decide_persist(offer)
+
+    def _decide_persist(self, offer: Dict[str, Any]) -> Dict[str, Any]:
+        decision = self.decide_fn(offer)
+        if self.writer is not None:
+            try:
+                self.writer.submit(offer, decision, {"source": "server", "engine": self.engine,
+                                                     "db_backend": os.getenv("DB_BACKEND", "sqlite")})
+            except Exception as e:
+                print(f"[WARN] save_decision_result failed: {e}")
+        return decision
+
+    # ---------- routes ----------
+    def _count(self, decision: Dict[str, Any]) -> Dict[str, Any]:
+        # นับบน event loop thread (ไม่ต้องมี lock)
+        self.counters["decisions"] += 1
+        if decision.get("accept"):
+            self.counters["accepted"] += 1
+        return decision
+
+    async def decide(self, body: Any) -> Dict[str, Any]:
+        return self._count(await self._blocking(self._decide_one, self._offer(body)))
+
+    async def decide_batch(self, body: Any) -> Dict[str, Any]:
+        offers = (body or {}).get("offers") if isinstance(body, dict) else None
+        if not isinstance(offers, list):
+            raise HttpError(400, "body must be {\"offers\": [...]}")
+        if len(offers) > SERVER_MAX_BATCH:
+            raise HttpError(413, f"batch larger than {SERVER_MAX_BATCH}")
+        parsed = [self._offer(o) for o in offers]
+
+        async def one(o):
+            try:
+                return self._count(await self._blocking(self._decide_one, o))
+            except Exception as e:
+                # เคสเดียวพังไม่ล้มทั้ง batch (รูปเดียวกับ inspect_cases.run_case)
+                return {"accept": False, "chosen_warehouse": None, "reason": f"error: {e}",
+                        "priced_amount": None, "candidates": []}
+
+        results = await asyncio.gather(*(one(o) for o in parsed))
+        return {"results": list(results)}
+
+    async def reserve(self, body: Any) -> Dict[str, Any]:
+        wid, oid, vol = self._hold_args(body)
+        return await self.reserve_flight.ado((oid, wid), self._hold_once, wid, oid, vol)
+
+    async def _hold_once(self, wid: str, oid: str, vol: float) -> Dict[str, Any]:
+        """retry ของ hold เดิม (ยัง HELD ใน ledger) คืน reservation เดิม ไม่ hold capacity ซ้ำ"""
+        from core.db import find_held_reservation, try_hold_capacity
+        held = await self._blocking(find_held_reservation, oid, wid)
+        if held is not None:
+            if abs(held["volume_cbm"] - vol) > 1e-9:
+                raise HttpError(409, f"offer {oid} already holds {held['volume_cbm']} cbm at {wid} "
+                                     f"({held['reservation_id']}); release it first")
+            return {**held, "idempotent": True}
+        rid = await self._blocking(try_hold_capacity, wid, oid, vol)
+        if not rid:
+            raise HttpError(409, f"insufficient capacity at {wid}")
+        self.counters["reserved"] += 1
+        return {"reservation_id": rid, "warehouse_id": wid, "volume_cbm": vol}
+
+    async def release(self, body: Any) -> Dict[str, Any]:
+        from core.db import release_reservation
+        rid = body.get("reservation_id") if isinstance(body, dict) else None
+        if not rid:
+            raise HttpError(400, "reservation_id required")
+        res = await self._blocking(release_reservation, str(rid))
+        if res is None:
+            raise HttpError(404, f"unknown or already released reservation {rid}")
+        self.counters["released"] += 1
+        return {"released": True, **res}
+
+    @staticmethod
+    def _hold_args(body: Any):
+        if not isinstance(body, dict):
+            raise HttpError(400, "body must be a JSON object")
+        wid, oid = body.get("warehouse_id"), body.get("offer_id")
+        try:
+            vol = float(body.get("volume_cbm"))
+        except (TypeError, ValueError):
+            raise HttpError(400, "volume_cbm must be a number")
+        if not wid or not oid or vol <= 0:
+            raise HttpError(400, "warehouse_id, offer_id and volume_cbm > 0 required")
+        return str(wid), str(oid), vol
+
+    def health(self) -> Dict[str, Any]:
+        return {"status": "ok" if self.warm else "starting", "warm": self.warm, "engine": self.engine,
+                "db_backend": os.getenv("DB_BACKEND", "sqlite"),
+                "uptime_sec": round(time.time() - self.started, 1)}
+
+    def metrics(self) -> Dict[str, Any]:
+        lat = {p: {"count": int(s.count), "avg_ms": round(s.mean, 2),
+                   **{f"p{int(q * 100)}_ms": round(s.quantile(q), 2) for q in (0.5, 0.95, 0.99)},
+                   "max_ms": round(s.max, 2)} for p, s in self.latency.items()}
+        from core import provider_client, route_estimator, location
+        return {**self.counters, "inflight": self.inflight, "max_concurrency": self.max_concurrency,
+                "latency": lat, "writer": dict(self.writer.stats) if self.writer is not None else None,
+                "idempotency": dict(self.idem.stats) if self.idem is not None else None,
+                "providers": provider_client.metrics(), "route_estimator": dict(route_estimator.STATS),
+                "singleflight": {**location.FLIGHT.stats, "inflight": location.FLIGHT.inflight()}}
+
+    async def route(self, method: str, path: str, body: Any):
+        table = {
+            ("POST", "/decide"): self.decide,
+            ("POST", "/decide/batch"): self.decide_batch,
+            ("POST", "/reserve"): self.reserve,
+            ("POST", "/release"): self.release,
+        }
+        if (method, path) in table:
+            if not self.warm:
+                raise HttpError(503, "warming up")
+            return await table[(method, path)](body)
+        if method == "GET" and path == "/health":
+            return self.health()
+        if method == "GET" and path == "/metrics":
+            return self.metrics()
+        if path in _ROUTES:
+            raise HttpError(405, f"{method} not allowed on {path}")
+        raise HttpError(404, f"no route {path}")
+
+    # ---------- HTTP/1.1 ----------
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), SERVER_KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").strip().split(" ", 2)
+                except ValueError:
+                    await self._send(writer, 400, {"error": "bad request line"}, keep=False)
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                keep = (headers.get("connection", "").lower() != "close") and version == "HTTP/1.1"
+
+                t0 = time.perf_counter()
+                path = target.split("?", 1)[0]
+                self.counters["requests"] += 1
+                try:
+                    body = None
+                    if "chunked" in headers.get("transfer-encoding", "").lower():
+                        raise HttpError(411, "chunked bodies not supported; send Content-Length")
+                    n = int(headers.get("content-length") or 0)
+                    if n > SERVER_MAX_BODY:
+                        raise HttpError(413, f"body larger than {SERVER_MAX_BODY} bytes")
+                    if n:
+                        raw = await reader.readexactly(n)
+                        try:
+                            body = json.loads(raw)
+                        except ValueError:
+                            raise HttpError(400, "body is not valid JSON")
+                    status, payload = 200, await self.route(method.upper(), path, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": e.message}
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                if status >= 400:
+                    self.counters["errors"] += 1
+                self._observe(path, (time.perf_counter() - t0) * 1000)
+                await self._send(writer, status, payload, keep=keep and status not in (411, 413))
+                if not keep or status in (411, 413):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, payload: Any, keep: bool):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    async def start(self, host: str = SERVER_HOST, port: int = SERVER_PORT) -> asyncio.AbstractServer:
+        self.sem = asyncio.Semaphore(self.max_concurrency)
+        if not self.warm:
+            # warmup ใน thread กัน event loop ค้าง (จะตอบ /health = starting ระหว่างนี้)
+            await asyncio.get_running_loop().run_in_executor(self.pool, self.warmup)
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def _serve(args):
+    svc = DispatchService(engine=args.engine, max_concurrency=args.concurrency,
+                          persist=not args.no_persist, reserve=not args.no_reserve)
+    server = await svc.start(args.host, args.port)
+    addrs = ", ".join(str(s.getsockname()) for s in server.sockets)
+    print(f"[INFO] serving on {addrs} (engine={svc.engine}, concurrency={svc.max_concurrency})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        svc.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="HTTP service for dispatcher decisions.")
+    ap.add_argument("--host", default=SERVER_HOST)
+    ap.add_argument("--port", type=int, default=SERVER_PORT)
+    ap.add_argument("--engine", choices=["dispatcher", "graph"], default=SERVER_ENGINE,
+                    help="ตัดสินใจผ่าน dispatcher_agent.run ตรง ๆ หรือผ่าน LangGraph (app.build)")
+    ap.add_argument("--concurrency", type=int, default=SERVER_MAX_CONCURRENCY,
+                    help="จำนวนการตัดสินใจที่รันพร้อมกันสูงสุด")
+    ap.add_argument("--no-persist", action="store_true", help="ไม่บันทึก decision ลง DB")
+    ap.add_argument("--no-reserve", action="store_true", help="ตัดสินอย่างเดียว ไม่ hold capacity ให้ผู้ชนะ")
+    args = ap.parse_args()
+    # kill -HUP <pid> -> อ่าน .env ใหม่แล้วสลับ pricing/scoring config (request ถัดไปเห็นค่าใหม่)
+    from core.pricing import install_reload_signal
+    install_reload_signal(os.path.join(ROOT, ".env"))
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        print("\n[INFO] shutting down")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# tests/test_archive.py
+import time
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from core import db as coredb
+from core import archive
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    coredb.init_db()
+    return tmp_path
+
+
+def _insert(ts, chosen, cands, offer_id):
+    con = coredb.get_conn()
+    con.execute("INSERT INTO decision_runs(ts, offer_json, decision_json, meta_json) VALUES (?,?,?,?)",
+                (ts, coredb.json.dumps({"offer_id": offer_id, "volume_cbm": 10.0}),
+                 coredb.json.dumps({"accept": True, "chosen_warehouse": chosen,
+                                    "reason": {"type": "history_aware_selection", "exploration": False},
+                                    "candidates": cands}), "{}"))
+    con.commit(); con.close()
+
+
+def test_archive_roundtrip_and_transparent_read(fresh_db, monkeypatch):
+    now = int(time.time())
+    cands = [
+        {"warehouse_id": "W1", "route": {"km": 5.0, "minutes": 15.0}, "profit": 50.0,
+         "margin": 0.1, "price_amount": 500.0, "cost": 450.0, "utilization": 0.4},
+        {"warehouse_id": "W2", "route": {"km": 9.0, "minutes": 20.0}, "profit": 40.0,
+         "margin": 0.08, "price_amount": 520.0, "cost": 480.0, "utilization": 0.3},
+    ]
+    _insert(now - 40 * 86400, "W1", cands, "OLD-1")
+    _insert(now - 35 * 86400, "W2", cands, "OLD-2")
+    _insert(now - 60, "W1", cands, "NEW-1")
+
+    before = coredb.get_recent_decisions(days=90)
+    stats = archive.archive_decisions(30)
+    assert stats["decisions"] == 2 and stats["candidates"] == 4 and stats["deleted"] == 2
+
+    con = coredb.get_conn()
+    assert con.execute("SELECT COUNT(*) FROM decision_runs").fetchone()[0] == 1
+    con.close()
+
+    after = coredb.get_recent_decisions(days=90)
+    assert [r["offer"]["offer_id"] for r in after] == [r["offer"]["offer_id"] for r in before]
+    assert [r["meta"] for r in after] == [r["meta"] for r in before] == [{}, {}, {}]
+    old = after[0]["decision"]
+    assert old["chosen_warehouse"] == "W1"
+    assert [c["warehouse_id"] for c in old["candidates"]] == ["W1", "W2"]
+    assert old["candidates"][0]["route"]["km"] == 5.0
+
+    # archive ทั้งหมดเก่ากว่า hot -> ไม่ต้อง lookup key กับ hot table
+    monkeypatch.setattr(coredb, "existing_decision_keys", lambda keys: pytest.fail("per-key hot lookup"))
+    assert len(coredb.get_recent_decisions(days=90)) == 3
+
+    only_w2 = coredb.get_recent_decisions(days=90, warehouse_id="W2")
+    assert [r["offer"]["offer_id"] for r in only_w2] == ["OLD-2"]
+    recent = coredb.get_recent_decisions(days=1)
+    assert [r["offer"]["offer_id"] for r in recent] == ["NEW-1"]
+
+
+def test_keep_hot_archive_is_not_double_counted(fresh_db):
+    now = int(time.time())
+    cands = [{"warehouse_id": "W1", "route": {"km": 5.0}, "profit": 50.0, "price_amount": 500.0, "utilization": 0.4}]
+    _insert(now - 40 * 86400, "W1", cands, "OLD-1")
+    _insert(now - 60, "W1", cands, "NEW-1")
+    before = coredb.get_recent_decisions(days=90)
+    stats_before = coredb.compute_warehouse_stats(90)
+
+    # --keep-hot สองรอบ: รอบสองไม่เขียนซ้ำ และตอนอ่านไม่ซ้ำกับ hot table
+    assert archive.archive_decisions(30, delete=False)["decisions"] == 1
+    assert archive.archive_decisions(30, delete=False)["decisions"] == 0
+    assert [r["offer"]["offer_id"] for r in coredb.get_recent_decisions(days=90)] == \
+           [r["offer"]["offer_id"] for r in before]
+    assert coredb.compute_warehouse_stats(90) == stats_before
+
+    # ลบจริงภายหลัง (เหมือนล้มระหว่างเขียนกับลบ) -> ไม่เขียนเพิ่ม แต่ลบได้ และอ่านจาก archive แทน
+    stats = archive.archive_decisions(30)
+    assert stats["decisions"] == 0 and stats["deleted"] == 1
+    assert [r["offer"]["offer_id"] for r in coredb.get_recent_decisions(days=90)] == ["OLD-1", "NEW-1"]
+    assert coredb.compute_warehouse_stats(90) == stats_before
@@ -0,0 +1,42 @@
+# tests/test_dashboard_follow.py
+import random
+
+from core import db as coredb
+from metrics import dashboard
+
+
+def _rows(n, seed):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        cands = [{"warehouse_id": f"W{j}", "profit": rnd.uniform(0, 100), "utilization": rnd.random(),
+                  "price_amount": 100.0, "route": {"km": rnd.uniform(0, 20)}} for j in range(1, 4)]
+        chosen = rnd.choice(cands)
+        out.append(({"offer_id": f"O{rnd.random()}", "volume_cbm": rnd.uniform(1, 30)},
+                    {"accept": True, "chosen_warehouse": chosen["warehouse_id"],
+                     "reason": {"exploration": rnd.random() < 0.2}, "candidates": cands}, {}))
+    return out
+
+
+def test_follow_tails_only_new_rows_and_matches_full_recompute(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    coredb.save_decision_results(_rows(120, 1))
+    fetched = []
+    real_after = coredb.get_decisions_after
+
+    def spy(*a, **k):
+        rows = real_after(*a, **k)
+        fetched.append(len(rows))
+        return rows
+
+    monkeypatch.setattr(coredb, "get_decisions_after", spy)
+    monkeypatch.setattr(dashboard.time, "sleep", lambda s: coredb.save_decision_results(_rows(15, 2)))
+    kpis = dashboard.follow(interval=0, page=50, fmt="json", max_refresh=2)
+    capsys.readouterr()
+
+    assert sum(fetched) == 135 and max(fetched) == 50
+    assert kpis["meta"]["follow"]["new_decisions"] == 15
+    full = dashboard.compute_kpis()
+    del kpis["meta"]["follow"]
+    assert kpis == full
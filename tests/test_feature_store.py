@@ -0,0 +1,48 @@
+# tests/test_feature_store.py
+import pytest
+
+from core import db as coredb
+from core import location, pricing, feature_store
+from core.pricing import PricingConfig
+from agents import dispatcher_agent, pricing_agent_llm, warehouse_agent_llm
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    coredb.seed_warehouses()
+    monkeypatch.setattr(location, "USE_REAL_ROUTE", False)
+    monkeypatch.setattr(pricing_agent_llm, "USE_LLM_PRICING", False)
+    monkeypatch.setattr(warehouse_agent_llm, "USE_LLM_WAREHOUSE", False)
+    monkeypatch.setattr(dispatcher_agent, "USE_LLM_EXPLAIN", False)
+    monkeypatch.setattr(dispatcher_agent, "_HIST", {})
+    monkeypatch.setattr(warehouse_agent_llm, "_winner_streaks", lambda: {})
+    monkeypatch.setattr(pricing, "_CFG", PricingConfig.from_env({"EPSILON": "0", "BID_JITTER": "0"}))
+    return monkeypatch
+
+
+def test_rescoring_reads_store_without_routing_or_pricing(env):
+    offer = {"offer_id": "F-1", "origin_lat": 13.70, "origin_lng": 100.60, "volume_cbm": 50, "duration_days": 10}
+    first = dispatcher_agent.run_cached(offer)
+    version = first["meta"]["features"]["snapshot_version"]
+    assert first["meta"]["features"]["hit"] is False
+
+    env.setattr(dispatcher_agent, "quote_warehouse", lambda *a, **k: pytest.fail("re-quoted"))
+    env.setattr(dispatcher_agent, "resolve_origin", lambda *a, **k: pytest.fail("re-routed"))
+    again = dispatcher_agent.run_cached(offer)
+    assert again["meta"]["features"] == {"snapshot_version": version, "hit": True}
+    assert again["chosen_warehouse"] == first["chosen_warehouse"]
+    assert [(c["warehouse_id"], c["price_amount"], c["route"]["km"]) for c in again["candidates"]] == \
+           [(c["warehouse_id"], c["price_amount"], c["route"]["km"]) for c in first["candidates"]]
+
+    # เปลี่ยนแค่น้ำหนัก scoring -> snapshot เดิม (A/B บน input เดียวกัน); เปลี่ยนราคา -> snapshot ใหม่
+    env.setattr(pricing, "_CFG", PricingConfig.from_env({"EPSILON": "0", "BID_JITTER": "0", "W_DISTANCE": "5"}))
+    ab = dispatcher_agent.run_cached(offer)
+    assert ab["meta"]["features"]["hit"] is True
+    assert ab["chosen_warehouse"] == min(ab["candidates"], key=lambda c: c["route"]["km"])["warehouse_id"]
+    ctx = dispatcher_agent.load_context()
+    assert feature_store.snapshot_version(ctx, PricingConfig.from_env({"KM_COST": "99"})) != version
+
+    rows = coredb.load_candidate_features(version, ["F-1", "missing"])
+    assert list(rows) == ["F-1"] and [r["pos"] for r in rows["F-1"]] == list(range(5))
@@ -0,0 +1,85 @@
+# tests/test_graph.py
+import os
+
+# app/server โหลด .env ตอน import — กันไม่ให้สลับไป Mongo/LLM ระหว่างเทส
+os.environ.setdefault("DB_BACKEND", "sqlite")
+
+import threading
+import time
+
+import app
+from agents import dispatcher_agent
+
+
+def test_graph_fans_out_quotes_and_keeps_warehouse_order(monkeypatch):
+    whs = [{"warehouse_id": f"W{i}", "lat": 13.6, "lng": 100.6} for i in range(1, 5)]
+    seen = set()
+
+    def slow_quote(offer, lat, lng, w, hist_row, cfg=None):
+        seen.add(threading.get_ident())
+        time.sleep(0.05 if w["warehouse_id"] == "W1" else 0.0)   # W1 เสร็จช้าสุด
+        return {"warehouse_id": w["warehouse_id"], "lat": lat}
+
+    monkeypatch.setattr(app, "GRAPH_RESERVE", False)
+    monkeypatch.setattr(dispatcher_agent, "resolve_origin", lambda offer: (13.7, 100.5))
+    monkeypatch.setattr(dispatcher_agent, "load_context",
+                        lambda: {"warehouses": whs, "hist": {}, "streaks": {}})
+    monkeypatch.setattr(dispatcher_agent, "quote_warehouse", slow_quote)
+    monkeypatch.setattr(dispatcher_agent, "select",
+                        lambda offer, cands, hist, streaks, cfg=None: {"accept": True, "chosen_warehouse": cands[0]["warehouse_id"],
+                                                             "offer_id": offer["offer_id"], "candidates": cands})
+
+    decisions = app.decide_many([{"offer_id": "A"}, {"offer_id": "B"}])
+    assert [d["offer_id"] for d in decisions] == ["A", "B"]
+    for d in decisions:
+        assert [c["warehouse_id"] for c in d["candidates"]] == ["W1", "W2", "W3", "W4"]
+        assert all(c["lat"] == 13.7 for c in d["candidates"])
+    assert len(seen) > 1
+
+
+def test_graph_without_warehouses_goes_straight_to_score(monkeypatch):
+    monkeypatch.setattr(dispatcher_agent, "resolve_origin", lambda offer: (0.0, 0.0))
+    monkeypatch.setattr(dispatcher_agent, "load_context", lambda: {"warehouses": [], "hist": {}, "streaks": {}})
+    out = app.get_app().invoke({"offer": {"offer_id": "X"}})
+    assert out["decision"]["accept"] is False and out["decision"]["candidates"] == []
+
+
+def test_input_streaks_override_db_streaks(monkeypatch):
+    whs = [{"warehouse_id": "W1", "lat": 13.6, "lng": 100.6}]
+    seen = []
+    monkeypatch.setattr(app, "GRAPH_RESERVE", False)
+    monkeypatch.setattr(dispatcher_agent, "resolve_origin", lambda offer: (13.7, 100.5))
+    monkeypatch.setattr(dispatcher_agent, "load_context",
+                        lambda: {"warehouses": whs, "hist": {}, "streaks": {"W9": 4}})
+    monkeypatch.setattr(dispatcher_agent, "quote_warehouse",
+                        lambda offer, lat, lng, w, hist_row, cfg=None: {"warehouse_id": w["warehouse_id"]})
+    monkeypatch.setattr(dispatcher_agent, "select",
+                        lambda offer, cands, hist, streaks, cfg=None: seen.append(dict(streaks)) or
+                        {"accept": True, "chosen_warehouse": "W1", "candidates": cands})
+
+    graph, streaks = app.get_app(), {"W1": 2}
+    for oid in ("A", "B"):
+        d = graph.invoke({"offer": {"offer_id": oid}, "streaks": streaks})["decision"]
+        streaks = dispatcher_agent.advance_streaks(streaks, d["chosen_warehouse"])
+    graph.invoke({"offer": {"offer_id": "C"}})
+    assert seen == [{"W1": 2}, {"W1": 3}, {"W9": 4}]
+
+
+def test_batch_helpers_reserve_only_when_asked(monkeypatch):
+    whs = [{"warehouse_id": "W1", "lat": 13.6, "lng": 100.6}]
+    held = []
+    monkeypatch.setattr(app, "GRAPH_RESERVE", True)
+    monkeypatch.setattr(dispatcher_agent, "resolve_origin", lambda offer: (13.7, 100.5))
+    monkeypatch.setattr(dispatcher_agent, "load_context", lambda: {"warehouses": whs, "hist": {}, "streaks": {}})
+    monkeypatch.setattr(dispatcher_agent, "quote_warehouse",
+                        lambda offer, lat, lng, w, hist_row, cfg=None: {"warehouse_id": w["warehouse_id"]})
+    monkeypatch.setattr(dispatcher_agent, "select",
+                        lambda offer, cands, hist, streaks, cfg=None: {"accept": True, "chosen_warehouse": "W1",
+                                                                       "candidates": cands})
+    monkeypatch.setattr(dispatcher_agent, "reserve",
+                        lambda offer, decision: held.append(offer["offer_id"]) or {**decision, "reservation_id": "R"})
+
+    assert "reservation_id" not in app.decide_many([{"offer_id": "A"}])[0] and held == []
+    assert app.decide_many([{"offer_id": "B"}], reserve=True)[0]["reservation_id"] == "R"
+    app.get_app().invoke({"offer": {"offer_id": "C"}})          # invoke เดี่ยวใช้ GRAPH_RESERVE
+    assert held == ["B", "C"]
@@ -0,0 +1,46 @@
+# tests/test_idempotency.py
+import threading
+
+from core import db as coredb
+from core.idempotency import Idempotency
+from core.writer import BufferedDecisionWriter
+
+
+def test_retry_replays_stored_decision_until_payload_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    writer = BufferedDecisionWriter(batch_size=100, flush_interval=1.0)
+    idem = Idempotency(writer, window_sec=3600)
+    calls = []
+
+    def decide(offer):
+        calls.append(offer["offer_id"])
+        threading.Event().wait(0.05)
+        decision = {"accept": True, "chosen_warehouse": "W1", "priced_amount": offer["volume_cbm"] * 10,
+                    "reservation_id": f"R{len(calls)}"}
+        writer.submit(offer, decision, {"source": "test"})
+        return decision
+
+    offer = {"offer_id": "O-1", "volume_cbm": 5.0, "origin_lat": None}
+    out = [None] * 4
+    threads = [threading.Thread(target=lambda i=i: out.__setitem__(i, idem.decide(dict(offer), decide)))
+               for i in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert calls == ["O-1"] and {d["reservation_id"] for d in out} == {"R1"}
+
+    # ยังไม่ flush -> เจอใน pending ของ writer; None field ไม่มีผลกับ hash
+    again = idem.decide({"offer_id": "O-1", "volume_cbm": 5.0}, decide)
+    assert again["meta"]["idempotent"]["source"] == "pending" and again["reservation_id"] == "R1"
+
+    writer.flush()
+    again = idem.decide(dict(offer), decide)
+    assert again["meta"]["idempotent"]["source"] == "db" and again["reservation_id"] == "R1"
+    assert calls == ["O-1"]
+
+    changed = idem.decide({**offer, "volume_cbm": 6.0}, decide)
+    assert changed["reservation_id"] == "R2" and "meta" not in changed
+    assert idem.stats["changed"] == 1 and idem.stats["misses"] == 2
+
+    assert Idempotency(writer, window_sec=0).decide(dict(offer), decide)["reservation_id"] == "R3"
+    writer.close()
@@ -0,0 +1,65 @@
+# tests/test_market_sim.py
+import pytest
+
+from core import db as coredb
+from core import location, rng
+from core.market_sim import MarketSim
+from agents import dispatcher_agent, pricing_agent_llm, warehouse_agent_llm
+
+
+def _fake_market(capacity=100.0):
+    """ตลาดจำลองในหน่วยความจำ: คลังเดียว รับถ้ายังมีที่"""
+    used = {"W1": 0.0}
+
+    def decide(offers):
+        out = []
+        for o in offers:
+            ok = used["W1"] + o["volume_cbm"] <= capacity
+            used["W1"] += o["volume_cbm"] if ok else 0.0
+            out.append({"accept": ok, "chosen_warehouse": "W1" if ok else None, "priced_amount": 10.0 if ok else None,
+                        "candidates": [{"warehouse_id": "W1", "profit": 2.0}]})
+        return out
+
+    def release(wid, vol):
+        used[wid] -= vol
+    return used, decide, release
+
+
+def test_seeded_run_is_deterministic_and_conserves_capacity():
+    reports = []
+    for _ in range(2):
+        used, decide, release = _fake_market()
+        sim = MarketSim([{"warehouse_id": "W1", "capacity_cbm": 100.0}], decide, release,
+                        consumers=3, horizon=2000, seed=11, mean_interarrival=5,
+                        volume_range=(10, 40), duration_range=(1, 5))
+        r = sim.run(drain=True)
+        assert used["W1"] == pytest.approx(0.0, abs=1e-6) and r["released"] == r["accepted"]
+        reports.append(r)
+    a, b = reports
+    assert {k: v for k, v in a.items() if k not in ("wall_sec", "events_per_sec", "decide_sec", "decide_ms")} == \
+           {k: v for k, v in b.items() if k not in ("wall_sec", "events_per_sec", "decide_sec", "decide_ms")}
+    assert a["rejected"] > 0 and a["retries"] > 0                 # ตลาดแน่น -> มี retry
+    assert a["offers"] == a["accepted"] + a["rejected"]
+    assert a["revenue"] == 10.0 * a["accepted"] and 0 < a["utilization_avg"]["W1"] <= 1.0
+    assert a["price_pct"] == {"p50": 10.0, "p95": 10.0, "p99": 10.0} and a["decide_ms"]["p99"] is not None
+
+
+def test_drives_dispatcher_with_reservations(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    monkeypatch.setattr(pricing_agent_llm, "USE_LLM_PRICING", False)
+    coredb.init_db()
+    coredb.seed_warehouses()
+    # test อื่นที่ import app ทำให้ .env ถูกโหลดแล้ว -> ปิด provider/LLM ตรงนี้
+    monkeypatch.setattr(location, "USE_REAL_ROUTE", False)
+    monkeypatch.setattr(dispatcher_agent, "USE_LLM_EXPLAIN", False)
+    monkeypatch.setattr(warehouse_agent_llm, "USE_LLM_WAREHOUSE", False)
+    monkeypatch.setattr(rng, "_RUN_SEED", 0)
+
+    before = {w["warehouse_id"]: w["used_cbm"] for w in coredb.list_active_warehouses()}
+    sim = MarketSim(coredb.list_active_warehouses(),
+                    lambda offers: dispatcher_agent.run_batch(offers, reserve_capacity=True),
+                    coredb.release_capacity, consumers=2, horizon=200, seed=3, mean_interarrival=20)
+    r = sim.run(drain=True)
+    assert r["offers"] > 0 and r["accepted"] > 0 and r["released"] == r["accepted"]
+    after = {w["warehouse_id"]: w["used_cbm"] for w in coredb.list_active_warehouses()}
+    assert after == pytest.approx(before)
@@ -0,0 +1,70 @@
+# tests/test_offer_queue.py
+import pytest
+
+from core.offer_queue import OfferQueue, IngestWorkers, QueueFull
+from agents import dispatcher_agent
+
+
+def test_workers_micro_batch_persist_then_ack(tmp_path):
+    q = OfferQueue(str(tmp_path / "q.sqlite3"))
+    q.enqueue_many([{"offer_id": f"O{i}"} for i in range(50)])
+    assert q.metrics()["depth"] == 50
+
+    sizes, persisted = [], []
+
+    def decide(offers):
+        sizes.append(len(offers))
+        return [{"accept": True, "chosen_warehouse": "W1", "offer_id": o["offer_id"]} for o in offers]
+
+    w = IngestWorkers(q, batch_size=16, max_wait=0.01, workers=2, decide_batch=decide,
+                      persist=persisted.extend).start()
+    assert w.drain(timeout=10)
+    w.stop()
+    assert max(sizes) <= 16 and sum(sizes) == 50
+    assert sorted(o["offer_id"] for o, d, m in persisted) == sorted(f"O{i}" for i in range(50))
+    m = w.metrics()
+    assert m["processed"] == 50 and m["depth"] == 0 and m["leased"] == 0
+
+
+def test_failed_batch_is_retried_then_dead_lettered(tmp_path):
+    q = OfferQueue(str(tmp_path / "q.sqlite3"), max_attempts=2)
+    q.enqueue({"offer_id": "BAD"})
+
+    def boom(offers):
+        raise RuntimeError("provider down")
+
+    w = IngestWorkers(q, batch_size=4, max_wait=0.0, decide_batch=boom, persist=lambda items: 0)
+    assert w.process_once() == 0 and q.metrics()["depth"] == 1
+    assert w.process_once() == 0
+    m = q.metrics()
+    assert m["depth"] == 0 and m["dead"] == 1
+
+
+def test_enqueue_backpressure(tmp_path):
+    q = OfferQueue(str(tmp_path / "q.sqlite3"), max_depth=3)
+    q.enqueue_many([{"offer_id": "a"}, {"offer_id": "b"}, {"offer_id": "c"}])
+    with pytest.raises(QueueFull):
+        q.enqueue({"offer_id": "d"}, timeout=0.05)
+
+
+def test_run_batch_advances_streaks_in_memory(monkeypatch):
+    whs = [{"warehouse_id": "W1", "lat": 0.0, "lng": 0.0}, {"warehouse_id": "W2", "lat": 0.0, "lng": 0.0}]
+    monkeypatch.setattr(dispatcher_agent, "load_context",
+                        lambda: {"warehouses": whs, "hist": {}, "streaks": {"W1": 2}})
+    monkeypatch.setattr(dispatcher_agent._loc, "route_many", lambda pairs: [{"km": 1.0, "minutes": 2.0}] * len(pairs))
+    monkeypatch.setattr(dispatcher_agent, "quote_warehouse",
+                        lambda offer, lat, lng, w, h, rt, cfg=None: {"warehouse_id": w["warehouse_id"], "route": rt})
+    seen = []
+
+    def select(offer, cands, hist, streaks, cfg=None):
+        seen.append(dict(streaks))
+        return {"accept": True, "chosen_warehouse": offer["win"], "candidates": cands}
+
+    monkeypatch.setattr(dispatcher_agent, "select", select)
+    offers = [{"offer_id": "a", "origin_lat": 1, "origin_lng": 1, "win": "W1"},
+              {"offer_id": "b", "origin_lat": 1, "origin_lng": 1, "win": "W2"},
+              {"offer_id": "c", "origin_lat": 1, "origin_lng": 1, "win": "W2"},
+              {"offer_id": "d", "win": None}]
+    out = dispatcher_agent.run_batch(offers)
+    assert seen == [{"W1": 2}, {"W1": 3}, {"W2": 1}]
+    assert out[3]["accept"] is False and "error" in out[3]["reason"]
@@ -0,0 +1,64 @@
+# tests/test_policy_sweep.py
+import random
+
+import numpy as np
+
+from core.policy_sweep import Corpus, Evaluator, grid, rank, sweep
+from agents import dispatcher_agent, pricing_agent_llm, warehouse_agent_llm
+
+ENV = {"BID_JITTER": "0", "EPSILON": "0"}
+
+
+def _corpus(n=60, seed=1):
+    rng = np.random.default_rng(seed)
+    m = 4
+    return Corpus(offer_ids=list(range(n)), warehouse_ids=[f"W{j + 1}" for j in range(m)],
+                  volume=rng.uniform(5, 200, n), duration=rng.integers(1, 30, n).astype("f8"),
+                  km=rng.uniform(1, 40, (n, m)), spec=np.full((n, m), 0.9), sla_fit=np.ones((n, m)),
+                  used=np.array([500.0, 7000.0, 100.0, 2000.0]), capacity=np.array([10000.0, 8000.0, 5000.0, 3000.0]),
+                  accept_rate=np.array([0.5, 0.8, 0.2, 0.0]), ewma_util=np.array([0.3, 0.9, 0.1, 0.7]),
+                  streaks={"W2": 2})
+
+
+def test_selection_matches_dispatcher(monkeypatch):
+    monkeypatch.setattr(pricing_agent_llm, "USE_LLM_PRICING", False)
+    monkeypatch.setattr(dispatcher_agent, "USE_LLM_EXPLAIN", False)
+    c = _corpus()
+    ev = Evaluator(c, ENV)
+    params = {"W_PROFIT": 0.3, "W_DISTANCE": 0.5, "COOLDOWN_GAMMA": 0.1}
+    cfg = ev.config(params)
+    chosen, explored = ev.select(ev.quotes(cfg), cfg, params)
+    assert not explored.any()
+
+    monkeypatch.setattr(warehouse_agent_llm, "COOLDOWN_GAMMA", 0.1)
+    whs = [{"warehouse_id": w, "used_cbm": u, "capacity_cbm": cap}
+           for w, u, cap in zip(c.warehouse_ids, c.used, c.capacity)]
+    hist = {w: {"accept_rate": a, "ewma_util": e} for w, a, e in zip(c.warehouse_ids, c.accept_rate, c.ewma_util)}
+    streaks, expect = dict(c.streaks), []
+    for i in range(len(c.offer_ids)):
+        offer = {"volume_cbm": c.volume[i], "duration_days": c.duration[i]}
+        cands = []
+        for j, w in enumerate(whs):
+            cand = dispatcher_agent._price.quote_candidate(offer, w, {"km": c.km[i, j]}, hist[w["warehouse_id"]], cfg)
+            cand["spec_score"] = 0.9
+            cands.append(cand)
+        d = dispatcher_agent.select(offer, cands, hist, streaks, cfg)
+        streaks = dispatcher_agent.advance_streaks(streaks, d["chosen_warehouse"])
+        expect.append(d["chosen_warehouse"])
+    assert [c.warehouse_ids[j] for j in chosen] == expect
+
+
+def test_sweep_reuses_quotes_and_parallel_matches_inline():
+    c = _corpus(n=80)
+    sets = grid({"ALPHA_MARGIN": [0.0, 0.3], "W_PROFIT": [0.2, 0.6, 0.9], "EPSILON": [0.0, 0.2]})
+    ev = Evaluator(c, ENV)
+    inline = [ev.evaluate(p) for p in sets]
+    assert ev.stats == {"evaluated": 12, "quote_hits": 10, "quote_misses": 2}
+    assert sweep(c, sets, processes=2, base_env=ENV, chunk=3) == inline
+
+    r = inline[0]
+    assert sum(r["wins"].values()) == 80 and 0.25 <= r["winner_hhi"] <= 1.0
+    assert r["exploration_rate"] == 0.0 and any(x["exploration_rate"] > 0 for x in inline)
+    best = rank(inline, "profit")
+    assert best[0]["overall_profit"] == max(x["overall_profit"] for x in inline)
+    assert rank(inline, "hhi")[0]["winner_hhi"] == min(x["winner_hhi"] for x in inline)
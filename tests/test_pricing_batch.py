@@ -0,0 +1,63 @@
+# tests/test_pricing_batch.py
+import numpy as np
+import pytest
+
+from core import pricing
+from core.pricing import PricingConfig
+from agents import pricing_agent_llm
+from agents.pricing_agent_llm import PricingAgent
+
+CFG = PricingConfig.from_env({"BID_JITTER": "0", "SURGE_K": "0.5",
+                              "RATE_CARD_OVERRIDES": '{"W2": {"km_cost": 20, "min_margin": 0.1}}'})
+
+
+def _pairs(n=200, seed=3):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(1, 100, n), rng.integers(1, 60, n).astype(float), rng.uniform(0, 40, n),
+            rng.uniform(0, 1.2, n), np.array(["W1", "W2", "W3"], dtype=object)[rng.integers(0, 3, n)])
+
+
+def test_quote_price_batch_matches_scalar():
+    vol, days, km, util, wids = _pairs()
+    q = pricing.quote_price_batch(vol, days, km, util, warehouse_ids=wids, cfg=CFG)
+    for i in range(len(vol)):
+        ref = pricing.quote_price(vol[i], days[i], km[i], util[i], rate=CFG.rate_for(wids[i]), cfg=CFG)
+        assert round(q["cost"][i], 2) == ref["cost"]
+        assert q["price_amount"][i] == pytest.approx(ref["price_amount"], abs=0.01)
+        assert q["margin"][i] == pytest.approx(ref["margin"], abs=1e-4)
+
+
+def test_agent_quote_batch_matches_quote_candidate(monkeypatch):
+    monkeypatch.setattr(pricing_agent_llm, "USE_LLM_PRICING", False)
+    vol, days, km, util, wids = _pairs()
+    used, cap, ar, ew = util * 500, 500.0, np.linspace(0, 1, len(vol)), np.linspace(0.5, 1, len(vol))
+    q = PricingAgent().quote_batch(vol, days, km, used, cap, ar, ew, warehouse_ids=wids, cfg=CFG)
+    for i in range(0, len(vol), 7):
+        ref = PricingAgent().quote_candidate(
+            {"volume_cbm": vol[i], "duration_days": days[i]},
+            {"warehouse_id": wids[i], "used_cbm": used[i], "capacity_cbm": cap},
+            {"km": km[i]}, {"accept_rate": ar[i], "ewma_util": ew[i]}, cfg=CFG)
+        assert q["price_amount"][i] == pytest.approx(ref["_raw_price"])
+        assert round(q["cost"][i], 2) == ref["cost"]
+        assert q["utilization"][i] == pytest.approx(ref["utilization"])
+
+
+def test_batch_broadcasts_and_jitter_is_seeded():
+    cfg = PricingConfig.from_env({"BID_JITTER": "0.05"})
+    vol = np.array([[10.0], [20.0]])                      # offers × คลัง
+    km = np.array([[1.0, 5.0, 9.0]])
+    a = PricingAgent().quote_batch(vol, 5, km, 100, 1000, cfg=cfg, seed=7)
+    b = PricingAgent().quote_batch(vol, 5, km, 100, 1000, cfg=cfg, seed=7)
+    assert a.shape == (2, 3) and np.array_equal(a, b)
+    assert np.all(np.abs(a["jitter"]) <= 0.05) and np.ptp(a["jitter"]) > 0
+
+
+def test_warehouse_ids_can_add_the_warehouse_axis():
+    km = np.array([[1.0], [5.0], [9.0]])                  # offers × 1
+    wids = np.array([["W1", "W2"]], dtype=object)         # 1 × คลัง
+    q = PricingAgent().quote_batch(10.0, 5, km, 100, 1000, warehouse_ids=wids, cfg=CFG,
+                                   offer_ids=np.array([["O1"], ["O2"], ["O3"]], dtype=object))
+    assert q.shape == (3, 2)
+    assert np.all(q["cost"][:, 1] > q["cost"][:, 0])      # W2 km_cost override
+    p = pricing.quote_price_batch(10.0, 5, km, 0.5, warehouse_ids=wids, cfg=CFG)
+    assert p.shape == (3, 2) and np.all(p["cost"][:, 1] > p["cost"][:, 0])
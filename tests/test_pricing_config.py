@@ -0,0 +1,57 @@
+# tests/test_pricing_config.py
+import os
+import json
+import signal
+import dataclasses
+
+import pytest
+
+from core import pricing
+from core.pricing import PricingConfig, RateCard
+from agents import pricing_agent_llm
+from agents.pricing_agent_llm import PricingAgent
+
+
+def test_from_env_overrides_and_immutability(tmp_path):
+    path = tmp_path / "rates.json"
+    path.write_text(json.dumps({"W2": {"km_cost": 20, "min_margin": 0.1, "bogus": 1}}))
+    cfg = PricingConfig.from_env({"KM_COST": "12", "W_PROFIT": "0.5", "BID_JITTER": "0",
+                                  "RATE_CARD_OVERRIDES": str(path)})
+    assert cfg.rate.km_cost == 12.0 and cfg.weights.profit == 0.5
+    assert cfg.rate_for("W1") is cfg.rate
+    assert cfg.rate_for("W2") == RateCard(km_cost=20.0, min_margin=0.1)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        cfg.rate.km_cost = 1.0
+    with pytest.raises(TypeError):
+        cfg.overrides["W3"] = cfg.rate
+
+    inline = PricingConfig.from_env({"RATE_CARD_OVERRIDES": '{"W1": {"surcharge": 3}}'})
+    assert inline.rate_for("W1").surcharge == 3.0
+
+
+def test_agent_uses_per_warehouse_rate_card(monkeypatch):
+    monkeypatch.setattr(pricing_agent_llm, "USE_LLM_PRICING", False)
+    cfg = PricingConfig.from_env({"BID_JITTER": "0", "RATE_CARD_OVERRIDES": '{"W2": {"km_cost": 20}}'})
+    offer = {"volume_cbm": 10, "duration_days": 5}
+    quote = lambda wid: PricingAgent().quote_candidate(
+        offer, {"warehouse_id": wid, "used_cbm": 0, "capacity_cbm": 100}, {"km": 4.0}, cfg=cfg)
+    assert quote("W2")["cost"] - quote("W1")["cost"] == pytest.approx((20 - 10) * 4.0)
+    q = pricing.quote_price(10, 5, 4.0, 0.5, cfg=cfg)
+    assert q["cost"] == pytest.approx(5 * 10 + 0.8 * 10 * 5 + 10 * 4.0 + 0.15 * 0.5 * 10)
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGHUP"), reason="POSIX only")
+def test_sighup_reloads_config(monkeypatch):
+    before = pricing.get_config()
+    monkeypatch.setenv("KM_COST", "33")
+    prev = signal.getsignal(signal.SIGHUP)
+    try:
+        assert pricing.install_reload_signal()
+        os.kill(os.getpid(), signal.SIGHUP)
+        cfg = pricing.get_config()
+        assert cfg.rate.km_cost == 33.0 and cfg.version == before.version + 1
+        assert pricing.load_rate()["km_cost"] == 33.0
+    finally:
+        signal.signal(signal.SIGHUP, prev)
+        monkeypatch.delenv("KM_COST")
+        pricing.reload_config()
@@ -0,0 +1,81 @@
+# tests/test_provider_client.py
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core import location
+from core.provider_client import ProviderClient, RateLimited, TokenBucket
+
+
+@pytest.fixture
+def upstream():
+    hits = []
+
+    class H(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            hits.append((self.path, self.client_address[1]))
+            time.sleep(0.1)
+            body = json.dumps({"status": "OK", "path": self.path}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *a):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), H)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}", hits
+    srv.shutdown()
+
+
+def test_concurrent_identical_requests_are_merged_and_connection_reused(upstream):
+    url, hits = upstream
+    c = ProviderClient("test", rate=0)
+    out = []
+    ts = [threading.Thread(target=lambda: out.append(c.get_json(url + "/a", params={"q": 1}))) for _ in range(8)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    assert len(out) == 8 and all(o == out[0] for o in out)
+    assert len(hits) == 1 and c.metrics()["merged"] == 7
+    c.get_json(url + "/b"); c.get_json(url + "/c")
+    assert len({port for _, port in hits[1:]}) == 1          # keep-alive: socket เดิม
+    m = c.metrics()
+    assert m["requests"] == 3 and m["errors"] == 0 and m["p95_ms"] >= 100
+
+
+def test_token_bucket_limits_rate_and_raises_when_exhausted(upstream):
+    b = TokenBucket(rate=10, burst=2)
+    t0 = time.monotonic()
+    assert all(b.acquire(1.0) for _ in range(4))
+    assert time.monotonic() - t0 >= 0.15                      # 2 ตัวหลังต้องรอ refill
+    url, _ = upstream
+    c = ProviderClient("test", rate=0.01, burst=1, rate_wait=0.0)
+    c.get_json(url + "/x")
+    with pytest.raises(RateLimited):
+        c.get_json(url + "/y")
+    assert c.metrics()["throttled"] == 1
+
+
+def test_throttled_google_falls_through_to_ors(monkeypatch):
+    class Throttled:
+        def get_json(self, *a, **k):
+            raise RateLimited("google")
+
+    class Ors:
+        def post_json(self, url, body, headers=None):
+            return {"routes": [{"summary": {"distance": 12.0, "duration": 900.0}}]}
+
+    monkeypatch.setattr(location, "USE_REAL_ROUTE", True)
+    monkeypatch.setattr(location, "GOOGLE_API_KEY", "k")
+    monkeypatch.setattr(location, "ORS_API_KEY", "k")
+    monkeypatch.setattr(location, "get_client", lambda name: Throttled() if name == "google" else Ors())
+    r = location._fetch_route(13.7, 100.5, 13.65, 100.64)
+    assert tuple(r) == (12.0, 15.0) and r.source == "ors"
@@ -0,0 +1,61 @@
+# tests/test_reservation.py
+import threading
+
+from core import db as coredb
+from agents import dispatcher_agent
+
+
+def _decision():
+    cands = [{"warehouse_id": w, "price_amount": p, "score": s}
+             for w, p, s in (("W2", 900.0, 0.9), ("W1", 950.0, 0.8), ("W3", 990.0, 0.7))]
+    return {"accept": True, "chosen_warehouse": "W2", "priced_amount": 900.0,
+            "reason": {"type": "history_aware_selection"}, "candidates": cands}
+
+
+def test_reserve_falls_through_in_rank_order():
+    tried = []
+
+    def hold(wid, offer_id, vol):
+        tried.append(wid)
+        return "RESV-X-W3" if wid == "W3" else None
+
+    out = dispatcher_agent.reserve({"offer_id": "X", "volume_cbm": 10}, _decision(), hold=hold)
+    assert tried == ["W2", "W1", "W3"]
+    assert out["accept"] and out["chosen_warehouse"] == "W3" and out["priced_amount"] == 990.0
+    r = out["meta"]["reservation"]
+    assert r["fallthrough"] and r["initial_winner"] == "W2"
+    assert [a["ok"] for a in r["attempts"]] == [False, False, True]
+
+
+def test_reserve_gives_up_after_max_attempts():
+    out = dispatcher_agent.reserve({"offer_id": "X", "volume_cbm": 10}, _decision(),
+                                   hold=lambda *a: None, max_attempts=2)
+    assert not out["accept"] and out["chosen_warehouse"] is None
+    assert len(out["meta"]["reservation"]["attempts"]) == 2
+
+
+def test_sqlite_hold_is_atomic_under_contention(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db(); coredb.seed_warehouses()
+    ok = []
+
+    def worker(i):
+        if coredb.try_hold_capacity("W1", f"O{i}", 1000.0):
+            ok.append(i)
+
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(20)]
+    [t.start() for t in ts]; [t.join() for t in ts]
+    w1 = next(w for w in coredb.list_active_warehouses() if w["warehouse_id"] == "W1")
+    assert len(ok) == 8                       # (10000 - 2000) / 1000
+    assert w1["used_cbm"] == 10000.0
+
+
+def test_find_held_reservation_tracks_ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db(); coredb.seed_warehouses()
+    assert coredb.find_held_reservation("O9", "W1") is None
+    rid = coredb.try_hold_capacity("W1", "O9", 25.0)
+    assert coredb.find_held_reservation("O9", "W1") == {"reservation_id": rid, "warehouse_id": "W1", "volume_cbm": 25.0}
+    assert coredb.find_held_reservation("O9", "W2") is None
+    coredb.release_reservation(rid)
+    assert coredb.find_held_reservation("O9", "W1") is None
@@ -0,0 +1,60 @@
+# tests/test_rng.py
+import numpy as np
+import pytest
+
+from core import rng
+from core.pricing import PricingConfig
+from agents import dispatcher_agent, pricing_agent_llm
+from agents.pricing_agent_llm import PricingAgent
+
+
+@pytest.fixture(autouse=True)
+def run_seed(monkeypatch):
+    monkeypatch.setattr(rng, "_RUN_SEED", 1234)
+    monkeypatch.setattr(pricing_agent_llm, "USE_LLM_PRICING", False)
+    monkeypatch.setattr(dispatcher_agent, "USE_LLM_EXPLAIN", False)
+
+
+def test_batch_draws_match_scalar_and_depend_only_on_ids():
+    ids, wids = np.array(["A", "B", 7], dtype=object), np.array(["W1", "W2"], dtype=object)
+    U = rng.uniform_batch(ids[:, None], "jitter", wids[None, :], -1, 1)
+    assert U.tolist() == [[rng.uniform_for(o, "jitter", w, -1, 1) for w in wids] for o in ids]
+    assert rng.uniform_batch(ids[::-1, None], "jitter", wids[None, ::-1], -1, 1).tolist() == U[::-1, ::-1].tolist()
+    assert rng.uniform_for("A", "jitter", "W1", -1, 1, seed=1) != U[0, 0]
+
+
+def test_quote_and_exploration_replay_per_offer():
+    cfg = PricingConfig.from_env({"BID_JITTER": "0.05", "EPSILON": "0.5"})
+    whs = [{"warehouse_id": f"W{j}", "used_cbm": 100.0 * j, "capacity_cbm": 1000.0} for j in range(1, 5)]
+    offers = [{"offer_id": f"O-{i}", "volume_cbm": 10.0 + i, "duration_days": 5} for i in range(30)]
+
+    agent = PricingAgent()
+    single = np.array([[agent.quote_candidate(o, w, {"km": 3.0}, cfg=cfg)["_raw_price"] for w in whs] for o in offers])
+    batch = agent.quote_batch(np.array([o["volume_cbm"] for o in offers])[:, None], 5, 3.0,
+                              np.array([w["used_cbm"] for w in whs])[None, :], 1000.0,
+                              warehouse_ids=np.array([w["warehouse_id"] for w in whs], dtype=object)[None, :],
+                              offer_ids=np.array([o["offer_id"] for o in offers], dtype=object)[:, None], cfg=cfg)
+    np.testing.assert_allclose(batch["price_amount"], single, rtol=1e-12)
+
+    def decide(o):
+        cands = [dict(agent.quote_candidate(o, w, {"km": 3.0}, cfg=cfg), spec_score=1.0) for w in whs]
+        d = dispatcher_agent.select(o, cands, {}, {}, cfg)
+        return d["chosen_warehouse"], d["reason"]["exploration"], d["priced_amount"]
+
+    first = [decide(o) for o in offers]
+    assert [decide(o) for o in reversed(offers)] == first[::-1]
+    assert any(e for _, e, _ in first) and not all(e for _, e, _ in first)
+    assert dispatcher_agent.select(offers[0], [], {}, {}, cfg)["meta"]["run_seed"] == 1234
+
+
+def test_batch_hashes_each_id_once_before_broadcast(monkeypatch):
+    calls = []
+    key = rng.offer_key
+    monkeypatch.setattr(rng, "offer_key", lambda *a: calls.append(a[0]) or key(*a))
+    ids = np.array([f"O-{i}" for i in range(50)], dtype=object)
+    wids = np.array([f"W{j}" for j in range(40)], dtype=object)
+    U = rng.uniform_batch(ids[:, None], "jitter", wids[None, :], -1, 1)
+    assert U.shape == (50, 40) and len(calls) == 50
+    assert U[17, 23] == rng.uniform_for("O-17", "jitter", "W23", -1, 1)
+    with pytest.raises(ValueError):
+        rng.uniform_batch(ids, "jitter", wids, -1, 1)
@@ -0,0 +1,107 @@
+# tests/test_route_estimator.py
+import random
+
+import pytest
+
+from core import db as coredb
+from core import location
+from core import route_estimator
+from core.route_estimator import RouteEstimator, _haversine_km
+
+RUSH_TS, NIGHT_TS = 1_700_000_000 + 1 * 3600, 1_700_000_000 + 15 * 3600   # 06:13 / 20:13 น. (UTC+7)
+WH = (13.6512, 100.6371)
+
+
+def _samples(n=300, seed=7):
+    """region A (lat 13.70-13.74): detour 1.3; region B (13.90-13.94): detour 1.6 — เร็ว 15 km/h ตอนเช้า, 45 ตอนดึก"""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        base, detour = rng.choice([(13.70, 1.3), (13.90, 1.6)])
+        lat, lng = base + rng.uniform(0.001, 0.04), 100.50 + rng.uniform(0.001, 0.04)
+        ts, kmh = rng.choice([(RUSH_TS, 15.0), (NIGHT_TS, 45.0)])
+        km = _haversine_km(lat, lng, *WH) * detour * rng.uniform(0.97, 1.03)
+        out.append((lat, lng, *WH, km, km / kmh * 60.0, ts, "google"))
+    return out
+
+
+def test_learns_detour_and_time_of_day_speed():
+    est = RouteEstimator(region_deg=0.05).fit(_samples())
+    hav = _haversine_km(13.72, 100.52, *WH)
+    rush = est.predict(13.72, 100.52, *WH, ts=RUSH_TS)
+    night = est.predict(13.72, 100.52, *WH, ts=NIGHT_TS)
+    assert rush.km == pytest.approx(hav * 1.3, rel=0.03)
+    assert rush.minutes == pytest.approx(rush.km / 15.0 * 60, rel=0.08)
+    assert night.minutes == pytest.approx(night.km / 45.0 * 60, rel=0.08)
+    assert est.predict(13.92, 100.52, *WH, ts=RUSH_TS).km == pytest.approx(
+        _haversine_km(13.92, 100.52, *WH) * 1.6, rel=0.03)
+    assert rush.confidence > 0.5
+    assert est.predict(14.50, 100.90, *WH).confidence == 0.0          # ไม่เคยเห็น region นี้
+
+
+def test_untrained_matches_haversine_and_skips_non_provider_rows():
+    lat, lng = 13.72, 100.52
+    hav = _haversine_km(lat, lng, *WH)
+    junk = [(lat, lng, *WH, hav, hav / 40.0 * 60.0, RUSH_TS, None),          # haversine fallback เก่า
+            (lat, lng, *WH, hav * 2, 5.0, RUSH_TS, "estimate"),
+            (lat, lng, *WH, hav * 2, 5.0, RUSH_TS, "haversine")]
+    est = RouteEstimator(default_kmh=40).fit(junk)
+    assert est.n == 0
+    e = est.predict(lat, lng, *WH)
+    assert e.km == pytest.approx(hav) and e.minutes == pytest.approx(hav / 40.0 * 60.0)
+    assert e.confidence == 0.0
+
+
+def test_route_uses_confident_estimate_instead_of_provider(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    coredb.save_distance_cache_many([(f"k{i}", *s[:6], 0.0, s[7]) for i, s in enumerate(_samples())])
+    route_estimator.reset()
+    route_estimator.get_estimator(refresh=True)
+    monkeypatch.setattr(route_estimator, "ROUTE_EST_MIN_CONF", 0.5)
+    calls = []
+    monkeypatch.setattr(location, "_fetch_route", lambda *p: calls.append(p) or (5.0, 10.0))
+    try:
+        r = location.route(13.721, 100.521, *WH)
+        assert r.source == "estimate" and not calls
+        assert r[0] == pytest.approx(_haversine_km(*location.snap_origin(13.721, 100.521)[:2], *WH) * 1.3, rel=0.03)
+        far = location.route(14.50, 100.90, *WH)                        # confidence 0 -> provider
+        assert len(calls) == 1 and tuple(far) == (5.0, 10.0)
+        assert route_estimator.STATS["estimated"] >= 1 and route_estimator.STATS["low_confidence"] >= 1
+        n_rows = coredb.get_conn().execute("SELECT COUNT(*) FROM distance_cache").fetchone()[0]
+        assert n_rows == len(_samples()) + 1                            # ค่าประมาณไม่ลง cache
+    finally:
+        route_estimator.reset()
+
+
+def test_predict_without_ts_ignores_wall_clock():
+    est = RouteEstimator(region_deg=0.05).fit(_samples())
+    a = est.predict(13.72, 100.52, *WH)
+    b = est.predict(13.72, 100.52, *WH, ts=None)
+    assert a == b
+    assert est.predict(13.72, 100.52, *WH, ts=RUSH_TS).minutes > a.minutes > \
+        est.predict(13.72, 100.52, *WH, ts=NIGHT_TS).minutes
+
+
+def test_refit_runs_in_background_and_low_confidence_uses_haversine(tmp_path, monkeypatch):
+    import threading
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    coredb.save_distance_cache_many([(f"k{i}", *s[:6], 0.0, s[7]) for i, s in enumerate(_samples())])
+    monkeypatch.setattr(location, "USE_REAL_ROUTE", False)
+    gate = threading.Event()
+    fit = route_estimator._fit
+    monkeypatch.setattr(route_estimator, "_fit", lambda: gate.wait(5) and fit())
+    route_estimator.reset()
+    try:
+        assert route_estimator.estimate(13.72, 100.52, *WH) is None        # ไม่รอ fit
+        gate.set()
+        for t in threading.enumerate():
+            if t.name == "route-estimator-fit":
+                t.join(5)
+        assert route_estimator.estimate(13.72, 100.52, *WH).confidence > 0.5
+        r = location.route(14.50, 100.90, *WH)                          # region ไม่เคยเห็น + provider ปิด
+        assert r.source == "haversine"
+        assert r[0] == pytest.approx(_haversine_km(*location.snap_origin(14.50, 100.90)[:2], *WH))
+    finally:
+        route_estimator.reset()
@@ -0,0 +1,41 @@
+# tests/test_route_matrix.py
+from core import db as coredb
+from core import location
+
+
+def test_route_matrix_chunks_google_requests(monkeypatch):
+    calls = []
+
+    def fake_google(origins, dests):
+        calls.append((len(origins), len(dests)))
+        if len(calls) == 1:
+            raise RuntimeError("OVER_QUERY_LIMIT")       # block แรกพัง -> ตกไป ORS
+        return [[(1.0, 2.0)] * len(dests) for _ in origins]
+
+    def fake_ors(origins, dests):
+        return [[(3.0, 4.0)] * len(dests) for _ in origins]
+
+    monkeypatch.setattr(location, "USE_REAL_ROUTE", True)
+    monkeypatch.setattr(location, "GOOGLE_API_KEY", "k")
+    monkeypatch.setattr(location, "ORS_API_KEY", "k")
+    monkeypatch.setattr(location, "_google_matrix", fake_google)
+    monkeypatch.setattr(location, "_ors_matrix", fake_ors)
+
+    origins = [(13.0 + i * 0.01, 100.0) for i in range(9)]
+    dests = [(13.5, 100.5 + j * 0.01) for j in range(30)]
+    m = location.route_matrix(origins, dests, qps=0)
+    assert all(o * d <= 100 and o <= 25 and d <= 25 for o, d in calls)
+    assert len(m) == 9 and all(len(r) == 30 for r in m)
+    assert m[0][0] == (3.0, 4.0) and m[-1][-1] == (1.0, 2.0)
+    assert m[0][0].source == "ors" and m[-1][-1].source == "google"
+
+    monkeypatch.setattr(location, "USE_REAL_ROUTE", False)
+    assert {c.source for row in location.route_matrix(origins[:2], dests[:2], qps=0) for c in row} == {"haversine"}
+
+
+def test_list_expiring_distance_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    coredb.save_distance_cache_many([("soon", 1, 2, 3, 4, 5.0, 6.0)], ttl_sec=600)
+    coredb.save_distance_cache_many([("later", 1, 2, 3, 5, 5.0, 6.0)], ttl_sec=7 * 86400)
+    assert [r[0] for r in coredb.list_expiring_distance_cache(3600)] == ["soon"]
@@ -0,0 +1,31 @@
+# tests/test_route_snap.py
+import pytest
+
+from core import db as coredb
+from core import location
+from core.location import snap_origin, _haversine_km
+
+
+@pytest.mark.parametrize("mode", ["grid", "geohash"])
+@pytest.mark.parametrize("err_m", [50.0, 100.0, 500.0])
+def test_snap_error_bound_and_idempotent(mode, err_m):
+    for lat, lng in [(13.6512, 100.6371), (13.7563, 100.5018), (-33.86, 151.21), (59.91, 10.75)]:
+        s_lat, s_lng, bound, label = snap_origin(lat, lng, mode, err_m)
+        assert _haversine_km(lat, lng, s_lat, s_lng) * 1000 <= bound + 1e-6
+        assert bound <= err_m + 1e-6
+        assert snap_origin(s_lat, s_lng, mode, err_m)[3] == label
+
+
+def test_nearby_origins_share_one_provider_call(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    calls = []
+    monkeypatch.setattr(location, "_fetch_route", lambda *p: calls.append(p) or (5.0, 10.0))
+    lat, lng = snap_origin(13.7563, 100.5018)[:2]           # กลาง cell -> จุดรอบ ๆ อยู่ cell เดียวกัน
+    a = location.route(lat + 0.0001, lng, 13.65, 100.64)
+    b = location.route(lat, lng - 0.0001, 13.65, 100.64)
+    assert len(calls) == 1 and tuple(a) == tuple(b) == (5.0, 10.0)
+    assert 0 < b.snap_err_m <= location.ROUTE_SNAP_MAX_ERR_M + 1e-6
+    con = coredb.get_conn()
+    assert con.execute("SELECT snap_err_m FROM distance_cache").fetchone()[0] == pytest.approx(b.snap_err_m)
+    con.close()
@@ -0,0 +1,114 @@
+# tests/test_server.py
+import os
+
+# app/server โหลด .env ตอน import — กันไม่ให้สลับไป Mongo/LLM ระหว่างเทส
+os.environ.setdefault("DB_BACKEND", "sqlite")
+
+import asyncio
+import json
+import threading
+
+from core import db as coredb
+from server import DispatchService
+
+
+OFFER = {"offer_id": "OFFER-0001", "customer_id": "C1", "origin_lat": 13.65, "origin_lng": 100.64,
+         "volume_cbm": 100.0, "start_date": "2025-11-20", "duration_days": 30,
+         "sla": {"latest_dropoff_hour": 24, "weekday_only": True}}
+
+
+async def _request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: t\r\nContent-Length: {len(data)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + data)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def test_decide_batch_reserve_release(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    peak = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def fake_decide(offer):
+        with lock:
+            peak["now"] += 1; peak["max"] = max(peak["max"], peak["now"])
+        threading.Event().wait(0.02)
+        with lock:
+            peak["now"] -= 1
+        return {"accept": True, "chosen_warehouse": "W1", "priced_amount": 1.0, "candidates": []}
+
+    async def scenario():
+        svc = DispatchService(max_concurrency=2, workers=8, persist=False, decide_fn=fake_decide)
+        server = await svc.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            assert (await _request(port, "GET", "/health"))[1]["warm"] is True
+            status, dec = await _request(port, "POST", "/decide", OFFER)
+            assert status == 200 and dec["chosen_warehouse"] == "W1"
+            status, out = await _request(port, "POST", "/decide/batch", {"offers": [OFFER] * 6})
+            assert status == 200 and len(out["results"]) == 6
+            assert (await _request(port, "POST", "/decide", {"offer_id": "x"}))[0] == 400
+
+            status, res = await _request(port, "POST", "/reserve",
+                                         {"warehouse_id": "W1", "offer_id": "O1", "volume_cbm": 500})
+            assert status == 200 and res["reservation_id"]
+            # retry ของ hold เดิม -> reservation เดิม ไม่ hold เพิ่ม (พร้อมกันก็ hold ครั้งเดียว)
+            retries = await asyncio.gather(*(_request(port, "POST", "/reserve",
+                                                      {"warehouse_id": "W1", "offer_id": "O1", "volume_cbm": 500})
+                                             for _ in range(3)))
+            assert {(st, r["reservation_id"], r["idempotent"]) for st, r in retries} == \
+                {(200, res["reservation_id"], True)}
+            assert (await _request(port, "POST", "/reserve",
+                                   {"warehouse_id": "W1", "offer_id": "O1", "volume_cbm": 50}))[0] == 409
+            assert (await _request(port, "POST", "/reserve",
+                                   {"warehouse_id": "W1", "offer_id": "O2", "volume_cbm": 1e9}))[0] == 409
+            assert (await _request(port, "POST", "/release",
+                                   {"warehouse_id": "W1", "volume_cbm": 500}))[0] == 400
+            status, rel = await _request(port, "POST", "/release", {"reservation_id": res["reservation_id"]})
+            assert status == 200 and rel["warehouse_id"] == "W1" and rel["volume_cbm"] == 500
+            # release ซ้ำ / id ที่ไม่มี hold จริง ไม่คืน capacity
+            assert (await _request(port, "POST", "/release", {"reservation_id": res["reservation_id"]}))[0] == 404
+            assert (await _request(port, "POST", "/release", {"reservation_id": "RESV-fake-W1"}))[0] == 404
+            status, again = await _request(port, "POST", "/reserve",    # คืนแล้ว -> hold ใหม่ได้
+                                           {"warehouse_id": "W1", "offer_id": "O1", "volume_cbm": 500})
+            assert status == 200 and again["reservation_id"] != res["reservation_id"]
+            assert (await _request(port, "POST", "/release", {"reservation_id": again["reservation_id"]}))[0] == 200
+
+            for i in range(5):
+                assert (await _request(port, "GET", f"/nope/{i}"))[0] == 404
+            status, m = await _request(port, "GET", "/metrics")
+            assert m["latency"]["other"]["count"] == 5 and not any(k.startswith("/nope") for k in m["latency"])
+            assert m["decisions"] == 7 and m["reserved"] == 2 and m["released"] == 2
+            assert m["latency"]["/decide/batch"]["count"] == 1
+        finally:
+            server.close(); await server.wait_closed(); svc.close()
+
+    asyncio.run(scenario())
+    assert peak["max"] <= 2
+    used = {w["warehouse_id"]: w["used_cbm"] for w in coredb.list_active_warehouses()}
+    assert used["W1"] == 2000.0
+
+
+def test_dispatcher_engine_holds_capacity_like_graph(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    from agents import dispatcher_agent
+    monkeypatch.setattr(dispatcher_agent, "_HIST", {})
+    monkeypatch.setattr(dispatcher_agent, "run", lambda offer: {
+        "accept": True, "chosen_warehouse": "W1", "priced_amount": 1.0, "reason": {"type": "test"},
+        "candidates": [{"warehouse_id": "W1", "price_amount": 1.0}]})
+    svc = DispatchService(engine="dispatcher", persist=False)
+    svc.warmup()
+    try:
+        dec = svc._decide_one(dict(OFFER))
+    finally:
+        svc.close()
+    used = {w["warehouse_id"]: w["used_cbm"] for w in coredb.list_active_warehouses()}
+    assert dec["reservation_id"] and used["W1"] == 2100.0
+    assert coredb.release_reservation(dec["reservation_id"])["volume_cbm"] == 100.0
+    assert coredb.release_reservation(dec["reservation_id"]) is None
+    assert {w["warehouse_id"]: w["used_cbm"] for w in coredb.list_active_warehouses()}["W1"] == 2000.0
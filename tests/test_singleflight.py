@@ -0,0 +1,130 @@
+# tests/test_singleflight.py
+import time
+import asyncio
+import threading
+
+import pytest
+
+from core import db as coredb
+from core import location
+from core.singleflight import SingleFlight
+
+
+def _slow(calls, value=42, delay=0.1):
+    def fn():
+        calls.append(1)
+        time.sleep(delay)
+        return value
+    return fn
+
+
+def test_threads_share_one_call_and_errors():
+    flight, calls, out = SingleFlight(), [], []
+    ts = [threading.Thread(target=lambda: out.append(flight.do("k", _slow(calls)))) for _ in range(10)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    assert calls == [1] and out == [42] * 10
+    assert flight.stats == {"leaders": 1, "shared": 9} and flight.inflight() == 0
+
+    def boom():
+        raise ValueError("x")
+    with pytest.raises(ValueError):
+        flight.do("k", boom)
+    assert flight.do("k", lambda: 7) == 7                   # key ถูกปล่อยหลัง error
+
+
+def test_asyncio_and_threads_join_the_same_flight():
+    flight, calls = SingleFlight(), []
+
+    async def main():
+        fn = _slow(calls, value="r", delay=0.2)
+        t = threading.Thread(target=lambda: res.append(flight.do("k", fn)))
+        lead = asyncio.ensure_future(flight.ado("k", fn))
+        await asyncio.sleep(0.05)
+        t.start()
+        rest = await asyncio.gather(*[flight.ado("k", fn) for _ in range(5)])
+        return [await lead, *rest]
+
+    res = []
+    out = asyncio.run(main())
+    time.sleep(0.05)
+    assert calls == [1] and out == ["r"] * 6 and res == ["r"]
+
+
+def test_concurrent_route_misses_call_provider_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    calls = []
+    monkeypatch.setattr(location, "_confident_estimate", lambda *p: None)
+    monkeypatch.setattr(location, "_fetch_route",
+                        lambda *p: calls.append(p) or time.sleep(0.2) or (5.0, 10.0))
+    out = []
+    ts = [threading.Thread(target=lambda: out.append(tuple(location.route(13.7563, 100.5018, 13.65, 100.64))))
+          for _ in range(8)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    assert len(calls) == 1 and out == [(5.0, 10.0)] * 8
+    assert tuple(location.route_many([(13.7563, 100.5018, 13.65, 100.64)])[0]) == (5.0, 10.0)
+    assert len(calls) == 1
+
+
+def test_sync_and_async_location_calls_share_flights(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    calls, geo = [], []
+    monkeypatch.setattr(location, "_confident_estimate", lambda *p: None)
+    monkeypatch.setattr(location, "_fetch_route",
+                        lambda *p: calls.append(p) or time.sleep(0.2) or (5.0, 10.0))
+    monkeypatch.setattr(location, "_geocode", lambda a: geo.append(a) or time.sleep(0.2) or (13.7, 100.5))
+
+    async def main():
+        t = threading.Thread(target=lambda: (location.route(13.7563, 100.5018, 13.65, 100.64),
+                                             location.geocode("Siam  Paragon")))
+        t.start()
+        await asyncio.sleep(0.05)
+        # ต้นทางขยับไม่กี่เมตร -> snap เข้า cell เดียวกับ route() ใน thread
+        r = await asyncio.gather(location.aroute(13.75631, 100.50181, 13.65, 100.64),
+                                 location.ageocode("siam paragon"))
+        await asyncio.get_running_loop().run_in_executor(None, t.join)
+        return r
+
+    r, g = asyncio.run(main())
+    assert len(calls) == 1 and tuple(r) == (5.0, 10.0) and r.snap == location.ROUTE_SNAP
+    assert len(geo) == 1 and g == (13.7, 100.5)
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    flight, calls = SingleFlight(), []
+
+    async def slow_coro():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "c"
+
+    async def main():
+        # fn ธรรมดา: thread ใน executor ทำต่อจนจบ ผู้รอได้ผล เรียก fn ครั้งเดียว
+        lead = asyncio.ensure_future(flight.ado("s", _slow(calls, value="s", delay=0.1)))
+        await asyncio.sleep(0.02)
+        waiter = asyncio.ensure_future(flight.ado("s", _slow(calls)))
+        await asyncio.sleep(0.02)
+        lead.cancel()
+        assert await waiter == "s" and len(calls) == 1
+
+        # coroutine: leader ถูก cancel -> ผู้รอ (coroutine + thread) เข้าคิวใหม่ ไม่ได้ CancelledError
+        calls.clear()
+        lead = asyncio.ensure_future(flight.ado("c", slow_coro))
+        await asyncio.sleep(0.02)
+        waiters = [asyncio.ensure_future(flight.ado("c", slow_coro)) for _ in range(3)]
+        t = threading.Thread(target=lambda: res.append(flight.do("c", lambda: "t")))
+        t.start()
+        await asyncio.sleep(0.02)
+        lead.cancel()
+        out = await asyncio.gather(*waiters)
+        await asyncio.get_running_loop().run_in_executor(None, t.join)
+        return out, lead
+
+    res = []
+    out, lead = asyncio.run(main())
+    assert lead.cancelled()
+    assert set(out) | set(res) <= {"c", "t"} and len(out) == 3 and len(res) == 1
+    assert flight.inflight() == 0
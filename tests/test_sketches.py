@@ -0,0 +1,32 @@
+# tests/test_sketches.py
+import numpy as np
+
+from metrics.sketches import DDSketch, HyperLogLog
+
+
+def test_ddsketch_relative_error_and_merge_across_buckets():
+    x = np.random.default_rng(0).lognormal(3, 1.5, 50000)
+    whole = DDSketch(0.01).add_many(x)
+    parts = [DDSketch(0.01) for _ in range(4)]
+    for i, v in enumerate(x):
+        parts[i % 4].add(v)
+    merged = DDSketch.from_dict(parts[0].to_dict())
+    for p in parts[1:]:
+        merged.merge(p)
+    for q in (0.01, 0.5, 0.9, 0.99):
+        exact = np.quantile(x, q, method="lower")
+        assert abs(whole.quantile(q) - exact) <= 0.011 * exact
+        assert merged.quantile(q) == whole.quantile(q)
+    assert merged.count == 50000 and merged.max == x.max() and abs(merged.mean - x.mean()) < 1e-6 * x.mean()
+    assert DDSketch().quantile(0.5) is None and DDSketch().add_many([0, 0, -3]).quantile(0.5) == 0.0
+
+
+def test_hyperloglog_estimates_and_merges():
+    a = HyperLogLog(12).add_many(f"C{i}" for i in range(30000))
+    b = HyperLogLog(12).add_many(f"C{i}" for i in range(20000, 50000))
+    assert abs(a.count() - 30000) < 0.05 * 30000
+    assert abs(HyperLogLog.from_dict(a.to_dict()).merge(b).count() - 50000) < 0.05 * 50000
+    small = HyperLogLog(12)
+    for v in ["x", "y", "x", None]:
+        small.add(v)
+    assert small.count() == 2
@@ -0,0 +1,71 @@
+# tests/test_variants.py
+import random
+
+import pytest
+
+from core import db as coredb
+from metrics.variants import compare
+
+
+def _save(n, version, win_profit, seed, legacy=False):
+    rnd = random.Random(seed)
+    items = []
+    for i in range(n):
+        cands = [{"warehouse_id": "W1", "profit": win_profit + rnd.uniform(-1, 1), "route": {"km": 2.0}},
+                 {"warehouse_id": "W2", "profit": 10.0, "route": {"km": 9.0}}]
+        accept = i % 4 != 0
+        dec = {"accept": accept, "chosen_warehouse": "W1" if accept else None, "candidates": cands}
+        meta = {}
+        if legacy:
+            dec["meta"] = {"version": version}
+        else:
+            meta["version"] = version
+        items.append(({"offer_id": f"{version}-{i}", "customer_id": f"C{i % 7}"}, dec, meta))
+    coredb.save_decision_results(items)
+
+
+def test_single_pass_variants_with_bootstrap(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    _save(400, "v_old", 8.0, 1)
+    _save(400, "v_new", 12.0, 2, legacy=True)      # version อยู่ใน decision.meta แบบเก่า
+    _save(50, "v_other", 5.0, 3)
+
+    out = compare(coredb.iter_decisions(0, page=64), variants=["v_old", "v_new"], bootstrap=300, seed=7)
+    old, new = out["variants"]["v_old"], out["variants"]["v_new"]
+    assert list(out["variants"]) == ["v_old", "v_new"] and out["baseline"] == "v_old"
+    assert old["n_rows"] == 400 and old["accept_rate"] == 0.75 and new["winner_share"] == {"W1": 1.0}
+    assert old["distinct_customers"] == 7 and new["km_median"] == pytest.approx(2.0, rel=0.01)
+
+    lo, hi = old["ci"]["accept_rate"]
+    assert lo < 0.75 < hi
+    d = new["delta"]["regret_mean"]
+    assert d["value"] < 0 and d["ci"][1] < 0           # W1 ดีกว่า W2 ใน v_new -> regret ลดลงชัด
+    assert new["delta"]["winner_hhi"]["value"] == 0.0
+
+    again = compare(coredb.iter_decisions(0, page=1000), variants=["v_old", "v_new"], bootstrap=300, seed=7)
+    assert again == out                                  # ผลไม่ขึ้นกับขนาดหน้า
+    chunked = compare(coredb.iter_decisions(0), variants=["v_old", "v_new"], bootstrap=300, seed=7, chunk=37)
+    assert chunked["variants"]["v_new"]["ci"]["profit_mean"] == pytest.approx(new["ci"]["profit_mean"], abs=2e-4)
+    assert set(compare(coredb.iter_decisions(0), bootstrap=0)["variants"]) == {"v_old", "v_new", "v_other"}
+
+
+def test_iter_decisions_includes_archived_rows_once(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    import time
+    from core import archive
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    coredb.init_db()
+    _save(20, "v_old", 8.0, 1)
+    con = coredb.get_conn()
+    con.execute("UPDATE decision_runs SET ts = ts - 40 * 86400 WHERE id <= 10")
+    con.commit(); con.close()
+    assert archive.archive_decisions(30, delete=False)["decisions"] == 10      # copy: ยังอยู่ทั้งสองฝั่ง
+    since = int(time.time()) - 90 * 86400
+    assert len(list(coredb.iter_decisions(since, page=4))) == 20
+    archive.archive_decisions(30)                                               # ลบจาก hot แล้ว
+    rows = list(coredb.iter_decisions(since, page=4))
+    assert len(rows) == 20 and sorted(r["offer"]["offer_id"] for r in rows) == sorted(f"v_old-{i}" for i in range(20))
+    assert compare(iter(rows), bootstrap=0)["variants"]["v_old"]["n_rows"] == 20
+    assert len(list(coredb.iter_decisions(since, archive=False))) == 10
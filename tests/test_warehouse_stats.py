@@ -0,0 +1,59 @@
+# tests/test_warehouse_stats.py
+import random
+import time
+
+import pytest
+
+from core import db as coredb
+from core import archive
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    coredb.init_db()
+    return tmp_path
+
+
+def _seed(n, now, rng):
+    con = coredb.get_conn()
+    for i in range(n):
+        cands = []
+        for wid in rng.sample(["W1", "W2", "W3", "W4"], rng.randint(0, 4)):
+            cands.append({"warehouse_id": wid, "profit": rng.uniform(-50, 200),
+                          "margin": rng.uniform(-0.1, 0.4), "price_amount": rng.uniform(100, 2000),
+                          "utilization": rng.choice([None, rng.random()])})
+        if i % 9 == 0:
+            cands.append({"warehouse_id": "", "profit": 10.0})
+        chosen = rng.choice([c["warehouse_id"] for c in cands if c["warehouse_id"]] or [None])
+        dec = {"accept": chosen is not None, "chosen_warehouse": chosen, "candidates": cands}
+        ts = now - rng.randint(0, 40 * 86400)
+        con.execute("INSERT INTO decision_runs(ts, offer_json, decision_json, meta_json) VALUES (?,?,?,?)",
+                    (ts, coredb.json.dumps({"offer_id": f"O{i}"}), coredb.json.dumps(dec), "{}"))
+    con.execute("INSERT INTO decision_runs(ts, offer_json, decision_json, meta_json) VALUES (?,?,?,?)",
+                (now, "{}", "not json", "{}"))
+    con.commit(); con.close()
+
+
+def _assert_same(native, ref):
+    assert set(native) == set(ref)
+    for wid, row in ref.items():
+        for k, v in row.items():
+            assert native[wid][k] == pytest.approx(v, rel=1e-9, abs=1e-9), (wid, k)
+
+
+def test_sqlite_native_matches_python_reference(fresh_db):
+    _seed(300, int(time.time()), random.Random(7))
+    for days in (1, 14, 60):
+        _assert_same(coredb.compute_warehouse_stats(days), coredb._py_compute_warehouse_stats(days))
+
+
+def test_native_stats_merge_archive_partials(fresh_db):
+    pytest.importorskip("pyarrow")
+    _seed(200, int(time.time()), random.Random(11))
+    ref = coredb._py_compute_warehouse_stats(60)
+    archive.archive_decisions(20)
+    assert archive.archive_available()
+    _assert_same(coredb.compute_warehouse_stats(60), ref)
+    _assert_same(coredb._py_compute_warehouse_stats(60), ref)
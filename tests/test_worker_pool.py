@@ -0,0 +1,52 @@
+# tests/test_worker_pool.py
+import os
+
+from core import worker_pool
+from core.worker_pool import ProcessDispatcher, shard_of
+
+
+def _echo(offers, reserve_capacity=False):
+    # รันใน worker process: คืน pid + generation ที่ worker เห็น
+    worker_pool._check_generation()
+    return [{"offer_id": o["offer_id"], "pid": os.getpid(), "gen": worker_pool._SEEN_GEN,
+             "reserve": reserve_capacity} for o in offers]
+
+
+def test_shard_is_stable_by_region():
+    a = {"origin_lat": 13.651, "origin_lng": 100.641}
+    b = {"origin_lat": 13.652, "origin_lng": 100.642}      # ช่อง grid เดียวกัน
+    assert shard_of(a, 8) == shard_of(b, 8)
+    assert shard_of({"origin_address": " Bangkok  DC "}, 8) == shard_of({"origin_address": "bangkok dc"}, 8)
+
+
+def test_dispatch_keeps_order_and_propagates_invalidation():
+    offers = [{"offer_id": f"O{i}", "origin_lat": 13.0 + i * 0.3, "origin_lng": 100.0} for i in range(12)]
+    with ProcessDispatcher(processes=3, fn=_echo) as pool:
+        out = pool.dispatch(offers, reserve_capacity=True)
+        assert [d["offer_id"] for d in out] == [o["offer_id"] for o in offers]
+        assert all(d["reserve"] and d["gen"] == 0 for d in out)
+        for o, d in zip(offers, out):                      # region เดียวกัน -> โปรเซสเดียวกัน
+            same = [x["pid"] for x, oo in zip(out, offers) if shard_of(oo, 3) == shard_of(o, 3)]
+            assert set(same) == {d["pid"]}
+        assert pool.invalidate() == 1
+        assert {d["gen"] for d in pool.dispatch(offers)} == {1}
+        assert sum(pool.stats["per_shard"]) == 24
+
+
+def _km_cost(offers, reserve_capacity=False):
+    worker_pool._check_generation()
+    from core.pricing import get_config
+    cfg = get_config()
+    return [{"offer_id": o["offer_id"], "km_cost": cfg.rate.km_cost} for o in offers]
+
+
+def test_invalidate_reloads_pricing_config_in_workers(tmp_path):
+    env = tmp_path / "pricing.env"
+    env.write_text("KM_COST=11\n")
+    offers = [{"offer_id": "O1", "origin_lat": 13.7, "origin_lng": 100.5}]
+    with ProcessDispatcher(processes=1, fn=_km_cost, env_file=str(env)) as pool:
+        before = pool.dispatch(offers)[0]["km_cost"]
+        env.write_text("KM_COST=22\n")                       # supervisor ได้ SIGHUP -> invalidate()
+        assert pool.dispatch(offers)[0]["km_cost"] == before
+        pool.invalidate()
+        assert pool.dispatch(offers)[0]["km_cost"] == 22.0
@@ -0,0 +1,99 @@
+# tests/test_writer.py
+import os
+import threading
+import time
+
+from core import db as coredb
+from core import writer as writer_mod
+from core.writer import BufferedDecisionWriter
+
+
+def test_flush_writes_in_batches():
+    batches = []
+    w = BufferedDecisionWriter(batch_size=10, flush_interval=0.05, sink=lambda b: batches.append(list(b)))
+    for i in range(25):
+        w.submit({"offer_id": f"O{i}"}, {"accept": True})
+    assert w.flush(timeout=5)
+    w.close()
+    assert sum(len(b) for b in batches) == 25
+    assert max(len(b) for b in batches) <= 10
+    assert w.stats["written"] == 25 and w.stats["spilled"] == 0
+
+
+def test_full_queue_falls_back_to_sync_write():
+    gate = threading.Event()
+    written = []
+
+    def slow_sink(batch):
+        gate.wait(2)
+        written.extend(batch)
+
+    w = BufferedDecisionWriter(batch_size=1, flush_interval=0.01, max_queue=1,
+                               put_timeout=0.01, sink=slow_sink)
+    for i in range(5):
+        threading.Thread(target=w.submit, args=({"offer_id": f"O{i}"}, {})).start()
+    time.sleep(0.2)
+    gate.set()
+    w.close(timeout=5)
+    assert len(written) == 5
+    assert w.stats["sync_fallback"] >= 1
+
+
+def test_sqlite_bulk_insert_keeps_submit_ts(tmp_path, monkeypatch):
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    coredb.init_db()
+    w = BufferedDecisionWriter(batch_size=50, flush_interval=0.05)
+    w.submit({"offer_id": "A"}, {"accept": True, "chosen_warehouse": "W1"}, {"source": "test"})
+    w.close()
+    rows = coredb.get_recent_decisions(days=1)
+    assert [r["offer"]["offer_id"] for r in rows] == ["A"]
+
+
+def test_failed_batch_is_spilled_and_replayed(tmp_path, monkeypatch):
+    monkeypatch.setattr(writer_mod, "WRITER_RETRIES", 1)
+    spill = tmp_path / "spill.jsonl"
+    down = threading.Event(); down.set()
+    written = []
+
+    def flaky_sink(batch):
+        if down.is_set():
+            raise RuntimeError("db down")
+        written.extend(batch)
+
+    w = BufferedDecisionWriter(batch_size=10, flush_interval=0.02, sink=flaky_sink, spill_path=str(spill))
+    for i in range(3):
+        w.submit({"offer_id": f"S{i}"}, {"accept": True})
+    assert w.flush(timeout=5)
+    assert not written and w.stats["spilled"] == 3 and spill.exists()
+    assert w.pending_decision("S1")[1] == {"accept": True}          # ยังไม่ลง DB -> retry ยังเจอ
+
+    down.clear()
+    w.submit({"offer_id": "S3"}, {"accept": True})
+    w.close(timeout=5)
+    assert sorted(item[0]["offer_id"] for item in written) == ["S0", "S1", "S2", "S3"]
+    assert w.stats["replayed"] == 3 and not spill.exists()
+    assert all(w.pending_decision(f"S{i}") is None for i in range(4))
+
+
+def test_only_db_writers_adopt_spill_files_of_dead_processes(tmp_path, monkeypatch):
+    import json, subprocess, sys
+    monkeypatch.setattr(coredb, "DB_PATH", str(tmp_path / "wms.sqlite3"))
+    monkeypatch.setattr(writer_mod, "WRITER_SPILL_DIR", str(tmp_path / "spill"))
+    coredb.init_db()
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                          capture_output=True, text=True).stdout.strip()
+    (tmp_path / "spill").mkdir()
+    orphan = tmp_path / "spill" / f"decisions.{dead}.jsonl"
+    orphan.write_text(json.dumps([{"offer_id": "ORPHAN"}, {"accept": True}, {}, int(time.time())]) + "\n")
+    alive = tmp_path / "spill" / f"decisions.{os.getppid()}.jsonl"
+    alive.write_text(orphan.read_text())
+
+    seen = []
+    w = BufferedDecisionWriter(flush_interval=0.02, sink=lambda b: seen.extend(b))   # sink เอง: ไม่แตะไฟล์
+    w.close(timeout=5)
+    assert w.spill_path is None and not seen and orphan.exists()
+
+    w = BufferedDecisionWriter(flush_interval=0.02)
+    w.close(timeout=5)
+    assert w.stats["replayed"] == 1 and not orphan.exists() and alive.exists()   # โปรเซสที่ยังอยู่ไม่ถูกแย่ง
+    assert [r["offer"]["offer_id"] for r in coredb.get_recent_decisions(days=1)] == ["ORPHAN"]